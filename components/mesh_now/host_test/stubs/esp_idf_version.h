@@ -0,0 +1,5 @@
+// Host shim of <esp_idf_version.h>: the host build follows the IDF the firmware targets
+#pragma once
+
+#define ESP_IDF_VERSION_VAL(major, minor, patch) (((major) << 16) | ((minor) << 8) | (patch))
+#define ESP_IDF_VERSION ESP_IDF_VERSION_VAL(5, 5, 1)
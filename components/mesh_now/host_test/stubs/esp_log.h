@@ -0,0 +1,24 @@
+// Host shim of <esp_log.h>: logs go to stderr when host_log_level allows
+#pragma once
+
+#include "host_shims.h"
+
+#define ESP_LOG_NONE    0
+#define ESP_LOG_ERROR   1
+#define ESP_LOG_WARN    2
+#define ESP_LOG_INFO    3
+#define ESP_LOG_DEBUG   4
+#define ESP_LOG_VERBOSE 5
+
+#define HOST_LOG(level, letter, tag, format, ...) \
+    do { \
+        if (host_log_level >= (level)) { \
+            host_log(letter, tag, format, ##__VA_ARGS__); \
+        } \
+    } while (0)
+
+#define ESP_LOGE(tag, format, ...) HOST_LOG(ESP_LOG_ERROR, 'E', tag, format, ##__VA_ARGS__)
+#define ESP_LOGW(tag, format, ...) HOST_LOG(ESP_LOG_WARN, 'W', tag, format, ##__VA_ARGS__)
+#define ESP_LOGI(tag, format, ...) HOST_LOG(ESP_LOG_INFO, 'I', tag, format, ##__VA_ARGS__)
+#define ESP_LOGD(tag, format, ...) HOST_LOG(ESP_LOG_DEBUG, 'D', tag, format, ##__VA_ARGS__)
+#define ESP_LOGV(tag, format, ...) HOST_LOG(ESP_LOG_VERBOSE, 'V', tag, format, ##__VA_ARGS__)
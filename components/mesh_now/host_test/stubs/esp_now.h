@@ -0,0 +1,50 @@
+// Host shim of <esp_now.h>: sends are recorded, receives are injected with host_receive()
+#pragma once
+
+#include <stdbool.h>
+#include <stdint.h>
+#include "esp_err.h"
+#include "esp_idf_version.h"
+
+#define ESP_NOW_ETH_ALEN 6
+#define ESP_NOW_KEY_LEN  16
+#define ESP_NOW_MAX_DATA_LEN 250
+
+typedef enum {
+    ESP_NOW_SEND_SUCCESS = 0,
+    ESP_NOW_SEND_FAIL,
+} esp_now_send_status_t;
+
+typedef struct {
+    uint8_t peer_addr[ESP_NOW_ETH_ALEN];
+    uint8_t lmk[ESP_NOW_KEY_LEN];
+    uint8_t channel;
+    int ifidx;
+    bool encrypt;
+    void *priv;
+} esp_now_peer_info_t;
+
+typedef struct {
+    uint8_t *src_addr;
+    uint8_t *des_addr;
+    void *rx_ctrl;
+} esp_now_recv_info_t;
+
+typedef struct {
+    const uint8_t *src_addr;
+    const uint8_t *des_addr;
+} esp_now_send_info_t;
+
+typedef void (*esp_now_recv_cb_t)(const esp_now_recv_info_t *recv_info, const uint8_t *data, int len);
+typedef void (*esp_now_send_cb_t)(const esp_now_send_info_t *send_info, esp_now_send_status_t status);
+
+esp_err_t esp_now_init(void);
+esp_err_t esp_now_deinit(void);
+esp_err_t esp_now_register_recv_cb(esp_now_recv_cb_t cb);
+esp_err_t esp_now_unregister_recv_cb(void);
+esp_err_t esp_now_register_send_cb(esp_now_send_cb_t cb);
+esp_err_t esp_now_unregister_send_cb(void);
+esp_err_t esp_now_send(const uint8_t *peer_addr, const uint8_t *data, size_t len);
+esp_err_t esp_now_add_peer(const esp_now_peer_info_t *peer);
+esp_err_t esp_now_del_peer(const uint8_t *peer_addr);
+bool esp_now_is_peer_exist(const uint8_t *peer_addr);
@@ -0,0 +1,6 @@
+// Host shim of <esp_random.h>: a seeded xorshift, so runs repeat
+#pragma once
+
+#include <stdint.h>
+
+uint32_t esp_random(void);
@@ -0,0 +1,8 @@
+// Host shim of <esp_system.h>: a fixed free heap figure
+#pragma once
+
+#include <stdint.h>
+
+#define HOST_FREE_HEAP 200000
+
+uint32_t esp_get_free_heap_size(void);
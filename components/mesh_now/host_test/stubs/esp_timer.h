@@ -0,0 +1,6 @@
+// Host shim of <esp_timer.h>: microseconds of CLOCK_MONOTONIC
+#pragma once
+
+#include <stdint.h>
+
+int64_t esp_timer_get_time(void);
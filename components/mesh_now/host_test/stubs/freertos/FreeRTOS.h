@@ -0,0 +1,18 @@
+// Host shim of FreeRTOS types; one tick is one millisecond
+#pragma once
+
+#include <stdint.h>
+
+typedef uint32_t TickType_t;
+typedef int BaseType_t;
+typedef unsigned int UBaseType_t;
+
+#define pdTRUE  1
+#define pdFALSE 0
+#define pdPASS  1
+#define pdFAIL  0
+#define portMAX_DELAY ((TickType_t)0xffffffffUL)
+#define pdMS_TO_TICKS(ms) ((TickType_t)(ms))
+#define configMAX_PRIORITIES 25
+#define tskIDLE_PRIORITY 0
+#define tskNO_AFFINITY 0x7FFFFFFF
@@ -0,0 +1,12 @@
+// Host shim of FreeRTOS semaphores on pthreads
+#pragma once
+
+#include "freertos/FreeRTOS.h"
+
+typedef struct host_semaphore *SemaphoreHandle_t;
+
+SemaphoreHandle_t xSemaphoreCreateMutex(void);
+SemaphoreHandle_t xSemaphoreCreateBinary(void);
+BaseType_t xSemaphoreTake(SemaphoreHandle_t semaphore, TickType_t ticks);
+BaseType_t xSemaphoreGive(SemaphoreHandle_t semaphore);
+void vSemaphoreDelete(SemaphoreHandle_t semaphore);
@@ -0,0 +1,13 @@
+// Host shim of FreeRTOS tasks: creation is recorded but nothing runs, so the
+// mesh layer's endless beacon/retransmit loops never start on the host
+#pragma once
+
+#include "freertos/FreeRTOS.h"
+
+typedef void *TaskHandle_t;
+typedef void (*TaskFunction_t)(void *);
+
+BaseType_t xTaskCreatePinnedToCore(TaskFunction_t task, const char *name, uint32_t stack_depth, void *parameters,
+                                   UBaseType_t priority, TaskHandle_t *handle, BaseType_t core_id);
+void vTaskDelete(TaskHandle_t task);
+void vTaskDelay(TickType_t ticks);
@@ -0,0 +1,347 @@
+// ESP-IDF and FreeRTOS shims for building mesh_now on a Linux/macOS host
+#include "host_shims.h"
+#include "esp_err.h"
+#include "esp_mac.h"
+#include "esp_now.h"
+#include "esp_system.h"
+#include "esp_random.h"
+#include "esp_timer.h"
+#include "freertos/FreeRTOS.h"
+#include "freertos/semphr.h"
+#include "freertos/task.h"
+
+#include <errno.h>
+#include <pthread.h>
+#include <stdarg.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+#include <unistd.h>
+
+#define HOST_MAX_PEERS 32
+
+int host_log_level = 0;
+
+static uint8_t station_mac[6] = {0x24, 0x0a, 0xc4, 0x00, 0x00, 0x01};
+static esp_now_recv_cb_t recv_cb = NULL;
+static esp_now_send_cb_t send_cb = NULL;
+static bool espnow_ready = false;
+static uint8_t peer_table[HOST_MAX_PEERS][ESP_NOW_ETH_ALEN];
+static int peer_total = 0;
+static host_frame_t last_frame;
+static size_t frames_sent = 0;
+static host_send_hook_t send_hook = NULL;
+static int tasks_created = 0;
+static int64_t fixed_time_us = -1;
+
+void host_log(char level, const char *tag, const char *format, ...)
+{
+    va_list args;
+    va_start(args, format);
+    fprintf(stderr, "%c (%s) ", level, tag);
+    vfprintf(stderr, format, args);
+    fputc('\n', stderr);
+    va_end(args);
+}
+
+const char *esp_err_to_name(esp_err_t code)
+{
+    switch (code) {
+    case ESP_OK: return "ESP_OK";
+    case ESP_FAIL: return "ESP_FAIL";
+    case ESP_ERR_NO_MEM: return "ESP_ERR_NO_MEM";
+    case ESP_ERR_INVALID_ARG: return "ESP_ERR_INVALID_ARG";
+    case ESP_ERR_ESPNOW_NOT_INIT: return "ESP_ERR_ESPNOW_NOT_INIT";
+    case ESP_ERR_ESPNOW_FULL: return "ESP_ERR_ESPNOW_FULL";
+    case ESP_ERR_ESPNOW_NOT_FOUND: return "ESP_ERR_ESPNOW_NOT_FOUND";
+    case ESP_ERR_ESPNOW_EXIST: return "ESP_ERR_ESPNOW_EXIST";
+    default: return "UNKNOWN_ERROR";
+    }
+}
+
+void host_set_mac(const uint8_t mac[6])
+{
+    memcpy(station_mac, mac, sizeof(station_mac));
+}
+
+esp_err_t esp_read_mac(uint8_t *mac, esp_mac_type_t type)
+{
+    (void)type;
+    memcpy(mac, station_mac, sizeof(station_mac));
+    return ESP_OK;
+}
+
+void host_set_time_us(int64_t time_us)
+{
+    fixed_time_us = time_us;
+}
+
+int64_t esp_timer_get_time(void)
+{
+    if (fixed_time_us >= 0) {
+        return fixed_time_us;
+    }
+    struct timespec now;
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    return (int64_t)now.tv_sec * 1000000 + now.tv_nsec / 1000;
+}
+
+uint32_t esp_get_free_heap_size(void)
+{
+    return HOST_FREE_HEAP;
+}
+
+uint32_t esp_random(void)
+{
+    static uint32_t state = 0x2545f491;
+    state ^= state << 13;
+    state ^= state >> 17;
+    state ^= state << 5;
+    return state;
+}
+
+// ESP-NOW
+
+esp_err_t esp_now_init(void)
+{
+    espnow_ready = true;
+    peer_total = 0;
+    return ESP_OK;
+}
+
+esp_err_t esp_now_deinit(void)
+{
+    espnow_ready = false;
+    peer_total = 0;
+    return ESP_OK;
+}
+
+esp_err_t esp_now_register_recv_cb(esp_now_recv_cb_t cb)
+{
+    recv_cb = cb;
+    return ESP_OK;
+}
+
+esp_err_t esp_now_unregister_recv_cb(void)
+{
+    recv_cb = NULL;
+    return ESP_OK;
+}
+
+esp_err_t esp_now_register_send_cb(esp_now_send_cb_t cb)
+{
+    send_cb = cb;
+    return ESP_OK;
+}
+
+esp_err_t esp_now_unregister_send_cb(void)
+{
+    send_cb = NULL;
+    return ESP_OK;
+}
+
+esp_err_t esp_now_send(const uint8_t *peer_addr, const uint8_t *data, size_t len)
+{
+    if (!espnow_ready) {
+        return ESP_ERR_ESPNOW_NOT_INIT;
+    }
+    if (len > sizeof(last_frame.data)) {
+        return ESP_ERR_ESPNOW_ARG;
+    }
+    memcpy(last_frame.dest, peer_addr, ESP_NOW_ETH_ALEN);
+    memcpy(last_frame.data, data, len);
+    last_frame.len = len;
+    frames_sent++;
+    if (send_hook) {
+        send_hook(&last_frame);
+    }
+    if (send_cb) {
+        // The radio reports back from the Wi-Fi task; here every send succeeds at once
+        esp_now_send_info_t info = {.src_addr = station_mac, .des_addr = last_frame.dest};
+        send_cb(&info, ESP_NOW_SEND_SUCCESS);
+    }
+    return ESP_OK;
+}
+
+static int find_peer(const uint8_t *peer_addr)
+{
+    for (int i = 0; i < peer_total; i++) {
+        if (memcmp(peer_table[i], peer_addr, ESP_NOW_ETH_ALEN) == 0) {
+            return i;
+        }
+    }
+    return -1;
+}
+
+esp_err_t esp_now_add_peer(const esp_now_peer_info_t *peer)
+{
+    if (find_peer(peer->peer_addr) >= 0) {
+        return ESP_ERR_ESPNOW_EXIST;
+    }
+    if (peer_total >= HOST_MAX_PEERS) {
+        return ESP_ERR_ESPNOW_FULL;
+    }
+    memcpy(peer_table[peer_total++], peer->peer_addr, ESP_NOW_ETH_ALEN);
+    return ESP_OK;
+}
+
+esp_err_t esp_now_del_peer(const uint8_t *peer_addr)
+{
+    int index = find_peer(peer_addr);
+    if (index < 0) {
+        return ESP_ERR_ESPNOW_NOT_FOUND;
+    }
+    memmove(peer_table[index], peer_table[index + 1], (size_t)(peer_total - index - 1) * ESP_NOW_ETH_ALEN);
+    peer_total--;
+    return ESP_OK;
+}
+
+bool esp_now_is_peer_exist(const uint8_t *peer_addr)
+{
+    return find_peer(peer_addr) >= 0;
+}
+
+void host_receive(const uint8_t src[6], const void *data, int len)
+{
+    if (!recv_cb) {
+        return;
+    }
+    uint8_t src_addr[ESP_NOW_ETH_ALEN];
+    memcpy(src_addr, src, sizeof(src_addr));
+    esp_now_recv_info_t info = {.src_addr = src_addr, .des_addr = station_mac, .rx_ctrl = NULL};
+    recv_cb(&info, data, len);
+}
+
+size_t host_sent_count(void)
+{
+    return frames_sent;
+}
+
+const host_frame_t *host_last_sent(void)
+{
+    return frames_sent ? &last_frame : NULL;
+}
+
+void host_reset_sent(void)
+{
+    frames_sent = 0;
+    last_frame.len = 0;
+}
+
+void host_set_send_hook(host_send_hook_t hook)
+{
+    send_hook = hook;
+}
+
+// FreeRTOS tasks
+
+BaseType_t xTaskCreatePinnedToCore(TaskFunction_t task, const char *name, uint32_t stack_depth, void *parameters,
+                                   UBaseType_t priority, TaskHandle_t *handle, BaseType_t core_id)
+{
+    (void)task; (void)name; (void)stack_depth; (void)parameters; (void)priority; (void)core_id;
+    tasks_created++;
+    if (handle) {
+        *handle = (TaskHandle_t)(intptr_t)tasks_created;
+    }
+    return pdPASS;
+}
+
+void vTaskDelete(TaskHandle_t task)
+{
+    (void)task;
+    tasks_created--;
+}
+
+void vTaskDelay(TickType_t ticks)
+{
+    usleep((useconds_t)ticks * 1000);
+}
+
+int host_task_count(void)
+{
+    return tasks_created;
+}
+
+// FreeRTOS semaphores: a counting semaphore capped at one covers both the
+// mutex (starts given) and the binary semaphore (starts taken)
+
+struct host_semaphore {
+    pthread_mutex_t lock;
+    pthread_cond_t changed;
+    int count;
+};
+
+static SemaphoreHandle_t semaphore_create(int initial)
+{
+    SemaphoreHandle_t semaphore = calloc(1, sizeof(*semaphore));
+    if (!semaphore) {
+        return NULL;
+    }
+    pthread_mutex_init(&semaphore->lock, NULL);
+    pthread_cond_init(&semaphore->changed, NULL);
+    semaphore->count = initial;
+    return semaphore;
+}
+
+SemaphoreHandle_t xSemaphoreCreateMutex(void)
+{
+    return semaphore_create(1);
+}
+
+SemaphoreHandle_t xSemaphoreCreateBinary(void)
+{
+    return semaphore_create(0);
+}
+
+BaseType_t xSemaphoreTake(SemaphoreHandle_t semaphore, TickType_t ticks)
+{
+    pthread_mutex_lock(&semaphore->lock);
+    if (semaphore->count == 0 && ticks != 0) {
+        if (ticks == portMAX_DELAY) {
+            while (semaphore->count == 0) {
+                pthread_cond_wait(&semaphore->changed, &semaphore->lock);
+            }
+        } else {
+            struct timespec deadline;
+            clock_gettime(CLOCK_REALTIME, &deadline);
+            deadline.tv_sec += ticks / 1000;
+            deadline.tv_nsec += (long)(ticks % 1000) * 1000000;
+            if (deadline.tv_nsec >= 1000000000) {
+                deadline.tv_sec++;
+                deadline.tv_nsec -= 1000000000;
+            }
+            while (semaphore->count == 0) {
+                if (pthread_cond_timedwait(&semaphore->changed, &semaphore->lock, &deadline) == ETIMEDOUT) {
+                    break;
+                }
+            }
+        }
+    }
+    BaseType_t taken = semaphore->count > 0 ? pdTRUE : pdFALSE;
+    if (taken) {
+        semaphore->count--;
+    }
+    pthread_mutex_unlock(&semaphore->lock);
+    return taken;
+}
+
+BaseType_t xSemaphoreGive(SemaphoreHandle_t semaphore)
+{
+    pthread_mutex_lock(&semaphore->lock);
+    BaseType_t given = semaphore->count == 0 ? pdTRUE : pdFALSE;
+    semaphore->count = 1;
+    pthread_cond_signal(&semaphore->changed);
+    pthread_mutex_unlock(&semaphore->lock);
+    return given;
+}
+
+void vSemaphoreDelete(SemaphoreHandle_t semaphore)
+{
+    if (!semaphore) {
+        return;
+    }
+    pthread_mutex_destroy(&semaphore->lock);
+    pthread_cond_destroy(&semaphore->changed);
+    free(semaphore);
+}
@@ -0,0 +1,41 @@
+// Hooks the host tests and benchmarks use to drive the ESP-IDF shims
+#pragma once
+
+#include <stdbool.h>
+#include <stddef.h>
+#include <stdint.h>
+
+#define HOST_MAX_FRAME 256
+
+// Log level for ESP_LOGx (ESP_LOG_NONE by default)
+extern int host_log_level;
+void host_log(char level, const char *tag, const char *format, ...) __attribute__((format(printf, 3, 4)));
+
+// Station MAC returned by esp_read_mac
+void host_set_mac(const uint8_t mac[6]);
+
+// Time esp_timer_get_time returns from now on; negative for the real clock
+void host_set_time_us(int64_t time_us);
+
+// Deliver a frame to the registered ESP-NOW receive callback
+void host_receive(const uint8_t src[6], const void *data, int len);
+
+// Frames passed to esp_now_send since the last host_reset_sent()
+typedef struct {
+    size_t len;
+    uint8_t dest[6];
+    // Aligned so tests can read the frame as a mesh_message_t
+    _Alignas(8) uint8_t data[HOST_MAX_FRAME];
+} host_frame_t;
+
+size_t host_sent_count(void);
+const host_frame_t *host_last_sent(void);
+void host_reset_sent(void);
+
+// Called with every frame passed to esp_now_send, for models that follow
+// more than the last one; NULL to stop
+typedef void (*host_send_hook_t)(const host_frame_t *frame);
+void host_set_send_hook(host_send_hook_t hook);
+
+// Tasks created through xTaskCreatePinnedToCore (they never run)
+int host_task_count(void);
@@ -0,0 +1,1362 @@
+// Host tests and receive-path micro-benchmarks for the mesh_now component.
+//
+// Built by scripts/host_test.py against the shims in stubs/. mesh_now.c is
+// included directly so the tests can reset its tables and the benchmarks can
+// set up the seen-ID and pending-ACK state they measure.
+//
+//   mesh_now_host [--tests] [--bench] [--models] [--filter NAME] [--iterations N] [--repeat N] [--verbose]
+//
+// Output is one line per result, read by the runner:
+//   ok <test> | FAIL <test>: <reason> | bench <name> <ns per op> <iterations> | model <name> <key> <value>
+
+#include "../src/mesh_now.c"
+#include "message_queue.h"
+#include "mesh_metrics.h"
+#include "message_json.h"
+#include "host_shims.h"
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+static const uint8_t local_mac[6] = {0x24, 0x0a, 0xc4, 0x00, 0x00, 0x01};
+static const uint8_t remote_mac[6] = {0x24, 0x0a, 0xc4, 0x00, 0x00, 0x02};
+static const uint8_t other_mac[6] = {0x24, 0x0a, 0xc4, 0x00, 0x00, 0x03};
+static const uint8_t test_key[32] = "mesh-now-host-test-key-32-bytes";
+
+static int delivered = 0;
+static mesh_message_t last_delivered;
+static const char *failure = NULL;
+static char failure_text[160];
+static uint32_t fresh_id = 1000000;
+
+#define CHECK(cond, ...) \
+    do { \
+        if (!(cond)) { \
+            snprintf(failure_text, sizeof(failure_text), __VA_ARGS__); \
+            failure = failure_text; \
+            return; \
+        } \
+    } while (0)
+
+static void capture_message(const mesh_message_t *message)
+{
+    delivered++;
+    last_delivered = *message;
+}
+
+static void reset_mesh(void)
+{
+    memset(seen_message_ids, 0, sizeof(seen_message_ids));
+    seen_message_count = 0;
+    memset(pending_messages, 0, sizeof(pending_messages));
+    memset(peers, 0, sizeof(peers));
+    peer_count = 0;
+    encryption_enabled = false;
+    encryption_key_len = 0;
+    mesh_groups_reset();
+    mesh_presence_reset();
+    mesh_store_init(&store);
+    host_set_time_us(-1);
+    host_set_send_hook(NULL);
+    delivered = 0;
+    receive_callback = capture_message;
+    host_set_mac(local_mac);
+    host_reset_sent();
+    mesh_metrics_reset();
+}
+
+static mesh_message_t make_message(uint8_t type, uint32_t id, const uint8_t *sender, const uint8_t *target,
+                                   uint8_t hops)
+{
+    mesh_message_t msg;
+    memset(&msg, 0, sizeof(msg));
+    msg.type = type;
+    msg.message_id = id;
+    msg.hop_count = hops;
+    memcpy(msg.sender_mac, sender, ESP_NOW_ETH_ALEN);
+    if (target) {
+        memcpy(msg.target_mac, target, ESP_NOW_ETH_ALEN);
+    }
+    snprintf(msg.message, sizeof(msg.message), "hello from the host build, message %u, padded to a typical chat length",
+             (unsigned)id);
+    return msg;
+}
+
+static void receive(const mesh_message_t *msg)
+{
+    host_receive(msg->sender_mac, msg, sizeof(*msg));
+}
+
+static const mesh_message_t *last_sent_message(void)
+{
+    const host_frame_t *frame = host_last_sent();
+    return frame && frame->len == sizeof(mesh_message_t) ? (const mesh_message_t *)frame->data : NULL;
+}
+
+// Tests
+
+static void test_duplicate_dropped(void)
+{
+    mesh_message_t msg = make_message(MSG_TYPE_CHAT, 42, remote_mac, NULL, 0);
+    receive(&msg);
+    receive(&msg);
+    CHECK(delivered == 1, "delivered %d times", delivered);
+}
+
+static void test_seen_ids_evict_oldest(void)
+{
+    for (uint32_t id = 1; id <= MAX_SEEN_MESSAGE_IDS + 1; id++) {
+        mesh_message_t msg = make_message(MSG_TYPE_CHAT, id, remote_mac, NULL, 0);
+        receive(&msg);
+    }
+    mesh_message_t oldest = make_message(MSG_TYPE_CHAT, 1, remote_mac, NULL, 0);
+    receive(&oldest);
+    CHECK(delivered == MAX_SEEN_MESSAGE_IDS + 2, "evicted id not redelivered (%d deliveries)", delivered);
+}
+
+static void test_invalid_length_ignored(void)
+{
+    mesh_message_t msg = make_message(MSG_TYPE_CHAT, 7, remote_mac, NULL, 0);
+    host_receive(remote_mac, &msg, sizeof(msg) - 1);
+    CHECK(delivered == 0, "short frame delivered");
+}
+
+static void test_encrypted_roundtrip(void)
+{
+    CHECK(mesh_now_set_encryption_key(test_key, sizeof(test_key)) == ESP_OK, "key rejected");
+    CHECK(mesh_now_send_broadcast("secret") == ESP_OK, "send failed");
+    const mesh_message_t *sent = last_sent_message();
+    CHECK(sent != NULL, "nothing sent");
+    CHECK(sent->flags & MSG_FLAG_ENCRYPTED, "payload not marked encrypted");
+    CHECK(strcmp(sent->message, "secret") != 0, "payload sent in clear");
+
+    mesh_message_t echoed = *sent;
+    memcpy(echoed.sender_mac, remote_mac, ESP_NOW_ETH_ALEN);
+    receive(&echoed);
+    CHECK(delivered == 1 && strcmp(last_delivered.message, "secret") == 0, "decrypted to '%.20s'",
+          last_delivered.message);
+}
+
+static void test_chat_forwarded_with_one_hop_less(void)
+{
+    mesh_message_t msg = make_message(MSG_TYPE_CHAT, 50, remote_mac, NULL, 3);
+    receive(&msg);
+    const mesh_message_t *sent = last_sent_message();
+    CHECK(delivered == 1, "not delivered");
+    CHECK(sent && sent->hop_count == 2 && sent->message_id == 50, "not forwarded with hop_count 2");
+}
+
+static void test_last_hop_not_forwarded(void)
+{
+    mesh_message_t msg = make_message(MSG_TYPE_CHAT, 51, remote_mac, NULL, 1);
+    receive(&msg);
+    CHECK(host_sent_count() == 0, "forwarded a message on its last hop");
+}
+
+static void test_direct_for_other_forwarded(void)
+{
+    mesh_message_t msg = make_message(MSG_TYPE_DIRECT, 60, remote_mac, other_mac, 3);
+    receive(&msg);
+    const mesh_message_t *sent = last_sent_message();
+    CHECK(delivered == 0, "delivered a message for another node");
+    CHECK(sent && sent->type == MSG_TYPE_DIRECT && sent->hop_count == 2, "not forwarded");
+}
+
+static void test_direct_for_us_acked(void)
+{
+    mesh_message_t msg = make_message(MSG_TYPE_DIRECT, 61, remote_mac, local_mac, 3);
+    receive(&msg);
+    const mesh_message_t *sent = last_sent_message();
+    CHECK(delivered == 1, "not delivered");
+    CHECK(sent && sent->type == MSG_TYPE_ACK && sent->message_id == 61, "no ACK sent");
+    CHECK(memcmp(sent->target_mac, remote_mac, ESP_NOW_ETH_ALEN) == 0, "ACK not addressed to the sender");
+}
+
+static void test_ack_releases_pending(void)
+{
+    CHECK(mesh_now_send_direct(remote_mac, "ping") == ESP_OK, "send failed");
+    uint32_t id = last_sent_message()->message_id;
+    CHECK(mesh_now_find_pending(id) >= 0, "direct message not pending");
+
+    mesh_message_t ack = make_message(MSG_TYPE_ACK, id, remote_mac, local_mac, DEFAULT_ROUTE_TTL);
+    receive(&ack);
+    CHECK(mesh_now_find_pending(id) < 0, "ACK did not release the pending message");
+}
+
+static void test_pending_slots_exhaust(void)
+{
+    for (int i = 0; i < MAX_PENDING_MESSAGES; i++) {
+        CHECK(mesh_now_send_direct(remote_mac, "fill") == ESP_OK, "send %d failed", i);
+    }
+    CHECK(mesh_now_send_direct(remote_mac, "one too many") == ESP_ERR_NO_MEM, "17th pending message accepted");
+}
+
+static void test_group_filter(void)
+{
+    mesh_now_set_group(3);
+    mesh_message_t msg = make_message(MSG_TYPE_GROUP, 70, remote_mac, NULL, 3);
+    msg.group_id = 7;
+    receive(&msg);
+    CHECK(delivered == 0, "delivered another group's message");
+    CHECK(host_sent_count() == 1, "other group's message not forwarded");
+
+    mesh_now_set_group(7);
+    msg.message_id = 71;
+    receive(&msg);
+    CHECK(delivered == 1, "own group's message not delivered");
+}
+
+// A beacon advertising group level0 (or -1 for none) at distance 0 and level1 at distance 1
+static mesh_message_t group_beacon(const uint8_t *sender, int level0, int level1)
+{
+    mesh_message_t beacon = make_message(MSG_TYPE_BEACON, 0, sender, NULL, 0);
+    memset(beacon.message, 0, sizeof(beacon.message));
+    strcpy(beacon.message, "MESH-NOW-BEACON");
+    uint8_t *payload = (uint8_t *)beacon.message;
+    payload[MESH_GROUP_BEACON_OFFSET] = MESH_GROUP_BEACON_VERSION;
+    mesh_group_set_t *levels = (mesh_group_set_t *)&payload[MESH_GROUP_BEACON_OFFSET + 1];
+    if (level0 >= 0) {
+        levels[0].bits[level0 / 8] |= 1u << (level0 % 8);
+    }
+    if (level1 >= 0) {
+        levels[1].bits[level1 / 8] |= 1u << (level1 % 8);
+    }
+    return beacon;
+}
+
+static void test_group_forward_skipped_without_subscribers(void)
+{
+    mesh_message_t beacon = group_beacon(remote_mac, 1, 2);
+    receive(&beacon);
+    mesh_message_t msg = make_message(MSG_TYPE_GROUP, 90, other_mac, NULL, 3);
+    msg.group_id = 7;
+    receive(&msg);
+    CHECK(host_sent_count() == 0, "forwarded with no subscriber in range");
+
+    mesh_metrics_snapshot_t snap;
+    mesh_metrics_snapshot(&snap);
+    CHECK(snap.counters[MESH_METRIC_GROUP_FORWARDS_SKIPPED] == 1, "skipped %u",
+          snap.counters[MESH_METRIC_GROUP_FORWARDS_SKIPPED]);
+}
+
+static void test_group_forward_within_reach(void)
+{
+    // A subscriber two hops away, behind remote
+    mesh_message_t beacon = group_beacon(remote_mac, -1, 7);
+    receive(&beacon);
+    mesh_message_t msg = make_message(MSG_TYPE_GROUP, 91, other_mac, NULL, 3);
+    msg.group_id = 7;
+    receive(&msg);
+    CHECK(host_sent_count() == 1, "not forwarded toward a subscriber two hops away");
+
+    // With two hops left the forward only reaches remote itself
+    msg.message_id = 92;
+    msg.hop_count = 2;
+    receive(&msg);
+    CHECK(host_sent_count() == 1, "forwarded beyond its reach");
+}
+
+static void test_group_legacy_neighbour_floods(void)
+{
+    mesh_message_t beacon = group_beacon(remote_mac, -1, -1);
+    receive(&beacon);
+    mesh_message_t legacy = make_message(MSG_TYPE_BEACON, 0, other_mac, NULL, 0);
+    memset(legacy.message, 0, sizeof(legacy.message));
+    strcpy(legacy.message, "MESH-NOW-BEACON");
+    receive(&legacy);
+
+    mesh_message_t msg = make_message(MSG_TYPE_GROUP, 93, remote_mac, NULL, 3);
+    msg.group_id = 7;
+    receive(&msg);
+    CHECK(host_sent_count() == 1, "not forwarded with a neighbour of unknown groups");
+}
+
+static void test_group_neighbour_expires(void)
+{
+    mesh_message_t beacon = group_beacon(remote_mac, -1, -1);
+    mesh_groups_note_beacon(remote_mac, (const uint8_t *)beacon.message, sizeof(beacon.message), 1000);
+    CHECK(!mesh_groups_should_forward(7, 3, 2000), "forwarded with only an uninterested neighbour");
+    CHECK(mesh_groups_neighbour_count(1000 + MESH_GROUP_NEIGHBOUR_TIMEOUT_MS) == 1, "neighbour expired early");
+    // Once nothing is known the node floods again
+    CHECK(mesh_groups_should_forward(7, 3, 1001 + MESH_GROUP_NEIGHBOUR_TIMEOUT_MS), "stale neighbour still trusted");
+}
+
+static void test_group_beacon_levels(void)
+{
+    mesh_groups_join(5);
+    mesh_message_t heard = group_beacon(remote_mac, 9, 11);
+    mesh_groups_note_beacon(remote_mac, (const uint8_t *)heard.message, sizeof(heard.message), 0);
+
+    uint8_t payload[MAX_MESH_MESSAGE_LEN] = {0};
+    mesh_groups_write_beacon(payload, sizeof(payload), 0);
+    const mesh_group_set_t *levels = (const mesh_group_set_t *)&payload[MESH_GROUP_BEACON_OFFSET + 1];
+    CHECK(payload[MESH_GROUP_BEACON_OFFSET] == MESH_GROUP_BEACON_VERSION, "no version byte");
+    CHECK(levels[0].bits[0] == 0x21 && levels[0].bits[1] == 0, "level 0 is 0x%02x", levels[0].bits[0]);
+    CHECK(levels[1].bits[1] == 0x02 && levels[1].bits[0] == 0, "level 1 is 0x%02x", levels[1].bits[1]);
+
+    // Behind a neighbour with older firmware there could be any group
+    mesh_groups_note_beacon(other_mac, payload, MESH_GROUP_BEACON_OFFSET, 0);
+    mesh_groups_write_beacon(payload, sizeof(payload), 0);
+    CHECK(levels[1].bits[MESH_GROUP_SET_BYTES - 1] == 0xFF, "legacy neighbour not advertised as every group");
+}
+
+static void test_group_several_subscriptions(void)
+{
+    mesh_groups_join(3);
+    mesh_groups_join(7);
+    uint8_t groups[4];
+    CHECK(mesh_groups_list(groups, 4) == 3 && groups[1] == 3 && groups[2] == 7, "groups not listed in order");
+
+    mesh_message_t msg = make_message(MSG_TYPE_GROUP, 94, remote_mac, NULL, 0);
+    msg.group_id = 3;
+    receive(&msg);
+    msg.message_id = 95;
+    msg.group_id = 7;
+    receive(&msg);
+    CHECK(delivered == 2, "delivered %d of 2", delivered);
+    CHECK(last_delivered.group_id == 7, "last delivered group %u", last_delivered.group_id);
+
+    mesh_groups_leave(3);
+    msg.message_id = 96;
+    msg.group_id = 3;
+    receive(&msg);
+    CHECK(delivered == 2, "delivered a group that was left");
+}
+
+static void test_relay_keeps_origin(void)
+{
+    CHECK(mesh_now_send_relay(other_mac, 4242, "from another island") == ESP_OK, "relay failed");
+    const mesh_message_t *sent = last_sent_message();
+    CHECK(sent != NULL, "nothing sent");
+    CHECK(sent->type == MSG_TYPE_CHAT && (sent->flags & MSG_FLAG_RELAYED), "type %d flags 0x%02x", sent->type,
+          sent->flags);
+    CHECK(sent->message_id == 4242 && memcmp(sent->sender_mac, other_mac, ESP_NOW_ETH_ALEN) == 0,
+          "origin not kept (id %u)", (unsigned)sent->message_id);
+    CHECK(delivered == 1, "relayed message not delivered locally");
+    CHECK(mesh_now_send_relay(other_mac, 4242, "again") == ESP_ERR_INVALID_STATE, "relayed the same id twice");
+
+    // The island's own echo of the relayed frame is a duplicate here
+    mesh_message_t echo = *sent;
+    receive(&echo);
+    CHECK(delivered == 1, "echo of a relayed message delivered");
+}
+
+static void test_relay_encrypted_delivered_in_clear(void)
+{
+    CHECK(mesh_now_set_encryption_key(test_key, sizeof(test_key)) == ESP_OK, "key rejected");
+    CHECK(mesh_now_send_relay(other_mac, 4243, "from another island") == ESP_OK, "relay failed");
+    const mesh_message_t *sent = last_sent_message();
+    CHECK(sent && (sent->flags & MSG_FLAG_ENCRYPTED) && strcmp(sent->message, "from another island") != 0,
+          "relayed in clear");
+    CHECK(delivered == 1 && strcmp(last_delivered.message, "from another island") == 0,
+          "delivered locally as '%.20s'", last_delivered.message);
+}
+
+static void test_relayed_sender_not_peer(void)
+{
+    mesh_message_t msg = make_message(MSG_TYPE_CHAT, 77, other_mac, NULL, 0);
+    msg.flags = MSG_FLAG_RELAYED;
+    receive(&msg);
+    CHECK(delivered == 1, "relayed message not delivered");
+    CHECK(mesh_now_get_peer_count() == 0, "relayed sender added as a peer");
+}
+
+static void at_ms(int64_t ms)
+{
+    host_set_time_us(ms * 1000);
+}
+
+// Presence frames the presence tick sends at ms
+static size_t presence_tick_at(int64_t ms)
+{
+    size_t before = host_sent_count();
+    at_ms(ms);
+    mesh_now_presence_tick(ms);
+    return host_sent_count() - before;
+}
+
+static void test_presence_debounced(void)
+{
+    at_ms(1000);
+    mesh_now_send_presence("away");
+    CHECK(host_sent_count() == 0, "presence sent before the debounce window closed");
+    at_ms(1200);
+    mesh_now_send_presence("busy");
+    CHECK(presence_tick_at(1400) == 0, "sent inside the debounce window");
+    CHECK(presence_tick_at(1500) == 1, "not sent after the debounce window");
+    const mesh_message_t *sent = last_sent_message();
+    CHECK(sent->type == MSG_TYPE_PRESENCE && strcmp(sent->message, "busy") == 0, "sent type %d '%s'", sent->type,
+          sent->message);
+    CHECK(presence_tick_at(2000) == 0, "sent again without a change");
+    // Nodes out of beacon range hear the status again before it times out there
+    CHECK(presence_tick_at(1500 + MESH_PRESENCE_REFRESH_MS) == 1, "status not refreshed");
+}
+
+static void test_presence_flap_sends_nothing(void)
+{
+    at_ms(0);
+    mesh_now_send_presence("online");
+    CHECK(presence_tick_at(500) == 1, "first status not sent");
+    at_ms(600);
+    mesh_now_send_presence("away");
+    at_ms(700);
+    mesh_now_send_presence("online");
+    CHECK(presence_tick_at(1500) == 0, "sent a status that flapped back");
+}
+
+static void test_typing_merged_and_refreshed(void)
+{
+    for (int64_t ms = 0; ms < 400; ms += 100) {
+        at_ms(ms);
+        mesh_now_send_typing(remote_mac, true);
+        mesh_now_send_typing(other_mac, true);
+    }
+    CHECK(presence_tick_at(500) == 1, "typing not sent");
+    const uint8_t *payload = (const uint8_t *)last_sent_message()->message;
+    CHECK(payload[MESH_PRESENCE_TYPING_OFFSET] == MESH_PRESENCE_FRAME_VERSION, "no version byte");
+    CHECK(payload[MESH_PRESENCE_TYPING_OFFSET + 1] == 2, "%u targets in the frame", payload[MESH_PRESENCE_TYPING_OFFSET + 1]);
+
+    // Still typing to one of them: repeated at the refresh interval
+    at_ms(2000);
+    mesh_now_send_typing(remote_mac, true);
+    CHECK(presence_tick_at(2000) == 0, "refreshed early");
+    CHECK(presence_tick_at(2500) == 1, "typing not refreshed");
+    payload = (const uint8_t *)last_sent_message()->message;
+    CHECK(payload[MESH_PRESENCE_TYPING_OFFSET + 1] == 1, "idle target still in the frame");
+
+    // Stopping sends nothing; receivers time it out
+    at_ms(2600);
+    mesh_now_send_typing(remote_mac, false);
+    CHECK(presence_tick_at(5000) == 0 && presence_tick_at(10000) == 0, "sent a frame for stopping");
+}
+
+static void test_typing_expires_at_receiver(void)
+{
+    mesh_message_t msg = make_message(MSG_TYPE_PRESENCE, 120, remote_mac, NULL, 2);
+    memset(msg.message, 0, sizeof(msg.message));
+    strcpy(msg.message, "online");
+    uint8_t *payload = (uint8_t *)msg.message;
+    payload[MESH_PRESENCE_TYPING_OFFSET] = MESH_PRESENCE_FRAME_VERSION;
+    payload[MESH_PRESENCE_TYPING_OFFSET + 1] = 2;
+    memcpy(&payload[MESH_PRESENCE_TYPING_OFFSET + 2], other_mac, ESP_NOW_ETH_ALEN);
+    memcpy(&payload[MESH_PRESENCE_TYPING_OFFSET + 2 + ESP_NOW_ETH_ALEN], local_mac, ESP_NOW_ETH_ALEN);
+    at_ms(1000);
+    receive(&msg);
+    CHECK(delivered == 0, "presence delivered as a message");
+    CHECK(host_sent_count() == 1, "presence not forwarded");
+
+    mesh_presence_entry_t entries[2];
+    CHECK(mesh_presence_list(entries, 2, 1000) == 1, "sender not listed");
+    CHECK(entries[0].typing && strcmp(entries[0].status, "online") == 0, "typing %d status '%s'", entries[0].typing,
+          entries[0].status);
+    CHECK(mesh_presence_list(entries, 2, 1000 + MESH_TYPING_TIMEOUT_MS) == 1 && !entries[0].typing,
+          "typing did not time out");
+    CHECK(mesh_presence_list(entries, 2, 1000 + MESH_PRESENCE_TIMEOUT_MS) == 0, "status did not time out");
+}
+
+static void test_presence_in_beacon(void)
+{
+    mesh_presence_set_status("on call", 0);
+    uint8_t payload[MAX_MESH_MESSAGE_LEN] = {0};
+    mesh_groups_write_beacon(payload, sizeof(payload), 0);
+    mesh_presence_write_beacon(payload, sizeof(payload));
+    mesh_presence_note_beacon(remote_mac, payload, sizeof(payload), 0);
+
+    mesh_presence_entry_t entry;
+    CHECK(mesh_presence_list(&entry, 1, 100) == 1 && strcmp(entry.status, "on call") == 0, "beacon status not noted");
+    CHECK(mesh_presence_list(&entry, 1, MESH_PRESENCE_BEACON_TIMEOUT_MS) == 0, "beacon status did not time out");
+
+    // A beacon without group levels has no status either
+    mesh_presence_note_beacon(other_mac, payload, MESH_GROUP_BEACON_OFFSET, 0);
+    CHECK(mesh_presence_list(&entry, 1, 100) == 1 && memcmp(entry.mac, remote_mac, ESP_NOW_ETH_ALEN) == 0,
+          "status read from a legacy beacon");
+}
+
+static void test_legacy_typing_frame(void)
+{
+    mesh_message_t msg = make_message(MSG_TYPE_TYPING, 130, remote_mac, local_mac, 0);
+    strcpy(msg.message, "typing");
+    at_ms(0);
+    receive(&msg);
+    mesh_presence_entry_t entry;
+    CHECK(mesh_presence_list(&entry, 1, 0) == 1 && entry.typing, "typing frame not noted");
+    msg.message_id = 131;
+    strcpy(msg.message, "stopped");
+    receive(&msg);
+    CHECK(mesh_presence_list(&entry, 1, 0) == 0, "stopped frame not noted");
+}
+
+static mesh_message_t beacon_from(const uint8_t *sender)
+{
+    mesh_message_t beacon = make_message(MSG_TYPE_BEACON, 0, sender, NULL, 0);
+    memset(beacon.message, 0, sizeof(beacon.message));
+    strcpy(beacon.message, "MESH-NOW-BEACON");
+    return beacon;
+}
+
+static void test_store_holds_relayed_direct(void)
+{
+    mesh_message_t msg = make_message(MSG_TYPE_DIRECT, 140, remote_mac, other_mac, 3);
+    msg.flags = MSG_FLAG_REQUIRES_ACK;
+    at_ms(1000);
+    receive(&msg);
+    CHECK(mesh_store_count(&store) == 1, "relayed direct message not held");
+
+    // The target beacons: the copy goes to it as a single hop
+    host_reset_sent();
+    mesh_message_t beacon = beacon_from(other_mac);
+    receive(&beacon);
+    const mesh_message_t *sent = last_sent_message();
+    CHECK(host_sent_count() == 1 && sent->type == MSG_TYPE_DIRECT && sent->message_id == 140, "not flushed");
+    CHECK(sent->hop_count == 1, "flushed with %u hops", sent->hop_count);
+    CHECK(memcmp(sent->sender_mac, remote_mac, ESP_NOW_ETH_ALEN) == 0, "flush lost the original sender");
+
+    // Not again on the next beacon, but once the retry interval is up
+    at_ms(1000 + MESH_STORE_FLUSH_RETRY_MS / 2);
+    receive(&beacon);
+    CHECK(host_sent_count() == 1, "flushed again before the retry interval");
+    at_ms(1000 + MESH_STORE_FLUSH_RETRY_MS);
+    receive(&beacon);
+    CHECK(host_sent_count() == 2, "not flushed again after the retry interval");
+
+    // The target's ACK on its way to the sender clears the copy
+    mesh_message_t ack = make_message(MSG_TYPE_ACK, 140, other_mac, remote_mac, DEFAULT_ROUTE_TTL);
+    receive(&ack);
+    CHECK(mesh_store_count(&store) == 0, "ACK did not clear the held copy");
+}
+
+static void test_store_skips_last_hop(void)
+{
+    // A flush another node sends its neighbour, overheard here
+    mesh_message_t msg = make_message(MSG_TYPE_DIRECT, 141, remote_mac, other_mac, 1);
+    msg.flags = MSG_FLAG_REQUIRES_ACK;
+    receive(&msg);
+    CHECK(mesh_store_count(&store) == 0, "held a frame on its last hop");
+    CHECK(host_sent_count() == 0, "forwarded a frame on its last hop");
+}
+
+static void test_store_encrypted_copy(void)
+{
+    CHECK(mesh_now_set_encryption_key(test_key, sizeof(test_key)) == ESP_OK, "key rejected");
+    mesh_message_t msg = make_message(MSG_TYPE_DIRECT, 142, remote_mac, other_mac, 3);
+    msg.flags = MSG_FLAG_REQUIRES_ACK;
+    mesh_message_t wire = msg;
+    mesh_now_maybe_encrypt_message(&wire);
+    receive(&wire);
+    const mesh_message_t *sent = last_sent_message();
+    CHECK(sent && (sent->flags & MSG_FLAG_ENCRYPTED) && memcmp(sent->message, msg.message, sizeof(msg.message)) != 0,
+          "forwarded in clear");
+
+    mesh_message_t beacon = beacon_from(other_mac);
+    receive(&beacon);
+    sent = last_sent_message();
+    CHECK(sent->type == MSG_TYPE_DIRECT && (sent->flags & MSG_FLAG_ENCRYPTED), "flushed in clear");
+}
+
+static void test_store_origin_holds_after_retries(void)
+{
+    at_ms(0);
+    CHECK(mesh_now_send_direct(remote_mac, "are you there") == ESP_OK, "send failed");
+    uint32_t id = last_sent_message()->message_id;
+    for (int64_t ms = 500; ms <= 4 * RETRANSMIT_TIMEOUT_MS; ms += 500) {
+        at_ms(ms);
+        mesh_now_retransmit_tick(ms);
+    }
+    CHECK(mesh_now_find_pending(id) < 0, "still pending after the last retry");
+    CHECK(mesh_store_count(&store) == 1, "given up rather than held");
+
+    host_reset_sent();
+    at_ms(30000);
+    mesh_message_t beacon = beacon_from(remote_mac);
+    receive(&beacon);
+    const mesh_message_t *sent = last_sent_message();
+    CHECK(sent && sent->message_id == id && strcmp(sent->message, "are you there") == 0, "not flushed to the target");
+}
+
+static void test_store_evicts(void)
+{
+    for (uint32_t id = 1; id <= MESH_STORE_MAX_PER_TARGET; id++) {
+        mesh_message_t msg = make_message(MSG_TYPE_DIRECT, id, remote_mac, other_mac, 3);
+        CHECK(!mesh_store_put(&store, &msg, id), "evicted with room to spare");
+    }
+    // One target never gets more than its share: its own oldest goes
+    mesh_message_t msg = make_message(MSG_TYPE_DIRECT, 100, remote_mac, other_mac, 3);
+    CHECK(mesh_store_put(&store, &msg, 100), "per-target limit not applied");
+    CHECK(mesh_store_count(&store) == MESH_STORE_MAX_PER_TARGET && !mesh_store_ack(&store, 1),
+          "target's oldest copy kept");
+
+    uint8_t target[6] = {0x24, 0x0a, 0xc4, 0x00, 0x01, 0x00};
+    for (uint32_t id = 200; mesh_store_count(&store) < MESH_STORE_MAX_ENTRIES; id++) {
+        target[5] = (uint8_t)id;
+        msg = make_message(MSG_TYPE_DIRECT, id, remote_mac, target, 3);
+        mesh_store_put(&store, &msg, id);
+    }
+    // Full: the oldest copy of all goes
+    msg = make_message(MSG_TYPE_DIRECT, 300, remote_mac, local_mac, 3);
+    CHECK(mesh_store_put(&store, &msg, 300), "full store not evicted");
+    CHECK(!mesh_store_ack(&store, 2) && mesh_store_ack(&store, 3), "oldest copy kept");
+}
+
+static void test_store_expires(void)
+{
+    mesh_message_t msg = make_message(MSG_TYPE_DIRECT, 150, remote_mac, other_mac, 3);
+    mesh_store_put(&store, &msg, 0);
+    msg = make_message(MSG_TYPE_DIRECT, 151, remote_mac, remote_mac, 3);
+    mesh_store_put(&store, &msg, 0);
+
+    // Flushed to a target that never answers
+    mesh_message_t out;
+    int64_t ms = 0;
+    for (int i = 0; i < MESH_STORE_MAX_FLUSHES; i++, ms += MESH_STORE_FLUSH_RETRY_MS) {
+        CHECK(mesh_store_take_due(&store, remote_mac, &out, ms) && out.message_id == 151, "flush %d not due", i);
+    }
+    CHECK(!mesh_store_take_due(&store, remote_mac, &out, ms), "flushed past the limit");
+    CHECK(mesh_store_expire(&store, ms) == 1 && mesh_store_count(&store) == 1, "unanswered copy kept");
+    CHECK(mesh_store_expire(&store, MESH_STORE_TTL_MS - 1) == 0, "expired before its TTL");
+    CHECK(mesh_store_expire(&store, MESH_STORE_TTL_MS) == 1, "kept past its TTL");
+}
+
+static void test_duplicate_direct_acked_again(void)
+{
+    mesh_message_t msg = make_message(MSG_TYPE_DIRECT, 160, remote_mac, local_mac, 1);
+    receive(&msg);
+    host_reset_sent();
+    // A held copy flushed after the first ACK was lost
+    receive(&msg);
+    const mesh_message_t *sent = last_sent_message();
+    CHECK(delivered == 1, "duplicate delivered");
+    CHECK(sent && sent->type == MSG_TYPE_ACK && sent->message_id == 160, "duplicate not ACKed");
+
+    host_reset_sent();
+    mesh_message_t chat = make_message(MSG_TYPE_CHAT, 161, remote_mac, NULL, 0);
+    receive(&chat);
+    receive(&chat);
+    CHECK(host_sent_count() == 0, "duplicate chat answered");
+}
+
+static void test_queue_fifo_and_drops(void)
+{
+    CHECK(message_queue_init() == ESP_OK, "init failed");
+    message_t msgs[MESSAGE_QUEUE_SIZE + 10];
+    for (size_t i = 0; i < MESSAGE_QUEUE_SIZE + 10; i++) {
+        memset(&msgs[i], 0, sizeof(msgs[i]));
+        msgs[i].timestamp = (uint32_t)i;
+    }
+    size_t accepted = message_queue_send_many(msgs, MESSAGE_QUEUE_SIZE + 10);
+    CHECK(accepted == MESSAGE_QUEUE_SIZE, "accepted %zu", accepted);
+
+    const message_t *refs[4];
+    CHECK(message_queue_peek(refs, 4, 0) == 4 && refs[0]->timestamp == 0, "peek out of order");
+    message_queue_commit(4);
+    message_t out;
+    CHECK(message_queue_receive(&out, 0) == ESP_OK && out.timestamp == 4, "receive out of order");
+
+    message_queue_stats_t stats;
+    message_queue_get_stats(&stats);
+    CHECK(stats.dropped == 10 && stats.dequeued == 5 && stats.depth == MESSAGE_QUEUE_SIZE - 5,
+          "stats dropped=%u dequeued=%u depth=%zu", (unsigned)stats.dropped, (unsigned)stats.dequeued, stats.depth);
+    message_queue_deinit();
+}
+
+static void test_queue_receive_times_out(void)
+{
+    CHECK(message_queue_init() == ESP_OK, "init failed");
+    message_t out;
+    int64_t start = esp_timer_get_time();
+    CHECK(message_queue_receive(&out, pdMS_TO_TICKS(20)) == ESP_FAIL, "received from an empty queue");
+    int64_t waited_ms = (esp_timer_get_time() - start) / 1000;
+    CHECK(waited_ms >= 15, "returned after %lld ms", (long long)waited_ms);
+    message_queue_deinit();
+}
+
+static void test_message_json_escaped(void)
+{
+    history_entry_t entry;
+    memset(&entry, 0, sizeof(entry));
+    entry.seq = 7;
+    entry.msg.message_id = 42;
+    entry.msg.timestamp = 1000;
+    memcpy(entry.msg.sender_mac, remote_mac, ESP_NOW_ETH_ALEN);
+    strcpy(entry.msg.message, "say \"hi\" \\ bye\n");
+
+    char json[MESSAGE_JSON_ENTRY_LEN];
+    message_json_entry(json, sizeof(json), &entry, false);
+    const char *expected = ",{\"seq\":7,\"id\":42,\"sender\":\"24:0a:c4:00:00:02\","
+                           "\"content\":\"say \\\"hi\\\" \\\\ bye\\u000a\",\"timestamp\":1000}";
+    CHECK(strcmp(json, expected) == 0, "wrote %.120s", json);
+
+    // Every byte escaped at its longest still fits
+    memset(entry.msg.message, 0x01, sizeof(entry.msg.message));
+    entry.msg.type = MSG_TYPE_GROUP;
+    size_t len = message_json_entry(json, sizeof(json), &entry, true);
+    const char *end = "\\u0001\",\"timestamp\":1000}";
+    CHECK(len < sizeof(json) - 1 && strcmp(json + len - strlen(end), end) == 0, "truncated: %.40s",
+          json + len - strlen(end));
+}
+
+static void test_metrics_count_receive_path(void)
+{
+    mesh_message_t msg = make_message(MSG_TYPE_CHAT, 80, remote_mac, NULL, 3);
+    receive(&msg);
+    receive(&msg);
+    host_receive(remote_mac, &msg, 3);
+    CHECK(mesh_now_send_direct(remote_mac, "ping") == ESP_OK, "send failed");
+    mesh_message_t ack = make_message(MSG_TYPE_ACK, last_sent_message()->message_id, remote_mac, local_mac, 3);
+    receive(&ack);
+
+    mesh_metrics_snapshot_t snap;
+    mesh_metrics_snapshot(&snap);
+    CHECK(snap.counters[MESH_METRIC_FRAMES_RECEIVED] == 3, "received %u", snap.counters[MESH_METRIC_FRAMES_RECEIVED]);
+    CHECK(snap.counters[MESH_METRIC_DUPLICATES] == 1, "duplicates %u", snap.counters[MESH_METRIC_DUPLICATES]);
+    CHECK(snap.counters[MESH_METRIC_FRAMES_INVALID] == 1, "invalid %u", snap.counters[MESH_METRIC_FRAMES_INVALID]);
+    CHECK(snap.counters[MESH_METRIC_FORWARDED] == 1, "forwarded %u", snap.counters[MESH_METRIC_FORWARDED]);
+    CHECK(snap.counters[MESH_METRIC_FRAMES_SENT] == 2, "sent %u", snap.counters[MESH_METRIC_FRAMES_SENT]);
+    CHECK(snap.counters[MESH_METRIC_ACKS_RECEIVED] == 1, "ACKs %u", snap.counters[MESH_METRIC_ACKS_RECEIVED]);
+
+    uint32_t acks = 0;
+    for (int b = 0; b <= MESH_METRICS_BUCKETS; b++) {
+        acks += snap.buckets[MESH_HIST_ACK_LATENCY][b];
+    }
+    // Pending messages keep millisecond send times, so an immediate ACK lands at or below 1 ms
+    CHECK(acks == 1 && snap.buckets[MESH_HIST_ACK_LATENCY][0] + snap.buckets[MESH_HIST_ACK_LATENCY][1] == 1,
+          "ACK latency above 1 ms");
+}
+
+static void test_metrics_histogram_buckets(void)
+{
+    mesh_metrics_observe_us(MESH_HIST_HTTP_SEND, 500);
+    mesh_metrics_observe_us(MESH_HIST_HTTP_SEND, 501);
+    mesh_metrics_observe_us(MESH_HIST_HTTP_SEND, 60000000);
+    mesh_metrics_observe_us(MESH_HIST_HTTP_SEND, -5);
+
+    mesh_metrics_snapshot_t snap;
+    mesh_metrics_snapshot(&snap);
+    const uint32_t *b = snap.buckets[MESH_HIST_HTTP_SEND];
+    CHECK(b[0] == 2 && b[1] == 1 && b[MESH_METRICS_BUCKETS] == 1, "buckets %u %u .. %u", b[0], b[1],
+          b[MESH_METRICS_BUCKETS]);
+    CHECK(snap.sums_us[MESH_HIST_HTTP_SEND] == 60001001, "sum %u", snap.sums_us[MESH_HIST_HTTP_SEND]);
+}
+
+typedef struct {
+    char text[16384];
+    size_t len;
+    int writes;
+} text_sink_t;
+
+static bool collect_text(const char *data, size_t len, void *ctx)
+{
+    text_sink_t *sink = ctx;
+    if (sink->len + len >= sizeof(sink->text)) {
+        return false;
+    }
+    memcpy(sink->text + sink->len, data, len);
+    sink->len += len;
+    sink->text[sink->len] = '\0';
+    sink->writes++;
+    return true;
+}
+
+static void test_metrics_text_and_binary(void)
+{
+    mesh_metrics_inc(MESH_METRIC_RETRANSMITS);
+    mesh_metrics_observe_us(MESH_HIST_HTTP_MESSAGES, 1500);
+
+    mesh_metrics_snapshot_t snap;
+    mesh_metrics_snapshot(&snap);
+    static text_sink_t sink;
+    memset(&sink, 0, sizeof(sink));
+    CHECK(mesh_metrics_write_text(&snap, collect_text, &sink), "text output stopped");
+    CHECK(strstr(sink.text, "\nmeshnow_retransmits_total 1\n"), "retransmit counter missing");
+    CHECK(strstr(sink.text, "meshnow_http_request_duration_seconds_bucket{handler=\"messages\",le=\"0.002500\"} 1\n"),
+          "histogram bucket missing");
+    CHECK(strstr(sink.text, "meshnow_http_request_duration_seconds_sum{handler=\"messages\"} 0.001500\n"),
+          "histogram sum missing");
+    CHECK(strstr(sink.text, "meshnow_free_heap_bytes 200000\n"), "heap gauge missing");
+    const char *family = strstr(sink.text, "# TYPE meshnow_http_request_duration_seconds histogram");
+    CHECK(family && !strstr(family + 1, "# TYPE meshnow_http_request_duration_seconds"), "family header repeated");
+
+    uint8_t buf[MESH_METRICS_BINARY_SIZE];
+    CHECK(mesh_metrics_encode(&snap, buf, sizeof(buf) - 1) == 0, "encoded into a short buffer");
+    CHECK(mesh_metrics_encode(&snap, buf, sizeof(buf)) == MESH_METRICS_BINARY_SIZE, "wrong encoded size");
+    CHECK(memcmp(buf, "MNM\x01", 4) == 0 && buf[4] == MESH_METRIC_COUNT, "bad header");
+    const uint8_t *retransmits = buf + 12 + 4 * MESH_METRIC_RETRANSMITS;
+    CHECK(retransmits[0] == 1 && retransmits[1] == 0, "retransmit counter not at its offset");
+}
+
+typedef struct {
+    const char *name;
+    void (*run)(void);
+} test_case_t;
+
+static const test_case_t tests[] = {
+    {"duplicate_dropped", test_duplicate_dropped},
+    {"seen_ids_evict_oldest", test_seen_ids_evict_oldest},
+    {"invalid_length_ignored", test_invalid_length_ignored},
+    {"encrypted_roundtrip", test_encrypted_roundtrip},
+    {"chat_forwarded_with_one_hop_less", test_chat_forwarded_with_one_hop_less},
+    {"last_hop_not_forwarded", test_last_hop_not_forwarded},
+    {"direct_for_other_forwarded", test_direct_for_other_forwarded},
+    {"direct_for_us_acked", test_direct_for_us_acked},
+    {"ack_releases_pending", test_ack_releases_pending},
+    {"pending_slots_exhaust", test_pending_slots_exhaust},
+    {"group_filter", test_group_filter},
+    {"group_forward_skipped_without_subscribers", test_group_forward_skipped_without_subscribers},
+    {"group_forward_within_reach", test_group_forward_within_reach},
+    {"group_legacy_neighbour_floods", test_group_legacy_neighbour_floods},
+    {"group_neighbour_expires", test_group_neighbour_expires},
+    {"group_beacon_levels", test_group_beacon_levels},
+    {"group_several_subscriptions", test_group_several_subscriptions},
+    {"relay_keeps_origin", test_relay_keeps_origin},
+    {"relay_encrypted_delivered_in_clear", test_relay_encrypted_delivered_in_clear},
+    {"relayed_sender_not_peer", test_relayed_sender_not_peer},
+    {"presence_debounced", test_presence_debounced},
+    {"presence_flap_sends_nothing", test_presence_flap_sends_nothing},
+    {"typing_merged_and_refreshed", test_typing_merged_and_refreshed},
+    {"typing_expires_at_receiver", test_typing_expires_at_receiver},
+    {"presence_in_beacon", test_presence_in_beacon},
+    {"legacy_typing_frame", test_legacy_typing_frame},
+    {"store_holds_relayed_direct", test_store_holds_relayed_direct},
+    {"store_skips_last_hop", test_store_skips_last_hop},
+    {"store_encrypted_copy", test_store_encrypted_copy},
+    {"store_origin_holds_after_retries", test_store_origin_holds_after_retries},
+    {"store_evicts", test_store_evicts},
+    {"store_expires", test_store_expires},
+    {"duplicate_direct_acked_again", test_duplicate_direct_acked_again},
+    {"queue_fifo_and_drops", test_queue_fifo_and_drops},
+    {"queue_receive_times_out", test_queue_receive_times_out},
+    {"message_json_escaped", test_message_json_escaped},
+    {"metrics_count_receive_path", test_metrics_count_receive_path},
+    {"metrics_histogram_buckets", test_metrics_histogram_buckets},
+    {"metrics_text_and_binary", test_metrics_text_and_binary},
+};
+
+// Benchmarks: each op handles one frame (or queue round trip) on state its
+// setup prepared; frames are built before the clock starts
+
+static mesh_message_t bench_frame;
+
+static void fill_seen_ids(void)
+{
+    for (uint32_t id = 1; id <= MAX_SEEN_MESSAGE_IDS; id++) {
+        mesh_now_mark_message_seen(id);
+    }
+}
+
+static void fill_pending(void)
+{
+    for (int i = 0; i < MAX_PENDING_MESSAGES; i++) {
+        pending_messages[i].active = true;
+        pending_messages[i].msg.message_id = (uint32_t)(500 + i);
+    }
+}
+
+static void setup_dedup_hit(void)
+{
+    fill_seen_ids();
+    // The newest ID sits at the end of the table: a full scan before the drop
+    bench_frame = make_message(MSG_TYPE_CHAT, MAX_SEEN_MESSAGE_IDS, remote_mac, NULL, 0);
+}
+
+static void setup_dedup_miss(void)
+{
+    fill_seen_ids();
+    bench_frame = make_message(MSG_TYPE_CHAT, 0, remote_mac, NULL, 0);
+}
+
+static void setup_decrypt(void)
+{
+    setup_dedup_miss();
+    mesh_now_set_encryption_key(test_key, sizeof(test_key));
+    bench_frame.flags |= MSG_FLAG_ENCRYPTED;
+}
+
+static void setup_route_chat(void)
+{
+    fill_seen_ids();
+    bench_frame = make_message(MSG_TYPE_CHAT, 0, remote_mac, NULL, 3);
+}
+
+static void setup_route_encrypted(void)
+{
+    setup_route_chat();
+    mesh_now_set_encryption_key(test_key, sizeof(test_key));
+    bench_frame.flags |= MSG_FLAG_ENCRYPTED;
+}
+
+static void setup_route_direct(void)
+{
+    fill_seen_ids();
+    bench_frame = make_message(MSG_TYPE_DIRECT, 0, remote_mac, other_mac, 3);
+}
+
+static void setup_route_direct_held(void)
+{
+    // A full store, so every frame evicts a copy to be held
+    setup_route_direct();
+    bench_frame.flags = MSG_FLAG_REQUIRES_ACK;
+    for (uint32_t id = 1; id <= MESH_STORE_MAX_ENTRIES; id++) {
+        mesh_message_t msg = make_message(MSG_TYPE_DIRECT, id, remote_mac, other_mac, 3);
+        msg.target_mac[5] = (uint8_t)id;
+        mesh_store_put(&store, &msg, 0);
+    }
+}
+
+static void setup_route_group(void)
+{
+    fill_seen_ids();
+    mesh_now_set_group(3);
+    bench_frame = make_message(MSG_TYPE_GROUP, 0, remote_mac, NULL, 3);
+    bench_frame.group_id = 7;
+}
+
+static void setup_ack_hit(void)
+{
+    fill_pending();
+    // Last slot: a full scan of the pending table
+    bench_frame = make_message(MSG_TYPE_ACK, 500 + MAX_PENDING_MESSAGES - 1, remote_mac, local_mac, 3);
+}
+
+static void setup_ack_miss(void)
+{
+    fill_pending();
+    bench_frame = make_message(MSG_TYPE_ACK, 99, remote_mac, local_mac, 3);
+}
+
+static void setup_ack_forward(void)
+{
+    bench_frame = make_message(MSG_TYPE_ACK, 99, remote_mac, other_mac, 3);
+}
+
+static void setup_queue(void)
+{
+    message_queue_init();
+    memset(&bench_frame, 0, sizeof(bench_frame));
+}
+
+static void op_receive(void)
+{
+    host_receive(remote_mac, &bench_frame, sizeof(bench_frame));
+}
+
+static void op_receive_fresh(void)
+{
+    bench_frame.message_id = fresh_id++;
+    host_receive(remote_mac, &bench_frame, sizeof(bench_frame));
+}
+
+static void op_receive_fresh_encrypted(void)
+{
+    // The receive path decrypts a copy, so the frame stays encrypted
+    bench_frame.message_id = fresh_id++;
+    host_receive(remote_mac, &bench_frame, sizeof(bench_frame));
+}
+
+static void op_ack_hit(void)
+{
+    host_receive(remote_mac, &bench_frame, sizeof(bench_frame));
+    pending_messages[MAX_PENDING_MESSAGES - 1].active = true;
+}
+
+static void op_queue_round_trip(void)
+{
+    message_t msg;
+    memset(&msg, 0, sizeof(msg));
+    message_queue_send(&msg);
+    message_queue_receive(&msg, 0);
+}
+
+typedef struct {
+    const char *name;
+    void (*setup)(void);
+    void (*op)(void);
+} bench_case_t;
+
+static const bench_case_t benches[] = {
+    {"dedup_hit", setup_dedup_hit, op_receive},
+    {"dedup_miss", setup_dedup_miss, op_receive_fresh},
+    {"decrypt_chat", setup_decrypt, op_receive_fresh_encrypted},
+    {"route_chat_forward", setup_route_chat, op_receive_fresh},
+    {"route_encrypted_forward", setup_route_encrypted, op_receive_fresh_encrypted},
+    {"route_direct_other", setup_route_direct, op_receive_fresh},
+    {"route_direct_held", setup_route_direct_held, op_receive_fresh},
+    {"route_group_other", setup_route_group, op_receive_fresh},
+    {"ack_pending_hit", setup_ack_hit, op_ack_hit},
+    {"ack_pending_miss", setup_ack_miss, op_receive},
+    {"ack_forward", setup_ack_forward, op_receive},
+    {"queue_round_trip", setup_queue, op_queue_round_trip},
+};
+
+static double now_ns(void)
+{
+    struct timespec now;
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    return (double)now.tv_sec * 1e9 + (double)now.tv_nsec;
+}
+
+static double run_bench(const bench_case_t *bench, long iterations, int repeat)
+{
+    double best = 0;
+    for (int r = 0; r < repeat; r++) {
+        reset_mesh();
+        bench->setup();
+        double start = now_ns();
+        for (long i = 0; i < iterations; i++) {
+            bench->op();
+        }
+        double per_op = (now_ns() - start) / (double)iterations;
+        if (r == 0 || per_op < best) {
+            best = per_op;
+        }
+    }
+    message_queue_deinit();
+    return best;
+}
+
+// Models: scenarios replayed through the real code on a simulated clock,
+// reporting what a deployment would see rather than passing or failing
+
+static uint32_t model_state;
+
+static uint32_t model_random(uint32_t bound)
+{
+    model_state = model_state * 1664525u + 1013904223u;
+    return (model_state >> 8) % bound;
+}
+
+static void model_print(const char *model, const char *key, double value)
+{
+    printf("model %s %s %.6g\n", model, key, value);
+}
+
+static bool presence_shows_typing(int64_t now_ms)
+{
+    mesh_presence_entry_t entries[MESH_PRESENCE_MAX_NODES];
+    size_t count = mesh_presence_list(entries, MESH_PRESENCE_MAX_NODES, now_ms);
+    for (size_t i = 0; i < count && i < MESH_PRESENCE_MAX_NODES; i++) {
+        if (memcmp(entries[i].mac, local_mac, ESP_NOW_ETH_ALEN) == 0) {
+            return entries[i].typing;
+        }
+    }
+    return false;
+}
+
+// Ten minutes of one user chatting with three nodes through a UI that reports
+// typing on every keystroke (and its end) and presence on every focus change.
+// Each of those calls used to send a frame; the model counts the frames the
+// presence tick sends instead, and follows what the first target shows.
+static void model_presence_typing(void)
+{
+    static const uint8_t third_mac[6] = {0x24, 0x0a, 0xc4, 0x00, 0x00, 0x04};
+    const uint8_t *targets[] = {remote_mac, other_mac, third_mac};
+    const int64_t duration_ms = 600000, step_ms = 100;
+
+    model_state = 1;
+    int target = -1;
+    int64_t idle_until = 3000, burst_end = 0, next_key = 0;
+    int64_t next_status = 30000, next_flap = 0;
+    int flaps = 0;
+    int64_t typing_ms = 0, shown_ms = 0, stale_ms = 0, burst_start = -1, show_delay_ms = 0;
+    int bursts = 0, shows = 0;
+
+    for (int64_t t = 0; t < duration_ms; t += step_ms) {
+        at_ms(t);
+        if (target < 0 && t >= idle_until) {
+            target = (int)model_random(3);
+            burst_end = t + 3000 + model_random(22000);
+            next_key = t;
+            if (target == 0) {
+                bursts++;
+                burst_start = t;
+            }
+        }
+        if (target >= 0 && t >= burst_end) {
+            mesh_now_send_typing(targets[target], false);
+            target = -1;
+            idle_until = t + 5000 + model_random(35000);
+        } else if (target >= 0 && t >= next_key) {
+            mesh_now_send_typing(targets[target], true);
+            next_key = t + 100 + model_random(300);
+            if (model_random(20) == 0) {
+                next_key += 1000 + model_random(3000);  // Pausing to think
+            }
+        }
+
+        if (t >= next_status) {
+            flaps = 1 + (int)model_random(3);
+            next_flap = t;
+            next_status = t + 60000 + model_random(120000);
+        }
+        if (flaps > 0 && t >= next_flap) {
+            mesh_now_send_presence(flaps % 2 ? "away" : "online");
+            flaps--;
+            next_flap = t + 100 + model_random(300);
+        }
+
+        // The retransmit task's period
+        if (t % 500 == 0 && presence_tick_at(t) > 0) {
+            const mesh_message_t *sent = last_sent_message();
+            mesh_presence_note_frame(local_mac, remote_mac, (const uint8_t *)sent->message, sizeof(sent->message), t);
+        }
+
+        bool shown = presence_shows_typing(t);
+        if (target == 0) {
+            typing_ms += step_ms;
+            shown_ms += shown ? step_ms : 0;
+            if (shown && burst_start >= 0) {
+                show_delay_ms += t - burst_start;
+                shows++;
+                burst_start = -1;
+            }
+        } else if (shown) {
+            stale_ms += step_ms;
+        }
+    }
+
+    mesh_metrics_snapshot_t snap;
+    mesh_metrics_snapshot(&snap);
+    uint32_t updates = snap.counters[MESH_METRIC_PRESENCE_UPDATES];
+    uint32_t frames = snap.counters[MESH_METRIC_PRESENCE_FRAMES];
+    model_print("presence_typing", "updates", updates);
+    model_print("presence_typing", "frames", frames);
+    model_print("presence_typing", "reduction", frames ? (double)updates / frames : 0);
+    model_print("presence_typing", "frames_per_min", frames * 60000.0 / duration_ms);
+    model_print("presence_typing", "typing_shown_pct", typing_ms ? 100.0 * shown_ms / typing_ms : 0);
+    model_print("presence_typing", "show_delay_ms", shows ? (double)show_delay_ms / shows : 0);
+    model_print("presence_typing", "clear_delay_ms", bursts ? (double)stale_ms / bursts : 0);
+}
+
+#define STORE_MODEL_TARGETS 6
+#define STORE_MODEL_MAX_MESSAGES 2048
+#define STORE_MODEL_LOSS_PCT 10
+
+static mesh_message_t store_model_frames[16];
+static size_t store_model_frame_count;
+
+static void store_model_capture(const host_frame_t *frame)
+{
+    if (frame->len == sizeof(mesh_message_t) && store_model_frame_count < 16) {
+        memcpy(&store_model_frames[store_model_frame_count++], frame->data, sizeof(mesh_message_t));
+    }
+}
+
+// Two hours of one node relaying direct messages from a neighbour to six
+// nodes out of the sender's range that sleep, or wander off, for anything
+// from half a minute to beyond the store's TTL. The local node is the relay;
+// the sender and targets are driven around it, and one frame in ten is lost
+// either way (the sender's retransmits are folded into its first send). A
+// message not delivered when it is first relayed was lost before the store:
+// retransmits reach the relay with an ID it has seen and go no further. The
+// model follows what the store gets through, at what latency and what cost in
+// frames and RAM.
+static void model_store_forward(void)
+{
+    uint8_t targets[STORE_MODEL_TARGETS][6];
+    bool awake[STORE_MODEL_TARGETS];
+    int64_t switch_at[STORE_MODEL_TARGETS], next_beacon[STORE_MODEL_TARGETS];
+    static int64_t sent_at[STORE_MODEL_MAX_MESSAGES];
+    static bool got[STORE_MODEL_MAX_MESSAGES];
+    const uint32_t first_id = 5000000;
+    const int64_t duration_ms = 2 * 3600 * 1000, step_ms = 100;
+
+    model_state = 7;
+    for (int i = 0; i < STORE_MODEL_TARGETS; i++) {
+        memcpy(targets[i], local_mac, 6);
+        targets[i][4] = 0x10;
+        targets[i][5] = (uint8_t)i;
+        awake[i] = model_random(2);
+        switch_at[i] = model_random(60000);
+        next_beacon[i] = model_random(5000);
+    }
+    host_set_send_hook(store_model_capture);
+
+    int sent = 0, first_try = 0, late = 0, duplicates = 0;
+    double late_latency_ms = 0;
+    size_t peak = 0;
+    int64_t next_send = 0;
+    for (int64_t t = 0; t < duration_ms; t += step_ms) {
+        at_ms(t);
+        store_model_frame_count = 0;
+
+        for (int i = 0; i < STORE_MODEL_TARGETS; i++) {
+            if (t >= switch_at[i]) {
+                awake[i] = !awake[i];
+                switch_at[i] = t + (awake[i] ? 20000 + model_random(70000) : 30000 + model_random(720000));
+            }
+            if (awake[i] && t >= next_beacon[i]) {
+                next_beacon[i] = t + 5000;
+                mesh_message_t beacon = beacon_from(targets[i]);
+                if (model_random(100) >= STORE_MODEL_LOSS_PCT) {
+                    receive(&beacon);
+                }
+            }
+        }
+
+        if (t >= next_send && sent < STORE_MODEL_MAX_MESSAGES) {
+            mesh_message_t msg = make_message(MSG_TYPE_DIRECT, first_id + sent, other_mac,
+                                              targets[model_random(STORE_MODEL_TARGETS)], DEFAULT_ROUTE_TTL);
+            msg.flags = MSG_FLAG_REQUIRES_ACK;
+            sent_at[sent++] = t;
+            next_send = t + 5000 + model_random(55000);
+            // The sender's retransmits, for a first frame lost on the way to the relay
+            for (int attempt = 0; attempt <= 3; attempt++) {
+                if (model_random(100) >= STORE_MODEL_LOSS_PCT) {
+                    receive(&msg);
+                    break;
+                }
+            }
+        }
+
+        if (t % 500 == 0) {
+            mesh_now_retransmit_tick(t);
+        }
+
+        // What the relay sent this step: direct frames a target may hear and ACK
+        mesh_message_t frames[16];
+        size_t count = store_model_frame_count;
+        memcpy(frames, store_model_frames, count * sizeof(frames[0]));
+        for (size_t f = 0; f < count; f++) {
+            int target = frames[f].target_mac[5];
+            uint32_t index = frames[f].message_id - first_id;
+            if (frames[f].type != MSG_TYPE_DIRECT || !awake[target] || model_random(100) < STORE_MODEL_LOSS_PCT) {
+                continue;
+            }
+            if (got[index]) {
+                duplicates++;
+            } else if (frames[f].hop_count > 1) {
+                first_try++;
+            } else {
+                late++;
+                late_latency_ms += t - sent_at[index];
+            }
+            got[index] = true;
+            mesh_message_t ack = make_message(MSG_TYPE_ACK, frames[f].message_id, targets[target], other_mac,
+                                              DEFAULT_ROUTE_TTL);
+            if (model_random(100) >= STORE_MODEL_LOSS_PCT) {
+                receive(&ack);
+            }
+        }
+
+        size_t held = mesh_store_count(&store);
+        peak = held > peak ? held : peak;
+    }
+    host_set_send_hook(NULL);
+    memset(got, 0, sizeof(got));
+
+    mesh_metrics_snapshot_t snap;
+    mesh_metrics_snapshot(&snap);
+    model_print("store_forward", "messages", sent);
+    model_print("store_forward", "delivered_without_store_pct", 100.0 * first_try / sent);
+    model_print("store_forward", "delivered_pct", 100.0 * (first_try + late) / sent);
+    model_print("store_forward", "held_delivery_s", late ? late_latency_ms / late / 1000 : 0);
+    model_print("store_forward", "flush_frames", snap.counters[MESH_METRIC_STORE_FLUSHED]);
+    model_print("store_forward", "duplicate_deliveries", duplicates);
+    model_print("store_forward", "evicted", snap.counters[MESH_METRIC_STORE_EVICTED]);
+    model_print("store_forward", "expired", snap.counters[MESH_METRIC_STORE_EXPIRED]);
+    model_print("store_forward", "held_at_end", mesh_store_count(&store));
+    model_print("store_forward", "peak_entries", peak);
+    model_print("store_forward", "store_bytes", sizeof(mesh_store_t));
+}
+
+typedef struct {
+    const char *name;
+    void (*run)(void);
+} model_case_t;
+
+static const model_case_t models[] = {
+    {"presence_typing", model_presence_typing},
+    {"store_forward", model_store_forward},
+};
+
+static bool selected(const char *name, const char *filter)
+{
+    return filter == NULL || strstr(name, filter) != NULL;
+}
+
+int main(int argc, char **argv)
+{
+    bool run_tests = false, run_benches = false, run_models = false;
+    const char *filter = NULL;
+    long iterations = 200000;
+    int repeat = 5;
+
+    for (int i = 1; i < argc; i++) {
+        if (strcmp(argv[i], "--tests") == 0) {
+            run_tests = true;
+        } else if (strcmp(argv[i], "--bench") == 0) {
+            run_benches = true;
+        } else if (strcmp(argv[i], "--models") == 0) {
+            run_models = true;
+        } else if (strcmp(argv[i], "--filter") == 0 && i + 1 < argc) {
+            filter = argv[++i];
+        } else if (strcmp(argv[i], "--iterations") == 0 && i + 1 < argc) {
+            iterations = atol(argv[++i]);
+        } else if (strcmp(argv[i], "--repeat") == 0 && i + 1 < argc) {
+            repeat = atoi(argv[++i]);
+        } else if (strcmp(argv[i], "--verbose") == 0) {
+            host_log_level = ESP_LOG_DEBUG;
+        } else {
+            fprintf(stderr, "usage: %s [--tests] [--bench] [--models] [--filter NAME] [--iterations N] [--repeat N] "
+                    "[--verbose]\n", argv[0]);
+            return 2;
+        }
+    }
+    if (!run_tests && !run_benches && !run_models) {
+        run_tests = run_benches = run_models = true;
+    }
+    if (iterations < 1 || repeat < 1) {
+        fprintf(stderr, "--iterations and --repeat must be positive\n");
+        return 2;
+    }
+
+    if (mesh_now_init() != ESP_OK) {
+        printf("FAIL mesh_now_init: returned an error\n");
+        return 1;
+    }
+
+    int failed = 0;
+    if (run_tests) {
+        for (size_t i = 0; i < sizeof(tests) / sizeof(tests[0]); i++) {
+            if (!selected(tests[i].name, filter)) {
+                continue;
+            }
+            reset_mesh();
+            failure = NULL;
+            tests[i].run();
+            if (failure) {
+                printf("FAIL %s: %s\n", tests[i].name, failure);
+                failed++;
+            } else {
+                printf("ok %s\n", tests[i].name);
+            }
+            fflush(stdout);
+        }
+    }
+
+    if (run_benches) {
+        for (size_t i = 0; i < sizeof(benches) / sizeof(benches[0]); i++) {
+            if (!selected(benches[i].name, filter)) {
+                continue;
+            }
+            double ns = run_bench(&benches[i], iterations, repeat);
+            printf("bench %s %.1f %ld\n", benches[i].name, ns, iterations);
+            fflush(stdout);
+        }
+    }
+
+    if (run_models) {
+        for (size_t i = 0; i < sizeof(models) / sizeof(models[0]); i++) {
+            if (!selected(models[i].name, filter)) {
+                continue;
+            }
+            reset_mesh();
+            models[i].run();
+            host_set_time_us(-1);
+            fflush(stdout);
+        }
+    }
+
+    mesh_now_deinit();
+    return failed ? 1 : 0;
+}
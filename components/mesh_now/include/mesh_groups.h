@@ -0,0 +1,67 @@
+#ifndef MESH_GROUPS_H
+#define MESH_GROUPS_H
+
+#include <stddef.h>
+#include <stdint.h>
+#include <stdbool.h>
+#include "mesh_now.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+// Group subscriptions and group-aware forwarding.
+//
+// Each node beacons which groups have a subscriber at each distance from it:
+// level 0 is its own subscriptions, level d the groups its neighbours report
+// at level d - 1. A forwarded frame with hop count h reaches nodes up to
+// h - 1 hops away, so a node forwards a group message only when a neighbour
+// reports a subscriber close enough for the forward to matter. With no
+// neighbour heard yet, or a neighbour whose beacon carries no group levels
+// (older firmware), it floods as before. Changes take a beacon interval per
+// hop to spread.
+
+#define MESH_GROUP_COUNT 256
+#define MESH_GROUP_SET_BYTES (MESH_GROUP_COUNT / 8)
+// Levels a beacon carries; a frame is never forwarded further than this
+#define MESH_GROUP_LEVELS (DEFAULT_ROUTE_TTL - 1)
+// A neighbour missing three beacons no longer counts
+#define MESH_GROUP_NEIGHBOUR_TIMEOUT_MS 15000
+#define MESH_GROUP_MAX_NEIGHBOURS MAX_PEERS
+
+// Beacon payload: the "MESH-NOW-BEACON" marker with its NUL, a version byte,
+// then MESH_GROUP_LEVELS group sets
+#define MESH_GROUP_BEACON_OFFSET 16
+#define MESH_GROUP_BEACON_VERSION 1
+#define MESH_GROUP_BEACON_SIZE (MESH_GROUP_BEACON_OFFSET + 1 + MESH_GROUP_LEVELS * MESH_GROUP_SET_BYTES)
+
+typedef struct {
+    uint8_t bits[MESH_GROUP_SET_BYTES];
+} mesh_group_set_t;
+
+// Back to the boot state: subscribed to group 0 only, no neighbours known
+void mesh_groups_reset(void);
+
+void mesh_groups_join(uint8_t group_id);
+void mesh_groups_leave(uint8_t group_id);
+bool mesh_groups_is_member(uint8_t group_id);
+// Subscribed group IDs in ascending order; returns how many there are
+size_t mesh_groups_list(uint8_t *groups, size_t max_groups);
+
+// Fill a beacon's payload after its marker
+void mesh_groups_write_beacon(uint8_t *payload, size_t len, int64_t now_ms);
+// Record the group levels a neighbour's beacon carries
+void mesh_groups_note_beacon(const uint8_t *mac, const uint8_t *payload, size_t len, int64_t now_ms);
+
+// Whether re-broadcasting a group frame that arrived with hop_count reaches
+// anyone subscribed to group_id
+bool mesh_groups_should_forward(uint8_t group_id, uint8_t hop_count, int64_t now_ms);
+
+// Fresh neighbours in the table
+size_t mesh_groups_neighbour_count(int64_t now_ms);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif // MESH_GROUPS_H
@@ -0,0 +1,106 @@
+#ifndef MESH_METRICS_H
+#define MESH_METRICS_H
+
+#include <stddef.h>
+#include <stdint.h>
+#include <stdbool.h>
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+// Counters and latency histograms for the mesh layer and the web server.
+// Every update is a single relaxed atomic add, so they can be bumped from the
+// Wi-Fi task's ESP-NOW callbacks, the mesh tasks and httpd without a lock.
+// Values are 32-bit and wrap; scrapers treat a decrease as a restart.
+
+typedef enum {
+    MESH_METRIC_FRAMES_SENT,        // ESP-NOW sends the driver reported delivered
+    MESH_METRIC_FRAMES_SEND_FAILED, // ESP-NOW sends the driver reported failed
+    MESH_METRIC_FRAMES_RECEIVED,    // Valid frames received
+    MESH_METRIC_FRAMES_INVALID,     // Frames dropped for their length
+    MESH_METRIC_DUPLICATES,         // Frames dropped as already seen
+    MESH_METRIC_BEACONS,            // Discovery beacons received
+    MESH_METRIC_FORWARDED,          // Frames re-broadcast for other nodes
+    MESH_METRIC_FORWARD_FAILED,     // Re-broadcasts esp_now_send refused
+    MESH_METRIC_ACKS_SENT,          // ACKs sent for direct messages to us
+    MESH_METRIC_ACKS_RECEIVED,      // ACKs that released a pending message
+    MESH_METRIC_RETRANSMITS,        // Pending messages sent again
+    MESH_METRIC_RETRANSMIT_GIVEUPS, // Pending messages held for their target after the last retry
+    MESH_METRIC_PENDING_EXHAUSTED,  // Direct sends refused: no pending slot free
+    MESH_METRIC_HTTP_FAILED,        // HTTP handlers that failed (connection dropped)
+    MESH_METRIC_GROUP_FORWARDS_SKIPPED, // Group frames not forwarded: no subscriber in range
+    MESH_METRIC_PRESENCE_UPDATES,   // Local presence and typing changes
+    MESH_METRIC_PRESENCE_FRAMES,    // Presence frames those were sent in
+    MESH_METRIC_STORE_HELD,         // Direct messages held for a target out of reach
+    MESH_METRIC_STORE_EVICTED,      // Held messages dropped to make room
+    MESH_METRIC_STORE_FLUSHED,      // Held messages sent on when their target beaconed
+    MESH_METRIC_STORE_DELIVERED,    // Held messages dropped when the target's ACK passed
+    MESH_METRIC_STORE_EXPIRED,      // Held messages dropped unanswered or past their TTL
+    MESH_METRIC_COUNT
+} mesh_metric_t;
+
+typedef enum {
+    MESH_HIST_HTTP_SEND,     // POST /send
+    MESH_HIST_HTTP_MESSAGES, // GET /messages
+    MESH_HIST_HTTP_STATIC,   // Page, script and stylesheet
+    MESH_HIST_HTTP_API,      // /peers, /wifi-info, /metrics
+    MESH_HIST_ACK_LATENCY,   // First send of a direct message to its ACK
+    MESH_HIST_COUNT
+} mesh_histogram_t;
+
+// Upper bounds (microseconds) of the histogram buckets; one more bucket
+// counts everything above the last bound
+#define MESH_METRICS_BUCKET_BOUNDS_US \
+    {500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000, 2500000, 5000000}
+#define MESH_METRICS_BUCKETS 13
+
+// Gauges sampled when a snapshot is taken
+typedef enum {
+    MESH_GAUGE_QUEUE_DEPTH,
+    MESH_GAUGE_QUEUE_HIGH_WATER,
+    MESH_GAUGE_QUEUE_ENQUEUED,
+    MESH_GAUGE_QUEUE_DEQUEUED,
+    MESH_GAUGE_QUEUE_DROPPED,
+    MESH_GAUGE_PEERS,
+    MESH_GAUGE_FREE_HEAP,
+    MESH_GAUGE_COUNT
+} mesh_gauge_t;
+
+typedef struct {
+    uint32_t uptime_ms;
+    uint32_t counters[MESH_METRIC_COUNT];
+    uint32_t gauges[MESH_GAUGE_COUNT];
+    uint32_t buckets[MESH_HIST_COUNT][MESH_METRICS_BUCKETS + 1]; // Per bucket, not cumulative
+    uint32_t sums_us[MESH_HIST_COUNT];
+} mesh_metrics_snapshot_t;
+
+// Binary form (little-endian): "MNM" + format version, then uint8 counts of
+// counters, gauges, histograms and bucket bounds, uint32 uptime_ms, the
+// counters, the gauges, and per histogram its bucket counts (bounds + 1)
+// followed by its sum in microseconds, all uint32.
+// scripts/mesh_metrics.py decodes it.
+#define MESH_METRICS_MAGIC "MNM"
+#define MESH_METRICS_VERSION 1
+#define MESH_METRICS_BINARY_SIZE \
+    (12 + 4 * (MESH_METRIC_COUNT + MESH_GAUGE_COUNT + MESH_HIST_COUNT * (MESH_METRICS_BUCKETS + 2)))
+
+// Output sink for mesh_metrics_write_text; return false to stop
+typedef bool (*mesh_metrics_writer_t)(const char *data, size_t len, void *ctx);
+
+// Function declarations
+void mesh_metrics_inc(mesh_metric_t metric);
+void mesh_metrics_observe_us(mesh_histogram_t histogram, int64_t elapsed_us);
+void mesh_metrics_snapshot(mesh_metrics_snapshot_t *snapshot);
+void mesh_metrics_reset(void);
+
+// Prometheus text exposition format, one line per write call
+bool mesh_metrics_write_text(const mesh_metrics_snapshot_t *snapshot, mesh_metrics_writer_t write, void *ctx);
+// Returns the bytes written, or 0 if len is below MESH_METRICS_BINARY_SIZE
+size_t mesh_metrics_encode(const mesh_metrics_snapshot_t *snapshot, uint8_t *buf, size_t len);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif // MESH_METRICS_H
@@ -16,6 +16,7 @@ extern "C" {
 
 #define MSG_FLAG_REQUIRES_ACK 0x01
 #define MSG_FLAG_ENCRYPTED    0x02
+#define MSG_FLAG_RELAYED      0x04  // Re-sent by a host bridge from another island
 
 // Message structure for ESP-NOW
 typedef struct {
@@ -61,8 +62,13 @@ esp_err_t mesh_now_send_broadcast(const char *message);
 esp_err_t mesh_now_send_message(const char *message);
 esp_err_t mesh_now_send_direct(const uint8_t *target_mac, const char *message);
 esp_err_t mesh_now_send_group(uint8_t group_id, const char *message);
+// Presence and typing are state, not messages: these record it and
+// mesh_presence.h decides when a frame carries it
 esp_err_t mesh_now_send_presence(const char *status);
 esp_err_t mesh_now_send_typing(const uint8_t *target_mac, bool typing);
+// Broadcast a chat message from another island under its original sender
+// and ID; ESP_ERR_INVALID_STATE if this node has already seen that ID
+esp_err_t mesh_now_send_relay(const uint8_t *origin_mac, uint32_t message_id, const char *message);
 esp_err_t mesh_now_set_group(uint8_t group_id);
 esp_err_t mesh_now_set_encryption_key(const uint8_t *key, size_t len);
 int mesh_now_get_peer_count(void);
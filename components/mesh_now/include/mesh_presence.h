@@ -0,0 +1,82 @@
+#ifndef MESH_PRESENCE_H
+#define MESH_PRESENCE_H
+
+#include <stddef.h>
+#include <stdint.h>
+#include <stdbool.h>
+#include "mesh_now.h"
+#include "mesh_groups.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+// Presence and typing state, aggregated into as few frames as possible.
+//
+// Local changes are not sent as they happen. A change starts a debounce
+// window, and when it closes one presence frame carries the current status
+// and every target being typed to; a status that flaps back within the
+// window sends nothing. While typing continues the frame is repeated every
+// MESH_TYPING_REFRESH_MS, and a status every MESH_PRESENCE_REFRESH_MS for
+// nodes beyond beacon range. Neighbours also get the status from beacons.
+//
+// Receivers keep what they heard until it times out, so typing ends without
+// a "stopped" frame: the sender just stops repeating it.
+
+#define MESH_PRESENCE_STATUS_LEN 32
+#define MESH_PRESENCE_DEBOUNCE_MS 500
+#define MESH_PRESENCE_REFRESH_MS 60000
+// Three missed refreshes, or three missed beacons for status heard in one
+#define MESH_PRESENCE_TIMEOUT_MS (3 * MESH_PRESENCE_REFRESH_MS)
+#define MESH_PRESENCE_BEACON_TIMEOUT_MS MESH_GROUP_NEIGHBOUR_TIMEOUT_MS
+// Local typing ends this long after the last keystroke
+#define MESH_TYPING_IDLE_MS 2000
+#define MESH_TYPING_REFRESH_MS 2000
+// Two refreshes and a poll interval, so one lost frame does not blink it off
+#define MESH_TYPING_TIMEOUT_MS 4500
+#define MESH_PRESENCE_MAX_TYPING_TARGETS 8
+#define MESH_PRESENCE_MAX_NODES MAX_PEERS
+
+// Presence frame payload: the status, NUL padded (all older firmware reads),
+// a version byte, the number of typing targets and their MACs
+#define MESH_PRESENCE_FRAME_VERSION 1
+#define MESH_PRESENCE_TYPING_OFFSET MESH_PRESENCE_STATUS_LEN
+#define MESH_PRESENCE_FRAME_SIZE \
+    (MESH_PRESENCE_TYPING_OFFSET + 2 + MESH_PRESENCE_MAX_TYPING_TARGETS * ESP_NOW_ETH_ALEN)
+// Beacon payload: the status follows the group levels
+#define MESH_PRESENCE_BEACON_OFFSET MESH_GROUP_BEACON_SIZE
+#define MESH_PRESENCE_BEACON_SIZE (MESH_PRESENCE_BEACON_OFFSET + MESH_PRESENCE_STATUS_LEN)
+
+typedef struct {
+    uint8_t mac[ESP_NOW_ETH_ALEN];
+    char status[MESH_PRESENCE_STATUS_LEN];
+    bool typing;                // Typing to this node
+} mesh_presence_entry_t;
+
+// Back to the boot state: no status, nobody typing, nothing heard
+void mesh_presence_reset(void);
+
+// Local changes; they go out with the next frame poll() asks for
+void mesh_presence_set_status(const char *status, int64_t now_ms);
+void mesh_presence_set_typing(const uint8_t *target_mac, bool typing, int64_t now_ms);
+
+// Whether a presence frame is due; if so fills payload with it. Call it
+// every few hundred milliseconds.
+bool mesh_presence_poll(uint8_t *payload, size_t len, int64_t now_ms);
+// Put the local status in a beacon's payload after the group levels
+void mesh_presence_write_beacon(uint8_t *payload, size_t len);
+
+// Record what a presence frame, a beacon or an older firmware's typing frame says
+void mesh_presence_note_frame(const uint8_t *mac, const uint8_t *my_mac, const uint8_t *payload, size_t len,
+                              int64_t now_ms);
+void mesh_presence_note_beacon(const uint8_t *mac, const uint8_t *payload, size_t len, int64_t now_ms);
+void mesh_presence_note_typing(const uint8_t *mac, bool typing, int64_t now_ms);
+
+// Nodes with an unexpired status or typing to this node; returns how many there are
+size_t mesh_presence_list(mesh_presence_entry_t *entries, size_t max_entries, int64_t now_ms);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif // MESH_PRESENCE_H
@@ -0,0 +1,68 @@
+#ifndef MESH_STORE_H
+#define MESH_STORE_H
+
+#include <stddef.h>
+#include <stdint.h>
+#include <stdbool.h>
+#include "mesh_now.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+// Store-and-forward for direct messages whose target is asleep or out of range.
+//
+// A node keeps a copy of every direct message it relays, and the origin one
+// it gave up retransmitting, until the target's ACK passes by. When a beacon
+// shows the target is a neighbour again the copies are handed to it as
+// single-hop frames; it ACKs them (again, if it already had one) and every
+// holder that hears the ACK drops its copy. Copies unanswered after
+// MESH_STORE_MAX_FLUSHES flushes or older than MESH_STORE_TTL_MS go too. When
+// the store is full the oldest copy makes room, the target's own oldest if it
+// already has MESH_STORE_MAX_PER_TARGET held, so one sleeping node cannot take
+// every slot.
+
+#define MESH_STORE_MAX_ENTRIES 16
+#define MESH_STORE_MAX_PER_TARGET 4
+#define MESH_STORE_TTL_MS (10 * 60 * 1000)
+// Two beacon intervals, so a flush or its ACK lost on the way is tried again
+#define MESH_STORE_FLUSH_RETRY_MS 10000
+#define MESH_STORE_MAX_FLUSHES 3
+
+typedef struct {
+    bool used;
+    uint8_t flushes;
+    int64_t stored_ms;
+    int64_t flushed_ms;
+    mesh_message_t msg;         // As it went out, so still encrypted if it was
+} mesh_store_entry_t;
+
+// One per node; a struct rather than file state so the host simulation can
+// run several nodes side by side
+typedef struct {
+    mesh_store_entry_t entries[MESH_STORE_MAX_ENTRIES];
+} mesh_store_t;
+
+void mesh_store_init(mesh_store_t *store);
+
+// Hold a copy of a direct message for its target. Returns true if another
+// copy was evicted to make room.
+bool mesh_store_put(mesh_store_t *store, const mesh_message_t *msg, int64_t now_ms);
+
+// Drop the copy the ACK for message_id answers; returns whether there was one
+bool mesh_store_ack(mesh_store_t *store, uint32_t message_id);
+
+// Next copy held for target_mac that is due a flush, counted as flushed.
+// Call it until it returns false when the target beacons.
+bool mesh_store_take_due(mesh_store_t *store, const uint8_t *target_mac, mesh_message_t *out, int64_t now_ms);
+
+// Drop copies past their TTL or their last flush; returns how many went
+size_t mesh_store_expire(mesh_store_t *store, int64_t now_ms);
+
+size_t mesh_store_count(const mesh_store_t *store);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif // MESH_STORE_H
@@ -0,0 +1,51 @@
+#ifndef MESSAGE_HISTORY_H
+#define MESSAGE_HISTORY_H
+
+#include <stddef.h>
+#include <stdint.h>
+#include <esp_err.h>
+#include "message_queue.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+// Data partition holding the append-only log (see partitions.csv)
+#define MESSAGE_HISTORY_PARTITION "history"
+#define MESSAGE_HISTORY_SUBTYPE 0x40
+
+// On-flash record layout (little-endian, fixed size):
+//   uint16 magic, uint16 payload length, uint32 seq,
+//   uint32 crc32(seq || payload), uint32 reserved, message_t payload
+#define MESSAGE_HISTORY_MAGIC 0x4D48
+#define MESSAGE_HISTORY_HEADER_SIZE 16
+#define MESSAGE_HISTORY_RECORD_SIZE (MESSAGE_HISTORY_HEADER_SIZE + sizeof(message_t))
+
+// Recent records kept in RAM; also buffers records not yet written to flash
+#define MESSAGE_HISTORY_RAM_RECORDS 32
+// Flush to flash once this many records are pending, or after the interval
+#define MESSAGE_HISTORY_FLUSH_BATCH 8
+#define MESSAGE_HISTORY_FLUSH_INTERVAL_MS 2000
+
+typedef struct {
+    uint32_t seq;
+    message_t msg;
+} history_entry_t;
+
+// Visitor for message_history_read; return false to stop early
+typedef bool (*message_history_visitor_t)(const history_entry_t *entry, void *ctx);
+
+// Function declarations
+esp_err_t message_history_init(void);
+esp_err_t message_history_deinit(void);
+uint32_t message_history_append(const message_t *msg);
+esp_err_t message_history_flush(void);
+size_t message_history_read(uint32_t since, size_t limit, message_history_visitor_t visitor, void *ctx);
+uint32_t message_history_oldest_seq(void);
+uint32_t message_history_latest_seq(void);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif // MESSAGE_HISTORY_H
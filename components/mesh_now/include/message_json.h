@@ -0,0 +1,31 @@
+#ifndef MESSAGE_JSON_H
+#define MESSAGE_JSON_H
+
+#include <stddef.h>
+#include <stdbool.h>
+#include "message_history.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+// JSON for the web API's message and presence lists. Message text is
+// whatever a client posted, so quotes, backslashes and control characters
+// are escaped; each byte takes at most six characters escaped.
+
+#define MESSAGE_JSON_ESCAPED_LEN(len) ((len) * 6 + 2)
+// One /messages entry: the fixed fields and the escaped content
+#define MESSAGE_JSON_ENTRY_LEN (MESSAGE_JSON_ESCAPED_LEN(MAX_MESH_MESSAGE_LEN) + 144)
+
+// Copy src into dst as the inside of a JSON string, truncated to fit
+void message_json_escape(char *dst, size_t dst_len, const char *src);
+
+// Write entry as a /messages object, preceded by a comma unless it is the
+// first; returns the length written
+size_t message_json_entry(char *dst, size_t dst_len, const history_entry_t *entry, bool first);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif // MESSAGE_JSON_H
@@ -1,30 +1,55 @@
 #ifndef MESSAGE_QUEUE_H
 #define MESSAGE_QUEUE_H
 
+#include <stddef.h>
+#include <stdint.h>
 #include <freertos/FreeRTOS.h>
-#include <freertos/queue.h>
 #include <esp_err.h>
+#include "mesh_now.h"
 
 #ifdef __cplusplus
 extern "C" {
 #endif
 
-// Message structure
+// Number of fixed slots in the ring buffer
+#define MESSAGE_QUEUE_SIZE 50
+
+// Message structure (shared by the mesh layer and the web server)
 typedef struct {
-    char message[256];
-    uint8_t sender_mac[6];
+    char message[MAX_MESH_MESSAGE_LEN];
+    uint8_t sender_mac[ESP_NOW_ETH_ALEN];
+    uint8_t type;          // MSG_TYPE_CHAT, MSG_TYPE_DIRECT, MSG_TYPE_GROUP, ...
+    uint8_t group_id;      // For MSG_TYPE_GROUP
     uint32_t timestamp;
+    uint32_t message_id;   // Sender's mesh message ID; (sender_mac, message_id) identifies a message
 } message_t;
 
+// Queue statistics
+typedef struct {
+    size_t depth;          // Messages currently queued
+    size_t high_water;     // Highest depth seen since init
+    uint32_t enqueued;     // Messages accepted
+    uint32_t dequeued;     // Messages committed by the consumer
+    uint32_t dropped;      // Messages rejected because the ring was full
+} message_queue_stats_t;
+
 // Function declarations
 esp_err_t message_queue_init(void);
 esp_err_t message_queue_deinit(void);
-QueueHandle_t message_queue_get_handle(void);
 esp_err_t message_queue_send(const message_t *msg);
+size_t message_queue_send_many(const message_t *msgs, size_t count);
 esp_err_t message_queue_receive(message_t *msg, TickType_t timeout);
+size_t message_queue_receive_batch(message_t *msgs, size_t max_count, TickType_t timeout);
+
+// Zero-copy access for a single consumer: peek returns pointers to up to
+// max_count queued slots (oldest first), commit releases them afterwards.
+size_t message_queue_peek(const message_t **slots, size_t max_count, TickType_t timeout);
+void message_queue_commit(size_t count);
+
+void message_queue_get_stats(message_queue_stats_t *stats);
 
 #ifdef __cplusplus
 }
 #endif
 
-#endif // MESSAGE_QUEUE_H
\ No newline at end of file
+#endif // MESSAGE_QUEUE_H
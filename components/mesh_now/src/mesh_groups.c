@@ -0,0 +1,165 @@
+#include "mesh_groups.h"
+#include <string.h>
+
+typedef struct {
+    bool used;
+    bool legacy;                // Beacon without group levels: subscriptions unknown
+    uint8_t mac[ESP_NOW_ETH_ALEN];
+    int64_t last_seen_ms;
+    mesh_group_set_t levels[MESH_GROUP_LEVELS];
+} group_neighbour_t;
+
+// Updated from the ESP-NOW receive callback and httpd, read by the beacon
+// task; like the peer table it is not locked
+static mesh_group_set_t local_groups = {.bits = {0x01}};   // Group 0, as before groups could be joined
+static group_neighbour_t neighbours[MESH_GROUP_MAX_NEIGHBOURS];
+
+static inline bool set_has(const mesh_group_set_t *set, uint8_t group_id)
+{
+    return (set->bits[group_id / 8] >> (group_id % 8)) & 1;
+}
+
+static inline bool fresh(const group_neighbour_t *n, int64_t now_ms)
+{
+    return n->used && now_ms - n->last_seen_ms <= MESH_GROUP_NEIGHBOUR_TIMEOUT_MS;
+}
+
+void mesh_groups_reset(void)
+{
+    memset(&local_groups, 0, sizeof(local_groups));
+    memset(neighbours, 0, sizeof(neighbours));
+    mesh_groups_join(0);
+}
+
+void mesh_groups_join(uint8_t group_id)
+{
+    local_groups.bits[group_id / 8] |= (uint8_t)(1u << (group_id % 8));
+}
+
+void mesh_groups_leave(uint8_t group_id)
+{
+    local_groups.bits[group_id / 8] &= (uint8_t)~(1u << (group_id % 8));
+}
+
+bool mesh_groups_is_member(uint8_t group_id)
+{
+    return set_has(&local_groups, group_id);
+}
+
+size_t mesh_groups_list(uint8_t *groups, size_t max_groups)
+{
+    size_t count = 0;
+    for (int group_id = 0; group_id < MESH_GROUP_COUNT; group_id++) {
+        if (set_has(&local_groups, (uint8_t)group_id)) {
+            if (count < max_groups) {
+                groups[count] = (uint8_t)group_id;
+            }
+            count++;
+        }
+    }
+    return count;
+}
+
+void mesh_groups_write_beacon(uint8_t *payload, size_t len, int64_t now_ms)
+{
+    if (len < MESH_GROUP_BEACON_SIZE) {
+        return;
+    }
+
+    mesh_group_set_t *levels = (mesh_group_set_t *)&payload[MESH_GROUP_BEACON_OFFSET + 1];
+    payload[MESH_GROUP_BEACON_OFFSET] = MESH_GROUP_BEACON_VERSION;
+    levels[0] = local_groups;
+    for (int d = 1; d < MESH_GROUP_LEVELS; d++) {
+        memset(&levels[d], 0, sizeof(levels[d]));
+    }
+
+    for (int i = 0; i < MESH_GROUP_MAX_NEIGHBOURS; i++) {
+        const group_neighbour_t *n = &neighbours[i];
+        if (!fresh(n, now_ms)) {
+            continue;
+        }
+        for (int d = 1; d < MESH_GROUP_LEVELS; d++) {
+            for (int b = 0; b < MESH_GROUP_SET_BYTES; b++) {
+                // Anything may lie behind a neighbour that does not say
+                levels[d].bits[b] |= n->legacy ? 0xFF : n->levels[d - 1].bits[b];
+            }
+        }
+    }
+}
+
+void mesh_groups_note_beacon(const uint8_t *mac, const uint8_t *payload, size_t len, int64_t now_ms)
+{
+    group_neighbour_t *slot = NULL;
+    group_neighbour_t *stalest = &neighbours[0];
+    for (int i = 0; i < MESH_GROUP_MAX_NEIGHBOURS; i++) {
+        group_neighbour_t *n = &neighbours[i];
+        if (n->used && memcmp(n->mac, mac, ESP_NOW_ETH_ALEN) == 0) {
+            slot = n;
+            break;
+        }
+        if (!slot && !n->used) {
+            slot = n;
+        }
+        if (n->last_seen_ms < stalest->last_seen_ms) {
+            stalest = n;
+        }
+    }
+    if (!slot) {
+        slot = stalest;
+    }
+
+    slot->used = true;
+    memcpy(slot->mac, mac, ESP_NOW_ETH_ALEN);
+    slot->last_seen_ms = now_ms;
+    slot->legacy = len < MESH_GROUP_BEACON_SIZE || payload[MESH_GROUP_BEACON_OFFSET] != MESH_GROUP_BEACON_VERSION;
+    if (slot->legacy) {
+        memset(slot->levels, 0, sizeof(slot->levels));
+    } else {
+        memcpy(slot->levels, &payload[MESH_GROUP_BEACON_OFFSET + 1], sizeof(slot->levels));
+    }
+}
+
+bool mesh_groups_should_forward(uint8_t group_id, uint8_t hop_count, int64_t now_ms)
+{
+    // A frame that arrived with hop_count is forwarded with one hop less, and
+    // not at all once that reaches zero
+    if (hop_count < 2) {
+        return false;
+    }
+    int reach = hop_count - 1;
+    if (reach > MESH_GROUP_LEVELS) {
+        // Further than the beacons describe
+        return true;
+    }
+
+    bool known = false;
+    for (int i = 0; i < MESH_GROUP_MAX_NEIGHBOURS; i++) {
+        const group_neighbour_t *n = &neighbours[i];
+        if (!fresh(n, now_ms)) {
+            continue;
+        }
+        if (n->legacy) {
+            return true;
+        }
+        known = true;
+        // A subscriber d hops from a neighbour is at most d + 1 from here
+        for (int d = 0; d < reach; d++) {
+            if (set_has(&n->levels[d], group_id)) {
+                return true;
+            }
+        }
+    }
+    // Nothing heard yet: flood until the neighbours have beaconed
+    return !known;
+}
+
+size_t mesh_groups_neighbour_count(int64_t now_ms)
+{
+    size_t count = 0;
+    for (int i = 0; i < MESH_GROUP_MAX_NEIGHBOURS; i++) {
+        if (fresh(&neighbours[i], now_ms)) {
+            count++;
+        }
+    }
+    return count;
+}
@@ -0,0 +1,221 @@
+#include "mesh_metrics.h"
+#include "mesh_now.h"
+#include "message_queue.h"
+#include <esp_timer.h>
+#include <esp_system.h>
+#include <stdatomic.h>
+#include <stdio.h>
+#include <string.h>
+
+static _Atomic uint32_t counters[MESH_METRIC_COUNT];
+static _Atomic uint32_t buckets[MESH_HIST_COUNT][MESH_METRICS_BUCKETS + 1];
+static _Atomic uint32_t sums_us[MESH_HIST_COUNT];
+
+static const uint32_t bucket_bounds_us[MESH_METRICS_BUCKETS] = MESH_METRICS_BUCKET_BOUNDS_US;
+
+// Names and help text, in enum order; scripts/mesh_metrics.py keeps the same lists
+static const char *const counter_names[MESH_METRIC_COUNT][2] = {
+    {"frames_sent", "ESP-NOW sends the driver reported delivered"},
+    {"frames_send_failed", "ESP-NOW sends the driver reported failed"},
+    {"frames_received", "Valid ESP-NOW frames received"},
+    {"frames_invalid", "Frames dropped for their length"},
+    {"duplicates", "Frames dropped as already seen"},
+    {"beacons", "Discovery beacons received"},
+    {"forwarded", "Frames re-broadcast for other nodes"},
+    {"forward_failed", "Re-broadcasts esp_now_send refused"},
+    {"acks_sent", "ACKs sent for direct messages to this node"},
+    {"acks_received", "ACKs that released a pending message"},
+    {"retransmits", "Pending messages sent again"},
+    {"retransmit_giveups", "Pending messages held for their target after the last retry"},
+    {"pending_exhausted", "Direct sends refused because no pending slot was free"},
+    {"http_failed", "HTTP handlers that failed"},
+    {"group_forwards_skipped", "Group frames not forwarded because no subscriber was in range"},
+    {"presence_updates", "Local presence and typing changes"},
+    {"presence_frames", "Presence frames sent carrying those changes"},
+    {"store_held", "Direct messages held for a target out of reach"},
+    {"store_evicted", "Held messages dropped to make room for newer ones"},
+    {"store_flushed", "Held messages sent on when their target beaconed"},
+    {"store_delivered", "Held messages dropped when the target's ACK passed"},
+    {"store_expired", "Held messages dropped unanswered or past their TTL"},
+};
+
+static const char *const gauge_names[MESH_GAUGE_COUNT][3] = {
+    {"queue_depth", "gauge", "Messages in the local message queue"},
+    {"queue_high_water", "gauge", "Highest local message queue depth since boot"},
+    {"queue_enqueued_total", "counter", "Messages accepted by the local message queue"},
+    {"queue_dequeued_total", "counter", "Messages taken from the local message queue"},
+    {"queue_dropped_total", "counter", "Messages dropped because the local message queue was full"},
+    {"peers", "gauge", "Known mesh peers"},
+    {"free_heap_bytes", "gauge", "Free heap"},
+};
+
+// Histograms sharing a family name follow each other, so HELP/TYPE is written once
+static const char *const histogram_names[MESH_HIST_COUNT][3] = {
+    {"http_request_duration_seconds", "handler=\"send\"", "HTTP handler time"},
+    {"http_request_duration_seconds", "handler=\"messages\"", "HTTP handler time"},
+    {"http_request_duration_seconds", "handler=\"static\"", "HTTP handler time"},
+    {"http_request_duration_seconds", "handler=\"api\"", "HTTP handler time"},
+    {"ack_latency_seconds", NULL, "First send of a direct message to its ACK"},
+};
+
+void mesh_metrics_inc(mesh_metric_t metric)
+{
+    if (metric < MESH_METRIC_COUNT) {
+        atomic_fetch_add_explicit(&counters[metric], 1, memory_order_relaxed);
+    }
+}
+
+void mesh_metrics_observe_us(mesh_histogram_t histogram, int64_t elapsed_us)
+{
+    if (histogram >= MESH_HIST_COUNT) {
+        return;
+    }
+    uint32_t us = elapsed_us < 0 ? 0 : elapsed_us > UINT32_MAX ? UINT32_MAX : (uint32_t)elapsed_us;
+    int bucket = 0;
+    while (bucket < MESH_METRICS_BUCKETS && us > bucket_bounds_us[bucket]) {
+        bucket++;
+    }
+    atomic_fetch_add_explicit(&buckets[histogram][bucket], 1, memory_order_relaxed);
+    atomic_fetch_add_explicit(&sums_us[histogram], us, memory_order_relaxed);
+}
+
+// Counters are read one by one: a snapshot taken during an update may see a
+// bucket count without its sum, which the next scrape catches up on
+void mesh_metrics_snapshot(mesh_metrics_snapshot_t *snapshot)
+{
+    memset(snapshot, 0, sizeof(*snapshot));
+    snapshot->uptime_ms = (uint32_t)(esp_timer_get_time() / 1000);
+    for (int i = 0; i < MESH_METRIC_COUNT; i++) {
+        snapshot->counters[i] = atomic_load_explicit(&counters[i], memory_order_relaxed);
+    }
+    for (int h = 0; h < MESH_HIST_COUNT; h++) {
+        for (int b = 0; b <= MESH_METRICS_BUCKETS; b++) {
+            snapshot->buckets[h][b] = atomic_load_explicit(&buckets[h][b], memory_order_relaxed);
+        }
+        snapshot->sums_us[h] = atomic_load_explicit(&sums_us[h], memory_order_relaxed);
+    }
+
+    message_queue_stats_t queue;
+    message_queue_get_stats(&queue);
+    snapshot->gauges[MESH_GAUGE_QUEUE_DEPTH] = (uint32_t)queue.depth;
+    snapshot->gauges[MESH_GAUGE_QUEUE_HIGH_WATER] = (uint32_t)queue.high_water;
+    snapshot->gauges[MESH_GAUGE_QUEUE_ENQUEUED] = queue.enqueued;
+    snapshot->gauges[MESH_GAUGE_QUEUE_DEQUEUED] = queue.dequeued;
+    snapshot->gauges[MESH_GAUGE_QUEUE_DROPPED] = queue.dropped;
+    snapshot->gauges[MESH_GAUGE_PEERS] = (uint32_t)mesh_now_get_peer_count();
+    snapshot->gauges[MESH_GAUGE_FREE_HEAP] = esp_get_free_heap_size();
+}
+
+void mesh_metrics_reset(void)
+{
+    for (int i = 0; i < MESH_METRIC_COUNT; i++) {
+        atomic_store_explicit(&counters[i], 0, memory_order_relaxed);
+    }
+    for (int h = 0; h < MESH_HIST_COUNT; h++) {
+        for (int b = 0; b <= MESH_METRICS_BUCKETS; b++) {
+            atomic_store_explicit(&buckets[h][b], 0, memory_order_relaxed);
+        }
+        atomic_store_explicit(&sums_us[h], 0, memory_order_relaxed);
+    }
+}
+
+// Microseconds as decimal seconds, without floating point
+static void format_seconds(char *buf, size_t len, uint32_t us)
+{
+    snprintf(buf, len, "%u.%06u", (unsigned)(us / 1000000), (unsigned)(us % 1000000));
+}
+
+#define EMIT(...) \
+    do { \
+        int n = snprintf(line, sizeof(line), __VA_ARGS__); \
+        if (n < 0 || !write(line, (size_t)n < sizeof(line) ? (size_t)n : sizeof(line) - 1, ctx)) { \
+            return false; \
+        } \
+    } while (0)
+
+bool mesh_metrics_write_text(const mesh_metrics_snapshot_t *snapshot, mesh_metrics_writer_t write, void *ctx)
+{
+    char line[192];
+    char seconds[24];
+
+    EMIT("# HELP meshnow_uptime_seconds Time since boot\n# TYPE meshnow_uptime_seconds gauge\n");
+    EMIT("meshnow_uptime_seconds %u.%03u\n", (unsigned)(snapshot->uptime_ms / 1000),
+         (unsigned)(snapshot->uptime_ms % 1000));
+
+    for (int i = 0; i < MESH_METRIC_COUNT; i++) {
+        EMIT("# HELP meshnow_%s_total %s\n# TYPE meshnow_%s_total counter\n", counter_names[i][0],
+             counter_names[i][1], counter_names[i][0]);
+        EMIT("meshnow_%s_total %u\n", counter_names[i][0], (unsigned)snapshot->counters[i]);
+    }
+
+    for (int i = 0; i < MESH_GAUGE_COUNT; i++) {
+        EMIT("# HELP meshnow_%s %s\n# TYPE meshnow_%s %s\n", gauge_names[i][0], gauge_names[i][2],
+             gauge_names[i][0], gauge_names[i][1]);
+        EMIT("meshnow_%s %u\n", gauge_names[i][0], (unsigned)snapshot->gauges[i]);
+    }
+
+    for (int h = 0; h < MESH_HIST_COUNT; h++) {
+        const char *name = histogram_names[h][0];
+        const char *labels = histogram_names[h][1];
+        if (h == 0 || strcmp(name, histogram_names[h - 1][0]) != 0) {
+            EMIT("# HELP meshnow_%s %s\n# TYPE meshnow_%s histogram\n", name, histogram_names[h][2], name);
+        }
+        const char *sep = labels ? "," : "";
+        labels = labels ? labels : "";
+
+        uint32_t cumulative = 0;
+        for (int b = 0; b < MESH_METRICS_BUCKETS; b++) {
+            cumulative += snapshot->buckets[h][b];
+            format_seconds(seconds, sizeof(seconds), bucket_bounds_us[b]);
+            EMIT("meshnow_%s_bucket{%s%sle=\"%s\"} %u\n", name, labels, sep, seconds, (unsigned)cumulative);
+        }
+        cumulative += snapshot->buckets[h][MESH_METRICS_BUCKETS];
+        EMIT("meshnow_%s_bucket{%s%sle=\"+Inf\"} %u\n", name, labels, sep, (unsigned)cumulative);
+        format_seconds(seconds, sizeof(seconds), snapshot->sums_us[h]);
+        if (*labels) {
+            EMIT("meshnow_%s_sum{%s} %s\nmeshnow_%s_count{%s} %u\n", name, labels, seconds, name, labels,
+                 (unsigned)cumulative);
+        } else {
+            EMIT("meshnow_%s_sum %s\nmeshnow_%s_count %u\n", name, seconds, name, (unsigned)cumulative);
+        }
+    }
+    return true;
+}
+
+static uint8_t *put_u32(uint8_t *p, uint32_t value)
+{
+    p[0] = (uint8_t)value;
+    p[1] = (uint8_t)(value >> 8);
+    p[2] = (uint8_t)(value >> 16);
+    p[3] = (uint8_t)(value >> 24);
+    return p + 4;
+}
+
+size_t mesh_metrics_encode(const mesh_metrics_snapshot_t *snapshot, uint8_t *buf, size_t len)
+{
+    if (len < MESH_METRICS_BINARY_SIZE) {
+        return 0;
+    }
+
+    uint8_t *p = buf;
+    memcpy(p, MESH_METRICS_MAGIC, 3);
+    p[3] = MESH_METRICS_VERSION;
+    p[4] = MESH_METRIC_COUNT;
+    p[5] = MESH_GAUGE_COUNT;
+    p[6] = MESH_HIST_COUNT;
+    p[7] = MESH_METRICS_BUCKETS;
+    p = put_u32(p + 8, snapshot->uptime_ms);
+    for (int i = 0; i < MESH_METRIC_COUNT; i++) {
+        p = put_u32(p, snapshot->counters[i]);
+    }
+    for (int i = 0; i < MESH_GAUGE_COUNT; i++) {
+        p = put_u32(p, snapshot->gauges[i]);
+    }
+    for (int h = 0; h < MESH_HIST_COUNT; h++) {
+        for (int b = 0; b <= MESH_METRICS_BUCKETS; b++) {
+            p = put_u32(p, snapshot->buckets[h][b]);
+        }
+        p = put_u32(p, snapshot->sums_us[h]);
+    }
+    return (size_t)(p - buf);
+}
@@ -1,12 +1,18 @@
 #include "mesh_now.h"
 #include "message_queue.h"
+#include "mesh_metrics.h"
+#include "mesh_groups.h"
+#include "mesh_presence.h"
+#include "mesh_store.h"
 #include <esp_log.h>
 #include <esp_now.h>
 #include <esp_mac.h>
 #include <esp_timer.h>
+#include <esp_random.h>
 #include <esp_err.h>
 #include <freertos/FreeRTOS.h>
 #include <freertos/task.h>
+#include <freertos/semphr.h>
 #include <stddef.h>
 #include <string.h>
 
@@ -16,7 +22,6 @@
 #define MAX_PENDING_MESSAGES 16
 #define MAX_SEEN_MESSAGE_IDS 128
 #define MAX_ENCRYPTION_KEY 32
-#define MAX_GROUP_ID 255
 
 static mesh_peer_t peers[MAX_PEERS];
 static int peer_count = 0;
@@ -28,19 +33,26 @@ static bool encryption_enabled = false;
 static uint8_t encryption_key[MAX_ENCRYPTION_KEY];
 static size_t encryption_key_len = 0;
 static uint32_t next_message_id = 1;
-static uint8_t local_group_id = 0;
 
 typedef struct {
     bool active;
     mesh_message_t msg;
     uint8_t dest_mac[ESP_NOW_ETH_ALEN];
     int retries;
+    int64_t first_send_time_ms;
     int64_t last_send_time_ms;
 } pending_message_t;
 
 static pending_message_t pending_messages[MAX_PENDING_MESSAGES];
+// Message IDs already handled. The receive callback and /relay on the httpd
+// task both check and mark it, so they do both under the lock in one step.
 static uint32_t seen_message_ids[MAX_SEEN_MESSAGE_IDS];
 static int seen_message_count = 0;
+static SemaphoreHandle_t seen_lock = NULL;
+// Direct messages held for targets out of reach. The receive callback and the
+// retransmit task both change it, on either core, so every call takes the lock.
+static mesh_store_t store;
+static SemaphoreHandle_t store_lock = NULL;
 
 static uint32_t mesh_now_generate_message_id(void)
 {
@@ -71,6 +83,18 @@ static void mesh_now_mark_message_seen(uint32_t message_id)
     seen_message_ids[MAX_SEEN_MESSAGE_IDS - 1] = message_id;
 }
 
+// Returns whether message_id was already seen, marking it seen if not
+static bool mesh_now_seen_check_and_mark(uint32_t message_id)
+{
+    xSemaphoreTake(seen_lock, portMAX_DELAY);
+    bool seen = mesh_now_is_message_seen(message_id);
+    if (!seen) {
+        mesh_now_mark_message_seen(message_id);
+    }
+    xSemaphoreGive(seen_lock);
+    return seen;
+}
+
 static int mesh_now_allocate_pending(void)
 {
     for (int i = 0; i < MAX_PENDING_MESSAGES; ++i) {
@@ -122,6 +146,7 @@ static esp_err_t mesh_now_queue_packet(const uint8_t *dest_mac, mesh_message_t *
     int index = mesh_now_allocate_pending();
     if (index < 0) {
         ESP_LOGW(TAG, "No pending slots available for message %u", msg->message_id);
+        mesh_metrics_inc(MESH_METRIC_PENDING_EXHAUSTED);
         return ESP_ERR_NO_MEM;
     }
 
@@ -129,7 +154,8 @@ static esp_err_t mesh_now_queue_packet(const uint8_t *dest_mac, mesh_message_t *
     pending_messages[index].msg = *msg;
     memcpy(pending_messages[index].dest_mac, dest_mac, ESP_NOW_ETH_ALEN);
     pending_messages[index].retries = 0;
-    pending_messages[index].last_send_time_ms = esp_timer_get_time() / 1000;
+    pending_messages[index].first_send_time_ms = esp_timer_get_time() / 1000;
+    pending_messages[index].last_send_time_ms = pending_messages[index].first_send_time_ms;
 
     return ESP_OK;
 }
@@ -158,6 +184,22 @@ static esp_err_t mesh_now_send_packet(const uint8_t *dest_mac, mesh_message_t *m
     return ret;
 }
 
+// Hand a message to the local message queue when no receive callback is set
+static void mesh_now_queue_local(const mesh_message_t *mesh_msg, const char *kind)
+{
+    message_t msg;
+    memcpy(msg.message, mesh_msg->message, sizeof(msg.message));
+    msg.message[sizeof(msg.message) - 1] = '\0';
+    memcpy(msg.sender_mac, mesh_msg->sender_mac, sizeof(msg.sender_mac));
+    msg.timestamp = mesh_msg->timestamp;
+    msg.message_id = mesh_msg->message_id;
+    msg.type = mesh_msg->type;
+    msg.group_id = mesh_msg->group_id;
+    if (message_queue_send(&msg) == ESP_OK) {
+        ESP_LOGI(TAG, "Queued %s message: %s", kind, msg.message);
+    }
+}
+
 static void mesh_now_route_message(mesh_message_t *msg)
 {
     if (msg->hop_count == 0) {
@@ -173,6 +215,9 @@ static void mesh_now_route_message(mesh_message_t *msg)
     esp_err_t ret = esp_now_send(broadcast_mac, (uint8_t *)&forward, sizeof(mesh_message_t));
     if (ret != ESP_OK) {
         ESP_LOGW(TAG, "Failed to route message %u: %s", forward.message_id, esp_err_to_name(ret));
+        mesh_metrics_inc(MESH_METRIC_FORWARD_FAILED);
+    } else {
+        mesh_metrics_inc(MESH_METRIC_FORWARDED);
     }
 }
 
@@ -189,38 +234,123 @@ static void mesh_now_send_ack(const mesh_message_t *received_msg)
     esp_err_t ret = esp_now_send(broadcast_mac, (uint8_t *)&ack_msg, sizeof(mesh_message_t));
     if (ret != ESP_OK) {
         ESP_LOGW(TAG, "Failed to send ACK for message %u: %s", received_msg->message_id, esp_err_to_name(ret));
+    } else {
+        mesh_metrics_inc(MESH_METRIC_ACKS_SENT);
     }
 }
 
-static void retransmit_task(void *pvParameters)
+// A direct message for this node seen before: the ACK for it may have been
+// lost, or a node holding a copy has not heard it
+static void mesh_now_ack_duplicate(const mesh_message_t *msg)
 {
+    uint8_t my_mac[ESP_NOW_ETH_ALEN];
+    esp_read_mac(my_mac, ESP_MAC_WIFI_STA);
+    if (msg->type == MSG_TYPE_DIRECT && memcmp(msg->target_mac, my_mac, ESP_NOW_ETH_ALEN) == 0) {
+        mesh_now_send_ack(msg);
+    }
+}
+
+// Keep a copy of a direct message until its target ACKs it
+static void mesh_now_store_message(const mesh_message_t *msg, int64_t now_ms)
+{
+    xSemaphoreTake(store_lock, portMAX_DELAY);
+    bool evicted = mesh_store_put(&store, msg, now_ms);
+    xSemaphoreGive(store_lock);
+    if (evicted) {
+        mesh_metrics_inc(MESH_METRIC_STORE_EVICTED);
+    }
+    mesh_metrics_inc(MESH_METRIC_STORE_HELD);
+}
+
+// Hand a node that has just beaconed the copies held for it
+static void mesh_now_store_flush(const uint8_t *target_mac, int64_t now_ms)
+{
+    mesh_message_t msg;
     while (1) {
-        int64_t now_ms = esp_timer_get_time() / 1000;
-        for (int i = 0; i < MAX_PENDING_MESSAGES; ++i) {
-            pending_message_t *pending = &pending_messages[i];
-            if (!pending->active) {
-                continue;
-            }
+        // Not held over the send
+        xSemaphoreTake(store_lock, portMAX_DELAY);
+        bool due = mesh_store_take_due(&store, target_mac, &msg, now_ms);
+        xSemaphoreGive(store_lock);
+        if (!due) {
+            break;
+        }
+        // It is a neighbour, so the nodes around it need not pass this on
+        msg.hop_count = 1;
+        esp_err_t ret = esp_now_send(broadcast_mac, (uint8_t *)&msg, sizeof(mesh_message_t));
+        if (ret != ESP_OK) {
+            ESP_LOGW(TAG, "Failed to flush held message %u: %s", msg.message_id, esp_err_to_name(ret));
+        } else {
+            ESP_LOGI(TAG, "Flushed held message %u to its target", msg.message_id);
+            mesh_metrics_inc(MESH_METRIC_STORE_FLUSHED);
+        }
+    }
+}
 
-            if (now_ms - pending->last_send_time_ms < RETRANSMIT_TIMEOUT_MS) {
-                continue;
-            }
+static esp_err_t mesh_now_send_message_packet(mesh_message_t *msg, bool queue_for_retransmit);
 
-            if (pending->retries >= 3) {
-                ESP_LOGW(TAG, "Dropping message %u after %d retries", pending->msg.message_id, pending->retries);
-                pending->active = false;
-                continue;
-            }
+// Send the presence frame mesh_presence has gathered, if one is due
+static void mesh_now_presence_tick(int64_t now_ms)
+{
+    mesh_message_t msg;
+    memset(&msg, 0, sizeof(mesh_message_t));
+    if (!mesh_presence_poll((uint8_t *)msg.message, sizeof(msg.message), now_ms)) {
+        return;
+    }
+    msg.type = MSG_TYPE_PRESENCE;
+    if (mesh_now_send_message_packet(&msg, false) == ESP_OK) {
+        mesh_metrics_inc(MESH_METRIC_PRESENCE_FRAMES);
+    }
+}
 
-            pending->retries++;
-            pending->last_send_time_ms = now_ms;
-            esp_err_t ret = esp_now_send(pending->dest_mac, (uint8_t *)&pending->msg, sizeof(mesh_message_t));
-            if (ret == ESP_OK) {
-                ESP_LOGI(TAG, "Retransmitted message %u (retry %d)", pending->msg.message_id, pending->retries);
-            } else {
-                ESP_LOGW(TAG, "Retransmit failed for %u: %s", pending->msg.message_id, esp_err_to_name(ret));
-            }
+// Send pending messages again, holding those out of retries, and drop held
+// copies that have expired
+static void mesh_now_retransmit_tick(int64_t now_ms)
+{
+    for (int i = 0; i < MAX_PENDING_MESSAGES; ++i) {
+        pending_message_t *pending = &pending_messages[i];
+        if (!pending->active) {
+            continue;
+        }
+
+        if (now_ms - pending->last_send_time_ms < RETRANSMIT_TIMEOUT_MS) {
+            continue;
         }
+
+        if (pending->retries >= 3) {
+            ESP_LOGW(TAG, "Holding message %u for its target after %d retries", pending->msg.message_id,
+                     pending->retries);
+            mesh_metrics_inc(MESH_METRIC_RETRANSMIT_GIVEUPS);
+            pending->active = false;
+            // The target may be asleep or out of range; its next beacon flushes it
+            mesh_now_store_message(&pending->msg, now_ms);
+            continue;
+        }
+
+        pending->retries++;
+        pending->last_send_time_ms = now_ms;
+        esp_err_t ret = esp_now_send(pending->dest_mac, (uint8_t *)&pending->msg, sizeof(mesh_message_t));
+        if (ret == ESP_OK) {
+            ESP_LOGI(TAG, "Retransmitted message %u (retry %d)", pending->msg.message_id, pending->retries);
+            mesh_metrics_inc(MESH_METRIC_RETRANSMITS);
+        } else {
+            ESP_LOGW(TAG, "Retransmit failed for %u: %s", pending->msg.message_id, esp_err_to_name(ret));
+        }
+    }
+
+    xSemaphoreTake(store_lock, portMAX_DELAY);
+    size_t expired = mesh_store_expire(&store, now_ms);
+    xSemaphoreGive(store_lock);
+    for (; expired > 0; expired--) {
+        mesh_metrics_inc(MESH_METRIC_STORE_EXPIRED);
+    }
+}
+
+static void retransmit_task(void *pvParameters)
+{
+    while (1) {
+        int64_t now_ms = esp_timer_get_time() / 1000;
+        mesh_now_presence_tick(now_ms);
+        mesh_now_retransmit_tick(now_ms);
         vTaskDelay(pdMS_TO_TICKS(500));
     }
 }
@@ -231,12 +361,14 @@ static void esp_now_send_cb(const esp_now_send_info_t *send_info, esp_now_send_s
 {
     if (status == ESP_NOW_SEND_SUCCESS)
     {
+        mesh_metrics_inc(MESH_METRIC_FRAMES_SENT);
         ESP_LOGI(TAG, "Message sent successfully to %02x:%02x:%02x:%02x:%02x:%02x",
                  send_info->des_addr[0], send_info->des_addr[1], send_info->des_addr[2],
                  send_info->des_addr[3], send_info->des_addr[4], send_info->des_addr[5]);
     }
     else
     {
+        mesh_metrics_inc(MESH_METRIC_FRAMES_SEND_FAILED);
         ESP_LOGW(TAG, "Failed to send message to %02x:%02x:%02x:%02x:%02x:%02x",
                  send_info->des_addr[0], send_info->des_addr[1], send_info->des_addr[2],
                  send_info->des_addr[3], send_info->des_addr[4], send_info->des_addr[5]);
@@ -248,12 +380,14 @@ static void esp_now_send_cb(const uint8_t *mac_addr, esp_now_send_status_t statu
 {
     if (status == ESP_NOW_SEND_SUCCESS)
     {
+        mesh_metrics_inc(MESH_METRIC_FRAMES_SENT);
         ESP_LOGI(TAG, "Message sent successfully to %02x:%02x:%02x:%02x:%02x:%02x",
                  mac_addr[0], mac_addr[1], mac_addr[2],
                  mac_addr[3], mac_addr[4], mac_addr[5]);
     }
     else
     {
+        mesh_metrics_inc(MESH_METRIC_FRAMES_SEND_FAILED);
         ESP_LOGW(TAG, "Failed to send message to %02x:%02x:%02x:%02x:%02x:%02x",
                  mac_addr[0], mac_addr[1], mac_addr[2],
                  mac_addr[3], mac_addr[4], mac_addr[5]);
@@ -267,12 +401,14 @@ static void esp_now_recv_cb(const esp_now_recv_info_t *recv_info, const uint8_t
 {
     if (len != sizeof(mesh_message_t))
     {
-        ESP_LOGW(TAG, "Received invalid message length: %d (expected %d)", len, sizeof(mesh_message_t));
+        ESP_LOGW(TAG, "Received invalid message length: %d (expected %d)", len, (int)sizeof(mesh_message_t));
+        mesh_metrics_inc(MESH_METRIC_FRAMES_INVALID);
         return;
     }
 
     mesh_message_t mesh_msg;
     memcpy(&mesh_msg, data, sizeof(mesh_message_t));
+    mesh_metrics_inc(MESH_METRIC_FRAMES_RECEIVED);
 
     bool payload_encrypted = false;
     if (mesh_msg.flags & MSG_FLAG_ENCRYPTED) {
@@ -287,11 +423,12 @@ static void esp_now_recv_cb(const esp_now_recv_info_t *recv_info, const uint8_t
              mesh_msg.type, mesh_msg.message_id);
 
     if (mesh_msg.type != MSG_TYPE_BEACON && mesh_msg.type != MSG_TYPE_ACK) {
-        if (mesh_now_is_message_seen(mesh_msg.message_id)) {
+        if (mesh_now_seen_check_and_mark(mesh_msg.message_id)) {
             ESP_LOGW(TAG, "Duplicate message %u ignored", mesh_msg.message_id);
+            mesh_metrics_inc(MESH_METRIC_DUPLICATES);
+            mesh_now_ack_duplicate(&mesh_msg);
             return;
         }
-        mesh_now_mark_message_seen(mesh_msg.message_id);
     }
 
     if (mesh_msg.type == MSG_TYPE_BEACON)
@@ -299,13 +436,27 @@ static void esp_now_recv_cb(const esp_now_recv_info_t *recv_info, const uint8_t
         ESP_LOGI(TAG, "Received discovery beacon from %02x:%02x:%02x:%02x:%02x:%02x",
                  mesh_msg.sender_mac[0], mesh_msg.sender_mac[1], mesh_msg.sender_mac[2],
                  mesh_msg.sender_mac[3], mesh_msg.sender_mac[4], mesh_msg.sender_mac[5]);
+        mesh_metrics_inc(MESH_METRIC_BEACONS);
         mesh_now_add_peer(mesh_msg.sender_mac);
+        mesh_groups_note_beacon(mesh_msg.sender_mac, (const uint8_t *)mesh_msg.message, sizeof(mesh_msg.message),
+                                esp_timer_get_time() / 1000);
+        mesh_presence_note_beacon(mesh_msg.sender_mac, (const uint8_t *)mesh_msg.message, sizeof(mesh_msg.message),
+                                  esp_timer_get_time() / 1000);
+        mesh_now_store_flush(mesh_msg.sender_mac, esp_timer_get_time() / 1000);
     }
     else if (mesh_msg.type == MSG_TYPE_ACK)
     {
         uint8_t my_mac[ESP_NOW_ETH_ALEN];
         esp_read_mac(my_mac, ESP_MAC_WIFI_STA);
 
+        // Delivered, so a copy held for the target can go
+        xSemaphoreTake(store_lock, portMAX_DELAY);
+        bool held = mesh_store_ack(&store, mesh_msg.message_id);
+        xSemaphoreGive(store_lock);
+        if (held) {
+            mesh_metrics_inc(MESH_METRIC_STORE_DELIVERED);
+        }
+
         if (memcmp(mesh_msg.target_mac, my_mac, ESP_NOW_ETH_ALEN) != 0)
         {
             if (mesh_msg.hop_count > 0) {
@@ -319,23 +470,24 @@ static void esp_now_recv_cb(const esp_now_recv_info_t *recv_info, const uint8_t
 
         int pending_index = mesh_now_find_pending(mesh_msg.message_id);
         if (pending_index >= 0) {
+            int64_t sent_ms = pending_messages[pending_index].first_send_time_ms;
             mesh_now_release_pending(pending_index);
+            mesh_metrics_inc(MESH_METRIC_ACKS_RECEIVED);
+            mesh_metrics_observe_us(MESH_HIST_ACK_LATENCY, esp_timer_get_time() - sent_ms * 1000);
             ESP_LOGI(TAG, "Received ACK for message %u", mesh_msg.message_id);
         }
     }
     else if (mesh_msg.type == MSG_TYPE_CHAT)
     {
-        mesh_now_add_peer(mesh_msg.sender_mac);
+        // A relayed message's sender is on another island, out of radio range
+        if (!(mesh_msg.flags & MSG_FLAG_RELAYED)) {
+            mesh_now_add_peer(mesh_msg.sender_mac);
+        }
 
         if (receive_callback) {
             receive_callback(&mesh_msg);
         } else {
-            message_t msg;
-            strncpy(msg.message, mesh_msg.message, sizeof(msg.message));
-            memcpy(msg.sender_mac, mesh_msg.sender_mac, sizeof(msg.sender_mac));
-            msg.timestamp = mesh_msg.timestamp;
-            message_queue_send(&msg);
-            ESP_LOGI(TAG, "Queued chat message: %s", mesh_msg.message);
+            mesh_now_queue_local(&mesh_msg, "chat");
         }
 
         if (mesh_msg.hop_count > 0) {
@@ -353,6 +505,13 @@ static void esp_now_recv_cb(const esp_now_recv_info_t *recv_info, const uint8_t
         if (memcmp(mesh_msg.target_mac, my_mac, ESP_NOW_ETH_ALEN) != 0)
         {
             if (mesh_msg.hop_count > 0) {
+                if (payload_encrypted) {
+                    mesh_now_maybe_encrypt_message(&mesh_msg);
+                }
+                // A frame on its last hop is a flush to a neighbour, not ours to hold
+                if (mesh_msg.hop_count > 1 && (mesh_msg.flags & MSG_FLAG_REQUIRES_ACK)) {
+                    mesh_now_store_message(&mesh_msg, esp_timer_get_time() / 1000);
+                }
                 mesh_now_route_message(&mesh_msg);
             }
             return;
@@ -364,31 +523,25 @@ static void esp_now_recv_cb(const esp_now_recv_info_t *recv_info, const uint8_t
         if (receive_callback) {
             receive_callback(&mesh_msg);
         } else {
-            message_t msg;
-            strncpy(msg.message, mesh_msg.message, sizeof(msg.message));
-            memcpy(msg.sender_mac, mesh_msg.sender_mac, sizeof(msg.sender_mac));
-            msg.timestamp = mesh_msg.timestamp;
-            message_queue_send(&msg);
-            ESP_LOGI(TAG, "Queued direct message: %s", mesh_msg.message);
+            mesh_now_queue_local(&mesh_msg, "direct");
         }
     }
     else if (mesh_msg.type == MSG_TYPE_GROUP)
     {
         mesh_now_add_peer(mesh_msg.sender_mac);
-        if (mesh_msg.group_id == local_group_id) {
+        if (mesh_groups_is_member(mesh_msg.group_id)) {
             if (receive_callback) {
                 receive_callback(&mesh_msg);
             } else {
-                message_t msg;
-                strncpy(msg.message, mesh_msg.message, sizeof(msg.message));
-                memcpy(msg.sender_mac, mesh_msg.sender_mac, sizeof(msg.sender_mac));
-                msg.timestamp = mesh_msg.timestamp;
-                message_queue_send(&msg);
-                ESP_LOGI(TAG, "Queued group message: %s", mesh_msg.message);
+                mesh_now_queue_local(&mesh_msg, "group");
             }
         }
 
-        if (mesh_msg.hop_count > 0) {
+        if (mesh_msg.hop_count > 1 &&
+            !mesh_groups_should_forward(mesh_msg.group_id, mesh_msg.hop_count, esp_timer_get_time() / 1000)) {
+            // No subscriber within the frame's remaining hops
+            mesh_metrics_inc(MESH_METRIC_GROUP_FORWARDS_SKIPPED);
+        } else if (mesh_msg.hop_count > 0) {
             if (payload_encrypted) {
                 mesh_now_maybe_encrypt_message(&mesh_msg);
             }
@@ -397,10 +550,13 @@ static void esp_now_recv_cb(const esp_now_recv_info_t *recv_info, const uint8_t
     }
     else if (mesh_msg.type == MSG_TYPE_PRESENCE)
     {
+        uint8_t my_mac[ESP_NOW_ETH_ALEN];
+        esp_read_mac(my_mac, ESP_MAC_WIFI_STA);
+
         mesh_now_add_peer(mesh_msg.sender_mac);
-        if (receive_callback) {
-            receive_callback(&mesh_msg);
-        }
+        // State rather than chat: kept in mesh_presence until it times out
+        mesh_presence_note_frame(mesh_msg.sender_mac, my_mac, (const uint8_t *)mesh_msg.message,
+                                 sizeof(mesh_msg.message), esp_timer_get_time() / 1000);
         if (mesh_msg.hop_count > 0) {
             if (payload_encrypted) {
                 mesh_now_maybe_encrypt_message(&mesh_msg);
@@ -414,9 +570,9 @@ static void esp_now_recv_cb(const esp_now_recv_info_t *recv_info, const uint8_t
         esp_read_mac(my_mac, ESP_MAC_WIFI_STA);
 
         if (memcmp(mesh_msg.target_mac, my_mac, ESP_NOW_ETH_ALEN) == 0) {
-            if (receive_callback) {
-                receive_callback(&mesh_msg);
-            }
+            // Only older firmware sends these; newer nodes put typing in presence frames
+            mesh_presence_note_typing(mesh_msg.sender_mac, strcmp(mesh_msg.message, "typing") == 0,
+                                      esp_timer_get_time() / 1000);
         } else if (mesh_msg.hop_count > 0) {
             if (payload_encrypted) {
                 mesh_now_maybe_encrypt_message(&mesh_msg);
@@ -432,12 +588,14 @@ static void esp_now_recv_cb(const uint8_t *mac_addr, const uint8_t *data, int le
 {
     if (len != sizeof(mesh_message_t))
     {
-        ESP_LOGW(TAG, "Received invalid message length: %d (expected %d)", len, sizeof(mesh_message_t));
+        ESP_LOGW(TAG, "Received invalid message length: %d (expected %d)", len, (int)sizeof(mesh_message_t));
+        mesh_metrics_inc(MESH_METRIC_FRAMES_INVALID);
         return;
     }
 
     mesh_message_t mesh_msg;
     memcpy(&mesh_msg, data, sizeof(mesh_message_t));
+    mesh_metrics_inc(MESH_METRIC_FRAMES_RECEIVED);
 
     bool payload_encrypted = false;
     if (mesh_msg.flags & MSG_FLAG_ENCRYPTED) {
@@ -452,11 +610,12 @@ static void esp_now_recv_cb(const uint8_t *mac_addr, const uint8_t *data, int le
              mesh_msg.type, mesh_msg.message_id);
 
     if (mesh_msg.type != MSG_TYPE_BEACON && mesh_msg.type != MSG_TYPE_ACK) {
-        if (mesh_now_is_message_seen(mesh_msg.message_id)) {
+        if (mesh_now_seen_check_and_mark(mesh_msg.message_id)) {
             ESP_LOGW(TAG, "Duplicate message %u ignored", mesh_msg.message_id);
+            mesh_metrics_inc(MESH_METRIC_DUPLICATES);
+            mesh_now_ack_duplicate(&mesh_msg);
             return;
         }
-        mesh_now_mark_message_seen(mesh_msg.message_id);
     }
 
     if (mesh_msg.type == MSG_TYPE_BEACON)
@@ -464,13 +623,27 @@ static void esp_now_recv_cb(const uint8_t *mac_addr, const uint8_t *data, int le
         ESP_LOGI(TAG, "Received discovery beacon from %02x:%02x:%02x:%02x:%02x:%02x",
                  mesh_msg.sender_mac[0], mesh_msg.sender_mac[1], mesh_msg.sender_mac[2],
                  mesh_msg.sender_mac[3], mesh_msg.sender_mac[4], mesh_msg.sender_mac[5]);
+        mesh_metrics_inc(MESH_METRIC_BEACONS);
         mesh_now_add_peer(mesh_msg.sender_mac);
+        mesh_groups_note_beacon(mesh_msg.sender_mac, (const uint8_t *)mesh_msg.message, sizeof(mesh_msg.message),
+                                esp_timer_get_time() / 1000);
+        mesh_presence_note_beacon(mesh_msg.sender_mac, (const uint8_t *)mesh_msg.message, sizeof(mesh_msg.message),
+                                  esp_timer_get_time() / 1000);
+        mesh_now_store_flush(mesh_msg.sender_mac, esp_timer_get_time() / 1000);
     }
     else if (mesh_msg.type == MSG_TYPE_ACK)
     {
         uint8_t my_mac[ESP_NOW_ETH_ALEN];
         esp_read_mac(my_mac, ESP_MAC_WIFI_STA);
 
+        // Delivered, so a copy held for the target can go
+        xSemaphoreTake(store_lock, portMAX_DELAY);
+        bool held = mesh_store_ack(&store, mesh_msg.message_id);
+        xSemaphoreGive(store_lock);
+        if (held) {
+            mesh_metrics_inc(MESH_METRIC_STORE_DELIVERED);
+        }
+
         if (memcmp(mesh_msg.target_mac, my_mac, ESP_NOW_ETH_ALEN) != 0)
         {
             if (mesh_msg.hop_count > 0) {
@@ -484,23 +657,24 @@ static void esp_now_recv_cb(const uint8_t *mac_addr, const uint8_t *data, int le
 
         int pending_index = mesh_now_find_pending(mesh_msg.message_id);
         if (pending_index >= 0) {
+            int64_t sent_ms = pending_messages[pending_index].first_send_time_ms;
             mesh_now_release_pending(pending_index);
+            mesh_metrics_inc(MESH_METRIC_ACKS_RECEIVED);
+            mesh_metrics_observe_us(MESH_HIST_ACK_LATENCY, esp_timer_get_time() - sent_ms * 1000);
             ESP_LOGI(TAG, "Received ACK for message %u", mesh_msg.message_id);
         }
     }
     else if (mesh_msg.type == MSG_TYPE_CHAT)
     {
-        mesh_now_add_peer(mesh_msg.sender_mac);
+        // A relayed message's sender is on another island, out of radio range
+        if (!(mesh_msg.flags & MSG_FLAG_RELAYED)) {
+            mesh_now_add_peer(mesh_msg.sender_mac);
+        }
 
         if (receive_callback) {
             receive_callback(&mesh_msg);
         } else {
-            message_t msg;
-            strncpy(msg.message, mesh_msg.message, sizeof(msg.message));
-            memcpy(msg.sender_mac, mesh_msg.sender_mac, sizeof(msg.sender_mac));
-            msg.timestamp = mesh_msg.timestamp;
-            message_queue_send(&msg);
-            ESP_LOGI(TAG, "Queued chat message: %s", mesh_msg.message);
+            mesh_now_queue_local(&mesh_msg, "chat");
         }
 
         if (mesh_msg.hop_count > 0) {
@@ -518,6 +692,13 @@ static void esp_now_recv_cb(const uint8_t *mac_addr, const uint8_t *data, int le
         if (memcmp(mesh_msg.target_mac, my_mac, ESP_NOW_ETH_ALEN) != 0)
         {
             if (mesh_msg.hop_count > 0) {
+                if (payload_encrypted) {
+                    mesh_now_maybe_encrypt_message(&mesh_msg);
+                }
+                // A frame on its last hop is a flush to a neighbour, not ours to hold
+                if (mesh_msg.hop_count > 1 && (mesh_msg.flags & MSG_FLAG_REQUIRES_ACK)) {
+                    mesh_now_store_message(&mesh_msg, esp_timer_get_time() / 1000);
+                }
                 mesh_now_route_message(&mesh_msg);
             }
             return;
@@ -529,31 +710,25 @@ static void esp_now_recv_cb(const uint8_t *mac_addr, const uint8_t *data, int le
         if (receive_callback) {
             receive_callback(&mesh_msg);
         } else {
-            message_t msg;
-            strncpy(msg.message, mesh_msg.message, sizeof(msg.message));
-            memcpy(msg.sender_mac, mesh_msg.sender_mac, sizeof(msg.sender_mac));
-            msg.timestamp = mesh_msg.timestamp;
-            message_queue_send(&msg);
-            ESP_LOGI(TAG, "Queued direct message: %s", mesh_msg.message);
+            mesh_now_queue_local(&mesh_msg, "direct");
         }
     }
     else if (mesh_msg.type == MSG_TYPE_GROUP)
     {
         mesh_now_add_peer(mesh_msg.sender_mac);
-        if (mesh_msg.group_id == local_group_id) {
+        if (mesh_groups_is_member(mesh_msg.group_id)) {
             if (receive_callback) {
                 receive_callback(&mesh_msg);
             } else {
-                message_t msg;
-                strncpy(msg.message, mesh_msg.message, sizeof(msg.message));
-                memcpy(msg.sender_mac, mesh_msg.sender_mac, sizeof(msg.sender_mac));
-                msg.timestamp = mesh_msg.timestamp;
-                message_queue_send(&msg);
-                ESP_LOGI(TAG, "Queued group message: %s", mesh_msg.message);
+                mesh_now_queue_local(&mesh_msg, "group");
             }
         }
 
-        if (mesh_msg.hop_count > 0) {
+        if (mesh_msg.hop_count > 1 &&
+            !mesh_groups_should_forward(mesh_msg.group_id, mesh_msg.hop_count, esp_timer_get_time() / 1000)) {
+            // No subscriber within the frame's remaining hops
+            mesh_metrics_inc(MESH_METRIC_GROUP_FORWARDS_SKIPPED);
+        } else if (mesh_msg.hop_count > 0) {
             if (payload_encrypted) {
                 mesh_now_maybe_encrypt_message(&mesh_msg);
             }
@@ -562,10 +737,13 @@ static void esp_now_recv_cb(const uint8_t *mac_addr, const uint8_t *data, int le
     }
     else if (mesh_msg.type == MSG_TYPE_PRESENCE)
     {
+        uint8_t my_mac[ESP_NOW_ETH_ALEN];
+        esp_read_mac(my_mac, ESP_MAC_WIFI_STA);
+
         mesh_now_add_peer(mesh_msg.sender_mac);
-        if (receive_callback) {
-            receive_callback(&mesh_msg);
-        }
+        // State rather than chat: kept in mesh_presence until it times out
+        mesh_presence_note_frame(mesh_msg.sender_mac, my_mac, (const uint8_t *)mesh_msg.message,
+                                 sizeof(mesh_msg.message), esp_timer_get_time() / 1000);
         if (mesh_msg.hop_count > 0) {
             if (payload_encrypted) {
                 mesh_now_maybe_encrypt_message(&mesh_msg);
@@ -579,9 +757,9 @@ static void esp_now_recv_cb(const uint8_t *mac_addr, const uint8_t *data, int le
         esp_read_mac(my_mac, ESP_MAC_WIFI_STA);
 
         if (memcmp(mesh_msg.target_mac, my_mac, ESP_NOW_ETH_ALEN) == 0) {
-            if (receive_callback) {
-                receive_callback(&mesh_msg);
-            }
+            // Only older firmware sends these; newer nodes put typing in presence frames
+            mesh_presence_note_typing(mesh_msg.sender_mac, strcmp(mesh_msg.message, "typing") == 0,
+                                      esp_timer_get_time() / 1000);
         } else if (mesh_msg.hop_count > 0) {
             if (payload_encrypted) {
                 mesh_now_maybe_encrypt_message(&mesh_msg);
@@ -606,6 +784,9 @@ static void beacon_task(void *pvParameters)
     while (1)
     {
         beacon.timestamp = esp_timer_get_time() / 1000;
+        // Group levels ride in the beacon's unused payload, so they cost no airtime
+        mesh_groups_write_beacon((uint8_t *)beacon.message, sizeof(beacon.message), beacon.timestamp);
+        mesh_presence_write_beacon((uint8_t *)beacon.message, sizeof(beacon.message));
 
         // Send beacon to broadcast address for peer discovery
         esp_err_t ret = esp_now_send(broadcast_mac, (uint8_t *)&beacon, sizeof(mesh_message_t));
@@ -626,6 +807,28 @@ esp_err_t mesh_now_init(void)
 {
     ESP_LOGI(TAG, "Initializing ESP-NOW mesh networking");
 
+    // Nodes deduplicate by message ID alone, so IDs must not start at the
+    // same value on every node (relayed messages keep their sender's IDs)
+    next_message_id = esp_random();
+
+    // Before the callbacks that use them are registered
+    if (!store_lock) {
+        store_lock = xSemaphoreCreateMutex();
+        if (!store_lock)
+        {
+            ESP_LOGE(TAG, "Failed to create the store lock");
+            return ESP_ERR_NO_MEM;
+        }
+    }
+    if (!seen_lock) {
+        seen_lock = xSemaphoreCreateMutex();
+        if (!seen_lock)
+        {
+            ESP_LOGE(TAG, "Failed to create the seen-ID lock");
+            return ESP_ERR_NO_MEM;
+        }
+    }
+
     // Initialize ESP-NOW
     esp_err_t ret = esp_now_init();
     if (ret != ESP_OK)
@@ -736,6 +939,16 @@ esp_err_t mesh_now_deinit(void)
     // Clear peer list
     peer_count = 0;
 
+    // Nothing uses the store or the seen IDs once the callbacks and tasks are gone
+    if (store_lock) {
+        vSemaphoreDelete(store_lock);
+        store_lock = NULL;
+    }
+    if (seen_lock) {
+        vSemaphoreDelete(seen_lock);
+        seen_lock = NULL;
+    }
+
     ESP_LOGI(TAG, "ESP-NOW mesh networking deinitialized successfully");
     return ESP_OK;
 }
@@ -895,12 +1108,14 @@ esp_err_t mesh_now_send_group(uint8_t group_id, const char *message)
 
 esp_err_t mesh_now_send_presence(const char *status)
 {
-    mesh_message_t msg;
-    memset(&msg, 0, sizeof(mesh_message_t));
-    msg.type = MSG_TYPE_PRESENCE;
-    strncpy(msg.message, status, sizeof(msg.message) - 1);
-    msg.message[sizeof(msg.message) - 1] = '\0';
-    return mesh_now_send_message_packet(&msg, false);
+    if (status == NULL)
+    {
+        return ESP_ERR_INVALID_ARG;
+    }
+
+    mesh_presence_set_status(status, esp_timer_get_time() / 1000);
+    mesh_metrics_inc(MESH_METRIC_PRESENCE_UPDATES);
+    return ESP_OK;
 }
 
 esp_err_t mesh_now_send_typing(const uint8_t *target_mac, bool typing)
@@ -910,18 +1125,58 @@ esp_err_t mesh_now_send_typing(const uint8_t *target_mac, bool typing)
         return ESP_ERR_INVALID_ARG;
     }
 
+    mesh_presence_set_typing(target_mac, typing, esp_timer_get_time() / 1000);
+    mesh_metrics_inc(MESH_METRIC_PRESENCE_UPDATES);
+    return ESP_OK;
+}
+
+esp_err_t mesh_now_send_relay(const uint8_t *origin_mac, uint32_t message_id, const char *message)
+{
+    if (origin_mac == NULL || message == NULL || message_id == 0)
+    {
+        return ESP_ERR_INVALID_ARG;
+    }
+
+    // Already on this island: it started here or another bridge relayed it first
+    if (mesh_now_seen_check_and_mark(message_id)) {
+        return ESP_ERR_INVALID_STATE;
+    }
+
     mesh_message_t msg;
     memset(&msg, 0, sizeof(mesh_message_t));
-    msg.type = MSG_TYPE_TYPING;
-    memcpy(msg.target_mac, target_mac, ESP_NOW_ETH_ALEN);
-    strncpy(msg.message, typing ? "typing" : "stopped", sizeof(msg.message) - 1);
+    msg.type = MSG_TYPE_CHAT;
+    msg.flags = MSG_FLAG_RELAYED;
+    msg.hop_count = DEFAULT_ROUTE_TTL;
+    msg.message_id = message_id;
+    memcpy(msg.sender_mac, origin_mac, ESP_NOW_ETH_ALEN);
+    msg.timestamp = esp_timer_get_time() / 1000;
+    strncpy(msg.message, message, sizeof(msg.message) - 1);
     msg.message[sizeof(msg.message) - 1] = '\0';
-    return mesh_now_send_message_packet(&msg, false);
+
+    // Sent as a copy: encryption happens in place and local clients need plaintext
+    mesh_message_t wire = msg;
+    esp_err_t ret = mesh_now_send_packet(broadcast_mac, &wire, false);
+    if (ret == ESP_OK) {
+        ESP_LOGI(TAG, "Relayed message id %u", message_id);
+        // This node's own clients see it as if it had arrived over the air
+        if (receive_callback) {
+            receive_callback(&msg);
+        } else {
+            mesh_now_queue_local(&msg, "relayed");
+        }
+    }
+    return ret;
 }
 
 esp_err_t mesh_now_set_group(uint8_t group_id)
 {
-    local_group_id = group_id;
+    // The only subscription from now on; see mesh_groups.h to hold several
+    uint8_t groups[MESH_GROUP_COUNT];
+    size_t count = mesh_groups_list(groups, MESH_GROUP_COUNT);
+    for (size_t i = 0; i < count; i++) {
+        mesh_groups_leave(groups[i]);
+    }
+    mesh_groups_join(group_id);
     return ESP_OK;
 }
 
@@ -0,0 +1,260 @@
+#include "mesh_presence.h"
+#include <string.h>
+
+_Static_assert(MESH_PRESENCE_BEACON_SIZE <= MAX_MESH_MESSAGE_LEN, "beacon payload too small for the status");
+_Static_assert(MESH_PRESENCE_FRAME_SIZE <= MAX_MESH_MESSAGE_LEN, "presence frame payload too small");
+
+typedef struct {
+    bool used;
+    bool announced;             // In the last frame sent
+    uint8_t mac[ESP_NOW_ETH_ALEN];
+    int64_t last_key_ms;
+} typing_target_t;
+
+typedef struct {
+    bool used;
+    uint8_t mac[ESP_NOW_ETH_ALEN];
+    char status[MESH_PRESENCE_STATUS_LEN];
+    int64_t status_until_ms;
+    int64_t typing_until_ms;
+} presence_node_t;
+
+// Set from httpd, polled by the retransmit task and updated from the ESP-NOW
+// receive callback; like the peer table it is not locked
+static char local_status[MESH_PRESENCE_STATUS_LEN];
+static char announced_status[MESH_PRESENCE_STATUS_LEN];
+static typing_target_t typing_targets[MESH_PRESENCE_MAX_TYPING_TARGETS];
+static int64_t change_ms = -1;              // First change since the last frame, -1 if none
+static int64_t last_frame_ms = -1;
+static presence_node_t nodes[MESH_PRESENCE_MAX_NODES];
+
+void mesh_presence_reset(void)
+{
+    memset(local_status, 0, sizeof(local_status));
+    memset(announced_status, 0, sizeof(announced_status));
+    memset(typing_targets, 0, sizeof(typing_targets));
+    memset(nodes, 0, sizeof(nodes));
+    change_ms = -1;
+    last_frame_ms = -1;
+}
+
+static void note_change(int64_t now_ms)
+{
+    if (change_ms < 0) {
+        change_ms = now_ms;
+    }
+}
+
+void mesh_presence_set_status(const char *status, int64_t now_ms)
+{
+    strncpy(local_status, status, sizeof(local_status) - 1);
+    local_status[sizeof(local_status) - 1] = '\0';
+    note_change(now_ms);
+}
+
+void mesh_presence_set_typing(const uint8_t *target_mac, bool typing, int64_t now_ms)
+{
+    typing_target_t *slot = NULL;
+    typing_target_t *oldest = &typing_targets[0];
+    for (int i = 0; i < MESH_PRESENCE_MAX_TYPING_TARGETS; i++) {
+        typing_target_t *t = &typing_targets[i];
+        if (t->used && memcmp(t->mac, target_mac, ESP_NOW_ETH_ALEN) == 0) {
+            slot = t;
+            break;
+        }
+        if (!slot && !t->used) {
+            slot = t;
+        }
+        if (t->last_key_ms < oldest->last_key_ms) {
+            oldest = t;
+        }
+    }
+
+    if (!typing) {
+        // Receivers let it time out; nothing is sent for a stop
+        if (slot && slot->used) {
+            slot->used = false;
+        }
+        return;
+    }
+    if (!slot) {
+        slot = oldest;
+        slot->used = false;
+    }
+    if (!slot->used) {
+        slot->used = true;
+        slot->announced = false;
+        memcpy(slot->mac, target_mac, ESP_NOW_ETH_ALEN);
+        note_change(now_ms);
+    }
+    slot->last_key_ms = now_ms;
+}
+
+static bool frame_due(int64_t now_ms)
+{
+    bool typing = false;
+    bool changed = strcmp(local_status, announced_status) != 0;
+    for (int i = 0; i < MESH_PRESENCE_MAX_TYPING_TARGETS; i++) {
+        typing_target_t *t = &typing_targets[i];
+        if (t->used && now_ms - t->last_key_ms > MESH_TYPING_IDLE_MS) {
+            t->used = false;
+        }
+        if (t->used) {
+            typing = true;
+            changed |= !t->announced;
+        }
+    }
+
+    if (!changed) {
+        // Also covers a status set back to what was last sent
+        change_ms = -1;
+    } else if (change_ms >= 0 && now_ms - change_ms >= MESH_PRESENCE_DEBOUNCE_MS) {
+        return true;
+    }
+    if (last_frame_ms < 0) {
+        return false;
+    }
+    int64_t since_frame = now_ms - last_frame_ms;
+    return (typing && since_frame >= MESH_TYPING_REFRESH_MS) ||
+           (local_status[0] != '\0' && since_frame >= MESH_PRESENCE_REFRESH_MS);
+}
+
+bool mesh_presence_poll(uint8_t *payload, size_t len, int64_t now_ms)
+{
+    if (len < MESH_PRESENCE_FRAME_SIZE || !frame_due(now_ms)) {
+        return false;
+    }
+
+    memset(payload, 0, MESH_PRESENCE_FRAME_SIZE);
+    memcpy(payload, local_status, MESH_PRESENCE_STATUS_LEN);
+    payload[MESH_PRESENCE_TYPING_OFFSET] = MESH_PRESENCE_FRAME_VERSION;
+    uint8_t count = 0;
+    for (int i = 0; i < MESH_PRESENCE_MAX_TYPING_TARGETS; i++) {
+        typing_target_t *t = &typing_targets[i];
+        if (t->used) {
+            memcpy(&payload[MESH_PRESENCE_TYPING_OFFSET + 2 + count * ESP_NOW_ETH_ALEN], t->mac, ESP_NOW_ETH_ALEN);
+            t->announced = true;
+            count++;
+        }
+    }
+    payload[MESH_PRESENCE_TYPING_OFFSET + 1] = count;
+
+    memcpy(announced_status, local_status, sizeof(announced_status));
+    change_ms = -1;
+    last_frame_ms = now_ms;
+    return true;
+}
+
+void mesh_presence_write_beacon(uint8_t *payload, size_t len)
+{
+    if (len >= MESH_PRESENCE_BEACON_SIZE) {
+        memcpy(&payload[MESH_PRESENCE_BEACON_OFFSET], local_status, MESH_PRESENCE_STATUS_LEN);
+    }
+}
+
+static presence_node_t *find_node(const uint8_t *mac, bool create)
+{
+    presence_node_t *slot = NULL;
+    presence_node_t *stalest = &nodes[0];
+    for (int i = 0; i < MESH_PRESENCE_MAX_NODES; i++) {
+        presence_node_t *n = &nodes[i];
+        if (n->used && memcmp(n->mac, mac, ESP_NOW_ETH_ALEN) == 0) {
+            return n;
+        }
+        if (!slot && !n->used) {
+            slot = n;
+        }
+        int64_t until = n->status_until_ms > n->typing_until_ms ? n->status_until_ms : n->typing_until_ms;
+        int64_t stalest_until = stalest->status_until_ms > stalest->typing_until_ms ?
+                                stalest->status_until_ms : stalest->typing_until_ms;
+        if (until < stalest_until) {
+            stalest = n;
+        }
+    }
+    if (!create) {
+        return NULL;
+    }
+    if (!slot) {
+        slot = stalest;
+    }
+    memset(slot, 0, sizeof(*slot));
+    slot->used = true;
+    memcpy(slot->mac, mac, ESP_NOW_ETH_ALEN);
+    return slot;
+}
+
+static void note_status(const uint8_t *mac, const uint8_t *status, int64_t until_ms)
+{
+    // An empty status clears one already known and is not worth a slot
+    presence_node_t *n = find_node(mac, status[0] != '\0');
+    if (!n) {
+        return;
+    }
+    memcpy(n->status, status, MESH_PRESENCE_STATUS_LEN);
+    n->status[MESH_PRESENCE_STATUS_LEN - 1] = '\0';
+    if (status[0] == '\0') {
+        n->status_until_ms = 0;
+    } else if (until_ms > n->status_until_ms) {
+        n->status_until_ms = until_ms;
+    }
+}
+
+void mesh_presence_note_frame(const uint8_t *mac, const uint8_t *my_mac, const uint8_t *payload, size_t len,
+                              int64_t now_ms)
+{
+    if (len < MESH_PRESENCE_STATUS_LEN) {
+        return;
+    }
+    note_status(mac, payload, now_ms + MESH_PRESENCE_TIMEOUT_MS);
+
+    // Older firmware sent a bare status
+    if (len < MESH_PRESENCE_FRAME_SIZE || payload[MESH_PRESENCE_TYPING_OFFSET] != MESH_PRESENCE_FRAME_VERSION) {
+        return;
+    }
+    uint8_t count = payload[MESH_PRESENCE_TYPING_OFFSET + 1];
+    if (count > MESH_PRESENCE_MAX_TYPING_TARGETS) {
+        count = MESH_PRESENCE_MAX_TYPING_TARGETS;
+    }
+    for (uint8_t i = 0; i < count; i++) {
+        if (memcmp(&payload[MESH_PRESENCE_TYPING_OFFSET + 2 + i * ESP_NOW_ETH_ALEN], my_mac, ESP_NOW_ETH_ALEN) == 0) {
+            mesh_presence_note_typing(mac, true, now_ms);
+            break;
+        }
+    }
+}
+
+void mesh_presence_note_beacon(const uint8_t *mac, const uint8_t *payload, size_t len, int64_t now_ms)
+{
+    if (len < MESH_PRESENCE_BEACON_SIZE || payload[MESH_GROUP_BEACON_OFFSET] != MESH_GROUP_BEACON_VERSION) {
+        return;
+    }
+    note_status(mac, &payload[MESH_PRESENCE_BEACON_OFFSET], now_ms + MESH_PRESENCE_BEACON_TIMEOUT_MS);
+}
+
+void mesh_presence_note_typing(const uint8_t *mac, bool typing, int64_t now_ms)
+{
+    presence_node_t *n = find_node(mac, typing);
+    if (n) {
+        n->typing_until_ms = typing ? now_ms + MESH_TYPING_TIMEOUT_MS : 0;
+    }
+}
+
+size_t mesh_presence_list(mesh_presence_entry_t *entries, size_t max_entries, int64_t now_ms)
+{
+    size_t count = 0;
+    for (int i = 0; i < MESH_PRESENCE_MAX_NODES; i++) {
+        const presence_node_t *n = &nodes[i];
+        bool has_status = n->status_until_ms > now_ms;
+        bool typing = n->typing_until_ms > now_ms;
+        if (!n->used || (!has_status && !typing)) {
+            continue;
+        }
+        if (count < max_entries) {
+            memcpy(entries[count].mac, n->mac, ESP_NOW_ETH_ALEN);
+            memcpy(entries[count].status, has_status ? n->status : "", has_status ? sizeof(n->status) : 1);
+            entries[count].typing = typing;
+        }
+        count++;
+    }
+    return count;
+}
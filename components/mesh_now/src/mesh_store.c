@@ -0,0 +1,115 @@
+#include "mesh_store.h"
+#include <string.h>
+
+void mesh_store_init(mesh_store_t *store)
+{
+    memset(store, 0, sizeof(*store));
+}
+
+bool mesh_store_put(mesh_store_t *store, const mesh_message_t *msg, int64_t now_ms)
+{
+    mesh_store_entry_t *slot = NULL;
+    mesh_store_entry_t *oldest = NULL;
+    mesh_store_entry_t *oldest_for_target = NULL;
+    int for_target = 0;
+    for (int i = 0; i < MESH_STORE_MAX_ENTRIES; i++) {
+        mesh_store_entry_t *e = &store->entries[i];
+        if (!e->used) {
+            if (!slot) {
+                slot = e;
+            }
+            continue;
+        }
+        if (e->msg.message_id == msg->message_id) {
+            return false;
+        }
+        if (!oldest || e->stored_ms < oldest->stored_ms) {
+            oldest = e;
+        }
+        if (memcmp(e->msg.target_mac, msg->target_mac, ESP_NOW_ETH_ALEN) == 0) {
+            for_target++;
+            if (!oldest_for_target || e->stored_ms < oldest_for_target->stored_ms) {
+                oldest_for_target = e;
+            }
+        }
+    }
+
+    bool evicted = false;
+    if (for_target >= MESH_STORE_MAX_PER_TARGET) {
+        slot = oldest_for_target;
+        evicted = true;
+    } else if (!slot) {
+        slot = oldest;
+        evicted = true;
+    }
+    memset(slot, 0, sizeof(*slot));
+    slot->used = true;
+    slot->stored_ms = now_ms;
+    slot->msg = *msg;
+    return evicted;
+}
+
+bool mesh_store_ack(mesh_store_t *store, uint32_t message_id)
+{
+    for (int i = 0; i < MESH_STORE_MAX_ENTRIES; i++) {
+        mesh_store_entry_t *e = &store->entries[i];
+        if (e->used && e->msg.message_id == message_id) {
+            e->used = false;
+            return true;
+        }
+    }
+    return false;
+}
+
+bool mesh_store_take_due(mesh_store_t *store, const uint8_t *target_mac, mesh_message_t *out, int64_t now_ms)
+{
+    // Oldest first, so the target gets them in the order they were sent
+    mesh_store_entry_t *due = NULL;
+    for (int i = 0; i < MESH_STORE_MAX_ENTRIES; i++) {
+        mesh_store_entry_t *e = &store->entries[i];
+        if (!e->used || e->flushes >= MESH_STORE_MAX_FLUSHES ||
+            memcmp(e->msg.target_mac, target_mac, ESP_NOW_ETH_ALEN) != 0) {
+            continue;
+        }
+        if (e->flushes > 0 && now_ms - e->flushed_ms < MESH_STORE_FLUSH_RETRY_MS) {
+            continue;
+        }
+        if (!due || e->stored_ms < due->stored_ms) {
+            due = e;
+        }
+    }
+    if (!due) {
+        return false;
+    }
+    due->flushes++;
+    due->flushed_ms = now_ms;
+    *out = due->msg;
+    return true;
+}
+
+size_t mesh_store_expire(mesh_store_t *store, int64_t now_ms)
+{
+    size_t expired = 0;
+    for (int i = 0; i < MESH_STORE_MAX_ENTRIES; i++) {
+        mesh_store_entry_t *e = &store->entries[i];
+        if (!e->used) {
+            continue;
+        }
+        // The last flush gets its retry interval for the ACK to come back
+        bool unanswered = e->flushes >= MESH_STORE_MAX_FLUSHES && now_ms - e->flushed_ms >= MESH_STORE_FLUSH_RETRY_MS;
+        if (unanswered || now_ms - e->stored_ms >= MESH_STORE_TTL_MS) {
+            e->used = false;
+            expired++;
+        }
+    }
+    return expired;
+}
+
+size_t mesh_store_count(const mesh_store_t *store)
+{
+    size_t count = 0;
+    for (int i = 0; i < MESH_STORE_MAX_ENTRIES; i++) {
+        count += store->entries[i].used;
+    }
+    return count;
+}
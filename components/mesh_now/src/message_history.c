@@ -0,0 +1,462 @@
+#include "message_history.h"
+#include <esp_log.h>
+#include <esp_partition.h>
+#include <esp_rom_crc.h>
+#include <esp_timer.h>
+#include <freertos/FreeRTOS.h>
+#include <freertos/semphr.h>
+#include <freertos/task.h>
+#include <stdlib.h>
+#include <string.h>
+
+#define TAG "MSG_HISTORY"
+#define HISTORY_SECTOR_SIZE 4096
+#define RECORDS_PER_SECTOR (HISTORY_SECTOR_SIZE / MESSAGE_HISTORY_RECORD_SIZE)
+
+typedef struct __attribute__((packed)) {
+    uint16_t magic;
+    uint16_t length;
+    uint32_t seq;
+    uint32_t crc;
+    uint32_t reserved;
+} history_record_header_t;
+
+_Static_assert(sizeof(history_record_header_t) == MESSAGE_HISTORY_HEADER_SIZE, "history header size mismatch");
+
+static SemaphoreHandle_t history_lock = NULL;
+static TaskHandle_t history_task_handle = NULL;
+
+// RAM ring of the most recent entries
+static history_entry_t ram_entries[MESSAGE_HISTORY_RAM_RECORDS];
+static size_t ram_head = 0;
+static size_t ram_count = 0;
+
+static uint32_t next_seq = 1;
+static uint32_t persisted_seq = 0;
+
+// Flash log: a ring of sectors, each holding consecutive sequence numbers.
+// The RAM index keeps the first sequence number and record count per sector.
+static const esp_partition_t *partition = NULL;
+static size_t sector_count = 0;
+static uint32_t *sector_first_seq = NULL;
+static uint16_t *sector_records = NULL;
+static size_t write_slot = 0;
+
+static uint8_t flush_buffer[MESSAGE_HISTORY_FLUSH_BATCH * MESSAGE_HISTORY_RECORD_SIZE];
+
+static uint32_t history_record_crc(uint32_t seq, const message_t *msg)
+{
+    uint32_t crc = esp_rom_crc32_le(0, (const uint8_t *)&seq, sizeof(seq));
+    return esp_rom_crc32_le(crc, (const uint8_t *)msg, sizeof(message_t));
+}
+
+static void history_encode(uint8_t *dst, const history_entry_t *entry)
+{
+    history_record_header_t header = {
+        .magic = MESSAGE_HISTORY_MAGIC,
+        .length = sizeof(message_t),
+        .seq = entry->seq,
+        .crc = history_record_crc(entry->seq, &entry->msg),
+        .reserved = 0xFFFFFFFF,
+    };
+    memcpy(dst, &header, sizeof(header));
+    memcpy(dst + sizeof(header), &entry->msg, sizeof(message_t));
+}
+
+static bool history_read_slot(size_t slot, history_entry_t *entry)
+{
+    size_t offset = (slot / RECORDS_PER_SECTOR) * HISTORY_SECTOR_SIZE +
+                    (slot % RECORDS_PER_SECTOR) * MESSAGE_HISTORY_RECORD_SIZE;
+
+    history_record_header_t header;
+    if (esp_partition_read(partition, offset, &header, sizeof(header)) != ESP_OK) {
+        return false;
+    }
+    if (header.magic != MESSAGE_HISTORY_MAGIC || header.length != sizeof(message_t)) {
+        return false;
+    }
+    if (esp_partition_read(partition, offset + sizeof(header), &entry->msg, sizeof(message_t)) != ESP_OK) {
+        return false;
+    }
+    if (history_record_crc(header.seq, &entry->msg) != header.crc) {
+        return false;
+    }
+
+    entry->seq = header.seq;
+    return true;
+}
+
+static bool history_slot_is_blank(size_t slot)
+{
+    size_t offset = (slot / RECORDS_PER_SECTOR) * HISTORY_SECTOR_SIZE +
+                    (slot % RECORDS_PER_SECTOR) * MESSAGE_HISTORY_RECORD_SIZE;
+    uint32_t words[MESSAGE_HISTORY_RECORD_SIZE / sizeof(uint32_t)];
+
+    if (esp_partition_read(partition, offset, words, sizeof(words)) != ESP_OK) {
+        return false;
+    }
+    for (size_t i = 0; i < sizeof(words) / sizeof(words[0]); i++) {
+        if (words[i] != 0xFFFFFFFF) {
+            return false;
+        }
+    }
+    return true;
+}
+
+// Rebuild the per-sector index from flash and find the append position
+static void history_scan(void)
+{
+    size_t total_slots = sector_count * RECORDS_PER_SECTOR;
+    uint32_t max_seq = 0;
+    size_t max_slot = 0;
+    history_entry_t entry;
+
+    for (size_t sector = 0; sector < sector_count; sector++) {
+        sector_first_seq[sector] = 0;
+        sector_records[sector] = 0;
+
+        for (size_t r = 0; r < RECORDS_PER_SECTOR; r++) {
+            size_t slot = sector * RECORDS_PER_SECTOR + r;
+            if (!history_read_slot(slot, &entry)) {
+                break;
+            }
+            if (r == 0) {
+                sector_first_seq[sector] = entry.seq;
+            } else if (entry.seq != sector_first_seq[sector] + r) {
+                break;
+            }
+            sector_records[sector]++;
+
+            if (entry.seq > max_seq) {
+                max_seq = entry.seq;
+                max_slot = slot;
+            }
+        }
+    }
+
+    if (max_seq == 0) {
+        write_slot = 0;
+    } else {
+        write_slot = (max_slot + 1) % total_slots;
+        // A torn write after the last record makes the rest of that sector unusable
+        if (write_slot % RECORDS_PER_SECTOR != 0 && !history_slot_is_blank(write_slot)) {
+            write_slot = ((write_slot / RECORDS_PER_SECTOR + 1) * RECORDS_PER_SECTOR) % total_slots;
+        }
+    }
+
+    next_seq = max_seq + 1;
+    persisted_seq = max_seq;
+}
+
+static bool history_ram_get(uint32_t seq, history_entry_t *entry)
+{
+    uint32_t latest = next_seq - 1;
+    if (ram_count == 0 || seq > latest || latest - seq >= ram_count) {
+        return false;
+    }
+
+    size_t index = (ram_head + MESSAGE_HISTORY_RAM_RECORDS - 1 - (latest - seq)) % MESSAGE_HISTORY_RAM_RECORDS;
+    *entry = ram_entries[index];
+    return true;
+}
+
+static bool history_flash_get(uint32_t seq, history_entry_t *entry)
+{
+    if (!partition) {
+        return false;
+    }
+
+    for (size_t sector = 0; sector < sector_count; sector++) {
+        uint32_t first = sector_first_seq[sector];
+        if (first != 0 && seq >= first && seq < first + sector_records[sector]) {
+            return history_read_slot(sector * RECORDS_PER_SECTOR + (seq - first), entry);
+        }
+    }
+    return false;
+}
+
+static uint32_t history_oldest_locked(void)
+{
+    uint32_t oldest = 0;
+
+    for (size_t sector = 0; sector < sector_count; sector++) {
+        if (sector_first_seq[sector] != 0 && (oldest == 0 || sector_first_seq[sector] < oldest)) {
+            oldest = sector_first_seq[sector];
+        }
+    }
+
+    if (ram_count > 0) {
+        uint32_t ram_oldest = next_seq - ram_count;
+        if (oldest == 0 || ram_oldest < oldest) {
+            oldest = ram_oldest;
+        }
+    }
+    return oldest;
+}
+
+static esp_err_t history_flush_locked(void)
+{
+    uint32_t latest = next_seq - 1;
+
+    if (!partition) {
+        persisted_seq = latest;
+        return ESP_OK;
+    }
+
+    size_t total_slots = sector_count * RECORDS_PER_SECTOR;
+    while (persisted_seq < latest) {
+        size_t sector = write_slot / RECORDS_PER_SECTOR;
+        size_t in_sector = write_slot % RECORDS_PER_SECTOR;
+
+        // Entering a sector reclaims it: the oldest records are dropped
+        if (in_sector == 0) {
+            esp_err_t err = esp_partition_erase_range(partition, sector * HISTORY_SECTOR_SIZE, HISTORY_SECTOR_SIZE);
+            if (err != ESP_OK) {
+                ESP_LOGE(TAG, "Failed to erase history sector %d: %s", (int)sector, esp_err_to_name(err));
+                return err;
+            }
+            sector_first_seq[sector] = 0;
+            sector_records[sector] = 0;
+        }
+
+        // Write a contiguous run that stays inside the current sector
+        size_t run = latest - persisted_seq;
+        if (run > RECORDS_PER_SECTOR - in_sector) {
+            run = RECORDS_PER_SECTOR - in_sector;
+        }
+        if (run > MESSAGE_HISTORY_FLUSH_BATCH) {
+            run = MESSAGE_HISTORY_FLUSH_BATCH;
+        }
+
+        history_entry_t entry;
+        size_t encoded = 0;
+        for (size_t i = 0; i < run; i++) {
+            if (!history_ram_get(persisted_seq + 1 + i, &entry)) {
+                break;
+            }
+            history_encode(&flush_buffer[encoded * MESSAGE_HISTORY_RECORD_SIZE], &entry);
+            encoded++;
+        }
+
+        if (encoded == 0) {
+            // Entries already left the RAM ring; they cannot be persisted
+            ESP_LOGW(TAG, "Skipping %u unpersisted entries", (unsigned)(latest - persisted_seq));
+            persisted_seq = latest;
+            break;
+        }
+
+        size_t offset = sector * HISTORY_SECTOR_SIZE + in_sector * MESSAGE_HISTORY_RECORD_SIZE;
+        esp_err_t err = esp_partition_write(partition, offset, flush_buffer, encoded * MESSAGE_HISTORY_RECORD_SIZE);
+        if (err != ESP_OK) {
+            ESP_LOGE(TAG, "Failed to write history records: %s", esp_err_to_name(err));
+            return err;
+        }
+
+        if (sector_records[sector] == 0) {
+            sector_first_seq[sector] = persisted_seq + 1;
+        }
+        sector_records[sector] += encoded;
+        persisted_seq += encoded;
+        write_slot = (write_slot + encoded) % total_slots;
+    }
+
+    return ESP_OK;
+}
+
+// Drain the message queue into the history log, batching flash writes
+static void history_task(void *pvParameters)
+{
+    message_t batch[MESSAGE_HISTORY_FLUSH_BATCH];
+    int64_t last_flush_ms = esp_timer_get_time() / 1000;
+
+    while (1) {
+        size_t n = message_queue_receive_batch(batch, MESSAGE_HISTORY_FLUSH_BATCH,
+                                               pdMS_TO_TICKS(MESSAGE_HISTORY_FLUSH_INTERVAL_MS));
+        for (size_t i = 0; i < n; i++) {
+            message_history_append(&batch[i]);
+        }
+
+        int64_t now_ms = esp_timer_get_time() / 1000;
+        xSemaphoreTake(history_lock, portMAX_DELAY);
+        uint32_t pending = (next_seq - 1) - persisted_seq;
+        if (pending >= MESSAGE_HISTORY_FLUSH_BATCH ||
+            (pending > 0 && now_ms - last_flush_ms >= MESSAGE_HISTORY_FLUSH_INTERVAL_MS)) {
+            history_flush_locked();
+            last_flush_ms = now_ms;
+        }
+        xSemaphoreGive(history_lock);
+    }
+}
+
+esp_err_t message_history_init(void)
+{
+    if (history_lock) {
+        return ESP_OK; // Already initialized
+    }
+
+    history_lock = xSemaphoreCreateMutex();
+    if (!history_lock) {
+        ESP_LOGE(TAG, "Failed to create history lock");
+        return ESP_FAIL;
+    }
+
+    ram_head = 0;
+    ram_count = 0;
+    next_seq = 1;
+    persisted_seq = 0;
+
+    partition = esp_partition_find_first(ESP_PARTITION_TYPE_DATA, MESSAGE_HISTORY_SUBTYPE,
+                                         MESSAGE_HISTORY_PARTITION);
+    if (partition) {
+        sector_count = partition->size / HISTORY_SECTOR_SIZE;
+        sector_first_seq = calloc(sector_count, sizeof(uint32_t));
+        sector_records = calloc(sector_count, sizeof(uint16_t));
+        if (!sector_first_seq || !sector_records || sector_count < 2) {
+            ESP_LOGE(TAG, "History partition unusable, keeping history in RAM only");
+            free(sector_first_seq);
+            free(sector_records);
+            sector_first_seq = NULL;
+            sector_records = NULL;
+            sector_count = 0;
+            partition = NULL;
+        } else {
+            history_scan();
+            ESP_LOGI(TAG, "History log: %d sectors, entries %u..%u",
+                     (int)sector_count, (unsigned)history_oldest_locked(), (unsigned)persisted_seq);
+        }
+    } else {
+        ESP_LOGW(TAG, "No '%s' partition, keeping history in RAM only", MESSAGE_HISTORY_PARTITION);
+    }
+
+    BaseType_t task_ret = xTaskCreatePinnedToCore(
+        history_task,
+        "history_task",
+        4096,
+        NULL,
+        4,
+        &history_task_handle,
+        0  // CORE 0
+    );
+
+    if (task_ret != pdPASS) {
+        ESP_LOGE(TAG, "Failed to create history task");
+        return ESP_FAIL;
+    }
+
+    return ESP_OK;
+}
+
+esp_err_t message_history_deinit(void)
+{
+    if (history_task_handle) {
+        vTaskDelete(history_task_handle);
+        history_task_handle = NULL;
+    }
+
+    if (history_lock) {
+        message_history_flush();
+        vSemaphoreDelete(history_lock);
+        history_lock = NULL;
+    }
+
+    free(sector_first_seq);
+    free(sector_records);
+    sector_first_seq = NULL;
+    sector_records = NULL;
+    sector_count = 0;
+    partition = NULL;
+    return ESP_OK;
+}
+
+uint32_t message_history_append(const message_t *msg)
+{
+    if (!history_lock || !msg) {
+        return 0;
+    }
+
+    xSemaphoreTake(history_lock, portMAX_DELAY);
+    history_entry_t *entry = &ram_entries[ram_head];
+    entry->seq = next_seq++;
+    entry->msg = *msg;
+    ram_head = (ram_head + 1) % MESSAGE_HISTORY_RAM_RECORDS;
+    if (ram_count < MESSAGE_HISTORY_RAM_RECORDS) {
+        ram_count++;
+    }
+    uint32_t seq = entry->seq;
+    xSemaphoreGive(history_lock);
+
+    return seq;
+}
+
+esp_err_t message_history_flush(void)
+{
+    if (!history_lock) {
+        return ESP_ERR_INVALID_STATE;
+    }
+
+    xSemaphoreTake(history_lock, portMAX_DELAY);
+    esp_err_t err = history_flush_locked();
+    xSemaphoreGive(history_lock);
+    return err;
+}
+
+size_t message_history_read(uint32_t since, size_t limit, message_history_visitor_t visitor, void *ctx)
+{
+    if (!history_lock || !visitor || limit == 0) {
+        return 0;
+    }
+
+    xSemaphoreTake(history_lock, portMAX_DELAY);
+    uint32_t oldest = history_oldest_locked();
+    uint32_t latest = next_seq - 1;
+    xSemaphoreGive(history_lock);
+
+    if (oldest == 0) {
+        return 0;
+    }
+
+    uint32_t seq = since + 1 > oldest ? since + 1 : oldest;
+    size_t visited = 0;
+    history_entry_t entry;
+
+    // Copy one entry at a time so the visitor runs without the lock held
+    for (; seq <= latest && visited < limit; seq++) {
+        xSemaphoreTake(history_lock, portMAX_DELAY);
+        bool found = history_ram_get(seq, &entry) || history_flash_get(seq, &entry);
+        xSemaphoreGive(history_lock);
+
+        if (!found) {
+            continue;
+        }
+        visited++;
+        if (!visitor(&entry, ctx)) {
+            break;
+        }
+    }
+
+    return visited;
+}
+
+uint32_t message_history_oldest_seq(void)
+{
+    if (!history_lock) {
+        return 0;
+    }
+
+    xSemaphoreTake(history_lock, portMAX_DELAY);
+    uint32_t oldest = history_oldest_locked();
+    xSemaphoreGive(history_lock);
+    return oldest;
+}
+
+uint32_t message_history_latest_seq(void)
+{
+    if (!history_lock) {
+        return 0;
+    }
+
+    xSemaphoreTake(history_lock, portMAX_DELAY);
+    uint32_t latest = next_seq - 1;
+    xSemaphoreGive(history_lock);
+    return latest;
+}
@@ -0,0 +1,50 @@
+#include "message_json.h"
+#include <inttypes.h>
+#include <stdio.h>
+#include <string.h>
+
+void message_json_escape(char *dst, size_t dst_len, const char *src)
+{
+    size_t len = 0;
+    for (; *src && len + 7 < dst_len; src++) {
+        unsigned char c = (unsigned char)*src;
+        if (c == '"' || c == '\\') {
+            dst[len++] = '\\';
+            dst[len++] = (char)c;
+        } else if (c < 0x20) {
+            len += snprintf(dst + len, dst_len - len, "\\u%04x", c);
+        } else {
+            dst[len++] = (char)c;
+        }
+    }
+    dst[len] = '\0';
+}
+
+size_t message_json_entry(char *dst, size_t dst_len, const history_entry_t *entry, bool first)
+{
+    const message_t *msg = &entry->msg;
+
+    char group_field[16] = "";
+    if (msg->type == MSG_TYPE_GROUP) {
+        snprintf(group_field, sizeof(group_field), ",\"group\":%u", msg->group_id);
+    }
+
+    // The stored text may fill the whole field
+    char text[MAX_MESH_MESSAGE_LEN];
+    memcpy(text, msg->message, sizeof(text));
+    text[sizeof(text) - 1] = '\0';
+    char content[MESSAGE_JSON_ESCAPED_LEN(MAX_MESH_MESSAGE_LEN)];
+    message_json_escape(content, sizeof(content), text);
+
+    int len = snprintf(dst, dst_len,
+                       "%s{\"seq\":%" PRIu32 ",\"id\":%" PRIu32 "%s,\"sender\":\"%02x:%02x:%02x:%02x:%02x:%02x\","
+                       "\"content\":\"%s\",\"timestamp\":%" PRIu32 "}",
+                       first ? "" : ",", entry->seq, msg->message_id, group_field,
+                       msg->sender_mac[0], msg->sender_mac[1], msg->sender_mac[2],
+                       msg->sender_mac[3], msg->sender_mac[4], msg->sender_mac[5],
+                       content, msg->timestamp);
+    if (len < 0) {
+        return 0;
+    }
+    return (size_t)len < dst_len ? (size_t)len : dst_len - 1;
+}
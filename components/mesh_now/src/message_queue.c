@@ -1,61 +1,175 @@
 #include "message_queue.h"
 #include <esp_log.h>
 #include <freertos/FreeRTOS.h>
+#include <freertos/semphr.h>
+#include <string.h>
 
 #define TAG "MSG_QUEUE"
-#define QUEUE_SIZE 50
 
-static QueueHandle_t message_queue = NULL;
+// Fixed-slot ring buffer. Producers copy into the slot at head; the single
+// consumer reads slots in place from tail and releases them with commit, so
+// a slot is never overwritten while the consumer still holds a reference.
+static message_t slots[MESSAGE_QUEUE_SIZE];
+static size_t head = 0;
+static size_t tail = 0;
+static size_t count = 0;
+static message_queue_stats_t stats;
+
+static SemaphoreHandle_t queue_lock = NULL;
+static SemaphoreHandle_t data_ready = NULL;
 
 esp_err_t message_queue_init(void) {
-    if (message_queue) {
+    if (queue_lock) {
         return ESP_OK; // Already initialized
     }
 
-    message_queue = xQueueCreate(QUEUE_SIZE, sizeof(message_t));
-    if (!message_queue) {
+    queue_lock = xSemaphoreCreateMutex();
+    data_ready = xSemaphoreCreateBinary();
+    if (!queue_lock || !data_ready) {
         ESP_LOGE(TAG, "Failed to create message queue");
+        if (queue_lock) {
+            vSemaphoreDelete(queue_lock);
+            queue_lock = NULL;
+        }
+        if (data_ready) {
+            vSemaphoreDelete(data_ready);
+            data_ready = NULL;
+        }
         return ESP_FAIL;
     }
 
-    ESP_LOGI(TAG, "Message queue initialized");
+    head = 0;
+    tail = 0;
+    count = 0;
+    memset(&stats, 0, sizeof(stats));
+
+    ESP_LOGI(TAG, "Message queue initialized (%d slots)", MESSAGE_QUEUE_SIZE);
     return ESP_OK;
 }
 
 esp_err_t message_queue_deinit(void) {
-    if (message_queue) {
-        vQueueDelete(message_queue);
-        message_queue = NULL;
+    if (queue_lock) {
+        vSemaphoreDelete(queue_lock);
+        vSemaphoreDelete(data_ready);
+        queue_lock = NULL;
+        data_ready = NULL;
         ESP_LOGI(TAG, "Message queue deinitialized");
     }
     return ESP_OK;
 }
 
-QueueHandle_t message_queue_get_handle(void) {
-    return message_queue;
+// Wait until at least one message is queued. Returns with the lock held.
+static bool message_queue_wait_locked(TickType_t timeout) {
+    xSemaphoreTake(queue_lock, portMAX_DELAY);
+    if (count > 0 || timeout == 0) {
+        return count > 0;
+    }
+
+    xSemaphoreGive(queue_lock);
+    xSemaphoreTake(data_ready, timeout);
+    xSemaphoreTake(queue_lock, portMAX_DELAY);
+    return count > 0;
+}
+
+size_t message_queue_send_many(const message_t *msgs, size_t n) {
+    if (!queue_lock || !msgs || n == 0) {
+        return 0;
+    }
+
+    xSemaphoreTake(queue_lock, portMAX_DELAY);
+    size_t accepted = 0;
+    while (accepted < n && count < MESSAGE_QUEUE_SIZE) {
+        slots[head] = msgs[accepted];
+        head = (head + 1) % MESSAGE_QUEUE_SIZE;
+        count++;
+        accepted++;
+    }
+
+    stats.enqueued += accepted;
+    stats.dropped += n - accepted;
+    if (count > stats.high_water) {
+        stats.high_water = count;
+    }
+    xSemaphoreGive(queue_lock);
+
+    if (accepted > 0) {
+        xSemaphoreGive(data_ready);
+    }
+    if (accepted < n) {
+        ESP_LOGW(TAG, "Queue full, dropped %d message(s)", (int)(n - accepted));
+    }
+
+    return accepted;
 }
 
 esp_err_t message_queue_send(const message_t *msg) {
-    if (!message_queue || !msg) {
-        return ESP_FAIL;
+    return message_queue_send_many(msg, 1) == 1 ? ESP_OK : ESP_FAIL;
+}
+
+size_t message_queue_peek(const message_t **refs, size_t max_count, TickType_t timeout) {
+    if (!queue_lock || !refs || max_count == 0) {
+        return 0;
     }
 
-    if (xQueueSend(message_queue, msg, 0) != pdTRUE) {
-        ESP_LOGW(TAG, "Failed to send message to queue");
-        return ESP_FAIL;
+    message_queue_wait_locked(timeout);
+    size_t n = count < max_count ? count : max_count;
+    for (size_t i = 0; i < n; i++) {
+        refs[i] = &slots[(tail + i) % MESSAGE_QUEUE_SIZE];
     }
+    xSemaphoreGive(queue_lock);
 
-    return ESP_OK;
+    return n;
+}
+
+void message_queue_commit(size_t n) {
+    if (!queue_lock || n == 0) {
+        return;
+    }
+
+    xSemaphoreTake(queue_lock, portMAX_DELAY);
+    if (n > count) {
+        n = count;
+    }
+    tail = (tail + n) % MESSAGE_QUEUE_SIZE;
+    count -= n;
+    stats.dequeued += n;
+    xSemaphoreGive(queue_lock);
+}
+
+size_t message_queue_receive_batch(message_t *msgs, size_t max_count, TickType_t timeout) {
+    if (!queue_lock || !msgs || max_count == 0) {
+        return 0;
+    }
+
+    message_queue_wait_locked(timeout);
+    size_t n = count < max_count ? count : max_count;
+    for (size_t i = 0; i < n; i++) {
+        msgs[i] = slots[tail];
+        tail = (tail + 1) % MESSAGE_QUEUE_SIZE;
+    }
+    count -= n;
+    stats.dequeued += n;
+    xSemaphoreGive(queue_lock);
+
+    return n;
 }
 
 esp_err_t message_queue_receive(message_t *msg, TickType_t timeout) {
-    if (!message_queue || !msg) {
-        return ESP_FAIL;
+    return message_queue_receive_batch(msg, 1, timeout) == 1 ? ESP_OK : ESP_FAIL;
+}
+
+void message_queue_get_stats(message_queue_stats_t *out) {
+    if (!out) {
+        return;
     }
 
-    if (xQueueReceive(message_queue, msg, timeout) != pdTRUE) {
-        return ESP_FAIL;
+    if (!queue_lock) {
+        memset(out, 0, sizeof(*out));
+        return;
     }
 
-    return ESP_OK;
-}
\ No newline at end of file
+    xSemaphoreTake(queue_lock, portMAX_DELAY);
+    *out = stats;
+    out->depth = count;
+    xSemaphoreGive(queue_lock);
+}
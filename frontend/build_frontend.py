@@ -6,44 +6,36 @@ Python version - Platform agnostic with TUI
 
 import os
 import sys
-import subprocess
 import argparse
+import importlib.util
 from pathlib import Path
 
-try:
-    from rich.console import Console
-    from rich.progress import Progress, SpinnerColumn, TextColumn
-    from rich.panel import Panel
-    from rich.text import Text
-    RICH_AVAILABLE = True
-except ImportError:
-    RICH_AVAILABLE = False
+# The subprocess runner is shared with the build and flash scripts
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+from command_runner import command_log, echo_to, log_path, run
+
+# rich is imported where output is drawn, so --ci runs never load it
+RICH_AVAILABLE = importlib.util.find_spec("rich") is not None
 
 def setup_console():
     """Setup console for output"""
     if RICH_AVAILABLE:
+        from rich.console import Console
         return Console()
     else:
         return None
 
-def run_command(cmd, console=None, ci_mode=False, cwd=None):
-    """Run a command and return success"""
-    try:
-        if ci_mode:
-            result = subprocess.run(cmd, shell=True, cwd=cwd, capture_output=True, text=True)
-        else:
-            result = subprocess.run(cmd, shell=True, cwd=cwd, capture_output=True, text=True)
-
-        if result.returncode != 0:
-            if console and not ci_mode:
-                console.print(f"[red]Command failed: {cmd}[/red]")
-                console.print(f"[dim]{result.stderr}[/dim]")
-            return False, result.stderr
-        return True, result.stdout
-    except Exception as e:
-        if console and not ci_mode:
-            console.print(f"[red]Error running command: {e}[/red]")
-        return False, str(e)
+def run_command(cmd, console=None, ci_mode=False, cwd=None, on_line=None):
+    """Run a command and return success and its output (the last lines)"""
+    result = run(cmd, cwd=cwd, on_line=on_line, log=command_log("frontend"))
+    if not result.ok and console and not ci_mode:
+        console.print(f"[red]Command failed: {cmd}[/red]")
+        if on_line is None:
+            echo = echo_to(console, "   ")
+            for line in result.tail(30):
+                echo(line)
+        console.print(f"[dim]Full output: {log_path('frontend')}[/dim]")
+    return result.ok, result.error or result.output
 
 def check_nodejs(console, ci_mode=False):
     """Check if Node.js is available"""
@@ -80,7 +72,8 @@ def install_dependencies(console, script_dir, ci_mode=False):
         if console and not ci_mode:
             console.print("[yellow]Installing dependencies...[/yellow]")
 
-        success, _ = run_command("npm install", console, ci_mode, cwd=script_dir)
+        success, _ = run_command("npm install", console, ci_mode, cwd=script_dir,
+                                 on_line=None if ci_mode else echo_to(console, "   "))
         if not success:
             if console and not ci_mode:
                 console.print("[red]Failed to install dependencies[/red]")
@@ -100,7 +93,8 @@ def build_frontend(console, script_dir, ci_mode=False):
         console.print("[bold blue]Building frontend...[/bold blue]")
         console.print()
 
-    success, _ = run_command("npm run build", console, ci_mode, cwd=script_dir)
+    success, _ = run_command("npm run build", console, ci_mode, cwd=script_dir,
+                             on_line=None if ci_mode else echo_to(console, "   "))
     if not success:
         if console and not ci_mode:
             console.print("[red]Frontend build failed[/red]")
@@ -135,6 +129,8 @@ def main():
 
     if console and not args.ci:
         # Show header
+        from rich.panel import Panel
+        from rich.text import Text
         title = Text("Mesh-NOW Frontend Builder", style="bold blue")
         panel = Panel(title, border_style="blue")
         console.print(panel)
@@ -0,0 +1,162 @@
+// Message list benchmark
+// Pushes synthetic messages into the virtualized list and reports frame
+// times. Built only with `npm run bench`; never embedded in the firmware.
+//
+// Query parameters: count (default 100000), batch (messages per frame,
+// default 200), capacity (store cap, default list default).
+
+import './styles.css';
+import { FrameStats, VirtualMessageList } from './messageList';
+
+interface PhaseResult {
+    name: string;
+    frames: number;
+    totalMs: number;
+    p50: number;
+    p95: number;
+    p99: number;
+    max: number;
+    over16: number;
+}
+
+interface BenchmarkResult {
+    count: number;
+    batch: number;
+    phases: PhaseResult[];
+    stored: number;
+    compacted: number;
+    domNodes: number;
+    heapMB: number | null;
+}
+
+declare global {
+    interface Window {
+        benchmarkResult?: BenchmarkResult;
+    }
+}
+
+const SENDERS = ['24:6f:28:00:00:01', '24:6f:28:00:00:02', '24:6f:28:00:00:03', '30:ae:a4:12:34:56'];
+const WORDS = ['mesh', 'node', 'hello', 'relay', 'espnow', 'packet', 'channel', 'peer', 'ok', 'ping'];
+
+function syntheticMessage(i: number): string {
+    // Deterministic, varied lengths (1-3 lines) like real chat
+    const words = 3 + ((i * 7919) % 20);
+    const parts: string[] = [`#${i}`];
+    for (let w = 0; w < words; w++) {
+        parts.push(WORDS[(i + w * 31) % WORDS.length]);
+    }
+    return parts.join(' ').slice(0, 127);
+}
+
+function percentile(sorted: number[], p: number): number {
+    if (sorted.length === 0) return 0;
+    return sorted[Math.min(sorted.length - 1, Math.floor(sorted.length * p))];
+}
+
+function summarize(name: string, frameTimes: number[], totalMs: number): PhaseResult {
+    const sorted = [...frameTimes].sort((a, b) => a - b);
+    return {
+        name,
+        frames: frameTimes.length,
+        totalMs,
+        p50: percentile(sorted, 0.5),
+        p95: percentile(sorted, 0.95),
+        p99: percentile(sorted, 0.99),
+        max: sorted.length ? sorted[sorted.length - 1] : 0,
+        over16: frameTimes.filter(t => t > 16.7).length,
+    };
+}
+
+function nextFrame(): Promise<number> {
+    return new Promise(resolve => requestAnimationFrame(resolve));
+}
+
+// Measure frame-to-frame intervals while step() runs once per frame
+async function runPhase(name: string, frames: number, step: (frame: number) => void): Promise<PhaseResult> {
+    const intervals: number[] = [];
+    const start = performance.now();
+    let last = await nextFrame();
+    for (let f = 0; f < frames; f++) {
+        step(f);
+        const now = await nextFrame();
+        intervals.push(now - last);
+        last = now;
+    }
+    return summarize(name, intervals, performance.now() - start);
+}
+
+async function run(): Promise<void> {
+    const params = new URLSearchParams(location.search);
+    const count = Number(params.get('count') || 100000);
+    const batch = Number(params.get('batch') || 200);
+    const capacity = params.get('capacity') ? Number(params.get('capacity')) : undefined;
+
+    const app = document.getElementById('app')!;
+    const container = document.createElement('div');
+    container.className = 'container';
+    const header = document.createElement('header');
+    header.innerHTML = '<h1>Mesh-NOW list benchmark</h1>';
+    const viewport = document.createElement('div');
+    viewport.className = 'messages';
+    const report = document.createElement('pre');
+    report.className = 'benchmark-report';
+    report.textContent = `Pushing ${count} messages, ${batch} per frame...`;
+    container.appendChild(header);
+    container.appendChild(viewport);
+    container.appendChild(report);
+    app.appendChild(container);
+
+    const list = new VirtualMessageList(viewport, { capacity });
+    const callbackTimes: number[] = [];
+    list.onFrame = (stats: FrameStats) => callbackTimes.push(stats.duration);
+
+    const phases: PhaseResult[] = [];
+    let pushed = 0;
+    phases.push(await runPhase('append', Math.ceil(count / batch), () => {
+        const end = Math.min(count, pushed + batch);
+        for (; pushed < end; pushed++) {
+            list.append(SENDERS[pushed % SENDERS.length], syntheticMessage(pushed));
+        }
+    }));
+    phases.push(summarize('append (list work only)', callbackTimes, callbackTimes.reduce((a, b) => a + b, 0)));
+
+    // Scroll from top to bottom of what is still stored
+    const scrollFrames = 240;
+    viewport.scrollTop = 0;
+    phases.push(await runPhase('scroll', scrollFrames, f => {
+        viewport.scrollTop = ((f + 1) / scrollFrames) * (viewport.scrollHeight - viewport.clientHeight);
+    }));
+
+    const memory = (performance as unknown as { memory?: { usedJSHeapSize: number } }).memory;
+    const result: BenchmarkResult = {
+        count,
+        batch,
+        phases,
+        stored: list.size,
+        compacted: list.compacted,
+        domNodes: document.getElementsByTagName('*').length,
+        heapMB: memory ? memory.usedJSHeapSize / (1024 * 1024) : null,
+    };
+    window.benchmarkResult = result;
+
+    const lines = [
+        `messages: ${count}  batch/frame: ${batch}`,
+        `stored: ${result.stored}  compacted: ${result.compacted}  DOM nodes: ${result.domNodes}` +
+            (result.heapMB !== null ? `  JS heap: ${result.heapMB.toFixed(1)} MB` : ''),
+        '',
+        'phase                      frames   total ms   p50 ms   p95 ms   p99 ms   max ms  >16.7ms',
+    ];
+    for (const p of phases) {
+        lines.push(
+            `${p.name.padEnd(26)} ${String(p.frames).padStart(6)} ${p.totalMs.toFixed(0).padStart(10)} ` +
+            `${p.p50.toFixed(2).padStart(8)} ${p.p95.toFixed(2).padStart(8)} ${p.p99.toFixed(2).padStart(8)} ` +
+            `${p.max.toFixed(2).padStart(8)} ${String(p.over16).padStart(8)}`
+        );
+    }
+    report.textContent = lines.join('\n');
+    console.log('Benchmark result:', result);
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    run().catch(error => console.error('Benchmark failed:', error));
+});
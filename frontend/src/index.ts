@@ -1,8 +1,10 @@
 import './styles.css';
 import { initDevTools } from './devtools';
+import { VirtualMessageList } from './messageList';
 
 // Types
 interface Message {
+    seq: number;
     sender: string;
     content: string;
     timestamp: number;
@@ -10,6 +12,10 @@ interface Message {
 
 interface ApiResponse {
     messages: Message[];
+    next: number;
+    oldest: number;
+    latest: number;
+    more: boolean;
 }
 
 interface PeersResponse {
@@ -22,6 +28,9 @@ interface WifiInfoResponse {
     channel: number;
 }
 
+// Mirrors CONFIG_MESH_NOW_SEND_BATCH_MAX; extra messages would be dropped
+const SEND_BATCH_MAX = 16;
+
 // Extend window interface
 declare global {
     interface Window {
@@ -32,10 +41,15 @@ declare global {
 // App class
 class MeshNowApp {
     private messagesContainer!: HTMLElement;
+    private messageList!: VirtualMessageList;
     private messageInput!: HTMLInputElement;
     private sendButton!: HTMLButtonElement;
     private statusIndicator!: HTMLElement;
     private peerCount!: HTMLElement;
+    private cursor = 0;
+    private polling = false;
+    private sending = false;
+    private outbox: string[] = [];
 
     constructor() {
         this.initializeElements();
@@ -66,6 +80,7 @@ class MeshNowApp {
         this.messagesContainer.id = 'messages';
         this.messagesContainer.className = 'messages';
         container.appendChild(this.messagesContainer);
+        this.messageList = new VirtualMessageList(this.messagesContainer);
 
         // Input area
         const inputArea = document.createElement('div');
@@ -99,46 +114,87 @@ class MeshNowApp {
         try { initDevTools(); } catch (e) { console.warn('devtools init failed', e); }
     }
 
-    private async sendMessage(): Promise<void> {
+    private sendMessage(): void {
         const message = this.messageInput.value.trim();
         if (!message) return;
 
-        console.log('Sending message:', message);
+        this.messageInput.value = '';
+        this.outbox.push(message);
+        this.flushOutbox();
+    }
+
+    // Messages typed while a request is in flight go out together in the
+    // next request as a messages[] batch
+    private async flushOutbox(): Promise<void> {
+        if (this.sending) return;
+        this.sending = true;
         try {
-            const response = await fetch('/send', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/x-www-form-urlencoded',
-                },
-                body: `message=${encodeURIComponent(message)}`
-            });
-
-            if (response.ok) {
-                this.messageInput.value = '';
-                this.addMessage('You', message);
-            } else {
-                this.addSystemMessage('Failed to send message', 'error');
+            while (this.outbox.length > 0) {
+                const batch = this.outbox.splice(0, SEND_BATCH_MAX);
+                const body = batch.length === 1
+                    ? `message=${encodeURIComponent(batch[0])}`
+                    : batch.map(m => `messages[]=${encodeURIComponent(m)}`).join('&');
+
+                console.log('Sending messages:', batch);
+                try {
+                    const response = await fetch('/send', {
+                        method: 'POST',
+                        headers: {
+                            'Content-Type': 'application/x-www-form-urlencoded',
+                        },
+                        body
+                    });
+
+                    if (response.ok) {
+                        batch.forEach(message => this.addMessage('You', message));
+                        this.messageList.scrollToBottom();
+                    } else {
+                        this.addSystemMessage(`Failed to send ${batch.length} message(s)`, 'error');
+                    }
+                } catch (error) {
+                    console.error('Send error:', error);
+                    this.addSystemMessage('Network error', 'error');
+                }
             }
-        } catch (error) {
-            console.error('Send error:', error);
-            this.addSystemMessage('Network error', 'error');
+        } finally {
+            this.sending = false;
         }
     }
 
     private async pollMessages(): Promise<void> {
+        if (this.polling) return;
+        this.polling = true;
         try {
-            console.log('Polling for messages...');
-            const response = await fetch('/messages');
-            const data: ApiResponse = await response.json();
-            console.log('Messages response:', data);
-
-            if (data.messages && data.messages.length > 0) {
-                data.messages.forEach(msg => {
-                    this.addMessage(msg.sender, msg.content);
-                });
+            // Page through history until caught up with the device
+            let more = true;
+            while (more) {
+                console.log('Polling for messages since', this.cursor);
+                const response = await fetch(`/messages?since=${this.cursor}`);
+                const data: ApiResponse = await response.json();
+                console.log('Messages response:', data);
+
+                // The device's history was wiped: its numbering started again below the cursor
+                if ((typeof data.latest === 'number' && data.latest < this.cursor) ||
+                    (typeof data.next === 'number' && data.next < this.cursor)) {
+                    console.log('History reset on the device, reloading from the start');
+                    this.addSystemMessage('Device history was reset');
+                    this.cursor = 0;
+                    continue;
+                }
+                if (data.messages && data.messages.length > 0) {
+                    data.messages.forEach(msg => {
+                        this.addMessage(msg.sender, msg.content);
+                    });
+                }
+                if (typeof data.next === 'number') {
+                    this.cursor = data.next;
+                }
+                more = !!data.more && !!data.messages && data.messages.length > 0;
             }
         } catch (error) {
             console.log('Poll error:', error);
+        } finally {
+            this.polling = false;
         }
     }
 
@@ -149,30 +205,11 @@ class MeshNowApp {
     }
 
     private addMessage(sender: string, content: string): void {
-        const messageDiv = document.createElement('div');
-        messageDiv.className = 'message';
-
-        const senderDiv = document.createElement('div');
-        senderDiv.className = 'message-sender';
-        senderDiv.textContent = sender;
-
-        const contentDiv = document.createElement('div');
-        contentDiv.className = 'message-content';
-        contentDiv.textContent = content;
-
-        messageDiv.appendChild(senderDiv);
-        messageDiv.appendChild(contentDiv);
-
-        this.messagesContainer.appendChild(messageDiv);
-        this.messagesContainer.scrollTop = this.messagesContainer.scrollHeight;
+        this.messageList.append(sender, content);
     }
 
     private addSystemMessage(content: string, type: 'info' | 'error' = 'info'): void {
-        const messageDiv = document.createElement('div');
-        messageDiv.className = `message system ${type}`;
-        messageDiv.textContent = content;
-        this.messagesContainer.appendChild(messageDiv);
-        this.messagesContainer.scrollTop = this.messagesContainer.scrollHeight;
+        this.messageList.append('', content, type);
     }
 
     private async updatePeerCount(): Promise<void> {
@@ -0,0 +1,324 @@
+// Virtualized message list
+// Keeps a capped store of messages and only renders DOM rows for the part of
+// the list that is inside (or just around) the viewport. Appends are queued
+// and applied once per animation frame.
+
+export type EntryKind = 'chat' | 'info' | 'error';
+
+export interface ListEntry {
+    key: number;
+    sender: string;
+    content: string;
+    kind: EntryKind;
+}
+
+export interface FrameStats {
+    appended: number;       // Entries applied this frame
+    rendered: number;       // Rows in the DOM after the frame
+    stored: number;         // Entries in the store
+    compacted: number;      // Entries dropped from the store so far
+    duration: number;       // ms spent in the frame callback
+}
+
+export interface ListOptions {
+    capacity?: number;              // Entries kept in memory
+    compactChunk?: number;          // Entries dropped at once when over capacity
+    overscan?: number;              // Extra rows rendered above/below the viewport
+    estimatedRowHeight?: number;    // px, until a row has been measured
+}
+
+const DEFAULT_CAPACITY = 2000;
+const DEFAULT_COMPACT_CHUNK = 500;
+const DEFAULT_OVERSCAN = 6;
+const DEFAULT_ROW_HEIGHT = 64;
+const STICK_TO_BOTTOM_PX = 8;
+const COMPACTED_HEADER_HEIGHT = 32;    // Matches .message-compacted in styles.css
+
+// Bounded message storage. Entries past capacity are dropped oldest-first in
+// chunks so the arrays are not shifted on every append; only a count of the
+// dropped entries is kept. Sender strings are interned since a chat has few
+// distinct senders.
+export class MessageStore {
+    readonly entries: ListEntry[] = [];
+    readonly heights: number[] = [];
+    compacted = 0;
+
+    private senders = new Map<string, string>();
+    private nextKey = 1;
+
+    constructor(
+        readonly capacity: number,
+        readonly compactChunk: number,
+        private readonly estimatedRowHeight: number
+    ) {}
+
+    get size(): number {
+        return this.entries.length;
+    }
+
+    push(sender: string, content: string, kind: EntryKind): ListEntry {
+        let interned = this.senders.get(sender);
+        if (interned === undefined) {
+            interned = sender;
+            this.senders.set(sender, sender);
+        }
+        const entry: ListEntry = { key: this.nextKey++, sender: interned, content, kind };
+        this.entries.push(entry);
+        this.heights.push(this.estimatedRowHeight);
+        return entry;
+    }
+
+    // Drop the oldest entries once the store is a full chunk over capacity.
+    // Returns the total height of the dropped rows.
+    compact(): number {
+        if (this.entries.length < this.capacity + this.compactChunk) {
+            return 0;
+        }
+        const drop = this.entries.length - this.capacity;
+        let removedHeight = 0;
+        for (let i = 0; i < drop; i++) {
+            removedHeight += this.heights[i];
+        }
+        this.entries.splice(0, drop);
+        this.heights.splice(0, drop);
+        this.compacted += drop;
+
+        // Forget senders that no longer appear
+        if (this.senders.size > 64) {
+            this.senders = new Map(this.entries.map(e => [e.sender, e.sender] as [string, string]));
+        }
+        return removedHeight;
+    }
+}
+
+export class VirtualMessageList {
+    onFrame?: (stats: FrameStats) => void;
+
+    private readonly store: MessageStore;
+    private readonly overscan: number;
+    private readonly spacer: HTMLElement;
+    private readonly header: HTMLElement;
+    private pending: { sender: string; content: string; kind: EntryKind }[] = [];
+    private rows = new Map<number, HTMLElement>();
+    private pool: HTMLElement[] = [];
+    private fresh = new Set<number>();
+    private offsets: number[] = [0];
+    private offsetsDirty = true;
+    private frameRequested = false;
+
+    constructor(private readonly viewport: HTMLElement, options: ListOptions = {}) {
+        this.store = new MessageStore(
+            options.capacity ?? DEFAULT_CAPACITY,
+            options.compactChunk ?? DEFAULT_COMPACT_CHUNK,
+            options.estimatedRowHeight ?? DEFAULT_ROW_HEIGHT
+        );
+        this.overscan = options.overscan ?? DEFAULT_OVERSCAN;
+
+        this.spacer = document.createElement('div');
+        this.spacer.className = 'message-spacer';
+        this.header = document.createElement('div');
+        this.header.className = 'message-compacted';
+        this.header.style.display = 'none';
+        this.spacer.appendChild(this.header);
+        this.viewport.appendChild(this.spacer);
+
+        this.viewport.addEventListener('scroll', () => this.scheduleFrame(), { passive: true });
+        window.addEventListener('resize', () => this.scheduleFrame());
+    }
+
+    get size(): number {
+        return this.store.size + this.pending.length;
+    }
+
+    get compacted(): number {
+        return this.store.compacted;
+    }
+
+    get renderedRows(): number {
+        return this.rows.size;
+    }
+
+    append(sender: string, content: string, kind: EntryKind = 'chat'): void {
+        this.pending.push({ sender, content, kind });
+        this.scheduleFrame();
+    }
+
+    scrollToBottom(): void {
+        this.viewport.scrollTop = this.viewport.scrollHeight;
+        this.scheduleFrame();
+    }
+
+    // Apply pending work now instead of waiting for the next frame
+    flush(): void {
+        this.frame();
+    }
+
+    private scheduleFrame(): void {
+        if (this.frameRequested) return;
+        this.frameRequested = true;
+        requestAnimationFrame(() => this.frame());
+    }
+
+    private headerHeight(): number {
+        return this.store.compacted > 0 ? COMPACTED_HEADER_HEIGHT : 0;
+    }
+
+    private frame(): void {
+        this.frameRequested = false;
+        const start = performance.now();
+
+        const viewport = this.viewport;
+        const atBottom = viewport.scrollTop + viewport.clientHeight >= viewport.scrollHeight - STICK_TO_BOTTOM_PX;
+
+        const appended = this.pending.length;
+        if (appended > 0) {
+            for (const item of this.pending) {
+                this.fresh.add(this.store.push(item.sender, item.content, item.kind).key);
+            }
+            this.pending = [];
+            this.offsetsDirty = true;
+
+            const removedHeight = this.store.compact();
+            if (removedHeight > 0) {
+                this.header.style.display = '';
+                this.header.textContent = `${this.store.compacted} older messages not shown`;
+                if (!atBottom) {
+                    viewport.scrollTop = Math.max(0, viewport.scrollTop - removedHeight);
+                }
+            }
+        }
+
+        this.layout(atBottom && appended > 0);
+        if (this.measure()) {
+            // Row heights changed; place rows again with the real heights
+            this.layout(atBottom);
+        }
+        this.fresh.clear();
+
+        if (this.onFrame) {
+            this.onFrame({
+                appended,
+                rendered: this.rows.size,
+                stored: this.store.size,
+                compacted: this.store.compacted,
+                duration: performance.now() - start,
+            });
+        }
+    }
+
+    private updateOffsets(): void {
+        if (!this.offsetsDirty) return;
+        const heights = this.store.heights;
+        const offsets = new Array<number>(heights.length + 1);
+        offsets[0] = this.headerHeight();
+        for (let i = 0; i < heights.length; i++) {
+            offsets[i + 1] = offsets[i] + heights[i];
+        }
+        this.offsets = offsets;
+        this.offsetsDirty = false;
+    }
+
+    // First index whose row ends below y
+    private indexAt(y: number): number {
+        const offsets = this.offsets;
+        let lo = 0;
+        let hi = offsets.length - 2;
+        while (lo < hi) {
+            const mid = (lo + hi) >> 1;
+            if (offsets[mid + 1] <= y) {
+                lo = mid + 1;
+            } else {
+                hi = mid;
+            }
+        }
+        return Math.max(0, lo);
+    }
+
+    private layout(stickToBottom: boolean): void {
+        this.updateOffsets();
+        const entries = this.store.entries;
+        const total = this.offsets[this.offsets.length - 1];
+        this.spacer.style.height = `${total}px`;
+
+        const viewport = this.viewport;
+        if (stickToBottom) {
+            viewport.scrollTop = Math.max(0, total - viewport.clientHeight);
+        }
+        if (entries.length === 0) return;
+
+        const top = viewport.scrollTop;
+        const first = Math.max(0, this.indexAt(top) - this.overscan);
+        const last = Math.min(entries.length - 1, this.indexAt(top + viewport.clientHeight) + this.overscan);
+
+        // Release rows that scrolled out of the window
+        const firstKey = entries[first].key;
+        const lastKey = entries[last].key;
+        for (const [key, row] of this.rows) {
+            if (key < firstKey || key > lastKey) {
+                this.rows.delete(key);
+                row.remove();
+                this.pool.push(row);
+            }
+        }
+
+        for (let i = first; i <= last; i++) {
+            const entry = entries[i];
+            let row = this.rows.get(entry.key);
+            if (!row) {
+                row = this.pool.pop() || this.createRow();
+                this.fillRow(row, entry);
+                this.rows.set(entry.key, row);
+                this.spacer.appendChild(row);
+            }
+            row.dataset.index = String(i);
+            row.style.transform = `translateY(${this.offsets[i]}px)`;
+        }
+    }
+
+    // Record real heights of rendered rows; true if any changed
+    private measure(): boolean {
+        const heights = this.store.heights;
+        let changed = false;
+        for (const row of this.rows.values()) {
+            const index = Number(row.dataset.index);
+            const height = row.offsetHeight;
+            if (height > 0 && height !== heights[index]) {
+                heights[index] = height;
+                changed = true;
+            }
+        }
+        if (changed) {
+            this.offsetsDirty = true;
+        }
+        return changed;
+    }
+
+    private createRow(): HTMLElement {
+        const row = document.createElement('div');
+        row.className = 'message-row';
+        const message = document.createElement('div');
+        const sender = document.createElement('div');
+        sender.className = 'message-sender';
+        const content = document.createElement('div');
+        content.className = 'message-content';
+        message.appendChild(sender);
+        message.appendChild(content);
+        row.appendChild(message);
+        return row;
+    }
+
+    private fillRow(row: HTMLElement, entry: ListEntry): void {
+        const message = row.firstChild as HTMLElement;
+        const sender = message.firstChild as HTMLElement;
+        const content = message.lastChild as HTMLElement;
+
+        let className = entry.kind === 'chat' ? 'message' : `message system ${entry.kind}`;
+        if (this.fresh.has(entry.key)) {
+            className += ' fresh';
+        }
+        message.className = className;
+        sender.textContent = entry.sender;
+        sender.style.display = entry.sender ? '' : 'none';
+        content.textContent = entry.content;
+    }
+}
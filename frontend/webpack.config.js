@@ -2,11 +2,16 @@ const path = require('path');
 const HtmlWebpackPlugin = require('html-webpack-plugin');
 const MiniCssExtractPlugin = require('mini-css-extract-plugin');
 
-module.exports = {
-  entry: './src/index.ts',
+// `--env bench` adds the message list benchmark page (benchmark.html). It is
+// never part of the firmware build, which embeds only the files below.
+module.exports = (env = {}) => ({
+  entry: {
+    bundle: './src/index.ts',
+    ...(env.bench ? { benchmark: './src/benchmark.ts' } : {}),
+  },
   output: {
     path: path.resolve(__dirname, 'dist'),
-    filename: 'bundle.js',
+    filename: '[name].js',
     clean: true,
     publicPath: '/'
   },
@@ -29,6 +34,7 @@ module.exports = {
   plugins: [
     new HtmlWebpackPlugin({
       template: 'public/index.html',
+      chunks: ['bundle'],
       minify: {
         collapseWhitespace: true,
         removeComments: true,
@@ -38,8 +44,13 @@ module.exports = {
         useShortDoctype: true
       }
     }),
+    ...(env.bench ? [new HtmlWebpackPlugin({
+      template: 'public/index.html',
+      filename: 'benchmark.html',
+      chunks: ['benchmark'],
+    })] : []),
     new MiniCssExtractPlugin({
-      filename: 'styles.css',
+      filename: env.bench ? '[name].css' : 'styles.css',
     }),
   ],
   optimization: {
@@ -55,4 +66,4 @@ module.exports = {
       '/api': 'http://localhost:80'
     }
   },
-};
\ No newline at end of file
+});
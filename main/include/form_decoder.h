@@ -0,0 +1,51 @@
+#ifndef FORM_DECODER_H
+#define FORM_DECODER_H
+
+#include <stdint.h>
+#include <stdbool.h>
+#include <stddef.h>
+#include <esp_err.h>
+#include "mesh_now.h"
+
+#define FORM_DECODER_KEY_LEN 16
+#define FORM_DECODER_JSON_DEPTH 8
+
+typedef enum {
+    FORM_BODY_URLENCODED,   // message=...&messages[]=...
+    FORM_BODY_JSON,         // {"message":"..."} or {"messages":["...","..."]}
+} form_body_type_t;
+
+// Incremental decoder for /send bodies. Feed it the body in arbitrary chunks;
+// decoded messages are collected into the caller's slots and only become
+// valid once form_decoder_finish() succeeds.
+typedef struct {
+    form_body_type_t type;
+    char (*messages)[MAX_MESH_MESSAGE_LEN];
+    size_t max_messages;
+    size_t count;
+    size_t dropped;
+
+    int state;
+    bool in_key;
+    bool capture;
+    bool truncated;
+    char key[FORM_DECODER_KEY_LEN];
+    size_t key_len;
+    size_t value_len;
+    uint8_t pct_first;
+    uint32_t codepoint;
+    uint32_t high_surrogate;
+    int hex_digits;
+
+    // JSON only
+    uint8_t depth;
+    uint8_t container_is_array;     // bit n set = container at depth n+1 is an array
+    bool in_messages_array;
+} form_decoder_t;
+
+void form_decoder_init(form_decoder_t *decoder, form_body_type_t type,
+                       char (*messages)[MAX_MESH_MESSAGE_LEN], size_t max_messages);
+void form_decoder_feed(form_decoder_t *decoder, const char *data, size_t len);
+esp_err_t form_decoder_finish(form_decoder_t *decoder);
+
+#endif // FORM_DECODER_H
@@ -1,16 +1,26 @@
 #ifndef WEB_SERVER_H
 #define WEB_SERVER_H
 
+#include <stdint.h>
+#include <stdbool.h>
 #include <esp_err.h>
-#include <freertos/FreeRTOS.h>
-#include <freertos/queue.h>
 
 // Function pointer type for message sending callback
 typedef esp_err_t (*message_send_callback_t)(const char *message);
+// Re-sends a message from another island under its original sender and ID (POST /relay)
+typedef esp_err_t (*message_relay_callback_t)(const uint8_t *origin_mac, uint32_t message_id, const char *message);
+// Sends a message to one group (POST /send?group=N)
+typedef esp_err_t (*message_group_send_callback_t)(uint8_t group_id, const char *message);
+// Records this node's status (POST /presence) and who its user is typing to (POST /typing)
+typedef esp_err_t (*presence_callback_t)(const char *status);
+typedef esp_err_t (*typing_callback_t)(const uint8_t *target_mac, bool typing);
 
 // Function declarations
-esp_err_t web_server_init(QueueHandle_t message_queue);
+esp_err_t web_server_init(void);
 esp_err_t web_server_deinit(void);
 void web_server_set_send_callback(message_send_callback_t callback);
+void web_server_set_relay_callback(message_relay_callback_t callback);
+void web_server_set_group_send_callback(message_group_send_callback_t callback);
+void web_server_set_presence_callbacks(presence_callback_t presence, typing_callback_t typing);
 
 #endif // WEB_SERVER_H
\ No newline at end of file
@@ -13,6 +13,7 @@
 #include "wifi_manager.h"
 #include "web_server.h"
 #include "message_queue.h"
+#include "message_history.h"
 
 #define TAG "MESH_NOW_MAIN"
 
@@ -27,6 +28,9 @@ static void mesh_now_receive_handler(const mesh_message_t *mesh_msg) {
     msg.message[sizeof(msg.message) - 1] = '\0';
     memcpy(msg.sender_mac, mesh_msg->sender_mac, sizeof(msg.sender_mac));
     msg.timestamp = mesh_msg->timestamp;
+    msg.message_id = mesh_msg->message_id;
+    msg.type = mesh_msg->type;
+    msg.group_id = mesh_msg->group_id;
     message_queue_send(&msg);
 }
 
@@ -43,6 +47,7 @@ void app_main(void) {
 
     // Initialize message queue
     ESP_ERROR_CHECK(message_queue_init());
+    ESP_ERROR_CHECK(message_history_init());
     mesh_now_set_receive_callback(mesh_now_receive_handler);
 
     // Initialize WiFi
@@ -55,10 +60,13 @@ void app_main(void) {
     ESP_ERROR_CHECK(mesh_now_init());
 
     // Initialize web server
-    ESP_ERROR_CHECK(web_server_init(message_queue_get_handle()));
+    ESP_ERROR_CHECK(web_server_init());
 
     // Set up message sending callback for web server
     web_server_set_send_callback(mesh_now_send_message);
+    web_server_set_relay_callback(mesh_now_send_relay);
+    web_server_set_group_send_callback(mesh_now_send_group);
+    web_server_set_presence_callbacks(mesh_now_send_presence, mesh_now_send_typing);
 
     // Print device information
     uint8_t mac[6];
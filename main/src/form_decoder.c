@@ -0,0 +1,459 @@
+#include "form_decoder.h"
+#include <string.h>
+
+// Hex digit value + 1, 0 for anything that is not a hex digit
+static const uint8_t hex_table[256] = {
+    ['0'] = 1, ['1'] = 2, ['2'] = 3, ['3'] = 4, ['4'] = 5,
+    ['5'] = 6, ['6'] = 7, ['7'] = 8, ['8'] = 9, ['9'] = 10,
+    ['a'] = 11, ['b'] = 12, ['c'] = 13, ['d'] = 14, ['e'] = 15, ['f'] = 16,
+    ['A'] = 11, ['B'] = 12, ['C'] = 13, ['D'] = 14, ['E'] = 15, ['F'] = 16,
+};
+
+#define HEX_VALUE(c) (hex_table[(uint8_t)(c)] - 1)
+#define IS_HEX(c) (hex_table[(uint8_t)(c)] != 0)
+
+enum {
+    // application/x-www-form-urlencoded
+    F_NORMAL,
+    F_PCT1,
+    F_PCT2,
+
+    // application/json
+    J_START,
+    J_OBJ_KEY_OR_END,
+    J_OBJ_KEY,
+    J_COLON,
+    J_VALUE,
+    J_ARR_VALUE_OR_END,
+    J_STRING,
+    J_ESC,
+    J_UNICODE,
+    J_LITERAL,
+    J_AFTER_VALUE,
+    J_DONE,
+    J_ERROR,
+};
+
+static bool key_matches(const form_decoder_t *d, const char *name)
+{
+    size_t len = strlen(name);
+    return d->key_len == len && memcmp(d->key, name, len) == 0;
+}
+
+static void value_begin(form_decoder_t *d, bool wanted)
+{
+    d->capture = false;
+    if (!wanted) {
+        return;
+    }
+    if (d->count >= d->max_messages) {
+        d->dropped++;
+        return;
+    }
+    d->capture = true;
+    d->value_len = 0;
+    d->truncated = false;
+}
+
+static void value_end(form_decoder_t *d)
+{
+    if (!d->capture) {
+        return;
+    }
+    d->capture = false;
+
+    char *value = d->messages[d->count];
+    size_t len = d->value_len;
+    if (d->truncated) {
+        // Do not leave a partial UTF-8 sequence at the cut
+        size_t lead = len;
+        while (lead > 0 && ((uint8_t)value[lead - 1] & 0xC0) == 0x80) {
+            lead--;
+        }
+        if (lead > 0 && ((uint8_t)value[lead - 1] & 0x80)) {
+            uint8_t c = (uint8_t)value[lead - 1];
+            size_t need = (c & 0xE0) == 0xC0 ? 2 : (c & 0xF0) == 0xE0 ? 3 : (c & 0xF8) == 0xF0 ? 4 : 1;
+            if (len - (lead - 1) < need) {
+                len = lead - 1;
+            }
+        }
+    }
+    value[len] = '\0';
+
+    if (len > 0) {
+        d->count++;
+    }
+}
+
+static void sink_byte(form_decoder_t *d, uint8_t b)
+{
+    if (d->in_key) {
+        // Only top-level JSON keys are remembered
+        if (d->type == FORM_BODY_JSON && d->depth > 1) {
+            return;
+        }
+        if (d->key_len < FORM_DECODER_KEY_LEN - 1) {
+            d->key[d->key_len++] = (char)b;
+        } else {
+            d->key_len = FORM_DECODER_KEY_LEN; // Too long to match any key
+        }
+    } else if (d->capture && b != 0) {
+        // NUL cannot be carried in a C-string message, so it is dropped
+        if (d->value_len < MAX_MESH_MESSAGE_LEN - 1) {
+            d->messages[d->count][d->value_len++] = (char)b;
+        } else {
+            d->truncated = true;
+        }
+    }
+}
+
+static void sink_codepoint(form_decoder_t *d, uint32_t cp)
+{
+    if (cp < 0x80) {
+        sink_byte(d, cp);
+    } else if (cp < 0x800) {
+        sink_byte(d, 0xC0 | (cp >> 6));
+        sink_byte(d, 0x80 | (cp & 0x3F));
+    } else if (cp < 0x10000) {
+        sink_byte(d, 0xE0 | (cp >> 12));
+        sink_byte(d, 0x80 | ((cp >> 6) & 0x3F));
+        sink_byte(d, 0x80 | (cp & 0x3F));
+    } else {
+        sink_byte(d, 0xF0 | (cp >> 18));
+        sink_byte(d, 0x80 | ((cp >> 12) & 0x3F));
+        sink_byte(d, 0x80 | ((cp >> 6) & 0x3F));
+        sink_byte(d, 0x80 | (cp & 0x3F));
+    }
+}
+
+// ---------------------------------------------------------------------------
+// application/x-www-form-urlencoded
+
+static void form_end_pair(form_decoder_t *d)
+{
+    if (!d->in_key) {
+        value_end(d);
+    }
+    d->in_key = true;
+    d->key_len = 0;
+}
+
+static void form_feed_char(form_decoder_t *d, char c)
+{
+    for (;;) {
+        switch (d->state) {
+        case F_PCT1:
+            if (IS_HEX(c)) {
+                d->pct_first = (uint8_t)c;
+                d->state = F_PCT2;
+                return;
+            }
+            sink_byte(d, '%');
+            d->state = F_NORMAL;
+            continue;
+
+        case F_PCT2:
+            d->state = F_NORMAL;
+            if (IS_HEX(c)) {
+                sink_byte(d, (HEX_VALUE(d->pct_first) << 4) | HEX_VALUE(c));
+                return;
+            }
+            sink_byte(d, '%');
+            sink_byte(d, d->pct_first);
+            continue;
+
+        default:
+            if (c == '&') {
+                form_end_pair(d);
+            } else if (c == '=' && d->in_key) {
+                d->in_key = false;
+                value_begin(d, key_matches(d, "message") || key_matches(d, "messages") ||
+                               key_matches(d, "messages[]"));
+            } else if (c == '+') {
+                sink_byte(d, ' ');
+            } else if (c == '%') {
+                d->state = F_PCT1;
+            } else {
+                sink_byte(d, (uint8_t)c);
+            }
+            return;
+        }
+    }
+}
+
+static void form_finish(form_decoder_t *d)
+{
+    if (d->state == F_PCT1) {
+        sink_byte(d, '%');
+    } else if (d->state == F_PCT2) {
+        sink_byte(d, '%');
+        sink_byte(d, d->pct_first);
+    }
+    d->state = F_NORMAL;
+    form_end_pair(d);
+}
+
+// ---------------------------------------------------------------------------
+// application/json
+
+static bool is_json_space(char c)
+{
+    return c == ' ' || c == '\t' || c == '\n' || c == '\r';
+}
+
+static bool current_is_array(const form_decoder_t *d)
+{
+    return d->depth > 0 && (d->container_is_array & (1u << (d->depth - 1)));
+}
+
+static void json_after_value(form_decoder_t *d)
+{
+    d->state = d->depth > 0 ? J_AFTER_VALUE : J_DONE;
+}
+
+static bool json_push(form_decoder_t *d, bool is_array)
+{
+    if (d->depth >= FORM_DECODER_JSON_DEPTH) {
+        return false;
+    }
+    if (is_array) {
+        d->container_is_array |= (1u << d->depth);
+    } else {
+        d->container_is_array &= ~(1u << d->depth);
+    }
+    d->depth++;
+    if (is_array && d->depth == 2 && key_matches(d, "messages")) {
+        d->in_messages_array = true;
+    }
+    return true;
+}
+
+static void json_pop(form_decoder_t *d)
+{
+    d->depth--;
+    if (d->depth < 2) {
+        d->in_messages_array = false;
+    }
+    json_after_value(d);
+}
+
+static void json_flush_surrogate(form_decoder_t *d)
+{
+    if (d->high_surrogate) {
+        sink_codepoint(d, 0xFFFD);
+        d->high_surrogate = 0;
+    }
+}
+
+static void json_string_end(form_decoder_t *d)
+{
+    json_flush_surrogate(d);
+    if (d->in_key) {
+        d->in_key = false;
+        d->state = J_COLON;
+    } else {
+        value_end(d);
+        json_after_value(d);
+    }
+}
+
+static void json_feed_char(form_decoder_t *d, char c)
+{
+    for (;;) {
+        switch (d->state) {
+        case J_START:
+            if (is_json_space(c)) return;
+            d->state = (c == '{' && json_push(d, false)) ? J_OBJ_KEY_OR_END : J_ERROR;
+            return;
+
+        case J_OBJ_KEY_OR_END:
+            if (is_json_space(c)) return;
+            if (c == '}') {
+                json_pop(d);
+                return;
+            }
+            d->state = J_OBJ_KEY;
+            continue;
+
+        case J_OBJ_KEY:
+            if (is_json_space(c)) return;
+            if (c != '"') {
+                d->state = J_ERROR;
+                return;
+            }
+            d->in_key = true;
+            if (d->depth == 1) {
+                d->key_len = 0;
+            }
+            d->capture = false;
+            d->state = J_STRING;
+            return;
+
+        case J_COLON:
+            if (is_json_space(c)) return;
+            d->state = c == ':' ? J_VALUE : J_ERROR;
+            return;
+
+        case J_ARR_VALUE_OR_END:
+            if (is_json_space(c)) return;
+            if (c == ']') {
+                json_pop(d);
+                return;
+            }
+            d->state = J_VALUE;
+            continue;
+
+        case J_VALUE:
+            if (is_json_space(c)) return;
+            if (c == '"') {
+                d->in_key = false;
+                value_begin(d, (d->depth == 1 && key_matches(d, "message")) ||
+                               (d->depth == 2 && d->in_messages_array));
+                d->state = J_STRING;
+            } else if (c == '{') {
+                d->state = json_push(d, false) ? J_OBJ_KEY_OR_END : J_ERROR;
+            } else if (c == '[') {
+                d->state = json_push(d, true) ? J_ARR_VALUE_OR_END : J_ERROR;
+            } else if ((c >= '0' && c <= '9') || c == '-' || (c >= 'a' && c <= 'z')) {
+                d->state = J_LITERAL;
+            } else {
+                d->state = J_ERROR;
+            }
+            return;
+
+        case J_LITERAL:
+            if ((c >= '0' && c <= '9') || (c >= 'a' && c <= 'z') || (c >= 'A' && c <= 'Z') ||
+                c == '.' || c == '+' || c == '-') {
+                return;
+            }
+            json_after_value(d);
+            continue;
+
+        case J_STRING:
+            if (c == '"') {
+                json_string_end(d);
+            } else if (c == '\\') {
+                d->state = J_ESC;
+            } else if ((uint8_t)c < 0x20) {
+                d->state = J_ERROR;
+            } else {
+                json_flush_surrogate(d);
+                sink_byte(d, (uint8_t)c);
+            }
+            return;
+
+        case J_ESC: {
+            char out = 0;
+            switch (c) {
+            case '"': out = '"'; break;
+            case '\\': out = '\\'; break;
+            case '/': out = '/'; break;
+            case 'b': out = '\b'; break;
+            case 'f': out = '\f'; break;
+            case 'n': out = '\n'; break;
+            case 'r': out = '\r'; break;
+            case 't': out = '\t'; break;
+            case 'u':
+                d->codepoint = 0;
+                d->hex_digits = 0;
+                d->state = J_UNICODE;
+                return;
+            default:
+                d->state = J_ERROR;
+                return;
+            }
+            json_flush_surrogate(d);
+            sink_byte(d, (uint8_t)out);
+            d->state = J_STRING;
+            return;
+        }
+
+        case J_UNICODE:
+            if (!IS_HEX(c)) {
+                d->state = J_ERROR;
+                return;
+            }
+            d->codepoint = (d->codepoint << 4) | HEX_VALUE(c);
+            if (++d->hex_digits < 4) {
+                return;
+            }
+            d->state = J_STRING;
+            if (d->codepoint >= 0xD800 && d->codepoint <= 0xDBFF) {
+                json_flush_surrogate(d);
+                d->high_surrogate = d->codepoint;
+            } else if (d->codepoint >= 0xDC00 && d->codepoint <= 0xDFFF) {
+                if (d->high_surrogate) {
+                    sink_codepoint(d, 0x10000 + ((d->high_surrogate - 0xD800) << 10) + (d->codepoint - 0xDC00));
+                    d->high_surrogate = 0;
+                } else {
+                    sink_codepoint(d, 0xFFFD);
+                }
+            } else {
+                json_flush_surrogate(d);
+                sink_codepoint(d, d->codepoint);
+            }
+            return;
+
+        case J_AFTER_VALUE:
+            if (is_json_space(c)) return;
+            if (c == ',') {
+                d->state = current_is_array(d) ? J_VALUE : J_OBJ_KEY;
+            } else if (c == '}' && !current_is_array(d)) {
+                json_pop(d);
+            } else if (c == ']' && current_is_array(d)) {
+                json_pop(d);
+            } else {
+                d->state = J_ERROR;
+            }
+            return;
+
+        case J_DONE:
+            if (!is_json_space(c)) {
+                d->state = J_ERROR;
+            }
+            return;
+
+        default:
+            return;
+        }
+    }
+}
+
+// ---------------------------------------------------------------------------
+
+void form_decoder_init(form_decoder_t *decoder, form_body_type_t type,
+                       char (*messages)[MAX_MESH_MESSAGE_LEN], size_t max_messages)
+{
+    memset(decoder, 0, sizeof(*decoder));
+    decoder->type = type;
+    decoder->messages = messages;
+    decoder->max_messages = max_messages;
+    decoder->in_key = type == FORM_BODY_URLENCODED;
+    decoder->state = type == FORM_BODY_JSON ? J_START : F_NORMAL;
+}
+
+void form_decoder_feed(form_decoder_t *decoder, const char *data, size_t len)
+{
+    if (decoder->type == FORM_BODY_JSON) {
+        for (size_t i = 0; i < len && decoder->state != J_ERROR; i++) {
+            json_feed_char(decoder, data[i]);
+        }
+    } else {
+        for (size_t i = 0; i < len; i++) {
+            form_feed_char(decoder, data[i]);
+        }
+    }
+}
+
+esp_err_t form_decoder_finish(form_decoder_t *decoder)
+{
+    if (decoder->type == FORM_BODY_JSON) {
+        if (decoder->state == J_LITERAL && decoder->depth == 0) {
+            decoder->state = J_DONE;
+        }
+        return decoder->state == J_DONE ? ESP_OK : ESP_ERR_INVALID_ARG;
+    }
+
+    form_finish(decoder);
+    return ESP_OK;
+}
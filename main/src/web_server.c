@@ -1,13 +1,22 @@
 #include "web_server.h"
 #include "wifi_manager.h"
 #include "mesh_now.h"
+#include "message_history.h"
+#include "message_json.h"
+#include "mesh_metrics.h"
+#include "form_decoder.h"
+#include "mesh_groups.h"
+#include "mesh_presence.h"
 
 #include <esp_log.h>
 #include <esp_http_server.h>
 #include <esp_wifi.h>
-#include <freertos/FreeRTOS.h>
-#include <freertos/queue.h>
+#include <esp_timer.h>
+#include <esp_random.h>
+#include <stdio.h>
+#include <stdlib.h>
 #include <string.h>
+#include <strings.h>
 #include <inttypes.h>
 
 // Embedded frontend files
@@ -17,10 +26,76 @@
 
 #define TAG "WEB_SERVER"
 #define HTTP_PORT 80
+#define MESSAGES_PER_POLL 10
+#define MESSAGES_PAGE_MAX 25
+// History entries a ?group= page looks through for its matches
+#define MESSAGES_SCAN_MAX 100
+#define SESSION_COOKIE "meshnow_sid"
+#define MAX_CLIENT_SESSIONS 16
+#define SESSION_TIMEOUT_MS 60000
+#define SEND_CHUNK_SIZE 256
+#define METRICS_CHUNK_SIZE 1024
+
+#ifdef CONFIG_MESH_NOW_SEND_BODY_LIMIT
+#define SEND_BODY_LIMIT CONFIG_MESH_NOW_SEND_BODY_LIMIT
+#else
+#define SEND_BODY_LIMIT 4096
+#endif
+
+#ifdef CONFIG_MESH_NOW_SEND_BATCH_MAX
+#define SEND_BATCH_MAX CONFIG_MESH_NOW_SEND_BATCH_MAX
+#else
+#define SEND_BATCH_MAX 16
+#endif
+
+#ifdef CONFIG_MESH_NOW_HTTPD_PRIORITY
+#define HTTPD_PRIORITY CONFIG_MESH_NOW_HTTPD_PRIORITY
+#else
+#define HTTPD_PRIORITY (tskIDLE_PRIORITY + 5)
+#endif
+
+// -1 lets the scheduler run the server on either core
+#if defined(CONFIG_MESH_NOW_HTTPD_CORE) && CONFIG_MESH_NOW_HTTPD_CORE >= 0 && !CONFIG_FREERTOS_UNICORE
+#define HTTPD_CORE CONFIG_MESH_NOW_HTTPD_CORE
+#else
+#define HTTPD_CORE tskNO_AFFINITY
+#endif
 
 static httpd_handle_t server = NULL;
-static QueueHandle_t message_queue = NULL;
 static message_send_callback_t send_callback = NULL;
+static message_relay_callback_t relay_callback = NULL;
+static message_group_send_callback_t group_send_callback = NULL;
+static presence_callback_t presence_callback = NULL;
+static typing_callback_t typing_callback = NULL;
+
+// Decoded /send messages; only the httpd task uses this
+static char send_batch[SEND_BATCH_MAX][MAX_MESH_MESSAGE_LEN];
+
+// Per-client read cursors into the shared history ring. Every client reads
+// the same entries, so fan-out costs one cursor per client rather than one
+// copy of each message. Only the httpd task touches this table.
+typedef struct {
+    uint32_t id;            // 0 = free slot
+    uint32_t cursor;        // Last sequence number delivered
+    int64_t last_seen_ms;
+} client_session_t;
+
+static client_session_t sessions[MAX_CLIENT_SESSIONS];
+
+// /metrics text batched into response chunks; only the httpd task uses this
+typedef struct {
+    httpd_req_t *req;
+    size_t len;
+    char buf[METRICS_CHUNK_SIZE];
+} metrics_chunk_t;
+
+static metrics_chunk_t metrics_chunk;
+
+// A handler and the latency histogram it reports to
+typedef struct {
+    esp_err_t (*handler)(httpd_req_t *req);
+    mesh_histogram_t histogram;
+} timed_route_t;
 
 // HTTP server handlers
 static esp_err_t index_handler(httpd_req_t *req) {
@@ -42,43 +117,89 @@ static esp_err_t css_handler(httpd_req_t *req) {
     return ESP_OK;
 }
 
+// Read a /send-style form or JSON body into send_batch. ESP_OK when decoded;
+// ESP_ERR_INVALID_SIZE or ESP_ERR_INVALID_ARG once the error response is sent;
+// ESP_FAIL if the socket failed
+static esp_err_t receive_form_body(httpd_req_t *req, size_t max_messages, form_decoder_t *decoder) {
+    // esp_http_server does not accept chunked request bodies, so
+    // Content-Length is authoritative and bounds the whole read
+    if (req->content_len > SEND_BODY_LIMIT) {
+        httpd_resp_send_err(req, HTTPD_413_CONTENT_TOO_LARGE, "Request body too large");
+        return ESP_ERR_INVALID_SIZE;
+    }
+
+    form_body_type_t type = FORM_BODY_URLENCODED;
+    char content_type[32];
+    if (httpd_req_get_hdr_value_str(req, "Content-Type", content_type, sizeof(content_type)) == ESP_OK &&
+        strncasecmp(content_type, "application/json", 16) == 0) {
+        type = FORM_BODY_JSON;
+    }
+
+    form_decoder_init(decoder, type, send_batch, max_messages);
+
+    char chunk[SEND_CHUNK_SIZE];
+    size_t remaining = req->content_len;
+    while (remaining > 0) {
+        int n = httpd_req_recv(req, chunk, remaining < sizeof(chunk) ? remaining : sizeof(chunk));
+        if (n == HTTPD_SOCK_ERR_TIMEOUT) {
+            continue;
+        }
+        if (n <= 0) {
+            ESP_LOGW(TAG, "Failed to read %s body (%d)", req->uri, n);
+            return ESP_FAIL;
+        }
+        form_decoder_feed(decoder, chunk, n);
+        remaining -= n;
+    }
+
+    if (form_decoder_finish(decoder) != ESP_OK) {
+        httpd_resp_send_err(req, HTTPD_400_BAD_REQUEST, "Invalid JSON body");
+        return ESP_ERR_INVALID_ARG;
+    }
+    return ESP_OK;
+}
+
+// Group from a ?group=N query: -1 without one, -2 if it is not a group ID
+static int query_group(httpd_req_t *req) {
+    char query[64];
+    char value[8];
+    if (httpd_req_get_url_query_str(req, query, sizeof(query)) != ESP_OK ||
+        httpd_query_key_value(query, "group", value, sizeof(value)) != ESP_OK) {
+        return -1;
+    }
+    char *end;
+    unsigned long group_id = strtoul(value, &end, 10);
+    return *end == '\0' && end != value && group_id < MESH_GROUP_COUNT ? (int)group_id : -2;
+}
+
+// POST /send, or /send?group=N to post to one group
 static esp_err_t send_handler(httpd_req_t *req) {
-    ESP_LOGI(TAG, "Handling /send request");
-    
-    char content[512];
-    int content_len = httpd_req_recv(req, content, sizeof(content) - 1);
-
-    if (content_len > 0 && send_callback) {
-        content[content_len] = '\0';
-        ESP_LOGI(TAG, "Received send request with content: %s", content);
-
-        // Parse message from POST data
-        char *msg_start = strstr(content, "message=");
-        if (msg_start) {
-            msg_start += 8; // Skip "message="
-            char *msg_end = strchr(msg_start, '&');
-            if (msg_end) *msg_end = '\0';
-
-            // URL decode (basic)
-            char decoded[256];
-            int len = 0;
-            for (int i = 0; msg_start[i] && len < sizeof(decoded) - 1; i++) {
-                if (msg_start[i] == '+') {
-                    decoded[len++] = ' ';
-                } else if (msg_start[i] == '%' && msg_start[i+1] && msg_start[i+2]) {
-                    int hex;
-                    sscanf(&msg_start[i+1], "%2x", &hex);
-                    decoded[len++] = (char)hex;
-                    i += 2;
-                } else {
-                    decoded[len++] = msg_start[i];
-                }
-            }
-            decoded[len] = '\0';
+    ESP_LOGI(TAG, "Handling /send request (%d bytes)", (int)req->content_len);
 
-            ESP_LOGI(TAG, "Decoded message: %s", decoded);
-            // Send message via callback
-            send_callback(decoded);
+    int group = query_group(req);
+    if (group == -2) {
+        httpd_resp_send_err(req, HTTPD_400_BAD_REQUEST, "Invalid group");
+        return ESP_OK;
+    }
+
+    form_decoder_t decoder;
+    esp_err_t err = receive_form_body(req, SEND_BATCH_MAX, &decoder);
+    if (err != ESP_OK) {
+        return err == ESP_FAIL ? ESP_FAIL : ESP_OK;
+    }
+    if (decoder.dropped > 0) {
+        ESP_LOGW(TAG, "Dropped %d messages over the per-request limit of %d",
+                 (int)decoder.dropped, SEND_BATCH_MAX);
+    }
+
+    for (size_t i = 0; i < decoder.count; i++) {
+        ESP_LOGI(TAG, "Decoded message: %s", send_batch[i]);
+        if (group >= 0) {
+            if (group_send_callback) {
+                group_send_callback((uint8_t)group, send_batch[i]);
+            }
+        } else if (send_callback) {
+            send_callback(send_batch[i]);
         }
     }
 
@@ -86,46 +207,200 @@ static esp_err_t send_handler(httpd_req_t *req) {
     return ESP_OK;
 }
 
+// POST /relay?sender=aa:bb:cc:dd:ee:ff&id=N with one message in a /send body.
+// A bridge uses this to carry a message heard on another island onto this
+// mesh under its origin's MAC and ID, so receivers deduplicate it like any
+// other copy of the message.
+static esp_err_t relay_handler(httpd_req_t *req) {
+    char query[64];
+    char sender[18];
+    char id_text[11];
+    uint8_t origin_mac[ESP_NOW_ETH_ALEN];
+    char *end = NULL;
+    unsigned long long message_id = 0;
+
+    if (httpd_req_get_url_query_str(req, query, sizeof(query)) == ESP_OK &&
+        httpd_query_key_value(query, "sender", sender, sizeof(sender)) == ESP_OK &&
+        httpd_query_key_value(query, "id", id_text, sizeof(id_text)) == ESP_OK) {
+        message_id = strtoull(id_text, &end, 10);
+    }
+    if (end == NULL || *end != '\0' || message_id == 0 || message_id > UINT32_MAX ||
+        sscanf(sender, "%2hhx:%2hhx:%2hhx:%2hhx:%2hhx:%2hhx",
+               &origin_mac[0], &origin_mac[1], &origin_mac[2],
+               &origin_mac[3], &origin_mac[4], &origin_mac[5]) != 6) {
+        httpd_resp_send_err(req, HTTPD_400_BAD_REQUEST, "Missing or invalid sender or id");
+        return ESP_OK;
+    }
+
+    form_decoder_t decoder;
+    esp_err_t err = receive_form_body(req, 1, &decoder);
+    if (err != ESP_OK) {
+        return err == ESP_FAIL ? ESP_FAIL : ESP_OK;
+    }
+    if (decoder.count == 0) {
+        httpd_resp_send_err(req, HTTPD_400_BAD_REQUEST, "No message");
+        return ESP_OK;
+    }
+
+    err = relay_callback ? relay_callback(origin_mac, (uint32_t)message_id, send_batch[0]) : ESP_ERR_NOT_SUPPORTED;
+    if (err == ESP_ERR_INVALID_STATE) {
+        // Already seen here: the message reached this mesh some other way
+        httpd_resp_set_status(req, "409 Conflict");
+        httpd_resp_send(req, "Already seen", HTTPD_RESP_USE_STRLEN);
+        return ESP_OK;
+    }
+    if (err != ESP_OK) {
+        httpd_resp_send_err(req, HTTPD_500_INTERNAL_SERVER_ERROR, "Relay failed");
+        return ESP_OK;
+    }
+
+    httpd_resp_send(req, "OK", 2);
+    return ESP_OK;
+}
+
+typedef struct {
+    httpd_req_t *req;
+    int group;              // Only this group's messages, or -1 for all
+    size_t limit;
+    size_t count;
+    uint32_t last_seq;
+} messages_page_t;
+
+// Serialize one history entry straight into the chunked response
+static bool messages_page_visit(const history_entry_t *entry, void *ctx) {
+    messages_page_t *page = (messages_page_t *)ctx;
+    const message_t *msg = &entry->msg;
+    bool group_message = msg->type == MSG_TYPE_GROUP;
+
+    // Skipped entries still move the cursor, so the next page starts after them
+    page->last_seq = entry->seq;
+    if (page->group >= 0 && (!group_message || msg->group_id != page->group)) {
+        return true;
+    }
+
+    static char entry_json[MESSAGE_JSON_ENTRY_LEN];   // httpd task only
+    message_json_entry(entry_json, sizeof(entry_json), entry, page->count == 0);
+
+    page->count++;
+    return httpd_resp_sendstr_chunk(page->req, entry_json) == ESP_OK && page->count < page->limit;
+}
+
+// Drop sessions of clients that stopped polling
+static void sessions_evict_stale(int64_t now_ms) {
+    for (int i = 0; i < MAX_CLIENT_SESSIONS; i++) {
+        if (sessions[i].id != 0 && now_ms - sessions[i].last_seen_ms > SESSION_TIMEOUT_MS) {
+            ESP_LOGI(TAG, "Evicting stale session %08" PRIx32, sessions[i].id);
+            sessions[i].id = 0;
+        }
+    }
+}
+
+static client_session_t *session_lookup(httpd_req_t *req) {
+    char value[16];
+    size_t value_len = sizeof(value);
+    if (httpd_req_get_cookie_val(req, SESSION_COOKIE, value, &value_len) != ESP_OK) {
+        return NULL;
+    }
+
+    uint32_t id = (uint32_t)strtoul(value, NULL, 16);
+    for (int i = 0; id != 0 && i < MAX_CLIENT_SESSIONS; i++) {
+        if (sessions[i].id == id) {
+            return &sessions[i];
+        }
+    }
+    return NULL;
+}
+
+// Take a free slot, or the least recently seen one when the table is full
+static client_session_t *session_create(int64_t now_ms) {
+    client_session_t *slot = &sessions[0];
+    for (int i = 0; i < MAX_CLIENT_SESSIONS; i++) {
+        if (sessions[i].id == 0) {
+            slot = &sessions[i];
+            break;
+        }
+        if (sessions[i].last_seen_ms < slot->last_seen_ms) {
+            slot = &sessions[i];
+        }
+    }
+
+    do {
+        slot->id = esp_random();
+    } while (slot->id == 0);
+    slot->cursor = 0;
+    slot->last_seen_ms = now_ms;
+    return slot;
+}
+
+static uint32_t query_uint(const char *query, const char *key, uint32_t fallback) {
+    char value[16];
+    if (httpd_query_key_value(query, key, value, sizeof(value)) != ESP_OK) {
+        return fallback;
+    }
+    return (uint32_t)strtoul(value, NULL, 10);
+}
+
+// GET /messages?since=<seq>&limit=<n>&group=<id>
+// Returns entries with seq > since (oldest first) plus the cursor for the next page.
+// latest below since means the history was wiped and numbering started again.
+// Clients that omit since continue from the cursor stored in their session cookie.
+// With group, only that group's messages; a page then looks through up to
+// MESSAGES_SCAN_MAX entries, so it can come back short with more to follow.
 static esp_err_t messages_handler(httpd_req_t *req) {
     ESP_LOGI(TAG, "Handling /messages request");
-    
-    char json_response[2048];
-    strcpy(json_response, "{\"messages\":[");
-
-    // Message structure (should match mesh_now.h)
-    typedef struct {
-        char message[256];
-        uint8_t sender_mac[6];
-        uint32_t timestamp;
-    } mesh_message_t;
-
-    mesh_message_t msg;
-    int msg_count = 0;
-    bool first = true;
-
-    while (message_queue && xQueueReceive(message_queue, &msg, 0) == pdTRUE && msg_count < 10) {
-        ESP_LOGI(TAG, "Found message in queue: %s", msg.message);
-        if (!first) {
-            strcat(json_response, ",");
-        }
 
-        char temp[512];
-        snprintf(temp, sizeof(temp),
-                "{\"sender\":\"%02x:%02x:%02x:%02x:%02x:%02x\",\"content\":\"%s\",\"timestamp\":%" PRIu32 "}",
-                msg.sender_mac[0], msg.sender_mac[1], msg.sender_mac[2],
-                msg.sender_mac[3], msg.sender_mac[4], msg.sender_mac[5],
-                msg.message, msg.timestamp);
+    int64_t now_ms = esp_timer_get_time() / 1000;
+    sessions_evict_stale(now_ms);
 
-        strcat(json_response, temp);
-        first = false;
-        msg_count++;
+    char set_cookie[64];
+    client_session_t *session = session_lookup(req);
+    if (!session) {
+        session = session_create(now_ms);
+        snprintf(set_cookie, sizeof(set_cookie), SESSION_COOKIE "=%08" PRIx32 "; Path=/; SameSite=Strict", session->id);
+        httpd_resp_set_hdr(req, "Set-Cookie", set_cookie);
     }
 
-    strcat(json_response, "]}");
-    ESP_LOGI(TAG, "Returning %d messages", msg_count);
+    uint32_t since = session->cursor;
+    uint32_t limit = MESSAGES_PER_POLL;
+    char query[64];
+    if (httpd_req_get_url_query_str(req, query, sizeof(query)) == ESP_OK) {
+        since = query_uint(query, "since", session->cursor);
+        limit = query_uint(query, "limit", MESSAGES_PER_POLL);
+    }
+    if (limit == 0 || limit > MESSAGES_PAGE_MAX) {
+        limit = MESSAGES_PAGE_MAX;
+    }
+    int group = query_group(req);
+    if (group == -2) {
+        httpd_resp_send_err(req, HTTPD_400_BAD_REQUEST, "Invalid group");
+        return ESP_OK;
+    }
 
     httpd_resp_set_type(req, "application/json");
-    httpd_resp_send(req, json_response, strlen(json_response));
+    httpd_resp_sendstr_chunk(req, "{\"messages\":[");
+
+    messages_page_t page = {
+        .req = req,
+        .group = group,
+        .limit = limit,
+        .count = 0,
+        .last_seq = since,
+    };
+    message_history_read(since, group >= 0 ? MESSAGES_SCAN_MAX : limit, messages_page_visit, &page);
+
+    session->cursor = page.last_seq;
+    session->last_seen_ms = now_ms;
+
+    uint32_t oldest = message_history_oldest_seq();
+    uint32_t latest = message_history_latest_seq();
+    char tail[128];
+    snprintf(tail, sizeof(tail),
+             "],\"next\":%" PRIu32 ",\"oldest\":%" PRIu32 ",\"latest\":%" PRIu32 ",\"more\":%s}",
+             page.last_seq, oldest, latest, latest > page.last_seq ? "true" : "false");
+    httpd_resp_sendstr_chunk(req, tail);
+    httpd_resp_sendstr_chunk(req, NULL);
+
+    ESP_LOGI(TAG, "Returning %d messages after %" PRIu32, (int)page.count, since);
     return ESP_OK;
 }
 
@@ -160,6 +435,128 @@ static esp_err_t peers_handler(httpd_req_t *req) {
     return ESP_OK;
 }
 
+// GET /groups lists this node's group subscriptions; POST /groups?join=N or
+// ?leave=N changes them first
+static esp_err_t groups_handler(httpd_req_t *req) {
+    if (req->method == HTTP_POST) {
+        char query[32];
+        char value[8];
+        bool join = false;
+        if (httpd_req_get_url_query_str(req, query, sizeof(query)) != ESP_OK ||
+            !((join = httpd_query_key_value(query, "join", value, sizeof(value)) == ESP_OK) ||
+              httpd_query_key_value(query, "leave", value, sizeof(value)) == ESP_OK)) {
+            httpd_resp_send_err(req, HTTPD_400_BAD_REQUEST, "Expected join or leave");
+            return ESP_OK;
+        }
+        char *end;
+        unsigned long group_id = strtoul(value, &end, 10);
+        if (*end != '\0' || end == value || group_id >= MESH_GROUP_COUNT) {
+            httpd_resp_send_err(req, HTTPD_400_BAD_REQUEST, "Invalid group");
+            return ESP_OK;
+        }
+        if (join) {
+            mesh_groups_join((uint8_t)group_id);
+        } else {
+            mesh_groups_leave((uint8_t)group_id);
+        }
+        ESP_LOGI(TAG, "%s group %lu", join ? "Joined" : "Left", group_id);
+    }
+
+    uint8_t groups[MESH_GROUP_COUNT];
+    size_t count = mesh_groups_list(groups, MESH_GROUP_COUNT);
+
+    httpd_resp_set_type(req, "application/json");
+    char chunk[160];
+    size_t len = (size_t)snprintf(chunk, sizeof(chunk), "{\"groups\":[");
+    for (size_t i = 0; i < count; i++) {
+        len += snprintf(chunk + len, sizeof(chunk) - len, "%s%u", i > 0 ? "," : "", groups[i]);
+        if (len > sizeof(chunk) - 8) {
+            if (httpd_resp_send_chunk(req, chunk, len) != ESP_OK) {
+                return ESP_FAIL;
+            }
+            len = 0;
+        }
+    }
+    len += snprintf(chunk + len, sizeof(chunk) - len, "],\"neighbours\":%u}",
+                    (unsigned)mesh_groups_neighbour_count(esp_timer_get_time() / 1000));
+    if (httpd_resp_send_chunk(req, chunk, len) != ESP_OK) {
+        return ESP_FAIL;
+    }
+    return httpd_resp_send_chunk(req, NULL, 0);
+}
+
+// GET /presence: nodes whose status has not timed out, and whether each is
+// typing to this node
+static esp_err_t presence_get_handler(httpd_req_t *req) {
+    static mesh_presence_entry_t entries[MESH_PRESENCE_MAX_NODES];   // httpd task only
+    size_t count = mesh_presence_list(entries, MESH_PRESENCE_MAX_NODES, esp_timer_get_time() / 1000);
+    if (count > MESH_PRESENCE_MAX_NODES) {
+        count = MESH_PRESENCE_MAX_NODES;
+    }
+
+    httpd_resp_set_type(req, "application/json");
+    if (httpd_resp_sendstr_chunk(req, "{\"nodes\":[") != ESP_OK) {
+        return ESP_FAIL;
+    }
+    for (size_t i = 0; i < count; i++) {
+        const mesh_presence_entry_t *e = &entries[i];
+        char status[MESSAGE_JSON_ESCAPED_LEN(MESH_PRESENCE_STATUS_LEN)];
+        message_json_escape(status, sizeof(status), e->status);
+        char entry[sizeof(status) + 80];
+        snprintf(entry, sizeof(entry),
+                 "%s{\"mac\":\"%02x:%02x:%02x:%02x:%02x:%02x\",\"status\":\"%s\",\"typing\":%s}",
+                 i > 0 ? "," : "", e->mac[0], e->mac[1], e->mac[2], e->mac[3], e->mac[4], e->mac[5],
+                 status, e->typing ? "true" : "false");
+        if (httpd_resp_sendstr_chunk(req, entry) != ESP_OK) {
+            return ESP_FAIL;
+        }
+    }
+    if (httpd_resp_sendstr_chunk(req, "]}") != ESP_OK) {
+        return ESP_FAIL;
+    }
+    return httpd_resp_send_chunk(req, NULL, 0);
+}
+
+// POST /presence with the new status as the message of a /send body; an
+// empty one clears it. Flapping is fine: mesh_presence debounces it.
+static esp_err_t presence_post_handler(httpd_req_t *req) {
+    form_decoder_t decoder;
+    esp_err_t err = receive_form_body(req, 1, &decoder);
+    if (err != ESP_OK) {
+        return err == ESP_FAIL ? ESP_FAIL : ESP_OK;
+    }
+    if (presence_callback) {
+        presence_callback(decoder.count > 0 ? send_batch[0] : "");
+    }
+    httpd_resp_send(req, "OK", 2);
+    return ESP_OK;
+}
+
+// POST /typing?to=aa:bb:cc:dd:ee:ff, or &typing=0 to stop. A UI can post it
+// on every keystroke; typing to several nodes goes out in one frame.
+static esp_err_t typing_handler(httpd_req_t *req) {
+    char query[64];
+    char to[18];
+    char typing[4] = "1";
+    uint8_t target_mac[ESP_NOW_ETH_ALEN];
+
+    if (httpd_req_get_url_query_str(req, query, sizeof(query)) != ESP_OK ||
+        httpd_query_key_value(query, "to", to, sizeof(to)) != ESP_OK ||
+        sscanf(to, "%2hhx:%2hhx:%2hhx:%2hhx:%2hhx:%2hhx",
+               &target_mac[0], &target_mac[1], &target_mac[2],
+               &target_mac[3], &target_mac[4], &target_mac[5]) != 6) {
+        httpd_resp_send_err(req, HTTPD_400_BAD_REQUEST, "Missing or invalid to");
+        return ESP_OK;
+    }
+    httpd_query_key_value(query, "typing", typing, sizeof(typing));
+
+    if (typing_callback) {
+        typing_callback(target_mac, strcmp(typing, "0") != 0);
+    }
+    httpd_resp_send(req, "OK", 2);
+    return ESP_OK;
+}
+
 static esp_err_t wifi_info_handler(httpd_req_t *req) {
     ESP_LOGI(TAG, "Handling /wifi-info request");
     
@@ -177,20 +574,90 @@ static esp_err_t wifi_info_handler(httpd_req_t *req) {
     return ESP_OK;
 }
 
-esp_err_t web_server_init(QueueHandle_t queue) {
-    message_queue = queue;
+static bool metrics_write(const char *data, size_t len, void *ctx) {
+    metrics_chunk_t *chunk = ctx;
+    if (chunk->len + len > sizeof(chunk->buf)) {
+        if (httpd_resp_send_chunk(chunk->req, chunk->buf, chunk->len) != ESP_OK) {
+            return false;
+        }
+        chunk->len = 0;
+    }
+    memcpy(chunk->buf + chunk->len, data, len);
+    chunk->len += len;
+    return true;
+}
 
+// GET /metrics: Prometheus text format, or with ?format=binary the compact
+// form described in mesh_metrics.h
+static esp_err_t metrics_handler(httpd_req_t *req) {
+    mesh_metrics_snapshot_t snapshot;
+    mesh_metrics_snapshot(&snapshot);
+
+    char query[32];
+    char format[8];
+    if (httpd_req_get_url_query_str(req, query, sizeof(query)) == ESP_OK &&
+        httpd_query_key_value(query, "format", format, sizeof(format)) == ESP_OK &&
+        strcmp(format, "binary") == 0) {
+        uint8_t encoded[MESH_METRICS_BINARY_SIZE];
+        size_t len = mesh_metrics_encode(&snapshot, encoded, sizeof(encoded));
+        httpd_resp_set_type(req, "application/octet-stream");
+        return httpd_resp_send(req, (const char *)encoded, len);
+    }
+
+    httpd_resp_set_type(req, "text/plain; version=0.0.4");
+    metrics_chunk.req = req;
+    metrics_chunk.len = 0;
+    if (!mesh_metrics_write_text(&snapshot, metrics_write, &metrics_chunk)) {
+        return ESP_FAIL;
+    }
+    if (metrics_chunk.len > 0 && httpd_resp_send_chunk(req, metrics_chunk.buf, metrics_chunk.len) != ESP_OK) {
+        return ESP_FAIL;
+    }
+    return httpd_resp_send_chunk(req, NULL, 0);
+}
+
+// Every URI is registered through this, so each request lands in a latency histogram
+static esp_err_t timed_handler(httpd_req_t *req) {
+    const timed_route_t *route = req->user_ctx;
+    int64_t start = esp_timer_get_time();
+    esp_err_t ret = route->handler(req);
+    mesh_metrics_observe_us(route->histogram, esp_timer_get_time() - start);
+    if (ret != ESP_OK) {
+        mesh_metrics_inc(MESH_METRIC_HTTP_FAILED);
+    }
+    return ret;
+}
+
+static const timed_route_t index_route = {index_handler, MESH_HIST_HTTP_STATIC};
+static const timed_route_t js_route = {js_handler, MESH_HIST_HTTP_STATIC};
+static const timed_route_t css_route = {css_handler, MESH_HIST_HTTP_STATIC};
+static const timed_route_t send_route = {send_handler, MESH_HIST_HTTP_SEND};
+static const timed_route_t relay_route = {relay_handler, MESH_HIST_HTTP_SEND};
+static const timed_route_t messages_route = {messages_handler, MESH_HIST_HTTP_MESSAGES};
+static const timed_route_t peers_route = {peers_handler, MESH_HIST_HTTP_API};
+static const timed_route_t groups_route = {groups_handler, MESH_HIST_HTTP_API};
+static const timed_route_t presence_get_route = {presence_get_handler, MESH_HIST_HTTP_API};
+static const timed_route_t presence_post_route = {presence_post_handler, MESH_HIST_HTTP_API};
+static const timed_route_t typing_route = {typing_handler, MESH_HIST_HTTP_API};
+static const timed_route_t wifi_info_route = {wifi_info_handler, MESH_HIST_HTTP_API};
+static const timed_route_t metrics_route = {metrics_handler, MESH_HIST_HTTP_API};
+
+esp_err_t web_server_init(void) {
     httpd_config_t config = HTTPD_DEFAULT_CONFIG();
     config.server_port = HTTP_PORT;
     config.stack_size = 8192;
+    config.task_priority = HTTPD_PRIORITY;
+    config.core_id = HTTPD_CORE;
+    // The default of 8 is too few for the URIs below
+    config.max_uri_handlers = 16;
 
     if (httpd_start(&server, &config) == ESP_OK) {
         // Main page
         httpd_uri_t index_uri = {
             .uri = "/",
             .method = HTTP_GET,
-            .handler = index_handler,
-            .user_ctx = NULL
+            .handler = timed_handler,
+            .user_ctx = (void *)&index_route
         };
         httpd_register_uri_handler(server, &index_uri);
 
@@ -198,8 +665,8 @@ esp_err_t web_server_init(QueueHandle_t queue) {
         httpd_uri_t js_uri = {
             .uri = "/bundle.js",
             .method = HTTP_GET,
-            .handler = js_handler,
-            .user_ctx = NULL
+            .handler = timed_handler,
+            .user_ctx = (void *)&js_route
         };
         httpd_register_uri_handler(server, &js_uri);
 
@@ -207,8 +674,8 @@ esp_err_t web_server_init(QueueHandle_t queue) {
         httpd_uri_t css_uri = {
             .uri = "/styles.css",
             .method = HTTP_GET,
-            .handler = css_handler,
-            .user_ctx = NULL
+            .handler = timed_handler,
+            .user_ctx = (void *)&css_route
         };
         httpd_register_uri_handler(server, &css_uri);
 
@@ -216,35 +683,91 @@ esp_err_t web_server_init(QueueHandle_t queue) {
         httpd_uri_t send_uri = {
             .uri = "/send",
             .method = HTTP_POST,
-            .handler = send_handler,
-            .user_ctx = NULL
+            .handler = timed_handler,
+            .user_ctx = (void *)&send_route
         };
         httpd_register_uri_handler(server, &send_uri);
 
+        httpd_uri_t relay_uri = {
+            .uri = "/relay",
+            .method = HTTP_POST,
+            .handler = timed_handler,
+            .user_ctx = (void *)&relay_route
+        };
+        httpd_register_uri_handler(server, &relay_uri);
+
         httpd_uri_t messages_uri = {
             .uri = "/messages",
             .method = HTTP_GET,
-            .handler = messages_handler,
-            .user_ctx = NULL
+            .handler = timed_handler,
+            .user_ctx = (void *)&messages_route
         };
         httpd_register_uri_handler(server, &messages_uri);
 
         httpd_uri_t peers_uri = {
             .uri = "/peers",
             .method = HTTP_GET,
-            .handler = peers_handler,
-            .user_ctx = NULL
+            .handler = timed_handler,
+            .user_ctx = (void *)&peers_route
         };
         httpd_register_uri_handler(server, &peers_uri);
 
+        httpd_uri_t groups_get_uri = {
+            .uri = "/groups",
+            .method = HTTP_GET,
+            .handler = timed_handler,
+            .user_ctx = (void *)&groups_route
+        };
+        httpd_register_uri_handler(server, &groups_get_uri);
+
+        httpd_uri_t groups_post_uri = {
+            .uri = "/groups",
+            .method = HTTP_POST,
+            .handler = timed_handler,
+            .user_ctx = (void *)&groups_route
+        };
+        httpd_register_uri_handler(server, &groups_post_uri);
+
+        httpd_uri_t presence_get_uri = {
+            .uri = "/presence",
+            .method = HTTP_GET,
+            .handler = timed_handler,
+            .user_ctx = (void *)&presence_get_route
+        };
+        httpd_register_uri_handler(server, &presence_get_uri);
+
+        httpd_uri_t presence_post_uri = {
+            .uri = "/presence",
+            .method = HTTP_POST,
+            .handler = timed_handler,
+            .user_ctx = (void *)&presence_post_route
+        };
+        httpd_register_uri_handler(server, &presence_post_uri);
+
+        httpd_uri_t typing_uri = {
+            .uri = "/typing",
+            .method = HTTP_POST,
+            .handler = timed_handler,
+            .user_ctx = (void *)&typing_route
+        };
+        httpd_register_uri_handler(server, &typing_uri);
+
         httpd_uri_t wifi_info_uri = {
             .uri = "/wifi-info",
             .method = HTTP_GET,
-            .handler = wifi_info_handler,
-            .user_ctx = NULL
+            .handler = timed_handler,
+            .user_ctx = (void *)&wifi_info_route
         };
         httpd_register_uri_handler(server, &wifi_info_uri);
 
+        httpd_uri_t metrics_uri = {
+            .uri = "/metrics",
+            .method = HTTP_GET,
+            .handler = timed_handler,
+            .user_ctx = (void *)&metrics_route
+        };
+        httpd_register_uri_handler(server, &metrics_uri);
+
         ESP_LOGI(TAG, "HTTP server started successfully");
         return ESP_OK;
     } else {
@@ -265,6 +788,19 @@ void web_server_set_send_callback(message_send_callback_t callback) {
     send_callback = callback;
 }
 
+void web_server_set_relay_callback(message_relay_callback_t callback) {
+    relay_callback = callback;
+}
+
+void web_server_set_group_send_callback(message_group_send_callback_t callback) {
+    group_send_callback = callback;
+}
+
+void web_server_set_presence_callbacks(presence_callback_t presence, typing_callback_t typing) {
+    presence_callback = presence;
+    typing_callback = typing;
+}
+
 
 esp_err_t web_server_send_message(const char *message) {
     // This should be set by the main application
@@ -6,22 +6,21 @@ Python version - Platform agnostic with TUI
 
 import os
 import sys
-import subprocess
 import argparse
 import shutil
+import importlib.util
 from pathlib import Path
 
-try:
-    from rich.console import Console
-    from rich.prompt import Prompt, IntPrompt
-    from rich.panel import Panel
-    from rich.text import Text
-    from rich.columns import Columns
-    from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn
-    from rich.table import Table
-    RICH_AVAILABLE = True
-except ImportError:
-    RICH_AVAILABLE = False
+from build_profile import BuildProfile
+from command_runner import command_log, echo_to, log_path, run
+from firmware_manifest import default_regions, git_sha, idf_regions, write_manifest
+from sdkconfig_check import errors, report
+from sdkconfig_profiles import PROFILES, check as check_profile
+
+# rich is imported where the TUI is drawn, so --ci runs never load it
+RICH_AVAILABLE = importlib.util.find_spec("rich") is not None
+
+FAILURE_TAIL = 30
 
 def check_idf_setup(console):
     """Check if ESP-IDF environment is set up"""
@@ -32,20 +31,37 @@ def check_idf_setup(console):
         sys.exit(1)
     return idf_path
 
-def run_command(cmd, cwd=None, console=None):
-    """Run a command and return success"""
-    try:
-        result = subprocess.run(cmd, shell=True, cwd=cwd, capture_output=True, text=True)
-        if result.returncode != 0:
-            if console:
-                console.print(f"[red]Command failed: {cmd}[/red]")
-                console.print(f"[dim]{result.stderr}[/dim]")
-            return False
-        return True
-    except Exception as e:
+def run_command(cmd, cwd=None, console=None, on_line=None, echoed=False):
+    """Run a command, streaming its lines to on_line and the build log; returns success
+
+    On failure the last lines are printed unless on_line already echoed them.
+    """
+    result = run(cmd, cwd=cwd, on_line=on_line, log=command_log("build"))
+    if not result.ok:
         if console:
-            console.print(f"[red]Error running command: {e}[/red]")
+            console.print(f"[red]Command failed: {cmd}[/red]")
+            if not echoed:
+                echo = echo_to(console, "   ")
+                for line in result.tail(FAILURE_TAIL):
+                    echo(line)
+            console.print(f"[dim]Full output: {log_path('build')}[/dim]")
         return False
+    return True
+
+def command_output(console, progress=None, task=None, target=None):
+    """on_line for build steps: the progress line with rich, else plain output"""
+    if progress:
+        from rich.markup import escape
+        return lambda line: progress.update(task, description=f"{target}: {escape(line.strip()[:60])}")
+    return echo_to(console, "   ")
+
+def print_title(console, text):
+    """A boxed title with rich, the bare text on the plain console"""
+    if type(console).__module__ == "rich.console":
+        from rich.panel import Panel
+        console.print(Panel.fit(text))
+    else:
+        console.print(text)
 
 def get_targets():
     """Get available targets with descriptions"""
@@ -59,7 +75,7 @@ def get_targets():
 
 def show_menu(console, targets):
     """Show target selection menu"""
-    console.print(Panel.fit("[bold blue]Mesh-NOW Target Selector[/bold blue]"))
+    print_title(console, "[bold blue]Mesh-NOW Target Selector[/bold blue]")
     console.print()
 
     for num, (target, desc) in targets.items():
@@ -69,8 +85,9 @@ def show_menu(console, targets):
     console.print("[cyan]0)[/cyan] Exit")
     console.print()
 
-def build_target(target, console, script_dir, progress=None):
-    """Build for a specific target"""
+def build_target(target, console, script_dir, progress=None, profile=None, config_profile=None):
+    """Build for a specific target, optionally with a sdkconfig profile"""
+    profile = profile or BuildProfile(script_dir.parent)
     build_dir = script_dir.parent / "build"
 
     # Clean previous build
@@ -78,13 +95,47 @@ def build_target(target, console, script_dir, progress=None):
         shutil.rmtree(build_dir)
 
     task = progress.add_task(f"Building {target}...", total=4) if progress else None
+    output = command_output(console, progress, task, target)
+    echoed = progress is None
+
+    # Target-specific config (or a profile generated from it) becomes
+    # sdkconfig.defaults, which set-target turns into a fresh sdkconfig
+    config_file = script_dir.parent / "configs" / f"sdkconfig.{target}"
+    config_text = None
+    with profile.phase("configure", target) as phase:
+        success = True
+        if config_profile:
+            if progress:
+                progress.update(task, description=f"Applying {config_profile} profile for {target}...")
+            else:
+                console.print(f"Using profile: {config_profile} ({config_file.name})")
+            config_text, _, findings = check_profile(target, config_profile, script_dir.parent)
+            report(console, findings)
+            success = not errors(findings)
+            if success:
+                Path("sdkconfig.defaults").write_text(config_text)
+        elif config_file.exists():
+            if progress:
+                progress.update(task, description=f"Applying config for {target}...")
+            else:
+                console.print(f"Using configuration: {config_file}")
+            success = run_command(f"cp {config_file} sdkconfig.defaults", console=console, on_line=output, echoed=echoed)
+        phase["ok"] = success
+    if not success:
+        if progress:
+            progress.update(task, description=f"Invalid configuration for {target}")
+        return False
+    if progress:
+        progress.advance(task)
 
     # Set target
     if progress:
         progress.update(task, description=f"Setting target {target}...")
     else:
         console.print(f"Setting target to {target}...")
-    success = run_command(f"idf.py set-target {target}", console=console)
+    with profile.phase("set-target", target) as phase:
+        success = run_command(f"idf.py set-target {target}", console=console, on_line=output, echoed=echoed)
+        phase["ok"] = success
     if not success:
         if progress:
             progress.update(task, description=f"Failed to set target {target}")
@@ -92,25 +143,15 @@ def build_target(target, console, script_dir, progress=None):
     if progress:
         progress.advance(task)
 
-    # Copy target-specific config
-    config_file = script_dir.parent / "configs" / f"sdkconfig.{target}"
-    if config_file.exists():
-        if progress:
-            progress.update(task, description=f"Applying config for {target}...")
-        else:
-            console.print(f"Using configuration: {config_file}")
-        success = run_command(f"cp {config_file} sdkconfig.defaults", console=console)
-        if not success:
-            return False
-    if progress:
-        progress.advance(task)
-
     # Build
     if progress:
         progress.update(task, description=f"Building {target}...")
     else:
         console.print(f"Building for {target}...")
-    success = run_command("idf.py build", console=console)
+    with profile.phase("build", target) as build_phase:
+        success = run_command("idf.py build", console=console, on_line=output, echoed=echoed)
+        build_phase["ok"] = success
+    profile.add_ninja_log(target, script_dir.parent / "build", build_phase)
     if not success:
         if progress:
             progress.update(task, description=f"Build failed for {target}")
@@ -119,19 +160,32 @@ def build_target(target, console, script_dir, progress=None):
         progress.advance(task)
 
     # Copy artifacts
-    builds_dir = script_dir.parent / "builds" / target
-    builds_dir.mkdir(parents=True, exist_ok=True)
-
-    artifacts = [
-        ("mesh-now.bin", "build/mesh-now.bin"),
-        ("bootloader.bin", "build/bootloader/bootloader.bin"),
-        ("partition-table.bin", "build/partition_table/partition-table.bin")
-    ]
-
-    for name, src in artifacts:
-        src_path = script_dir.parent / src
-        if src_path.exists():
-            shutil.copy2(src_path, builds_dir / name)
+    with profile.phase("artifacts", target):
+        # Profile builds sit side by side, so a fleet can be flashed with one of them
+        builds_dir = script_dir.parent / "builds" / (f"{config_profile}/{target}" if config_profile else target)
+        builds_dir.mkdir(parents=True, exist_ok=True)
+
+        artifacts = [
+            ("mesh-now.bin", "build/mesh-now.bin"),
+            ("bootloader.bin", "build/bootloader/bootloader.bin"),
+            ("partition-table.bin", "build/partition_table/partition-table.bin")
+        ]
+
+        for name, src in artifacts:
+            src_path = script_dir.parent / src
+            if src_path.exists():
+                shutil.copy2(src_path, builds_dir / name)
+
+        # flash.py reads flash mode/frequency/size from the config it was built with
+        if config_text:
+            (builds_dir / config_file.name).write_text(config_text)
+        elif config_file.exists():
+            shutil.copy2(config_file, builds_dir / config_file.name)
+
+        # One merged image plus manifest so flashers can do a single write
+        if all((builds_dir / name).exists() for name, _ in artifacts):
+            regions = idf_regions(script_dir.parent / "build") or default_regions(target)
+            write_manifest(builds_dir, target, regions, git_sha(script_dir.parent))
 
     # Get binary size
     bin_file = builds_dir / "mesh-now.bin"
@@ -149,11 +203,11 @@ def build_target(target, console, script_dir, progress=None):
 
     return True
 
-def build_all_targets(console, script_dir, ci_mode=False):
+def build_all_targets(console, script_dir, ci_mode=False, profile=None, config_profile=None):
     """Build all targets"""
     targets = ["esp32", "esp32s2", "esp32s3", "esp32c3", "esp32c6"]
 
-    console.print(Panel.fit("[bold blue]Building All ESP32 Targets[/bold blue]"))
+    print_title(console, "[bold blue]Building All ESP32 Targets[/bold blue]")
     console.print(f"Targets: {', '.join(targets)}")
     console.print()
 
@@ -161,6 +215,7 @@ def build_all_targets(console, script_dir, ci_mode=False):
     successful_builds = []
 
     if RICH_AVAILABLE and not ci_mode:
+        from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn
         with Progress(
             SpinnerColumn(),
             TextColumn("[progress.description]{task.description}"),
@@ -168,14 +223,14 @@ def build_all_targets(console, script_dir, ci_mode=False):
             console=console
         ) as progress:
             for target in targets:
-                if build_target(target, console, script_dir, progress):
+                if build_target(target, console, script_dir, progress, profile, config_profile):
                     successful_builds.append(target)
                 else:
                     failed_builds.append(target)
     else:
         for target in targets:
             console.print(f"Building for {target}...")
-            if build_target(target, console, script_dir):
+            if build_target(target, console, script_dir, profile=profile, config_profile=config_profile):
                 successful_builds.append(target)
             else:
                 failed_builds.append(target)
@@ -187,8 +242,9 @@ def build_all_targets(console, script_dir, ci_mode=False):
     console.print("Build Summary:")
     console.print("=" * 40)
 
-    table = Table() if RICH_AVAILABLE and not ci_mode else None
-    if table:
+    if RICH_AVAILABLE and not ci_mode:
+        from rich.table import Table
+        table = Table()
         table.add_column("Status", style="bold")
         table.add_column("Targets")
         table.add_row("Successful", f"{len(successful_builds)}: {', '.join(successful_builds)}")
@@ -202,7 +258,7 @@ def build_all_targets(console, script_dir, ci_mode=False):
 
     console.print()
     console.print("Build artifacts location:")
-    console.print("   builds/")
+    console.print(f"   builds/{config_profile}/" if config_profile else "   builds/")
     for target in successful_builds:
         console.print(f"   ├── {target}/")
         console.print("   │   ├── mesh-now.bin")
@@ -272,11 +328,15 @@ def main():
     parser = argparse.ArgumentParser(description="Mesh-NOW Target Selector and Builder")
     parser.add_argument('--ci', action='store_true', help='Disable colors and TUI for CI')
     parser.add_argument('--target', type=str, help='Build specific target (non-interactive)')
+    parser.add_argument('--profile', choices=list(PROFILES),
+                        help='Build with a generated sdkconfig profile (artifacts go to builds/<profile>/<target>)')
+    parser.add_argument('--profile-dir', help='Where to write build-profile.json and build-trace.json (default: builds/profile)')
     parser.add_argument('--with-frontend', action='store_true', help='Build and embed frontend before ESP32 build')
     args = parser.parse_args()
 
     # Setup console
     if RICH_AVAILABLE and not args.ci:
+        from rich.console import Console
         console = Console()
     else:
         # Fallback to plain console
@@ -296,16 +356,21 @@ def main():
 
     script_dir = Path(__file__).parent
     os.chdir(script_dir.parent)  # Change to project root
+    profile = BuildProfile(script_dir.parent)
 
     # Handle frontend building if requested
     if args.with_frontend:
         if console and not args.ci:
-            console.print(Panel.fit("[bold green]Frontend Integration Enabled[/bold green]"))
+            print_title(console, "[bold green]Frontend Integration Enabled[/bold green]")
             console.print()
 
-        if not build_frontend(console, script_dir.parent, args.ci):
+        with profile.phase("frontend") as phase:
+            phase["ok"] = build_frontend(console, script_dir.parent, args.ci)
+        if not phase["ok"]:
             sys.exit(1)
-        if not embed_frontend(console, script_dir.parent, args.ci):
+        with profile.phase("embed") as phase:
+            phase["ok"] = embed_frontend(console, script_dir.parent, args.ci)
+        if not phase["ok"]:
             sys.exit(1)
 
         if console and not args.ci:
@@ -318,7 +383,8 @@ def main():
         if args.target not in [t[0] for t in targets.values()]:
             console.print(f"[red]Invalid target: {args.target}[/red]")
             sys.exit(1)
-        build_target(args.target, console, script_dir)
+        build_target(args.target, console, script_dir, profile=profile, config_profile=args.profile)
+        profile.finish(console, args.profile_dir)
         return
 
     # Interactive mode
@@ -326,6 +392,7 @@ def main():
         show_menu(console, targets)
 
         if RICH_AVAILABLE and not args.ci:
+            from rich.prompt import IntPrompt
             choice = IntPrompt.ask("Select target (0-6)", default=0)
         else:
             try:
@@ -338,15 +405,17 @@ def main():
             break
         elif choice in targets:
             target, desc = targets[choice]
-            if build_target(target, console, script_dir):
+            if build_target(target, console, script_dir, profile=profile, config_profile=args.profile):
                 break
         elif choice == 6:
-            success = build_all_targets(console, script_dir, args.ci)
+            success = build_all_targets(console, script_dir, args.ci, profile, args.profile)
             if success:
                 break
         else:
             console.print("[red]Invalid choice. Please select 0-6.[/red]")
             console.print()
 
+    profile.finish(console, args.profile_dir)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
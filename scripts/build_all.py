@@ -5,19 +5,20 @@ Mesh-NOW Multi-Target Build Script
 
 import os
 import sys
-import subprocess
 import argparse
 import shutil
+import importlib.util
 from pathlib import Path
 
-try:
-    from rich.console import Console
-    from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn
-    from rich.panel import Panel
-    from rich.table import Table
-    RICH_AVAILABLE = True
-except ImportError:
-    RICH_AVAILABLE = False
+from build_profile import BuildProfile
+from command_runner import command_log, echo_to, log_path, run
+from firmware_manifest import default_regions, git_sha, idf_regions, write_manifest
+from sdkconfig_check import errors, report, validate
+
+# rich is imported where the TUI is drawn, so --ci runs never load it
+RICH_AVAILABLE = importlib.util.find_spec("rich") is not None
+
+FAILURE_TAIL = 30
 
 def check_idf_setup(console):
     """Check if ESP-IDF environment is set up"""
@@ -28,25 +29,45 @@ def check_idf_setup(console):
         sys.exit(1)
     return idf_path
 
-def run_command(cmd, cwd=None, console=None, capture_output=False):
-    """Run a command and return success and output"""
-    try:
-        if capture_output:
-            result = subprocess.run(cmd, shell=True, cwd=cwd, capture_output=True, text=True)
-        else:
-            result = subprocess.run(cmd, shell=True, cwd=cwd)
-        return result.returncode == 0, result.stdout if capture_output else None
-    except Exception as e:
-        if console:
-            console.print(f"[red]Error running command: {e}[/red]")
-        return False, None
+def run_command(cmd, cwd=None, console=None, capture_output=False, on_line=None, echoed=True):
+    """Run a command and return success and output
+
+    Lines stream to on_line (plain output by default) and the build log; with
+    capture_output the last lines are returned as well. On failure the last
+    lines are printed unless on_line already echoed them.
+    """
+    result = run(cmd, cwd=cwd, on_line=on_line or echo_to(console, "   "), log=command_log("build"))
+    if not result.ok and console:
+        console.print(f"[red]Command failed ({result.reason()}): {cmd}[/red]")
+        if not echoed:
+            echo = echo_to(console, "   ")
+            for line in result.tail(FAILURE_TAIL):
+                echo(line)
+        console.print(f"[dim]Full output: {log_path('build')}[/dim]")
+    return result.ok, result.output if capture_output else None
+
+def command_output(console, progress=None, task=None, target=None):
+    """on_line for build steps: the progress line with rich, else plain output"""
+    if progress:
+        from rich.markup import escape
+        return lambda line: progress.update(task, description=f"{target}: {escape(line.strip()[:60])}")
+    return echo_to(console, "   ")
+
+def print_title(console, text):
+    """A boxed title with rich, the bare text on the plain console"""
+    if type(console).__module__ == "rich.console":
+        from rich.panel import Panel
+        console.print(Panel.fit(text))
+    else:
+        console.print(text)
 
 def get_targets():
     """Get available targets"""
     return ["esp32", "esp32s2", "esp32s3", "esp32c3", "esp32c6"]
 
-def build_target(target, console, script_dir, progress=None):
+def build_target(target, console, script_dir, progress=None, profile=None):
     """Build for a specific target"""
+    profile = profile or BuildProfile(script_dir.parent)
     build_dir = script_dir.parent / "build"
 
     # Clean previous build
@@ -54,13 +75,34 @@ def build_target(target, console, script_dir, progress=None):
         shutil.rmtree(build_dir)
 
     task = progress.add_task(f"Building {target}...", total=4) if progress else None
+    output = command_output(console, progress, task, target)
+    echoed = progress is None
+
+    # Target-specific config becomes sdkconfig.defaults, which set-target
+    # turns into a fresh sdkconfig
+    config_file = script_dir.parent / "configs" / f"sdkconfig.{target}"
+    with profile.phase("configure", target) as phase:
+        success = True
+        if config_file.exists():
+            if progress:
+                progress.update(task, description=f"Applying config for {target}...")
+            else:
+                console.print(f"Using configuration: {config_file}")
+            success, _ = run_command(f"cp {config_file} sdkconfig.defaults", console=console, on_line=output, echoed=echoed)
+        phase["ok"] = success
+    if not success:
+        return False
+    if progress:
+        progress.advance(task)
 
     # Set target
     if progress:
         progress.update(task, description=f"Setting target {target}...")
     else:
         console.print(f"Setting target to {target}...")
-    success, _ = run_command(f"idf.py set-target {target}", console=console)
+    with profile.phase("set-target", target) as phase:
+        success, _ = run_command(f"idf.py set-target {target}", console=console, on_line=output, echoed=echoed)
+        phase["ok"] = success
     if not success:
         if progress:
             progress.update(task, description=f"Failed to set target {target}")
@@ -68,25 +110,15 @@ def build_target(target, console, script_dir, progress=None):
     if progress:
         progress.advance(task)
 
-    # Copy target-specific config
-    config_file = script_dir.parent / "configs" / f"sdkconfig.{target}"
-    if config_file.exists():
-        if progress:
-            progress.update(task, description=f"Applying config for {target}...")
-        else:
-            console.print(f"Using configuration: {config_file}")
-        success, _ = run_command(f"cp {config_file} sdkconfig.defaults", console=console)
-        if not success:
-            return False
-    if progress:
-        progress.advance(task)
-
     # Build
     if progress:
         progress.update(task, description=f"Building {target}...")
     else:
         console.print(f"Building for {target}...")
-    success, _ = run_command("idf.py build", console=console)
+    with profile.phase("build", target) as build_phase:
+        success, _ = run_command("idf.py build", console=console, on_line=output, echoed=echoed)
+        build_phase["ok"] = success
+    profile.add_ninja_log(target, script_dir.parent / "build", build_phase)
     if not success:
         if progress:
             progress.update(task, description=f"Build failed for {target}")
@@ -95,19 +127,29 @@ def build_target(target, console, script_dir, progress=None):
         progress.advance(task)
 
     # Copy artifacts
-    builds_dir = script_dir.parent / "builds" / target
-    builds_dir.mkdir(parents=True, exist_ok=True)
-
-    artifacts = [
-        ("mesh-now.bin", "build/mesh-now.bin"),
-        ("bootloader.bin", "build/bootloader/bootloader.bin"),
-        ("partition-table.bin", "build/partition_table/partition-table.bin")
-    ]
-
-    for name, src in artifacts:
-        src_path = script_dir.parent / src
-        if src_path.exists():
-            shutil.copy2(src_path, builds_dir / name)
+    with profile.phase("artifacts", target):
+        builds_dir = script_dir.parent / "builds" / target
+        builds_dir.mkdir(parents=True, exist_ok=True)
+
+        artifacts = [
+            ("mesh-now.bin", "build/mesh-now.bin"),
+            ("bootloader.bin", "build/bootloader/bootloader.bin"),
+            ("partition-table.bin", "build/partition_table/partition-table.bin")
+        ]
+
+        for name, src in artifacts:
+            src_path = script_dir.parent / src
+            if src_path.exists():
+                shutil.copy2(src_path, builds_dir / name)
+
+        # flash.py reads flash mode/frequency/size from the config it was built with
+        if config_file.exists():
+            shutil.copy2(config_file, builds_dir / config_file.name)
+
+        # One merged image plus manifest so flashers can do a single write
+        if all((builds_dir / name).exists() for name, _ in artifacts):
+            regions = idf_regions(script_dir.parent / "build") or default_regions(target)
+            write_manifest(builds_dir, target, regions, git_sha(script_dir.parent))
 
     # Get binary size
     bin_file = builds_dir / "mesh-now.bin"
@@ -174,11 +216,14 @@ def main():
     parser = argparse.ArgumentParser(description="Mesh-NOW Multi-Target Build Script")
     parser.add_argument('--ci', action='store_true', help='Disable colors and TUI for CI')
     parser.add_argument('--targets', nargs='*', help='Build specific targets (default: all)')
+    parser.add_argument('--profile-dir', help='Where to write build-profile.json and build-trace.json (default: builds/profile)')
     parser.add_argument('--with-frontend', action='store_true', help='Build and embed frontend before ESP32 builds')
+    parser.add_argument('--skip-config-check', action='store_true', help='Build without validating the sdkconfigs first')
     args = parser.parse_args()
 
     # Setup console
     if RICH_AVAILABLE and not args.ci:
+        from rich.console import Console
         console = Console()
     else:
         class PlainConsole:
@@ -196,30 +241,47 @@ def main():
 
     script_dir = Path(__file__).parent
     os.chdir(script_dir.parent)  # Change to project root
+    profile = BuildProfile(script_dir.parent)
+    targets = args.targets if args.targets else get_targets()
+
+    # Validate every config before spending minutes on builds
+    if not args.skip_config_check:
+        with profile.phase("validate") as phase:
+            _, findings, elapsed = validate(script_dir.parent, targets)
+            phase["ok"] = not errors(findings)
+        report(console, findings)
+        if not phase["ok"]:
+            console.print(f"[red]Configuration check failed ({len(errors(findings))} error(s)); "
+                          f"fix them or pass --skip-config-check[/red]")
+            sys.exit(1)
+        console.print(f"Configuration check passed in {elapsed:.1f} ms")
+        console.print()
 
     # Handle frontend building if requested
     if args.with_frontend:
         if console and not args.ci:
-            console.print(Panel.fit("[bold green]Frontend Integration Enabled[/bold green]"))
+            print_title(console, "[bold green]Frontend Integration Enabled[/bold green]")
             console.print()
 
-        if not build_frontend(console, script_dir.parent, args.ci):
+        with profile.phase("frontend") as phase:
+            phase["ok"] = build_frontend(console, script_dir.parent, args.ci)
+        if not phase["ok"]:
             sys.exit(1)
-        if not embed_frontend(console, script_dir.parent, args.ci):
+        with profile.phase("embed") as phase:
+            phase["ok"] = embed_frontend(console, script_dir.parent, args.ci)
+        if not phase["ok"]:
             sys.exit(1)
 
         if console and not args.ci:
             console.print()
 
-    targets = args.targets if args.targets else get_targets()
-
     # Update panel title if frontend is enabled
     panel_title = "[bold blue]Mesh-NOW Multi-Target Build Script"
     if args.with_frontend:
         panel_title += " + Frontend"
     panel_title += "[/bold blue]"
 
-    console.print(Panel.fit(panel_title))
+    print_title(console, panel_title)
     console.print(f"Targets: {', '.join(targets)}")
     console.print()
 
@@ -227,6 +289,7 @@ def main():
     successful_builds = []
 
     if RICH_AVAILABLE and not args.ci:
+        from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn
         with Progress(
             SpinnerColumn(),
             TextColumn("[progress.description]{task.description}"),
@@ -234,14 +297,14 @@ def main():
             console=console
         ) as progress:
             for target in targets:
-                if build_target(target, console, script_dir, progress):
+                if build_target(target, console, script_dir, progress, profile):
                     successful_builds.append(target)
                 else:
                     failed_builds.append(target)
     else:
         for target in targets:
             console.print(f"Building for {target}...")
-            if build_target(target, console, script_dir):
+            if build_target(target, console, script_dir, profile=profile):
                 successful_builds.append(target)
             else:
                 failed_builds.append(target)
@@ -253,8 +316,9 @@ def main():
     console.print("Build Summary:")
     console.print("=" * 40)
 
-    table = Table() if RICH_AVAILABLE and not args.ci else None
-    if table:
+    if RICH_AVAILABLE and not args.ci:
+        from rich.table import Table
+        table = Table()
         table.add_column("Status", style="bold")
         table.add_column("Targets")
         table.add_row("Successful", f"{len(successful_builds)}: {', '.join(successful_builds)}")
@@ -280,6 +344,8 @@ def main():
     for target in successful_builds:
         console.print(f"   {target}: idf.py set-target {target} && idf.py flash")
 
+    profile.finish(console, args.profile_dir)
+
     if not failed_builds:
         console.print()
         console.print("[green]All builds completed successfully![/green]")
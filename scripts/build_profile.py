@@ -0,0 +1,228 @@
+"""
+Mesh-NOW Build Profile
+Phase timing for build.py/build_all.py
+
+Times each phase of a build (frontend, embed, set-target, configure,
+compile, link, artifact copy) and reads ninja's .ninja_log to split the
+build step into compile and link and to rank the slowest translation units.
+Results go to builds/profile/ as build-profile.json and as a Chrome trace
+(build-trace.json, open in chrome://tracing or https://ui.perfetto.dev).
+"""
+
+import re
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+PROJECT_NAME = "mesh-now"
+DEFAULT_OUTPUT = Path(__file__).resolve().parent.parent / "builds" / "profile"
+SLOWEST_UNITS = 10
+# Headers generated by embed_frontend.py; units including them carry the
+# frontend as a C array
+EMBEDDED_HEADERS = ("index_html.h", "bundle_js.h", "styles_css.h")
+UNIT_PATTERN = re.compile(r"__idf_(\w+)\.dir/(.+)\.obj$")
+
+
+def read_ninja_log(build_dir):
+    """(start_ms, end_ms, output) of the last ninja run in build_dir"""
+    path = Path(build_dir) / ".ninja_log"
+    try:
+        lines = path.read_text().splitlines()
+    except OSError:
+        return []
+    entries, last_end = {}, 0
+    for line in lines:
+        if line.startswith("#"):
+            continue
+        fields = line.split("\t")
+        if len(fields) < 4:
+            continue
+        start, end, output = int(fields[0]), int(fields[1]), fields[3]
+        if end < last_end:
+            entries = {}           # An earlier run; keep only the newest
+        last_end = end
+        entries[output] = (start, end, output)
+    return sorted(entries.values())
+
+
+def unit_name(output):
+    """'main: src/web_server.c' for an object file, else the output path"""
+    match = UNIT_PATTERN.search(output)
+    return f"{match.group(1)}: {match.group(2)}" if match else output
+
+
+def embedding_units(project_dir):
+    """Source paths (relative to their component) that include the frontend headers"""
+    units = set()
+    for source in Path(project_dir, "main").rglob("*.c"):
+        text = source.read_text(errors="replace")
+        if any(f'"{header}"' in text for header in EMBEDDED_HEADERS):
+            units.add(f"main: {source.relative_to(Path(project_dir, 'main')).as_posix()}")
+    return units
+
+
+def ninja_breakdown(entries, embedded=()):
+    """Compile/link split, per-component compile time and slowest units"""
+    if not entries:
+        return None
+    origin = entries[0][0]
+    wall = max(end for _, end, _ in entries) - origin
+    units = [(end - start, output) for start, end, output in entries if output.endswith((".obj", ".o"))]
+    app_links = [(start, end) for start, end, output in entries if output.endswith(f"{PROJECT_NAME}.elf")]
+
+    components = {}
+    for ms, output in units:
+        component = unit_name(output).split(":")[0] if UNIT_PATTERN.search(output) else "other"
+        components[component] = components.get(component, 0) + ms
+
+    compile_ms = sum(ms for ms, _ in units)
+    embedded_ms = sum(ms for ms, output in units if unit_name(output) in embedded)
+    link_start, link_end = app_links[-1] if app_links else (origin + wall, origin + wall)
+    return {
+        "wall_ms": wall,
+        "edges": len(entries),
+        "compile_wall_ms": link_start - origin,
+        "link_ms": link_end - link_start,
+        "post_link_ms": origin + wall - link_end,
+        "compile_cpu_ms": compile_ms,
+        "embedded_frontend_ms": embedded_ms,
+        "components": dict(sorted(components.items(), key=lambda item: -item[1])),
+        "slowest": [{"unit": unit_name(output), "ms": ms, "embeds_frontend": unit_name(output) in embedded}
+                    for ms, output in sorted(units, reverse=True)[:SLOWEST_UNITS]],
+    }
+
+
+class BuildProfile:
+    """Phases of one build_all/build run, relative to when it started"""
+
+    def __init__(self, project_dir):
+        self.project_dir = Path(project_dir)
+        self.started = time.time()
+        self.origin = time.monotonic()
+        self.phases = []
+        self.ninja = {}
+
+    @contextmanager
+    def phase(self, name, target=None):
+        """Time a block; set record["ok"] = False in it to mark a failure"""
+        record = {"target": target, "name": name, "start": time.monotonic() - self.origin,
+                  "duration": 0.0, "ok": True}
+        self.phases.append(record)
+        try:
+            yield record
+        except BaseException:
+            record["ok"] = False
+            raise
+        finally:
+            record["duration"] = time.monotonic() - self.origin - record["start"]
+
+    def add_ninja_log(self, target, build_dir, build_phase):
+        """Split a finished build phase into compile/link/post-link from ninja's log"""
+        entries = read_ninja_log(build_dir)
+        breakdown = ninja_breakdown(entries, embedding_units(self.project_dir))
+        if breakdown is None:
+            return
+        self.ninja[target] = {"breakdown": breakdown, "entries": entries, "phase": build_phase}
+
+        # Whatever ran before ninja (cmake checks, idf.py startup) counts as compile
+        start, total = build_phase["start"], build_phase["duration"]
+        link = breakdown["link_ms"] / 1000.0
+        post = breakdown["post_link_ms"] / 1000.0
+        compile_time = max(0.0, total - link - post)
+        index = self.phases.index(build_phase)
+        self.phases[index:index + 1] = [
+            {"target": target, "name": "compile", "start": start, "duration": compile_time, "ok": True},
+            {"target": target, "name": "link", "start": start + compile_time, "duration": link, "ok": True},
+            {"target": target, "name": "post-link", "start": start + compile_time + link, "duration": post,
+             "ok": build_phase["ok"]},
+        ]
+
+    def summary(self):
+        targets = {}
+        for record in self.phases:
+            phases = targets.setdefault(record["target"] or "all", {})
+            phases[record["name"]] = round(phases.get(record["name"], 0.0) + record["duration"], 3)
+        return {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "total_seconds": round(time.monotonic() - self.origin, 3),
+            "phases": [dict(record, start=round(record["start"], 3), duration=round(record["duration"], 3))
+                       for record in self.phases],
+            "targets": targets,
+            "ninja": {target: data["breakdown"] for target, data in self.ninja.items()},
+        }
+
+    def chrome_trace(self):
+        """Trace Event Format: one row per target for phases, ninja edges packed into lanes"""
+        events = [{"ph": "M", "name": "process_name", "pid": 1, "args": {"name": "phases"}}]
+        lanes_by_target = {}
+        for record in self.phases:
+            target = record["target"] or "all"
+            tid = lanes_by_target.setdefault(target, len(lanes_by_target) + 1)
+            events.append({"name": record["name"], "cat": "phase", "ph": "X", "pid": 1, "tid": tid,
+                           "ts": int(record["start"] * 1e6), "dur": int(record["duration"] * 1e6),
+                           "args": {"target": target, "ok": record["ok"]}})
+        for target, tid in lanes_by_target.items():
+            events.append({"ph": "M", "name": "thread_name", "pid": 1, "tid": tid, "args": {"name": target}})
+
+        for pid, (target, data) in enumerate(self.ninja.items(), start=2):
+            events.append({"ph": "M", "name": "process_name", "pid": pid, "args": {"name": f"ninja {target}"}})
+            # ninja runs at the end of the build phase, after idf.py/cmake startup
+            phase = data["phase"]
+            base = (phase["start"] + phase["duration"]) * 1e6 - data["breakdown"]["wall_ms"] * 1000
+            origin = data["entries"][0][0]
+            lanes = []             # End time of the last edge in each lane
+            for start, end, output in data["entries"]:
+                lane = next((i for i, busy_until in enumerate(lanes) if busy_until <= start), len(lanes))
+                if lane == len(lanes):
+                    lanes.append(end)
+                else:
+                    lanes[lane] = end
+                events.append({"name": unit_name(output), "cat": "ninja", "ph": "X", "pid": pid, "tid": lane,
+                               "ts": int(base + (start - origin) * 1000), "dur": (end - start) * 1000})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, output_dir):
+        """Write build-profile.json and build-trace.json; returns their paths"""
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        profile_path = output_dir / "build-profile.json"
+        trace_path = output_dir / "build-trace.json"
+        profile_path.write_text(json.dumps(self.summary(), indent=2) + "\n")
+        trace_path.write_text(json.dumps(self.chrome_trace()))
+        return profile_path, trace_path
+
+    def report(self, console):
+        """Phase table and slowest units, through the build scripts' console"""
+        summary = self.summary()
+        names = []
+        for phases in summary["targets"].values():
+            names += [name for name in phases if name not in names]
+
+        console.print("Build profile (seconds):")
+        console.print("  " + f"{'target':<10}" + "".join(f"{name:>12}" for name in names) + f"{'total':>10}")
+        for target, phases in summary["targets"].items():
+            cells = "".join(f"{phases[name]:>12.1f}" if name in phases else f"{'-':>12}" for name in names)
+            console.print(f"  {target:<10}{cells}{sum(phases.values()):>10.1f}")
+
+        for target, breakdown in summary["ninja"].items():
+            share = (breakdown["embedded_frontend_ms"] * 100.0 / breakdown["compile_cpu_ms"]
+                     if breakdown["compile_cpu_ms"] else 0.0)
+            console.print()
+            console.print(f"{target}: {breakdown['edges']} ninja edges, "
+                          f"{breakdown['compile_cpu_ms'] / 1000:.1f}s compile CPU, "
+                          f"{share:.0f}% in units embedding the frontend")
+            for unit in breakdown["slowest"][:5]:
+                marker = "  (embeds frontend)" if unit["embeds_frontend"] else ""
+                console.print(f"  {unit['ms'] / 1000:>7.2f}s  {unit['unit']}{marker}")
+
+    def finish(self, console, output_dir=None):
+        """Report and write the profile at the end of a build script"""
+        if not self.phases:
+            return
+        profile_path, trace_path = self.write(output_dir or DEFAULT_OUTPUT)
+        console.print()
+        self.report(console)
+        console.print()
+        console.print(f"Profile: {profile_path}")
+        console.print(f"Chrome trace: {trace_path}")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Mesh-NOW Startup Check
+Import-time budget for the meshnow CLI
+
+Runs `meshnow <command> --help` under `python -X importtime` for every
+subcommand (best of a few runs) and fails when a command imports more than
+its budget allows, or loads a module the scripts only import on use: rich,
+asyncio, sqlite3 and the like must stay out of a plain --ci/--help start.
+Modules the bare interpreter loads anyway are not counted.
+
+    python scripts/check_startup.py                  # all commands, default budget
+    python scripts/check_startup.py flash fleet-flash --budget 40
+"""
+
+import sys
+import argparse
+import subprocess
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+MESHNOW = SCRIPT_DIR / "meshnow"
+DEFAULT_BUDGET_MS = 60.0
+RUNS = 5
+# Imported where they are used; loading any of these at startup is a regression
+DEFERRED_MODULES = ("rich", "asyncio", "sqlite3", "logging", "concurrent.futures", "esptool", "serial")
+
+
+def import_times(args):
+    """{module: cumulative microseconds} for top-level imports of a python run"""
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], capture_output=True, text=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if cumulative.strip().isdigit():
+            # Nesting shows as two more spaces of indent per level
+            times[name.strip()] = (int(cumulative), not name.startswith("  "))
+    return times
+
+
+def startup_cost(args, baseline):
+    """(ms of top-level imports beyond the bare interpreter, every module imported)"""
+    times = import_times(args)
+    cost = sum(us for name, (us, top) in times.items() if top and name not in baseline)
+    return cost / 1000.0, set(times)
+
+
+def deferred_loaded(modules):
+    return sorted(name for name in modules
+                  if any(name == deferred or name.startswith(deferred + ".") for deferred in DEFERRED_MODULES))
+
+
+def main():
+    sys.path.insert(0, str(SCRIPT_DIR))
+    from meshnow import COMMANDS
+
+    parser = argparse.ArgumentParser(description="Check the meshnow CLI's import-time budget")
+    parser.add_argument("commands", nargs="*", help=f"Subcommands to check (default: all of {', '.join(COMMANDS)})")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_MS,
+                        help=f"Milliseconds of imports allowed per command (default: {DEFAULT_BUDGET_MS:.0f})")
+    parser.add_argument("--runs", type=int, default=RUNS, help=f"Runs per command, best one counts (default: {RUNS})")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.commands if name not in COMMANDS]
+    if unknown:
+        parser.error(f"unknown command(s): {', '.join(unknown)}")
+
+    baseline = set(import_times(["-c", "pass"]))
+    failures = 0
+    print(f"{'command':<16} {'imports':>10} {'budget':>8}  result")
+    for name in args.commands or COMMANDS:
+        runs = [startup_cost([str(MESHNOW), name, "--help"], baseline) for _ in range(max(1, args.runs))]
+        cost = min(ms for ms, _ in runs)
+        deferred = deferred_loaded(set.union(*(modules for _, modules in runs)))
+        problems = []
+        if cost > args.budget:
+            problems.append("over budget")
+        if deferred:
+            problems.append(f"loads {', '.join(deferred)}")
+        failures += bool(problems)
+        print(f"{name:<16} {cost:>8.1f}ms {args.budget:>6.0f}ms  {'; '.join(problems) or 'ok'}")
+
+    if failures:
+        print(f"{failures} command(s) failed the startup check")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
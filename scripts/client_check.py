@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Mesh-NOW Client Check
+Exercise meshnow.client against a stand-in node
+
+Checks the client's contract: concurrent requests stay within the connection
+pool, batches arrive complete and in order, the message iterator yields every
+message once and follows new ones, 503s and refused connections are retried
+with backoff without posting a message twice, a group stream holds only
+its group's messages, and presence and typing reach a linked node. It also times a batch sent
+pipelined against the same messages sent one request at a time.
+
+With --url the checks that need the stand-in's fault injection are skipped
+and messages are posted to that node.
+"""
+
+import sys
+import time
+import socket
+import asyncio
+import argparse
+
+from meshnow.client import MeshNowClient, MeshNowError
+from standin_node import StandinNode, StandinServer, link
+
+
+class CheckFailed(Exception):
+    pass
+
+
+def expect(condition, reason):
+    if not condition:
+        raise CheckFailed(reason)
+
+
+async def collect(client, since):
+    return [message async for message in client.iter_messages(since=since)]
+
+
+async def check_pool(client, server, tag):
+    opened = client.connections_opened
+    await asyncio.gather(*(client.peers() for _ in range(200)))
+    expect(client.connections_opened - opened <= len(client.connections),
+           f"{client.connections_opened - opened} connections opened for a pool of {len(client.connections)}")
+
+
+async def check_batch_order(client, server, tag):
+    start = await head(client)
+    messages = [f"{tag}-batch-{i:03d}" for i in range(100)]
+    await client.send_batch(messages)
+    got = [m.content for m in await collect(client, start) if m.content.startswith(f"{tag}-batch-")]
+    expect(got == messages, f"{len(got)} of {len(messages)} batch messages back, "
+                            f"in order: {got == messages[:len(got)]}")
+
+
+async def check_iterator_follow(client, server, tag):
+    start = await head(client)
+    iterator = client.iter_messages(since=start, follow=True, poll_interval=0.05)
+    follower = asyncio.ensure_future(take(iterator, 5))
+    await asyncio.sleep(0.2)
+    for i in range(5):
+        await client.send(f"{tag}-follow-{i}")
+    got = await asyncio.wait_for(follower, 5)
+    expect([m.content for m in got] == [f"{tag}-follow-{i}" for i in range(5)],
+           f"follower saw {[m.content for m in got]}")
+    expect([m.seq for m in got] == sorted(set(m.seq for m in got)), "sequence numbers repeat or go backwards")
+
+
+async def check_busy_retry(client, server, tag):
+    start = await head(client)
+    retried = client.retried
+    server.node.reject_next(3, retry_after=0)
+    await client.send(f"{tag}-busy")
+    got = [m.content for m in await collect(client, start)]
+    expect(got == [f"{tag}-busy"], f"after three 503s the node holds {got}")
+    expect(client.retried - retried == 3, f"{client.retried - retried} retries for three 503s")
+
+
+async def check_busy_pipeline(client, server, tag):
+    start = await head(client)
+    server.node.reject_next(2, retry_after=0)
+    messages = [f"{tag}-pipe-{i:02d}" for i in range(40)]
+    await client.send_batch(messages)
+    got = [m.content for m in await collect(client, start)]
+    expect(sorted(got) == messages, f"{len(got)} messages back for 40 sent, {len(got) - len(set(got))} repeated")
+
+
+async def check_group_stream(client, server, tag):
+    start = await head(client)
+    await client.join_group(7)
+    # More broadcasts than one group page looks through, so the stream needs several
+    await client.send_batch([f"{tag}-all-{i:03d}" for i in range(150)])
+    await client.send(f"{tag}-group-0", group=7)
+    await client.send(f"{tag}-other", group=8)
+    await client.send(f"{tag}-group-1", group=7)
+    got = [m async for m in client.iter_messages(since=start, group=7)]
+    expect([(m.content, m.group) for m in got] == [(f"{tag}-group-{i}", 7) for i in range(2)],
+           f"group 7 stream holds {[m.content for m in got]}")
+    groups = (await client.leave_group(7))["groups"]
+    expect(7 not in groups, f"still in group 7 after leaving: {groups}")
+    await client.send(f"{tag}-after-leave", group=7)
+    got = [m.content for m in await collect(client, start) if m.content.endswith("after-leave")]
+    expect(not got, "kept a message for a group it left")
+
+
+async def check_presence(client, server, tag):
+    peer = StandinNode(mac="24:6f:28:00:00:99")
+    link(server.node, peer)
+    try:
+        await client.set_presence("away")
+        for _ in range(20):
+            await client.typing(peer.mac)
+        nodes = peer.presence_status()["nodes"]
+        expect(nodes == [{"mac": server.node.mac, "status": "away", "typing": True}], f"peer sees {nodes}")
+
+        peer.set_presence("on call")
+        nodes = await client.presence()
+        expect([(n["mac"], n["status"], n["typing"]) for n in nodes] == [(peer.mac, "on call", False)],
+               f"node sees {nodes}")
+        await client.set_presence("")
+        expect(peer.presence_status()["nodes"][0]["status"] == "", "status not cleared")
+    finally:
+        link(server.node)
+
+
+async def check_refused(client, server, tag):
+    # A port nothing listens on: every attempt is refused
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    async with MeshNowClient(f"http://127.0.0.1:{port}", retries=3, backoff=0.01) as dead:
+        started = time.monotonic()
+        try:
+            await dead.send("never")
+        except MeshNowError:
+            pass
+        else:
+            raise CheckFailed("send to a closed port succeeded")
+        expect(dead.retried == 3, f"{dead.retried} retries, expected 3")
+        expect(time.monotonic() - started < 2, "backoff took too long")
+
+
+async def head(client):
+    """Sequence number of the newest message"""
+    page = await client.messages(since=0, limit=1)
+    since = page["next"]
+    while page["more"]:
+        page = await client.messages(since=since)
+        since = page["next"]
+    return since
+
+
+async def take(iterator, count):
+    got = []
+    async for message in iterator:
+        got.append(message)
+        if len(got) == count:
+            break
+    return got
+
+
+async def time_pipelining(base_url, count):
+    """Seconds for count messages: one request each, then batched and pipelined"""
+    async with MeshNowClient(base_url, pool_size=1) as client:
+        start = time.perf_counter()
+        for i in range(count):
+            await client.send(f"timing-single-{i}")
+        single = time.perf_counter() - start
+        start = time.perf_counter()
+        await client.send_batch([f"timing-batch-{i}" for i in range(count)])
+        batched = time.perf_counter() - start
+    return single, batched
+
+
+CHECKS = (
+    ("pool", check_pool, False),
+    ("batch_order", check_batch_order, False),
+    ("iterator_follow", check_iterator_follow, False),
+    ("busy_retry", check_busy_retry, True),
+    ("busy_pipeline", check_busy_pipeline, True),
+    ("group_stream", check_group_stream, True),
+    ("presence", check_presence, True),
+    ("refused", check_refused, False),
+)
+
+
+async def run_checks(base_url, server, args):
+    failed = 0
+    tag = f"check-{int(time.time() * 1000)}"
+    async with MeshNowClient(base_url, pool_size=args.pool, backoff=0.01) as client:
+        for name, check, needs_standin in CHECKS:
+            if needs_standin and server is None:
+                print(f"skip {name}: needs the stand-in")
+                continue
+            try:
+                await check(client, server, tag)
+                print(f"ok {name}")
+            except (CheckFailed, MeshNowError, asyncio.TimeoutError) as e:
+                failed += 1
+                print(f"FAIL {name}: {e or type(e).__name__}")
+    single, batched = await time_pipelining(base_url, args.messages)
+    print(f"{args.messages} messages: {single * 1000:.0f} ms one request each, "
+          f"{batched * 1000:.0f} ms batched and pipelined ({single / max(batched, 1e-9):.1f}x)")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check meshnow.client against a stand-in node")
+    parser.add_argument("--url", help="Node to check against (default: start a local stand-in)")
+    parser.add_argument("--pool", type=int, default=2, help="Client connection pool size")
+    parser.add_argument("--messages", type=int, default=256, help="Messages for the pipelining timing")
+    parser.add_argument("--ci", action="store_true", help="CI mode - plain output")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        server = StandinServer(StandinNode(loopback=True))
+        base_url = server.start()
+        print(f"Started stand-in node at {base_url}")
+    try:
+        failed = asyncio.run(run_checks(base_url, server, args))
+    finally:
+        if server:
+            server.stop()
+    print("Client check FAILED" if failed else "Client check passed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Mesh-NOW Command Runner
+Streaming subprocess runner shared by the build and flash scripts
+
+Runs commands on asyncio and hands every output line (stdout and stderr
+merged, split on \\r as well as \\n so esptool and ninja progress comes
+through) to a callback as it arrives and to a rotating log file. Only the
+last lines stay in memory, however long the command runs. Commands can time
+out, be cancelled from another thread and run concurrently:
+
+    result = run("idf.py build", on_line=print, log=command_log("build"))
+    results = run_all([["esptool.py", "--port", p, "chip_id"] for p in ports], limit=4)
+
+Ships next to flash.py, flash_mesh_now.py and install_esptool.py in
+releases, so it must stay standard library only (rich is optional).
+"""
+
+import os
+import re
+import time
+import signal
+from collections import deque
+from pathlib import Path
+
+# asyncio, logging and rich are imported on first use: every script imports
+# this module, and most invocations never run a command
+
+TAIL_LINES = 200
+MAX_LINE = 64 * 1024
+READ_SIZE = 4096
+TERMINATE_GRACE = 3.0
+CANCEL_POLL = 0.1
+LOG_DIR = Path(os.environ.get("MESH_NOW_LOG_DIR")
+               or Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "mesh-now" / "logs")
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+
+
+class CommandResult:
+    """Outcome of one command; lines holds only the tail of its output"""
+
+    def __init__(self, cmd, tail=TAIL_LINES):
+        self.cmd = cmd
+        self.returncode = None
+        self.lines = deque(maxlen=tail)
+        self.error = None
+        self.timed_out = False
+        self.cancelled = False
+        self.duration = 0.0
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not (self.timed_out or self.cancelled)
+
+    @property
+    def output(self):
+        return "\n".join(self.lines)
+
+    def tail(self, count):
+        return list(self.lines)[-count:]
+
+    def reason(self):
+        """One line on why the command failed"""
+        if self.error:
+            return self.error
+        if self.timed_out:
+            return f"timed out after {self.duration:.0f}s"
+        if self.cancelled:
+            return "cancelled"
+        return self.lines[-1] if self.lines else f"exit code {self.returncode}"
+
+
+def command_text(cmd):
+    return cmd if isinstance(cmd, str) else " ".join(str(part) for part in cmd)
+
+
+def command_log(name):
+    """Rotating log file LOG_DIR/<name>.log (None if it can't be created)"""
+    import logging
+    import logging.handlers
+
+    logger = logging.getLogger(f"mesh_now.commands.{name}")
+    if not logger.handlers:
+        try:
+            LOG_DIR.mkdir(parents=True, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                LOG_DIR / f"{name}.log", maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")
+        except OSError:
+            return None
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+def log_path(name):
+    return LOG_DIR / f"{name}.log"
+
+
+def echo_to(console=None, prefix=""):
+    """on_line callback printing raw lines through a rich console, or stdout"""
+    def echo(line):
+        if type(console).__module__ == "rich.console":
+            from rich.text import Text
+            console.print(Text(prefix + line, style="dim"))
+        else:
+            print(prefix + line, flush=True)
+    return echo
+
+
+async def _stop(process):
+    """Terminate the process (and its children), killing it if it lingers"""
+    import asyncio
+
+    if process.returncode is not None:
+        return
+    try:
+        if os.name != "nt":
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            process.terminate()
+        await asyncio.wait_for(process.wait(), TERMINATE_GRACE)
+    except asyncio.TimeoutError:
+        if os.name != "nt":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+        await process.wait()
+    except ProcessLookupError:
+        pass
+
+
+async def run_async(cmd, cwd=None, env=None, timeout=None, on_line=None, log=None, cancel_event=None,
+                    tail=TAIL_LINES):
+    """Run cmd (a shell string or an argument list), streaming its output.
+
+    on_line is called with each line as it arrives. cancel_event is any
+    object with is_set() (e.g. threading.Event), checked between reads.
+    """
+    import asyncio
+
+    result = CommandResult(cmd, tail)
+    start = time.monotonic()
+    if log:
+        log.info("$ %s", command_text(cmd))
+
+    kwargs = {"stdout": asyncio.subprocess.PIPE, "stderr": asyncio.subprocess.STDOUT, "cwd": cwd, "env": env}
+    if os.name != "nt":
+        # Own process group, so stopping a shell command also stops what it started
+        kwargs["start_new_session"] = True
+    try:
+        if isinstance(cmd, str):
+            process = await asyncio.create_subprocess_shell(cmd, **kwargs)
+        else:
+            process = await asyncio.create_subprocess_exec(*[str(part) for part in cmd], **kwargs)
+    except OSError as e:
+        result.error = str(e)
+        if log:
+            log.info("failed to start: %s", e)
+        return result
+
+    def emit(raw):
+        line = raw.decode("utf-8", "replace")
+        result.lines.append(line)
+        if log:
+            log.info("%s", line)
+        if on_line:
+            on_line(line)
+
+    async def pump():
+        buffer = b""
+        while True:
+            chunk = await process.stdout.read(READ_SIZE)
+            if not chunk:
+                break
+            buffer += chunk
+            parts = re.split(rb"[\r\n]", buffer)
+            buffer = parts.pop()
+            if len(buffer) > MAX_LINE:
+                parts.append(buffer)
+                buffer = b""
+            for part in parts:
+                if part:
+                    emit(part)
+        if buffer:
+            emit(buffer)
+        await process.wait()
+
+    reader = asyncio.ensure_future(pump())
+    deadline = start + timeout if timeout else None
+    try:
+        while not reader.done():
+            wait = CANCEL_POLL if cancel_event is not None else None
+            if deadline is not None:
+                remaining = max(0.0, deadline - time.monotonic())
+                wait = remaining if wait is None else min(wait, remaining)
+            await asyncio.wait({reader}, timeout=wait)
+            if reader.done():
+                break
+            if cancel_event is not None and cancel_event.is_set():
+                result.cancelled = True
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                result.timed_out = True
+                break
+        if not reader.done():
+            await _stop(process)
+        await reader
+    except asyncio.CancelledError:
+        result.cancelled = True
+        reader.cancel()
+        await _stop(process)
+        raise
+    finally:
+        if process.returncode is None:
+            await _stop(process)
+        result.returncode = process.returncode
+        result.duration = time.monotonic() - start
+        if log:
+            state = "timed out" if result.timed_out else "cancelled" if result.cancelled else "exit"
+            log.info("%s %s after %.1fs", state, result.returncode, result.duration)
+    return result
+
+
+async def run_many_async(commands, limit=4, on_line=None, **kwargs):
+    """Run commands with at most limit at once; on_line gets (index, line)"""
+    import asyncio
+
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def one(index, cmd):
+        async with semaphore:
+            callback = (lambda line: on_line(index, line)) if on_line else None
+            return await run_async(cmd, on_line=callback, **kwargs)
+
+    return await asyncio.gather(*(one(index, cmd) for index, cmd in enumerate(commands)))
+
+
+def run(cmd, **kwargs):
+    """Blocking run_async for synchronous scripts (and worker threads)"""
+    import asyncio
+
+    return asyncio.run(run_async(cmd, **kwargs))
+
+
+def run_all(commands, limit=4, on_line=None, **kwargs):
+    """Blocking run_many_async; results in the order of commands"""
+    import asyncio
+
+    return asyncio.run(run_many_async(commands, limit, on_line, **kwargs))
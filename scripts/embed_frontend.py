@@ -8,19 +8,16 @@ Python version - Platform agnostic with TUI
 import os
 import sys
 import argparse
+import importlib.util
 from pathlib import Path
 
-try:
-    from rich.console import Console
-    from rich.panel import Panel
-    from rich.text import Text
-    RICH_AVAILABLE = True
-except ImportError:
-    RICH_AVAILABLE = False
+# rich is imported where output is drawn, so --ci runs never load it
+RICH_AVAILABLE = importlib.util.find_spec("rich") is not None
 
 def setup_console():
     """Setup console for output"""
     if RICH_AVAILABLE:
+        from rich.console import Console
         return Console()
     else:
         return None
@@ -74,6 +71,8 @@ def main():
 
     if console and not args.ci:
         # Show header
+        from rich.panel import Panel
+        from rich.text import Text
         title = Text("Mesh-NOW Frontend Embedder", style="bold blue")
         panel = Panel(title, border_style="blue")
         console.print(panel)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Mesh-NOW esptool Progress Check
+Replay recorded esptool transcripts through flash.py's progress parser
+
+The transcripts in scripts/transcripts/ are write_flash runs as esptool v4
+and v5 print them: v4 one line per block, v5 a progress bar redrawn with
+\\r, and one v5 run whose connection drops partway through the app. Each is
+fed through flash.py's replay path and the check asserts where every image
+ended up, the KB/s worked out from esptool's own timings, and whether the
+run was caught as failed. flash.py --replay and the fleet flasher read real
+runs the same way, so a new esptool output format shows up here first.
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+from flash import FlashRegion, replay_transcript
+
+TRANSCRIPTS = Path(__file__).resolve().parent / "transcripts"
+
+ESP32_IMAGES = [(0x1000, "bootloader.bin", 26384), (0x8000, "partition-table.bin", 3072),
+                (0x10000, "mesh-now.bin", 875712)]
+ESP32S3_IMAGES = [(0x0, "bootloader.bin", 15104), (0x8000, "partition-table.bin", 3072),
+                  (0x10000, "mesh-now.bin", 912384)]
+
+# transcript, images, {image: (final percent, KB/s or None)}, fatal error or None
+CASES = (
+    ("esptool-v4-esp32.txt", ESP32_IMAGES,
+     {"bootloader.bin": (100.0, 32.2), "partition-table.bin": (100.0, 30.0), "mesh-now.bin": (100.0, 64.8)},
+     None),
+    ("esptool-v5-esp32s3.txt", ESP32S3_IMAGES,
+     {"bootloader.bin": (100.0, 49.2), "partition-table.bin": (100.0, 30.0), "mesh-now.bin": (100.0, 129.1)},
+     None),
+    ("esptool-v5-esp32s3-write-failed.txt", ESP32S3_IMAGES,
+     {"bootloader.bin": (100.0, 49.2), "partition-table.bin": (100.0, 30.0), "mesh-now.bin": (37.6, None)},
+     "Packet content transfer stopped (received 8 bytes)"),
+)
+
+
+def check_case(name, images, expected, error):
+    """Problems found replaying one transcript; empty when it parses as expected"""
+    problems = []
+    trail = {}
+
+    def on_region(region):
+        trail.setdefault(region.name, []).append(region.percent)
+
+    tracker = replay_transcript(TRANSCRIPTS / name, [FlashRegion(o, n, size) for o, n, size in images], on_region)
+    for region in tracker.regions:
+        percent, kbps = expected[region.name]
+        seen = trail.get(region.name, [])
+        if len(seen) < 2:
+            problems.append(f"{region.name}: {len(seen)} progress update(s)")
+        if seen != sorted(seen):
+            problems.append(f"{region.name}: progress went backwards")
+        if abs(region.percent - percent) > 0.05:
+            problems.append(f"{region.name}: ended at {region.percent:.1f}%, expected {percent:.1f}%")
+        speed = region.kb_per_second
+        if kbps is None and speed is not None:
+            problems.append(f"{region.name}: {speed:.1f} KB/s for an unfinished write")
+        elif kbps is not None and (speed is None or abs(speed - kbps) > 0.05):
+            problems.append(f"{region.name}: {speed or 0:.1f} KB/s, expected {kbps:.1f}")
+    if tracker.error != error:
+        problems.append(f"fatal error {tracker.error!r}, expected {error!r}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded esptool transcripts through flash.py's parser")
+    parser.add_argument("--ci", action="store_true", help="CI mode - plain output")
+    parser.parse_args()
+
+    failed = 0
+    for name, images, expected, error in CASES:
+        problems = check_case(name, images, expected, error)
+        if problems:
+            failed += 1
+            print(f"FAIL {name}: {'; '.join(problems)}")
+        else:
+            print(f"ok {name}")
+    print("esptool progress check FAILED" if failed else "esptool progress check passed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Fake esptool
+Stand-in for esptool.py that needs no hardware
+
+Prints transcripts shaped like esptool v4 output for chip_id, flash_id and
+write_flash, taking time proportional to the image sizes, so the flashing
+tools can be exercised without boards:
+
+    flash_mesh_now.py --fleet /dev/fake0 /dev/fake1 --esptool "python3 scripts/fake_esptool.py"
+
+Behavior per port comes from the JSON file named by FAKE_ESPTOOL_CONFIG:
+
+    {"default": {"chip": "ESP32-S3", "kbps": 900},
+     "ports": {"/dev/fake3": {"chip": "ESP32-C3", "fail": "write"}}}
+
+Port keys: chip, kbps (flash write ceiling in kbit/s), max_baud (highest
+baud rate the adapter survives), fail ("connect" or "write"), mac. Link
+speed follows --baud, so baud probing sees realistic timings. FAKE_ESPTOOL_TIME_SCALE shrinks or stretches every delay (0 = no
+delays). If FAKE_ESPTOOL_LOG is set, start/end events are appended to it
+as JSON lines so concurrency can be checked afterwards.
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import hashlib
+from pathlib import Path
+
+VERSION = "4.7.0"
+DEFAULT_PORT = {"chip": "ESP32", "kbps": 3000, "max_baud": 921600, "fail": None}
+CHIP_DETAILS = {
+    "ESP32": ("ESP32-D0WD-V3 (revision v3.0)", "WiFi, BT, Dual Core, 240MHz"),
+    "ESP32-S2": ("ESP32-S2FH4 (revision v0.0)", "WiFi, Embedded Flash 4MB"),
+    "ESP32-S3": ("ESP32-S3 (QFN56) (revision v0.2)", "WiFi, BLE, Embedded PSRAM 8MB"),
+    "ESP32-C3": ("ESP32-C3 (QFN32) (revision v0.4)", "WiFi, BLE"),
+    "ESP32-C6": ("ESP32-C6 (QFN40) (revision v0.0)", "WiFi 6, BT 5, IEEE802.15.4"),
+}
+BLOCK = 0x4000
+SUBCOMMANDS = {"chip_id", "flash_id", "read_mac", "write_flash", "read_flash", "version"}
+
+
+def load_port_config(port):
+    config = dict(DEFAULT_PORT)
+    path = os.environ.get("FAKE_ESPTOOL_CONFIG")
+    if path and Path(path).exists():
+        data = json.loads(Path(path).read_text())
+        config.update(data.get("default", {}))
+        config.update(data.get("ports", {}).get(port, {}))
+    if "mac" not in config:
+        digest = hashlib.md5(port.encode()).digest()
+        config["mac"] = "24:6f:28:" + ":".join(f"{b:02x}" for b in digest[:3])
+    return config
+
+
+def log_event(port, event, **fields):
+    path = os.environ.get("FAKE_ESPTOOL_LOG")
+    if not path:
+        return
+    record = {"t": time.time(), "pid": os.getpid(), "port": port, "event": event, **fields}
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def sleep(seconds):
+    scale = float(os.environ.get("FAKE_ESPTOOL_TIME_SCALE", "1"))
+    if seconds * scale > 0:
+        time.sleep(seconds * scale)
+
+
+def say(line=""):
+    print(line, flush=True)
+
+
+def parse_args(argv):
+    options = {"--port": None, "--chip": "auto", "--baud": "115200"}
+    command, rest = None, []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if command is None and arg in SUBCOMMANDS:
+            command = arg
+        elif command is None and arg.startswith("--") and i + 1 < len(argv):
+            options[arg] = argv[i + 1]
+            i += 1
+        elif command is not None:
+            rest.append(arg)
+        i += 1
+    return options, command, rest
+
+
+def fatal(message, port):
+    say(f"A fatal error occurred: {message}")
+    log_event(port, "end", ok=False)
+    sys.exit(2)
+
+
+def connect(options, config):
+    port = options["--port"]
+    chip = config["chip"]
+    say(f"esptool.py v{VERSION}")
+    say(f"Serial port {port}")
+    say("Connecting....")
+    sleep(0.3)
+    if config.get("fail") == "connect":
+        fatal(f"Failed to connect to {chip}: No serial data received.", port)
+    if options["--chip"] != "auto" and options["--chip"].replace("-", "").lower() != chip.replace("-", "").lower():
+        fatal(f"This chip is {chip} not {options['--chip'].upper()}. Wrong --chip argument?", port)
+    description, features = CHIP_DETAILS.get(chip, (chip, "WiFi"))
+    say(f"Detecting chip type... {chip}")
+    say(f"Chip is {description}")
+    say(f"Features: {features}")
+    say("Crystal is 40MHz")
+    say(f"MAC: {config['mac']}")
+    say("Uploading stub...")
+    say("Running stub...")
+    say("Stub running...")
+    if options["--baud"] != "115200":
+        say(f"Changing baud rate to {options['--baud']}")
+        say("Changed.")
+        if int(options["--baud"]) > int(config["max_baud"]):
+            fatal("Failed to read flash ID: Serial data stream stopped: Possible serial noise or corruption.", port)
+
+
+def link_kbps(options, config):
+    """Effective kbit/s: 10 bits per byte on the wire plus protocol overhead"""
+    return min(float(config["kbps"]), int(options["--baud"]) * 0.75 / 1000)
+
+
+def write_flash(rest, port, config, kbps):
+    # Positional address/file pairs; skip the values of --flash_* options
+    values = {i + 1 for i, a in enumerate(rest) if a.startswith("--flash_")}
+    args = [a for i, a in enumerate(rest) if not a.startswith("--") and i not in values]
+    pairs = [(int(args[i], 0), Path(args[i + 1])) for i in range(0, len(args) - 1, 2)]
+
+    say("Configuring flash size...")
+    for index, (offset, path) in enumerate(pairs):
+        data = path.read_bytes()
+        compressed = len(zlib.compress(data, 9))
+        end = offset + ((len(data) + 0xFFF) & ~0xFFF) - 1
+        say(f"Flash will be erased from 0x{offset:08x} to 0x{end:08x}...")
+        say(f"Compressed {len(data)} bytes to {compressed}...")
+        start = time.monotonic()
+        blocks = max(1, (compressed + BLOCK - 1) // BLOCK)
+        for block in range(blocks):
+            percent = (block * 100) // blocks
+            address = offset + (len(data) * block // blocks) // 0x1000 * 0x1000
+            say(f"Writing at 0x{address:08x}... ({percent} %)")
+            if config.get("fail") == "write" and index == len(pairs) - 1 and block == blocks // 2:
+                fatal("Packet content transfer stopped (received 8 bytes)", port)
+            sleep(min(BLOCK, compressed) * 8 / (kbps * 1000))
+        say(f"Writing at 0x{offset + max(0, len(data) - 1) // 0x1000 * 0x1000:08x}... (100 %)")
+        elapsed = max(time.monotonic() - start, compressed * 8 / (kbps * 1000))
+        effective = len(data) * 8 / 1000 / elapsed if elapsed else 0
+        say(f"Wrote {len(data)} bytes ({compressed} compressed) at 0x{offset:08x} in {elapsed:.1f} seconds "
+            f"(effective {effective:.1f} kbit/s)...")
+        say("Hash of data verified.")
+        say()
+
+
+def read_flash(rest, config, kbps):
+    offset, size, path = int(rest[0], 0), int(rest[1], 0), Path(rest[2])
+    for block in range(0, size, BLOCK):
+        say(f"Reading at 0x{offset + block:08x}... ({block * 100 // size} %)")
+        sleep(min(BLOCK, size - block) * 8 / (kbps * 1000))
+    path.write_bytes(b"\xff" * size)
+    # Report the unscaled link time so probes rank rates the same at any time scale
+    elapsed = size * 8 / (kbps * 1000)
+    say(f"Read {size} bytes at 0x{offset:08x} in {elapsed:.1f} seconds ({size * 8 / 1000 / elapsed:.1f} kbit/s)...")
+
+
+def main():
+    options, command, rest = parse_args(sys.argv[1:])
+    if command == "version" or "--version" in sys.argv[1:]:
+        say(f"esptool.py v{VERSION}")
+        say(VERSION)
+        return
+
+    port = options["--port"] or "/dev/ttyUSB0"
+    config = load_port_config(port)
+    log_event(port, "start", command=command)
+    connect(options, config)
+
+    if command == "write_flash":
+        write_flash(rest, port, config, link_kbps(options, config))
+    elif command == "read_flash":
+        read_flash(rest, config, link_kbps(options, config))
+    elif command == "flash_id":
+        say("Manufacturer: 20")
+        say("Device: 4016")
+        say("Detected flash size: 4MB")
+    elif command == "chip_id":
+        if config["chip"] == "ESP32":
+            say("Warning: ESP32 has no Chip ID. Reading MAC instead.")
+            say(f"MAC: {config['mac']}")
+        else:
+            say(f"Chip ID: 0x{zlib.crc32(port.encode()):08x}")
+
+    say("Leaving...")
+    say("Hard resetting via RTS pin...")
+    log_event(port, "end", ok=True)
+
+
+if __name__ == "__main__":
+    main()
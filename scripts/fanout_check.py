@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Mesh-NOW /messages Fan-out Check
+Simulate several browser clients polling one node and verify every client
+receives every message exactly once, in order.
+
+Each simulated client keeps its own cookie jar, so by default it relies on the
+node's per-client session cursor (--use-since makes it pass ?since= like the
+web UI instead). Messages are injected through /send on --inject-url, which
+should be a different node on the same mesh when testing real hardware. With
+no --url a local stand-in node is started.
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+import statistics
+from http.cookiejar import CookieJar
+from urllib.parse import urlencode
+from urllib.request import build_opener, HTTPCookieProcessor, Request
+
+from standin_node import StandinNode, StandinServer
+
+
+class PollingClient(threading.Thread):
+    """One browser tab polling /messages"""
+
+    def __init__(self, index, base_url, tag, poll_interval, use_since):
+        super().__init__(daemon=True)
+        self.index = index
+        self.base_url = base_url
+        self.tag = tag
+        self.poll_interval = poll_interval
+        self.use_since = use_since
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()))
+        self.cursor = None
+        self.received = []
+        self.arrival = {}
+        self.errors = 0
+        self.stop_event = threading.Event()
+
+    def poll_once(self):
+        url = f"{self.base_url}/messages"
+        if self.use_since and self.cursor is not None:
+            url += f"?since={self.cursor}"
+        with self.opener.open(url, timeout=5) as response:
+            data = json.load(response)
+        now = time.monotonic()
+        for msg in data.get("messages", []):
+            if msg["content"].startswith(self.tag):
+                self.received.append(msg["content"])
+                self.arrival.setdefault(msg["content"], now)
+        self.cursor = data.get("next", self.cursor)
+        return bool(data.get("more"))
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                while self.poll_once():
+                    pass
+            except Exception:
+                self.errors += 1
+            self.stop_event.wait(self.poll_interval)
+
+
+def send_message(base_url, content):
+    body = urlencode({"message": content}).encode("utf-8")
+    request = Request(f"{base_url}/send", data=body,
+                      headers={"Content-Type": "application/x-www-form-urlencoded"})
+    with build_opener().open(request, timeout=5) as response:
+        response.read()
+
+
+def run_round(args, clients_count, base_url, inject_url):
+    tag = f"fanout-{clients_count}-{int(time.time() * 1000)}-"
+    clients = [PollingClient(i, base_url, tag, args.poll_interval, args.use_since)
+               for i in range(clients_count)]
+    for client in clients:
+        client.start()
+
+    sent_at = {}
+    expected = []
+    for i in range(args.messages):
+        content = f"{tag}{i:05d}"
+        send_message(inject_url, content)
+        sent_at[content] = time.monotonic()
+        expected.append(content)
+        time.sleep(1.0 / args.rate)
+
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline:
+        if all(set(expected) <= set(c.received) for c in clients):
+            break
+        time.sleep(0.1)
+
+    for client in clients:
+        client.stop_event.set()
+    for client in clients:
+        client.join(timeout=5)
+
+    delivered = missing = duplicates = out_of_order = errors = 0
+    latencies = []
+    for client in clients:
+        got = client.received
+        unique = set(got)
+        delivered += len(unique & set(expected))
+        missing += len(set(expected) - unique)
+        duplicates += len(got) - len(unique)
+        ordered = [m for m in got if m in sent_at]
+        out_of_order += sum(1 for a, b in zip(ordered, ordered[1:]) if a > b)
+        errors += client.errors
+        latencies.extend(client.arrival[m] - sent_at[m] for m in unique if m in sent_at)
+
+    total = len(expected) * clients_count
+    return {
+        "clients": clients_count,
+        "expected": total,
+        "delivered": delivered,
+        "missing": missing,
+        "duplicates": duplicates,
+        "out_of_order": out_of_order,
+        "errors": errors,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "max_ms": max(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify /messages fan-out to concurrent clients")
+    parser.add_argument("--url", help="Node to poll (default: start a local stand-in)")
+    parser.add_argument("--inject-url", help="Node to send through (default: --url)")
+    parser.add_argument("--clients", default="1,2,4,8,16", help="Comma-separated client counts")
+    parser.add_argument("--messages", type=int, default=50, help="Messages per round")
+    parser.add_argument("--rate", type=float, default=20.0, help="Messages sent per second")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between polls (web UI: 1)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for delivery")
+    parser.add_argument("--use-since", action="store_true", help="Pass ?since= instead of relying on cookies")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        server = StandinServer(StandinNode(loopback=True))
+        base_url = server.start()
+        print(f"Started stand-in node at {base_url}")
+    inject_url = args.inject_url or base_url
+
+    results = []
+    try:
+        for count in [int(c) for c in args.clients.split(",") if c.strip()]:
+            results.append(run_round(args, count, base_url, inject_url))
+    finally:
+        if server:
+            server.stop()
+
+    print()
+    print(f"{'clients':>7} {'expected':>8} {'delivered':>9} {'missing':>7} {'dups':>5} "
+          f"{'reorder':>7} {'errors':>6} {'p50 ms':>8} {'max ms':>8}")
+    for r in results:
+        print(f"{r['clients']:>7} {r['expected']:>8} {r['delivered']:>9} {r['missing']:>7} "
+              f"{r['duplicates']:>5} {r['out_of_order']:>7} {r['errors']:>6} "
+              f"{r['p50_ms']:>8.1f} {r['max_ms']:>8.1f}")
+
+    complete = all(r["missing"] == 0 and r["duplicates"] == 0 and r["out_of_order"] == 0 for r in results)
+    print()
+    print("Delivery complete" if complete else "Delivery INCOMPLETE")
+    sys.exit(0 if complete else 1)
+
+
+if __name__ == "__main__":
+    main()
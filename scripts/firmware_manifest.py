@@ -0,0 +1,94 @@
+"""
+Mesh-NOW Firmware Manifest
+Merged single image and manifest for a target's build artifacts
+
+Lays bootloader, partition table and app out at their flash offsets in one
+0xFF-padded image (what `esptool.py merge_bin` produces) and records every
+image's offset, size and SHA-256 together with the target and git commit in
+manifest.json, so flashers can do a single contiguous write and check what
+they are about to write.
+
+The padding between the partition table and the app covers the nvs
+(0x9000) and phy_init (0xF000) partitions, so writing the merged image
+erases them like `esptool.py erase_flash` would: stored Wi-Fi settings and
+RF calibration are rebuilt on the next boot. Flashers take --keep-nvs to
+write the separate images instead.
+"""
+
+import json
+import hashlib
+import subprocess
+from pathlib import Path
+
+MANIFEST_NAME = "manifest.json"
+MERGED_NAME = "mesh-now-merged.bin"
+MANIFEST_VERSION = 1
+
+# The ROM loads the second-stage bootloader from 0x1000 on the original ESP32
+# and the S2, and from 0x0 on everything newer
+BOOTLOADER_OFFSETS = {"esp32": 0x1000, "esp32s2": 0x1000}
+ARTIFACT_NAMES = ("bootloader.bin", "partition-table.bin", "mesh-now.bin")
+
+
+def default_regions(target):
+    """(offset, name) for each image when the build didn't record offsets"""
+    return [
+        (BOOTLOADER_OFFSETS.get(target, 0x0), "bootloader.bin"),
+        (0x8000, "partition-table.bin"),
+        (0x10000, "mesh-now.bin"),
+    ]
+
+
+def idf_regions(build_dir):
+    """(offset, name) from ESP-IDF's build/flasher_args.json, or None"""
+    try:
+        flash_files = json.loads((Path(build_dir) / "flasher_args.json").read_text())["flash_files"]
+    except (OSError, ValueError, KeyError):
+        return None
+    regions = []
+    for offset, path in flash_files.items():
+        name = Path(path).name
+        if name in ARTIFACT_NAMES:
+            regions.append((int(offset, 16), name))
+    return sorted(regions) if len(regions) == len(ARTIFACT_NAMES) else None
+
+
+def git_sha(repo_dir):
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo_dir, capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def merge_images(images):
+    """One image covering 0x0 to the end of the last (offset, data), gaps 0xFF
+    (so writing it erases any partition in a gap)"""
+    end = max(offset + len(data) for offset, data in images)
+    merged = bytearray(b"\xff" * end)
+    for offset, data in sorted(images):
+        merged[offset:offset + len(data)] = data
+    return bytes(merged)
+
+
+def image_entry(name, offset, data):
+    return {"name": name, "offset": f"0x{offset:x}", "size": len(data),
+            "sha256": hashlib.sha256(data).hexdigest()}
+
+
+def write_manifest(builds_dir, target, regions, sha=None):
+    """Write the merged image and manifest.json next to the images; returns the manifest"""
+    builds_dir = Path(builds_dir)
+    images = [(offset, name, (builds_dir / name).read_bytes()) for offset, name in regions]
+    merged = merge_images([(offset, data) for offset, _, data in images])
+    (builds_dir / MERGED_NAME).write_bytes(merged)
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "target": target,
+        "git_sha": sha,
+        "images": [image_entry(name, offset, data) for offset, name, data in images],
+        "merged": image_entry(MERGED_NAME, 0x0, merged),
+    }
+    (builds_dir / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2) + "\n")
+    return manifest
@@ -5,46 +5,43 @@ Python version - Platform agnostic with TUI
 """
 
 import os
+import re
 import sys
-import subprocess
+import json
+import time
+import shlex
+import threading
+import hashlib
+import tempfile
 import argparse
+import importlib.util
 from pathlib import Path
 
-try:
-    from rich.console import Console
-    from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn
-    from rich.panel import Panel
-    from rich.text import Text
-    from rich.prompt import Prompt
-    RICH_AVAILABLE = True
-except ImportError:
-    RICH_AVAILABLE = False
+from command_runner import command_log, echo_to, log_path, run
+
+# rich is imported where output is drawn, so --ci runs never load it
+RICH_AVAILABLE = importlib.util.find_spec("rich") is not None
+
+FAILURE_TAIL = 30
 
 def setup_console():
     """Setup console for output"""
     if RICH_AVAILABLE:
+        from rich.console import Console
         return Console()
     else:
         return None
 
-def run_command(cmd, console=None, ci_mode=False, cwd=None):
-    """Run a command and return success"""
-    try:
-        if ci_mode:
-            result = subprocess.run(cmd, shell=True, cwd=cwd, capture_output=True, text=True)
-        else:
-            result = subprocess.run(cmd, shell=True, cwd=cwd, capture_output=True, text=True)
-
-        if result.returncode != 0:
-            if console and not ci_mode:
-                console.print(f"[red]Command failed: {cmd}[/red]")
-                console.print(f"[dim]{result.stderr}[/dim]")
-            return False, result.stderr
-        return True, result.stdout
-    except Exception as e:
-        if console and not ci_mode:
-            console.print(f"[red]Error running command: {e}[/red]")
-        return False, str(e)
+def run_command(cmd, console=None, ci_mode=False, cwd=None, on_line=None):
+    """Run a command and return success and its output (the last lines)"""
+    result = run(cmd, cwd=cwd, on_line=on_line, log=command_log("flash"))
+    if not result.ok and console and not ci_mode:
+        console.print(f"[red]Command failed: {cmd}[/red]")
+        echo = echo_to(console, "   ")
+        for line in result.tail(FAILURE_TAIL):
+            echo(line)
+        console.print(f"[dim]Full output: {log_path('flash')}[/dim]")
+    return result.ok, result.error or result.output
 
 def check_firmware_files(console, ci_mode=False):
     """Check if required firmware files exist"""
@@ -76,7 +73,630 @@ def get_file_size(file_path):
         size /= 1024.0
     return f"{size:.1f}TB"
 
-def flash_firmware(target, port, console, ci_mode=False):
+# Fallback layout for builds without a manifest. The ROM loads the bootloader
+# from 0x1000 on the ESP32 and S2, from 0x0 on newer chips.
+BOOTLOADER_OFFSETS = {"esp32": 0x1000, "esp32s2": 0x1000}
+APP_REGIONS = [(0x8000, "partition-table.bin"), (0x10000, "mesh-now.bin")]
+# Written by scripts/firmware_manifest.py at build time
+MANIFEST_NAME = "manifest.json"
+
+ESPTOOL = os.environ.get("MESH_NOW_ESPTOOL", "esptool.py")
+DEFAULT_BAUD = 460800
+BAUD_CANDIDATES = [2000000, 1500000, 921600, 460800, 230400, 115200]
+PROBE_BYTES = 0x10000
+PROBE_TIMEOUT = 60
+BAUD_CACHE = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "mesh-now" / "baud.json"
+DEFAULT_FLASH_SETTINGS = {"mode": "dio", "freq": "40m", "size": "detect"}
+# Images whose headers must land byte for byte (smart writes, merged images)
+KEEP_FLASH_ARGS = ["--flash_mode", "keep", "--flash_freq", "keep", "--flash_size", "keep"]
+
+# esptool v4: "Writing at 0x00010000... (12 %)"
+# esptool v5: "Writing at 0x00010000 [=====>      ]  12.3% 65536/524288 bytes..."
+WRITING_PATTERN = re.compile(r"Writing at (0x[0-9a-fA-F]+)\S*\s*(?:\((\d+)\s*%\)|\[[^\]]*\]\s*([\d.]+)%)")
+COMPRESSED_PATTERN = re.compile(r"Compressed (\d+) bytes to (\d+)")
+WROTE_PATTERN = re.compile(r"Wrote (\d+) bytes(?: \((\d+) compressed\))? at (0x[0-9a-fA-F]+) in ([\d.]+) seconds")
+FATAL_PATTERN = re.compile(r"A fatal error occurred:\s*(.*)")
+
+
+class FlashRegion:
+    """Progress of one image being written"""
+
+    def __init__(self, offset, name, size):
+        self.offset = offset
+        self.name = name
+        self.size = size
+        self.compressed = None
+        self.percent = 0.0
+        self.started = None
+        self.finished = None
+        self.esptool_seconds = None
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+    @property
+    def seconds(self):
+        """Write time, preferring esptool's own measurement"""
+        if self.esptool_seconds:
+            return self.esptool_seconds
+        if self.started is not None and self.finished is not None and self.finished > self.started:
+            return self.finished - self.started
+        return None
+
+    @property
+    def kb_per_second(self):
+        seconds = self.seconds
+        return self.size / 1024.0 / seconds if seconds else None
+
+
+class EsptoolProgress:
+    """Turn esptool write_flash output into per-region progress"""
+
+    def __init__(self, regions, clock=time.monotonic):
+        self.regions = sorted(regions, key=lambda r: r.offset)
+        self.clock = clock
+        self.error = None
+
+    def region_at(self, address):
+        candidates = [r for r in self.regions if address >= r.offset]
+        return candidates[-1] if candidates else None
+
+    @property
+    def total_percent(self):
+        total = sum(r.size for r in self.regions) or 1
+        return sum(r.size * r.percent / 100.0 for r in self.regions) * 100.0 / total
+
+    def feed(self, line):
+        """Parse one output line; returns the region it updated, if any"""
+        now = self.clock()
+
+        match = WRITING_PATTERN.search(line)
+        if match:
+            region = self.region_at(int(match.group(1), 16))
+            if region is None:
+                return None
+            if region.started is None:
+                region.started = now
+            region.percent = float(match.group(2) or match.group(3))
+            return region
+
+        match = WROTE_PATTERN.search(line)
+        if match:
+            region = self.region_at(int(match.group(3), 16))
+            if region is None:
+                return None
+            region.size = int(match.group(1))
+            if match.group(2):
+                region.compressed = int(match.group(2))
+            region.esptool_seconds = float(match.group(4))
+            region.percent = 100.0
+            region.finished = now
+            if region.started is None:
+                region.started = now
+            return region
+
+        match = COMPRESSED_PATTERN.search(line)
+        if match:
+            # Precedes the Writing lines of the next region that has not started
+            pending = [r for r in self.regions if r.started is None]
+            if pending:
+                pending[0].compressed = int(match.group(2))
+            return None
+
+        match = FATAL_PATTERN.search(line)
+        if match:
+            self.error = match.group(1).strip()
+        return None
+
+
+def stream_lines(stream):
+    """Yield lines from a byte stream, splitting on \r as well as \n"""
+    buffer = b""
+    while True:
+        chunk = stream.read1(4096) if hasattr(stream, "read1") else stream.read(4096)
+        if not chunk:
+            break
+        buffer += chunk
+        parts = re.split(rb"[\r\n]", buffer)
+        buffer = parts.pop()
+        for part in parts:
+            if part:
+                yield part.decode("utf-8", "replace")
+    if buffer:
+        yield buffer.decode("utf-8", "replace")
+
+
+def replay_transcript(path, regions, on_region=None):
+    """Feed a recorded write_flash log through EsptoolProgress; returns the tracker"""
+    # Wall-clock times mean nothing when replaying; use esptool's own
+    tracker = EsptoolProgress(regions, clock=lambda: 0.0)
+    with open(path, "rb") as f:
+        for line in stream_lines(f):
+            region = tracker.feed(line)
+            if region and on_region:
+                on_region(region)
+    return tracker
+
+
+def load_manifest(directory="."):
+    """The build's manifest.json, or None for older builds"""
+    try:
+        return json.loads((Path(directory) / MANIFEST_NAME).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def firmware_regions(target, directory="."):
+    """(offset, name) of each image, from the manifest when there is one"""
+    manifest = load_manifest(directory)
+    if manifest:
+        return [(int(image["offset"], 16), image["name"]) for image in manifest["images"]]
+    return [(BOOTLOADER_OFFSETS.get(target, 0x0), "bootloader.bin")] + APP_REGIONS
+
+
+def manifest_mismatches(directory="."):
+    """Manifest images that are present but differ from the recorded size or SHA-256"""
+    manifest = load_manifest(directory)
+    if not manifest:
+        return []
+    bad = []
+    for entry in manifest["images"] + ([manifest["merged"]] if manifest.get("merged") else []):
+        path = Path(directory) / entry["name"]
+        if not path.exists():
+            continue
+        data = path.read_bytes()
+        if len(data) != entry["size"] or hashlib.sha256(data).hexdigest() != entry["sha256"]:
+            bad.append(entry["name"])
+    return bad
+
+
+def full_flash_images(target, directory=".", keep_nvs=False):
+    """(offset, name, path) images and flash args for a complete flash; a
+    merged image goes in one contiguous write. Its 0xFF padding also covers
+    the nvs and phy_init partitions, so keep_nvs writes the separate images
+    around them instead."""
+    manifest = load_manifest(directory)
+    merged = manifest.get("merged") if manifest and not keep_nvs else None
+    if merged and (Path(directory) / merged["name"]).exists():
+        # The build already wrote the flash settings into the bootloader header
+        return [(int(merged["offset"], 16), merged["name"], Path(directory) / merged["name"])], KEEP_FLASH_ARGS
+    images = [(offset, name, Path(directory) / name) for offset, name in firmware_regions(target, directory)]
+    return images, flash_settings_args(flash_settings(target, directory))
+
+
+def local_regions(target, directory="."):
+    """FlashRegion for each image that exists in directory"""
+    regions = []
+    for offset, name in firmware_regions(target, directory):
+        path = Path(directory) / name
+        size = path.stat().st_size if path.exists() else 0
+        regions.append(FlashRegion(offset, name, size))
+    return regions
+
+
+def throughput_report(regions, console=None):
+    """Print write time and effective speed per image"""
+    rows = []
+    for region in regions:
+        seconds = region.seconds
+        speed = region.kb_per_second
+        ratio = f"{region.compressed / region.size * 100:.0f}%" if region.compressed and region.size else "-"
+        rows.append((region.name, f"0x{region.offset:x}", f"{region.size / 1024:.1f} KB", ratio,
+                     f"{seconds:.2f} s" if seconds else "-", f"{speed:.1f} KB/s" if speed else "-"))
+
+    if console:
+        from rich.table import Table
+        table = Table(title="Flash throughput")
+        for column in ("Image", "Offset", "Size", "Compressed", "Time", "Effective"):
+            table.add_column(column, justify="left" if column == "Image" else "right")
+        for row in rows:
+            table.add_row(*row)
+        console.print(table)
+    else:
+        for row in rows:
+            print(f"{row[0]:<22} {row[1]:>8} {row[2]:>10} {row[3]:>10} {row[4]:>8} {row[5]:>12}")
+
+
+def esptool_cmd(*args, esptool=None):
+    """esptool command line; MESH_NOW_ESPTOOL may name another command"""
+    return shlex.split(esptool or ESPTOOL, posix=os.name != 'nt') + [str(a) for a in args]
+
+
+def flash_settings(target, directory="."):
+    """Flash mode/frequency/size from the target's sdkconfig (shipped next to
+    the images, or configs/ in a source checkout)"""
+    settings = dict(DEFAULT_FLASH_SETTINGS, source=None)
+    candidates = [
+        Path(directory) / f"sdkconfig.{target}",
+        Path(__file__).resolve().parent.parent / "configs" / f"sdkconfig.{target}",
+    ]
+    for path in candidates:
+        if not path.exists():
+            continue
+        text = path.read_text()
+        for key, pattern in (("mode", r"CONFIG_ESPTOOLPY_FLASHMODE_(\w+)=y"),
+                             ("freq", r"CONFIG_ESPTOOLPY_FLASHFREQ_(\w+)=y"),
+                             ("size", r"CONFIG_ESPTOOLPY_FLASHSIZE_(\w+)=y")):
+            match = re.search(pattern, text)
+            if match:
+                value = match.group(1)
+                settings[key] = value if key == "size" else value.lower()
+        settings["source"] = str(path)
+        break
+    return settings
+
+
+def flash_settings_args(settings):
+    return ["--flash_mode", settings["mode"], "--flash_freq", settings["freq"], "--flash_size", settings["size"]]
+
+
+def usb_serial_id(port):
+    """USB VID:PID:serial of the adapter behind port, or None"""
+    try:
+        from serial.tools import list_ports
+    except ImportError:
+        return None
+    for info in list_ports.comports():
+        if info.device == port and info.vid is not None:
+            return f"{info.vid:04x}:{info.pid:04x}:{info.serial_number or info.location or ''}"
+    return None
+
+
+def load_baud_cache():
+    try:
+        return json.loads(BAUD_CACHE.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def update_baud_cache(key, entry):
+    """Store one entry, re-reading first so concurrent fleet probes don't drop each other's"""
+    cache = load_baud_cache()
+    cache[key] = entry
+    try:
+        BAUD_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = BAUD_CACHE.with_name(f"{BAUD_CACHE.name}.{os.getpid()}.{threading.get_ident()}")
+        tmp.write_text(json.dumps(cache, indent=2, sort_keys=True))
+        os.replace(tmp, BAUD_CACHE)
+    except OSError:
+        pass
+
+
+def baud_cache_key(target, port):
+    return f"{usb_serial_id(port) or port}/{target}"
+
+
+def probe_link(target, port, baud, esptool=None):
+    """Read PROBE_BYTES at baud; returns KB/s, or None if the link fails"""
+    with tempfile.TemporaryDirectory(prefix="mesh-now-probe-") as tmp:
+        cmd = esptool_cmd("--chip", target, "--port", port, "--baud", baud, "--after", "no_reset",
+                          "read_flash", 0, PROBE_BYTES, Path(tmp) / "probe.bin", esptool=esptool)
+        start = time.monotonic()
+        result = run(cmd, timeout=PROBE_TIMEOUT, log=command_log("flash"))
+        if not result.ok:
+            return None
+        # Time the transfer itself when esptool reports it, not connection setup
+        match = re.search(r"Read \d+ bytes at 0x[0-9a-fA-F]+ in ([\d.]+) seconds", result.output)
+        seconds = float(match.group(1)) if match and float(match.group(1)) > 0 else time.monotonic() - start
+        return PROBE_BYTES / 1024.0 / seconds
+
+
+def probe_baud(target, port, console=None, esptool=None):
+    """Find the highest baud rate that reads back reliably"""
+    entry = None
+    for baud in BAUD_CANDIDATES:
+        kbps = probe_link(target, port, baud, esptool)
+        if console:
+            console.print(f"[dim]  {baud:>8} baud: {'%.1f KB/s' % kbps if kbps else 'failed'}[/dim]")
+        if kbps:
+            entry = {"baud": baud, "kbps": round(kbps, 1)}
+            break
+    if entry is None:
+        return None
+
+    if entry["baud"] == DEFAULT_BAUD:
+        entry["default_kbps"] = entry["kbps"]
+    elif entry["baud"] > DEFAULT_BAUD:
+        default_kbps = probe_link(target, port, DEFAULT_BAUD, esptool)
+        entry["default_kbps"] = round(default_kbps, 1) if default_kbps else None
+    entry["probed"] = int(time.time())
+    return entry
+
+
+def tuned_baud(target, port, console=None, reprobe=False, esptool=None):
+    """Cached (or freshly probed) baud entry for this adapter and chip"""
+    key = baud_cache_key(target, port)
+    cached = load_baud_cache().get(key)
+    if cached and not reprobe:
+        return cached
+
+    if console:
+        console.print(f"[bold]Probing baud rates on {port}...[/bold]")
+    entry = probe_baud(target, port, console, esptool)
+    if entry:
+        update_baud_cache(key, entry)
+    return entry
+
+
+def demote_baud(target, port, failed_baud):
+    """After a failure at failed_baud, remember the next lower rate; returns it"""
+    lower = [b for b in BAUD_CANDIDATES if b < failed_baud]
+    if not lower:
+        return None
+    key = baud_cache_key(target, port)
+    entry = load_baud_cache().get(key, {})
+    entry.update({"baud": lower[0], "kbps": None})
+    update_baud_cache(key, entry)
+    return lower[0]
+
+
+def speedup_report(entry, console=None):
+    """How much faster the tuned link is than the 460800 baud default"""
+    if not entry or not entry.get("kbps") or not entry.get("default_kbps") or entry["baud"] == DEFAULT_BAUD:
+        return
+    ratio = entry["kbps"] / entry["default_kbps"]
+    message = (f"Link at {entry['baud']} baud: {entry['kbps']:.1f} KB/s vs {entry['default_kbps']:.1f} KB/s "
+               f"at the {DEFAULT_BAUD} default ({ratio:.1f}x)")
+    if console:
+        console.print(f"[green]{message}[/green]")
+    else:
+        print(message)
+
+
+def write_flash_images(target, port, images, console, ci_mode=False, flash_args=None, baud=DEFAULT_BAUD):
+    """Write (offset, name, path) images with one compressed esptool run, showing real progress"""
+    if flash_args is None:
+        flash_args = flash_settings_args(flash_settings(target))
+    flash_cmd = esptool_cmd("--chip", target, "--port", port, "--baud", baud,
+                            "--before", "default_reset", "--after", "hard_reset",
+                            "write_flash", "--compress", *flash_args)
+    for offset, _, path in images:
+        flash_cmd += [hex(offset), str(path)]
+
+    tracker = EsptoolProgress([FlashRegion(offset, name, Path(path).stat().st_size) for offset, name, path in images])
+    if console and not ci_mode:
+        from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+            console=console,
+        ) as progress:
+            tasks = {region.name: progress.add_task(f"{region.name}", total=100) for region in tracker.regions}
+
+            def on_line(line):
+                region = tracker.feed(line)
+                if region:
+                    progress.update(tasks[region.name], completed=region.percent)
+
+            result = run(flash_cmd, on_line=on_line, log=command_log("flash"))
+    else:
+        last_step = {}
+
+        def on_line(line):
+            region = tracker.feed(line)
+            if region and not ci_mode:
+                step = int(region.percent) // 25
+                if last_step.get(region.name) != step:
+                    last_step[region.name] = step
+                    print(f"{region.name}: {region.percent:.0f}%")
+
+        result = run(flash_cmd, on_line=on_line, log=command_log("flash"))
+
+    success = result.ok
+    if not success and console and not ci_mode:
+        console.print(f"[red]Command failed: {' '.join(flash_cmd)}[/red]")
+        console.print(f"[dim]{tracker.error or result.reason()}[/dim]")
+    elif not success and ci_mode:
+        print(f"esptool failed: {tracker.error or result.reason()}")
+
+    if success:
+        throughput_report(tracker.regions, console if not ci_mode else None)
+    return success
+
+
+# Smart flashing ---------------------------------------------------------------
+
+SECTOR_SIZE = 0x1000
+SMART_CHUNK_SIZE = 0x10000
+# Past this share of changed sectors one contiguous write beats many small ones
+SMART_FULL_WRITE_RATIO = 0.6
+APP_IMAGE = "mesh-now.bin"
+
+
+class MockFlashBackend:
+    """Flash chip contents held in a file, for rehearsing smart flashing"""
+
+    def __init__(self, path, size=0x400000):
+        self.path = Path(path)
+        self.flash = bytearray(self.path.read_bytes()) if self.path.exists() else bytearray(b"\xff" * size)
+        if len(self.flash) < size:
+            self.flash += b"\xff" * (size - len(self.flash))
+        self.md5_calls = 0
+        self.bytes_written = 0
+
+    def md5(self, offset, size):
+        self.md5_calls += 1
+        return hashlib.md5(bytes(self.flash[offset:offset + size])).hexdigest()
+
+    def write(self, offset, data):
+        # Erase whole sectors first, like the chip does
+        erase_end = offset + (len(data) + SECTOR_SIZE - 1) // SECTOR_SIZE * SECTOR_SIZE
+        self.flash[offset:erase_end] = b"\xff" * (erase_end - offset)
+        self.flash[offset:offset + len(data)] = data
+        self.bytes_written += len(data)
+
+    def close(self):
+        self.path.write_bytes(bytes(self.flash))
+
+
+class EsptoolBackend:
+    """Reads flash digests over one esptool connection (esptool as a library)"""
+
+    def __init__(self, target, port, baud=DEFAULT_BAUD):
+        from esptool.cmds import detect_chip
+
+        self.esp = detect_chip(port, 115200)
+        if self.esp.CHIP_NAME.lower().replace("-", "") != target.lower():
+            self.esp._port.close()
+            raise RuntimeError(f"Port {port} has a {self.esp.CHIP_NAME}, not {target}")
+        self.esp = self.esp.run_stub()
+        if baud != 115200:
+            self.esp.change_baud(baud)
+        self.md5_calls = 0
+
+    def md5(self, offset, size):
+        self.md5_calls += 1
+        digest = self.esp.flash_md5sum(offset, size)
+        return digest.hex() if isinstance(digest, bytes) else digest
+
+    def close(self):
+        self.esp._port.close()
+
+
+class SmartFlashPlan:
+    """Which regions of each image need writing"""
+
+    def __init__(self):
+        self.images = []      # (name, status, changed sectors, total sectors)
+        self.writes = []      # (offset, name, data)
+
+    @property
+    def bytes_to_write(self):
+        return sum(len(data) for _, _, data in self.writes)
+
+
+def changed_sectors(backend, offset, data):
+    """Sector indexes of data that differ on the device, narrowing 64 KB chunks first.
+    Returns None when so many chunks differ that a full write is cheaper."""
+    chunks = []
+    for chunk_start in range(0, len(data), SMART_CHUNK_SIZE):
+        chunk = data[chunk_start:chunk_start + SMART_CHUNK_SIZE]
+        if backend.md5(offset + chunk_start, len(chunk)) != hashlib.md5(chunk).hexdigest():
+            chunks.append(chunk_start)
+    if len(chunks) > (len(data) + SMART_CHUNK_SIZE - 1) // SMART_CHUNK_SIZE * SMART_FULL_WRITE_RATIO:
+        return None
+
+    changed = []
+    for chunk_start in chunks:
+        chunk_end = min(len(data), chunk_start + SMART_CHUNK_SIZE)
+        for sector_start in range(chunk_start, chunk_end, SECTOR_SIZE):
+            sector = data[sector_start:sector_start + SECTOR_SIZE]
+            if backend.md5(offset + sector_start, len(sector)) != hashlib.md5(sector).hexdigest():
+                changed.append(sector_start // SECTOR_SIZE)
+    return changed
+
+
+def sector_runs(sectors):
+    """Merge sorted sector indexes into (first, count) runs"""
+    runs = []
+    for sector in sectors:
+        if runs and runs[-1][0] + runs[-1][1] == sector:
+            runs[-1][1] += 1
+        else:
+            runs.append([sector, 1])
+    return [tuple(run) for run in runs]
+
+
+def plan_smart_flash(backend, images):
+    """Compare (offset, name, data) images with the device and decide what to write"""
+    plan = SmartFlashPlan()
+    for offset, name, data in images:
+        total = (len(data) + SECTOR_SIZE - 1) // SECTOR_SIZE
+        if backend.md5(offset, len(data)) == hashlib.md5(data).hexdigest():
+            plan.images.append((name, "unchanged", 0, total))
+            continue
+
+        if name != APP_IMAGE or len(data) <= SMART_CHUNK_SIZE:
+            plan.images.append((name, "full", total, total))
+            plan.writes.append((offset, name, data))
+            continue
+
+        sectors = changed_sectors(backend, offset, data)
+        if not sectors or len(sectors) > total * SMART_FULL_WRITE_RATIO:
+            # No sector differs only if the tail past the image differs; rewrite it all
+            plan.images.append((name, "full", total, total))
+            plan.writes.append((offset, name, data))
+            continue
+
+        plan.images.append((name, "partial", len(sectors), total))
+        for first, count in sector_runs(sectors):
+            start = first * SECTOR_SIZE
+            plan.writes.append((offset + start, f"{name}@0x{offset + start:x}", data[start:start + count * SECTOR_SIZE]))
+    return plan
+
+
+def print_smart_plan(plan, console=None):
+    """Show per-image decisions"""
+    if console:
+        from rich.table import Table
+        table = Table(title="Smart flash plan")
+        for column in ("Image", "Decision", "Sectors"):
+            table.add_column(column)
+        for name, status, changed, total in plan.images:
+            style = {"unchanged": "green", "partial": "yellow", "full": "red"}[status]
+            table.add_row(name, f"[{style}]{status}[/{style}]", f"{changed}/{total}")
+        console.print(table)
+        console.print(f"[dim]{len(plan.writes)} write(s), {plan.bytes_to_write / 1024:.1f} KB[/dim]")
+    else:
+        for name, status, changed, total in plan.images:
+            print(f"{name:<22} {status:<10} {changed}/{total} sectors")
+        print(f"{len(plan.writes)} write(s), {plan.bytes_to_write / 1024:.1f} KB")
+
+
+def smart_flash(target, port, console, ci_mode=False, mock_flash=None, baud=DEFAULT_BAUD, keep_nvs=False):
+    """Write only the images (and app sectors) that differ from the device"""
+    images = [(offset, name, Path(name).read_bytes()) for offset, name in firmware_regions(target)]
+
+    start = time.monotonic()
+    try:
+        backend = MockFlashBackend(mock_flash) if mock_flash else EsptoolBackend(target, port, baud)
+    except ImportError:
+        if console and not ci_mode:
+            console.print("[yellow]esptool is not importable; falling back to a full flash[/yellow]")
+        images, flash_args = full_flash_images(target, keep_nvs=keep_nvs)
+        return write_flash_images(target, port, images, console, ci_mode, flash_args, baud)
+    except Exception as e:
+        if console and not ci_mode:
+            console.print(f"[red]Could not read flash digests: {e}[/red]")
+        elif ci_mode:
+            print(f"Could not read flash digests: {e}")
+        return False
+
+    try:
+        plan = plan_smart_flash(backend, images)
+        if isinstance(backend, MockFlashBackend):
+            for offset, _, data in plan.writes:
+                backend.write(offset, data)
+    finally:
+        backend.close()
+
+    if not ci_mode:
+        print_smart_plan(plan, console)
+        message = f"Compared in {time.monotonic() - start:.1f}s using {backend.md5_calls} digest reads"
+        if console:
+            console.print(f"[dim]{message}[/dim]")
+        else:
+            print(message)
+
+    if not plan.writes or isinstance(backend, MockFlashBackend):
+        if ci_mode:
+            print(f"Smart flash: {len(plan.writes)} write(s), {plan.bytes_to_write} bytes")
+        return True
+
+    with tempfile.TemporaryDirectory(prefix="mesh-now-smart-") as tmp:
+        writes = []
+        for index, (offset, name, data) in enumerate(plan.writes):
+            path = Path(tmp) / f"{index:02d}.bin"
+            path.write_bytes(data)
+            writes.append((offset, name, path))
+        return write_flash_images(target, port, writes, console, ci_mode, KEEP_FLASH_ARGS, baud)
+
+
+def flash_firmware(target, port, console, ci_mode=False, smart=False, mock_flash=None, baud="auto",
+                   reprobe=False, keep_nvs=False):
     """Flash firmware to ESP32"""
     if console and not ci_mode:
         console.print(f"[bold blue]Flashing firmware to {target} on {port}[/bold blue]")
@@ -91,8 +711,26 @@ def flash_firmware(target, port, console, ci_mode=False):
                 console.print(f"  {file}: {size}")
         console.print()
 
+    # Refuse firmware that doesn't match what the build recorded
+    manifest = load_manifest()
+    if manifest:
+        problem = None
+        mismatches = manifest_mismatches()
+        if mismatches:
+            problem = f"{', '.join(mismatches)} differ from {MANIFEST_NAME} (corrupt or mixed-up files?)"
+        elif manifest["target"] != target:
+            problem = f"firmware is built for {manifest['target']}, not {target}"
+        if problem:
+            if console and not ci_mode:
+                console.print(f"[red]{problem}[/red]")
+            elif ci_mode:
+                print(problem)
+            return False
+        if console and not ci_mode:
+            console.print(f"[dim]Build {(manifest.get('git_sha') or 'unknown')[:12]}, images match {MANIFEST_NAME}[/dim]")
+
     # Check esptool
-    success, _ = run_command("esptool.py --version", console, ci_mode)
+    success = True if mock_flash else run_command(" ".join(esptool_cmd("version")), console, ci_mode)[0]
     if not success:
         if console and not ci_mode:
             console.print("[red]esptool.py not found. Installing...[/red]")
@@ -104,29 +742,38 @@ def flash_firmware(target, port, console, ci_mode=False):
         else:
             return False
 
-    # Flash command
-    flash_cmd = f"""esptool.py --chip {target} --port {port} --baud 460800 --before default_reset --after hard_reset write_flash --flash_mode dio --flash_freq 40m --flash_size detect 0x0 bootloader.bin 0x8000 partition-table.bin 0x10000 mesh-now.bin"""
+    if mock_flash:
+        success = smart_flash(target, port, console, ci_mode, mock_flash, keep_nvs=keep_nvs)
+    else:
+        entry = None
+        if baud == "auto":
+            entry = tuned_baud(target, port, console if not ci_mode else None, reprobe)
+            baud = entry["baud"] if entry else DEFAULT_BAUD
 
-    if console and not ci_mode:
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[progress.description]{task.description}"),
-            BarColumn(),
-            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-            console=console,
-        ) as progress:
-            task = progress.add_task("Flashing firmware...", total=100)
+        settings = flash_settings(target)
+        if console and not ci_mode:
+            source = settings["source"] or "defaults"
+            console.print(f"[dim]{baud} baud, flash {settings['mode']} @ {settings['freq']}, "
+                          f"{settings['size']} (from {source})[/dim]")
 
-            # Simulate progress (esptool doesn't provide progress info)
-            import time
-            for i in range(0, 101, 10):
-                progress.update(task, completed=i)
-                time.sleep(0.2)
+        while True:
+            if smart:
+                success = smart_flash(target, port, console, ci_mode, baud=baud, keep_nvs=keep_nvs)
+            else:
+                images, flash_args = full_flash_images(target, keep_nvs=keep_nvs)
+                success = write_flash_images(target, port, images, console, ci_mode, flash_args, baud)
+            if success or entry is None:
+                break
+            # The cached rate stopped working; step down once and try again
+            lower = demote_baud(target, port, baud)
+            if lower is None:
+                break
+            if console and not ci_mode:
+                console.print(f"[yellow]Retrying at {lower} baud[/yellow]")
+            baud, entry = lower, None
 
-            success, output = run_command(flash_cmd, console, ci_mode)
-            progress.update(task, completed=100)
-    else:
-        success, output = run_command(flash_cmd, console, ci_mode)
+        if success and not ci_mode:
+            speedup_report(entry, console)
 
     if success:
         if console and not ci_mode:
@@ -147,17 +794,41 @@ def flash_firmware(target, port, console, ci_mode=False):
 
 def main():
     parser = argparse.ArgumentParser(description="Flash ESP32 firmware")
-    parser.add_argument("target", nargs="?", default="esp32",
-                       help="ESP32 target (esp32, esp32s2, esp32s3, esp32c3, esp32c6)")
+    parser.add_argument("target", nargs="?",
+                       help="ESP32 target (esp32, esp32s2, esp32s3, esp32c3, esp32c6); default from manifest.json, else esp32")
     parser.add_argument("port", nargs="?", default="/dev/ttyUSB0" if os.name != 'nt' else "COM1",
                        help="Serial port")
     parser.add_argument("--ci", action="store_true", help="CI mode - minimal output")
+    parser.add_argument("--replay", metavar="TRANSCRIPT",
+                        help="Parse a recorded esptool write_flash log and report progress/throughput")
+    parser.add_argument("--smart", action="store_true",
+                        help="Only write images/sectors whose flash digest differs from the local files")
+    parser.add_argument("--mock-flash", metavar="IMAGE",
+                        help="Smart-flash into a file standing in for the chip's flash (implies --smart)")
+    parser.add_argument("--baud", default="auto",
+                        help="Baud rate, or 'auto' to probe once per USB adapter and cache it (default)")
+    parser.add_argument("--reprobe", action="store_true", help="Ignore the cached baud rate and probe again")
+    parser.add_argument("--keep-nvs", action="store_true",
+                        help="Write the separate images rather than the merged one, which erases NVS and phy_init")
     args = parser.parse_args()
+    if args.target is None:
+        manifest = load_manifest()
+        args.target = manifest["target"] if manifest else "esp32"
 
     console = setup_console() if not args.ci else None
 
+    if args.replay:
+        show = None if args.ci else lambda region: print(f"{region.name}: {region.percent:.1f}%")
+        tracker = replay_transcript(args.replay, local_regions(args.target), show)
+        throughput_report(tracker.regions, console)
+        if tracker.error:
+            print(f"esptool reported: {tracker.error}")
+        sys.exit(1 if tracker.error else 0)
+
     if console and not args.ci:
         # Show header
+        from rich.panel import Panel
+        from rich.text import Text
         title = Text(f"ESP32 Firmware Flasher - {args.target}", style="bold blue")
         panel = Panel(title, border_style="blue")
         console.print(panel)
@@ -170,7 +841,9 @@ def main():
         sys.exit(1)
 
     # Flash firmware
-    success = flash_firmware(args.target, args.port, console, args.ci)
+    baud = args.baud if args.baud == "auto" else int(args.baud)
+    success = flash_firmware(args.target, args.port, console, args.ci, args.smart, args.mock_flash, baud, args.reprobe,
+                             args.keep_nvs)
 
     if not success:
         sys.exit(1)
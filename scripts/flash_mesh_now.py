@@ -5,47 +5,37 @@ Python version - Platform agnostic with TUI
 """
 
 import os
+import re
 import sys
-import subprocess
+import glob
+import time
+import shlex
+import tempfile
+import threading
+import importlib.util
 import argparse
 from pathlib import Path
 
-try:
-    from rich.console import Console
-    from rich.prompt import Prompt, IntPrompt
-    from rich.panel import Panel
-    from rich.text import Text
-    from rich.columns import Columns
-    from rich.table import Table
-    RICH_AVAILABLE = True
-except ImportError:
-    RICH_AVAILABLE = False
+from command_runner import command_log, echo_to, log_path, run
+
+# rich is imported where output is drawn, so --ci runs never load it
+RICH_AVAILABLE = importlib.util.find_spec("rich") is not None
 
 def setup_console():
     """Setup console for output"""
     if RICH_AVAILABLE:
+        from rich.console import Console
         return Console()
     else:
         return None
 
-def run_command(cmd, console=None, ci_mode=False, cwd=None):
-    """Run a command and return success"""
-    try:
-        if ci_mode:
-            result = subprocess.run(cmd, shell=True, cwd=cwd, capture_output=True, text=True)
-        else:
-            result = subprocess.run(cmd, shell=True, cwd=cwd, capture_output=True, text=True)
-
-        if result.returncode != 0:
-            if console and not ci_mode:
-                console.print(f"[red]Command failed: {cmd}[/red]")
-                console.print(f"[dim]{result.stderr}[/dim]")
-            return False, result.stderr
-        return True, result.stdout
-    except Exception as e:
-        if console and not ci_mode:
-            console.print(f"[red]Error running command: {e}[/red]")
-        return False, str(e)
+def run_command(cmd, console=None, ci_mode=False, cwd=None, on_line=None):
+    """Run a command and return success and its output (the last lines)"""
+    result = run(cmd, cwd=cwd, on_line=on_line, log=command_log("flash"))
+    if not result.ok and console and not ci_mode:
+        console.print(f"[red]Command failed ({result.reason()}): {cmd}[/red]")
+        console.print(f"[dim]Full output: {log_path('flash')}[/dim]")
+    return result.ok, result.error or result.output
 
 def find_firmware_dirs(search_path=None):
     """Find available firmware directories"""
@@ -75,6 +65,7 @@ def show_target_table(targets, console):
     if not console:
         return
 
+    from rich.table import Table
     table = Table(title="Available ESP32 Targets")
     table.add_column("ID", style="cyan", no_wrap=True)
     table.add_column("Target", style="magenta")
@@ -100,6 +91,7 @@ def select_target_interactive(targets, console):
     if not console:
         return None
 
+    from rich.prompt import IntPrompt
     while True:
         try:
             choice = IntPrompt.ask("Select target", choices=[str(i) for i in range(1, len(targets) + 1)])
@@ -119,18 +111,22 @@ def select_port(console, ci_mode=False):
         return "/dev/ttyUSB0" if os.name != 'nt' else "COM1"
 
     if console:
+        from rich.prompt import Prompt
         default_port = "/dev/ttyUSB0" if os.name != 'nt' else "COM1"
         port = Prompt.ask("Enter COM port", default=default_port)
         return port
     else:
         return "/dev/ttyUSB0" if os.name != 'nt' else "COM1"
 
-def flash_target(target_name, target_path, port, console, ci_mode=False):
+def flash_target(target_name, target_path, port, console, ci_mode=False, smart=False, baud="auto", keep_nvs=False):
     """Flash firmware for selected target"""
     if console and not ci_mode:
         console.print(f"[bold blue]Flashing {target_name} firmware...[/bold blue]")
         console.print()
 
+    # Resolved before the chdir, while target_path still points where it did
+    settings_args = " ".join(sdkconfig_flash_args(target_name, target_path))
+
     # Change to target directory
     original_cwd = Path.cwd()
     try:
@@ -144,13 +140,24 @@ def flash_target(target_name, target_path, port, console, ci_mode=False):
             cmd = f"{sys.executable} flash.py {target_name} {port}"
             if ci_mode:
                 cmd += " --ci"
+            if smart:
+                cmd += " --smart"
+            if keep_nvs:
+                cmd += " --keep-nvs"
+            cmd += f" --baud {baud}"
         else:
             if console and not ci_mode:
                 console.print("[yellow]Using manual flash command[/yellow]")
             # Manual flash command
-            cmd = f"""esptool.py --chip {target_name} --port {port} --baud 460800 --before default_reset --after hard_reset write_flash --flash_mode dio --flash_freq 40m --flash_size detect 0x0 bootloader.bin 0x8000 partition-table.bin 0x10000 mesh-now.bin"""
+            manual_baud = 460800 if baud == "auto" else baud
+            if (target_path / "mesh-now-merged.bin").exists() and not keep_nvs:
+                images = "--flash_mode keep --flash_freq keep --flash_size keep 0x0 mesh-now-merged.bin"
+            else:
+                bootloader_offset = BOOTLOADER_OFFSETS.get(target_name, 0x0)
+                images = f"{settings_args} {bootloader_offset:#x} bootloader.bin 0x8000 partition-table.bin 0x10000 mesh-now.bin"
+            cmd = f"""esptool.py --chip {target_name} --port {port} --baud {manual_baud} --before default_reset --after hard_reset write_flash --compress {images}"""
 
-        success, output = run_command(cmd, console, ci_mode)
+        success, output = run_command(cmd, console, ci_mode, on_line=echo_to(console, "   "))
 
         if success:
             if console and not ci_mode:
@@ -172,16 +179,390 @@ def flash_target(target_name, target_path, port, console, ci_mode=False):
     finally:
         os.chdir(original_cwd)
 
+# Fleet mode -----------------------------------------------------------------
+
+SERIAL_PORT_PATTERNS = [
+    "/dev/ttyUSB*", "/dev/ttyACM*",                       # Linux
+    "/dev/cu.usbserial*", "/dev/cu.usbmodem*",            # macOS
+    "/dev/cu.SLAB_USBtoUART*", "/dev/cu.wchusbserial*",
+]
+
+# Layout used when no flash.py/manifest is available; the ESP32 and S2 boot
+# from 0x1000, newer chips from 0x0
+BOOTLOADER_OFFSETS = {"esp32": 0x1000, "esp32s2": 0x1000}
+APP_REGIONS = [(0x8000, "partition-table.bin"), (0x10000, "mesh-now.bin")]
+
+KNOWN_TARGETS = ["esp32", "esp32s2", "esp32s3", "esp32c2", "esp32c3", "esp32c6", "esp32h2"]
+
+CHIP_PATTERNS = [
+    re.compile(r"Detecting chip type\.*\s*(ESP32[\w-]*)"),
+    re.compile(r"Chip type:\s*(ESP32[\w-]*)"),
+    re.compile(r"Chip is (ESP32[\w-]*)"),
+]
+
+FATAL_PATTERN = re.compile(r"A fatal error occurred:\s*(.*)")
+
+
+def enumerate_ports(patterns=None):
+    """Expand port names/globs; with none given, find USB serial adapters"""
+    if not patterns:
+        if os.name == 'nt':
+            try:
+                from serial.tools import list_ports
+                return sorted(p.device for p in list_ports.comports())
+            except ImportError:
+                return []
+        patterns = SERIAL_PORT_PATTERNS
+
+    ports = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if matches:
+            ports.extend(matches)
+        elif not glob.has_magic(pattern):
+            ports.append(pattern)
+    # Keep order, drop duplicates
+    return list(dict.fromkeys(ports))
+
+
+def chip_to_target(chip_name):
+    """Map esptool's chip name (e.g. ESP32-S3, ESP32-D0WD-V3) to a build target"""
+    name = chip_name.lower().replace("-", "")
+    matches = [t for t in KNOWN_TARGETS if name.startswith(t)]
+    return max(matches, key=len) if matches else None
+
+
+def parse_chip_name(output):
+    """Return the chip name reported in esptool output, or None"""
+    for pattern in CHIP_PATTERNS:
+        match = pattern.search(output)
+        if match:
+            return match.group(1).rstrip("-")
+    return None
+
+
+def esptool_command(esptool):
+    """Command prefix for esptool; --esptool may include arguments"""
+    return shlex.split(esptool, posix=os.name != 'nt')
+
+
+class FleetJob:
+    """State of one port in a fleet flash"""
+
+    def __init__(self, port):
+        self.port = port
+        self.chip = None
+        self.target = None
+        self.baud = None
+        self.status = "queued"
+        self.progress = 0.0
+        self.detail = ""
+        self.started = None
+        self.finished = None
+        self.ok = False
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+
+def run_esptool(args, on_line=None, timeout=None, cancel_event=None):
+    """Run esptool for a fleet job, feeding each output line to on_line; returns (code, output)"""
+    result = run(args, on_line=on_line, timeout=timeout, cancel_event=cancel_event, log=command_log("fleet"))
+    if result.error:
+        return -1, result.error
+    if result.timed_out:
+        return -1, f"{result.output}\nA fatal error occurred: esptool timed out after {timeout}s"
+    if result.cancelled:
+        return -1, f"{result.output}\nA fatal error occurred: cancelled"
+    return result.returncode, result.output
+
+
+def last_error(output):
+    """Best one-line explanation of an esptool failure"""
+    match = FATAL_PATTERN.search(output)
+    if match:
+        return match.group(1).strip()
+    lines = [line for line in output.splitlines() if line.strip()]
+    return lines[-1].strip() if lines else "no output"
+
+
+def load_flash_module(target_path):
+    """Import flash.py from next to this script or from the firmware directory"""
+    for candidate in (Path(__file__).resolve().parent / "flash.py", Path(target_path) / "flash.py"):
+        if candidate.exists():
+            # flash.py imports command_runner from its own directory
+            if str(candidate.parent) not in sys.path:
+                sys.path.append(str(candidate.parent))
+            spec = importlib.util.spec_from_file_location("mesh_now_flash", candidate)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            return module
+    return None
+
+
+def sdkconfig_flash_args(target, target_path):
+    """--flash_mode/--flash_freq/--flash_size from the target's sdkconfig, via flash.py"""
+    flash_module = load_flash_module(target_path)
+    if flash_module is None or not hasattr(flash_module, "flash_settings"):
+        # The build wrote the image headers from the same sdkconfig
+        return ["--flash_mode", "keep", "--flash_freq", "keep", "--flash_size", "keep"]
+    return flash_module.flash_settings_args(flash_module.flash_settings(target, target_path))
+
+
+def fleet_images(job, target_path, smart=False, keep_nvs=False):
+    """(offset, path) images for one port and the flash args they need (None
+    for the sdkconfig ones); a merged image is written in one go unless
+    keep_nvs asks to leave the nvs and phy_init partitions alone"""
+    flash_module = load_flash_module(target_path)
+    if flash_module is None or not hasattr(flash_module, "full_flash_images"):
+        regions = [(BOOTLOADER_OFFSETS.get(job.target, 0x0), "bootloader.bin")] + APP_REGIONS
+        return [(offset, target_path / name) for offset, name in regions], None
+
+    mismatches = flash_module.manifest_mismatches(target_path)
+    if mismatches:
+        raise ValueError(f"{', '.join(mismatches)} differ from manifest")
+    if smart:
+        # Digests are compared image by image
+        regions = flash_module.firmware_regions(job.target, target_path)
+        return [(offset, target_path / name) for offset, name in regions], None
+    images, flash_args = flash_module.full_flash_images(job.target, target_path, keep_nvs)
+    return [(offset, path) for offset, _, path in images], flash_args
+
+
+def fleet_link_settings(job, target_path, baud, esptool):
+    """Baud rate and flash mode/freq/size args for one port, tuned via flash.py when it can,
+    and whether the rate came from tuning (so a failed write may step it down)"""
+    flash_module = load_flash_module(target_path)
+    if flash_module is None or not hasattr(flash_module, "tuned_baud"):
+        fallback = 460800 if baud == "auto" else baud
+        return fallback, sdkconfig_flash_args(job.target, target_path), False
+
+    entry = None
+    if baud == "auto":
+        job.status = "tuning"
+        entry = flash_module.tuned_baud(job.target, job.port, esptool=esptool)
+        baud = entry["baud"] if entry else flash_module.DEFAULT_BAUD
+    return baud, sdkconfig_flash_args(job.target, target_path), entry is not None
+
+
+def plan_fleet_smart_flash(job, target_path, regions, baud):
+    """Smart-flash plan for one port via flash.py, or None to write everything"""
+    flash_module = load_flash_module(target_path)
+    if flash_module is None or not hasattr(flash_module, "plan_smart_flash"):
+        job.detail = "flash.py without smart mode; full write"
+        return None
+    job.status = "comparing"
+    try:
+        backend = flash_module.EsptoolBackend(job.target, job.port, baud)
+    except ImportError:
+        job.detail = "esptool library unavailable; full write"
+        return None
+    try:
+        images = [(offset, path.name, path.read_bytes()) for offset, path in regions]
+        return flash_module.plan_smart_flash(backend, images)
+    finally:
+        backend.close()
+
+
+def flash_fleet_port(job, firmware_dirs, esptool, baud, stop_event, smart=False, keep_nvs=False):
+    """Detect the chip on one port and flash the matching firmware"""
+    job.started = time.monotonic()
+    try:
+        if stop_event.is_set():
+            job.status, job.detail = "skipped", "cancelled"
+            return job
+
+        job.status = "detecting"
+        code, output = run_esptool(esptool_command(esptool) + ["--port", job.port, "chip_id"], timeout=60,
+                                   cancel_event=stop_event)
+        job.chip = parse_chip_name(output)
+        if code != 0 and not job.chip:
+            job.status, job.detail = "failed", f"detect: {last_error(output)}"
+            return job
+        job.target = chip_to_target(job.chip) if job.chip else None
+        if job.target not in firmware_dirs:
+            job.status = "failed"
+            job.detail = f"no firmware for {job.target or job.chip or 'unknown chip'}"
+            return job
+
+        target_path = firmware_dirs[job.target]
+        regions, image_flash_args = fleet_images(job, target_path, smart, keep_nvs)
+        missing = [str(path.name) for _, path in regions if not path.exists()]
+        if missing:
+            job.status, job.detail = "failed", f"missing {', '.join(missing)}"
+            return job
+
+        baud, flash_args, tuned = fleet_link_settings(job, target_path, baud, esptool)
+        flash_args = image_flash_args or flash_args
+        job.baud = baud
+        with tempfile.TemporaryDirectory(prefix="mesh-now-fleet-") as tmp:
+            if smart:
+                plan = plan_fleet_smart_flash(job, target_path, regions, baud)
+                if plan is not None:
+                    if not plan.writes:
+                        job.status, job.progress, job.ok, job.detail = "done", 1.0, True, "up to date"
+                        return job
+                    regions = []
+                    for index, (offset, _, data) in enumerate(plan.writes):
+                        path = Path(tmp) / f"{index:02d}.bin"
+                        path.write_bytes(data)
+                        regions.append((offset, path))
+                    flash_args = ["--flash_mode", "keep", "--flash_freq", "keep", "--flash_size", "keep"]
+                    job.detail = f"{len(plan.writes)} write(s), {plan.bytes_to_write / 1024:.0f} KB"
+
+            flash_module = load_flash_module(target_path)
+            while True:
+                # flash.py's parser knows both esptool v4 and v5 output and weights
+                # progress by image size, so the app dominates like it does in time
+                tracker = None
+                if flash_module is not None and hasattr(flash_module, "EsptoolProgress"):
+                    tracker = flash_module.EsptoolProgress(
+                        [flash_module.FlashRegion(offset, path.name, path.stat().st_size) for offset, path in regions])
+
+                def on_line(line):
+                    if tracker is not None and tracker.feed(line):
+                        job.progress = tracker.total_percent / 100.0
+
+                job.status, job.progress = "flashing", 0.0
+                args = esptool_command(esptool) + [
+                    "--chip", job.target, "--port", job.port, "--baud", str(baud),
+                    "--before", "default_reset", "--after", "hard_reset",
+                    "write_flash", "--compress",
+                ] + flash_args
+                for offset, path in regions:
+                    args += [hex(offset), str(path)]
+                code, output = run_esptool(args, on_line, timeout=600, cancel_event=stop_event)
+                if code == 0 or not tuned or stop_event.is_set():
+                    break
+                # The cached rate stopped working; step down once and try again, as flash.py does
+                lower = flash_module.demote_baud(job.target, job.port, baud)
+                if lower is None:
+                    break
+                job.detail = f"retried at {lower} baud after {baud}"
+                baud = job.baud = lower
+                tuned = False
+            if code != 0:
+                job.status, job.detail = "failed", f"flash: {last_error(output)}"
+                return job
+
+        job.status, job.progress, job.ok = "done", 1.0, True
+        return job
+    except Exception as e:
+        job.status, job.detail = "failed", str(e)
+        return job
+    finally:
+        job.finished = time.monotonic()
+
+
+def fleet_table(jobs, title):
+    """Rich table of fleet job states"""
+    from rich.table import Table
+
+    styles = {"done": "green", "failed": "red", "skipped": "yellow", "flashing": "cyan",
+              "detecting": "blue", "tuning": "blue", "comparing": "blue"}
+    table = Table(title=title)
+    table.add_column("Port", style="cyan", no_wrap=True)
+    table.add_column("Chip", style="magenta")
+    table.add_column("Baud", justify="right")
+    table.add_column("Status")
+    table.add_column("Progress", justify="right")
+    table.add_column("Time", justify="right")
+    table.add_column("Detail", style="dim")
+    for job in jobs:
+        style = styles.get(job.status, "white")
+        table.add_row(job.port, job.chip or "-", str(job.baud or "-"), f"[{style}]{job.status}[/{style}]",
+                      f"{job.progress * 100:.0f}%", f"{job.elapsed:.1f}s", job.detail)
+    return table
+
+
+def print_fleet_summary(jobs, wall_time, console):
+    """Final pass/fail table"""
+    passed = sum(1 for job in jobs if job.ok)
+    if console:
+        console.print(fleet_table(jobs, "Fleet flash summary"))
+        style = "green" if passed == len(jobs) else "red"
+        console.print(f"[{style}]{passed}/{len(jobs)} ports flashed in {wall_time:.1f}s[/{style}]")
+        return
+
+    print(f"{'PORT':<24} {'CHIP':<12} {'BAUD':>8} {'RESULT':<8} {'TIME':>7}  DETAIL")
+    for job in jobs:
+        result = "PASS" if job.ok else "FAIL"
+        print(f"{job.port:<24} {job.chip or '-':<12} {job.baud or '-':>8} {result:<8} {job.elapsed:>6.1f}s  {job.detail}")
+    print(f"{passed}/{len(jobs)} ports flashed in {wall_time:.1f}s")
+
+
+def run_fleet(ports, firmware_dirs, esptool, jobs_limit, baud, console, ci_mode=False, smart=False,
+              keep_nvs=False):
+    """Flash every port concurrently with at most jobs_limit esptool processes"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    jobs = [FleetJob(port) for port in ports]
+    stop_event = threading.Event()
+    start = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs_limit)) as pool:
+        futures = [pool.submit(flash_fleet_port, job, firmware_dirs, esptool, baud, stop_event, smart, keep_nvs)
+                   for job in jobs]
+        try:
+            if console and not ci_mode:
+                from rich.live import Live
+                with Live(fleet_table(jobs, "Fleet flash"), console=console, refresh_per_second=4) as live:
+                    while not all(f.done() for f in futures):
+                        live.update(fleet_table(jobs, "Fleet flash"))
+                        time.sleep(0.25)
+                    live.update(fleet_table(jobs, "Fleet flash"))
+            else:
+                reported = {}
+                while True:
+                    finished = all(f.done() for f in futures)
+                    for job in jobs:
+                        if reported.get(job.port) != job.status:
+                            reported[job.port] = job.status
+                            if not ci_mode:
+                                print(f"[{job.port}] {job.status} {job.detail}".rstrip())
+                    if finished:
+                        break
+                    time.sleep(0.25)
+        except KeyboardInterrupt:
+            # Running esptool processes see the event and are stopped by the runner
+            stop_event.set()
+            raise
+
+    wall_time = time.monotonic() - start
+    if console and not ci_mode:
+        console.print()
+    print_fleet_summary(jobs, wall_time, None if ci_mode else console)
+    return all(job.ok for job in jobs)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Universal Mesh-NOW flash tool")
     parser.add_argument("firmware_dir", nargs="?", help="Path to firmware directory")
     parser.add_argument("--ci", action="store_true", help="CI mode - minimal output")
+    parser.add_argument("--fleet", nargs="*", metavar="PORT",
+                        help="Flash many boards at once; ports or globs (default: all USB serial ports)")
+    parser.add_argument("--jobs", type=int, default=8, help="Fleet mode: concurrent esptool processes")
+    parser.add_argument("--baud", default="auto",
+                        help="Baud rate, or 'auto' to probe once per USB adapter and cache it (default)")
+    parser.add_argument("--smart", action="store_true",
+                        help="Only write images/sectors whose flash digest differs (needs esptool installed as a library)")
+    parser.add_argument("--keep-nvs", action="store_true",
+                        help="Write the separate images rather than the merged one, which erases NVS and phy_init")
+    parser.add_argument("--esptool", default=os.environ.get("MESH_NOW_ESPTOOL", "esptool.py"),
+                        help="esptool command (e.g. 'python fake_esptool.py' for testing)")
     args = parser.parse_args()
+    if args.baud != "auto":
+        args.baud = int(args.baud)
 
     console = setup_console() if not args.ci else None
 
     if console and not args.ci:
         # Show header
+        from rich.panel import Panel
+        from rich.text import Text
         title = Text("Mesh-NOW Universal Flash Tool", style="bold blue")
         subtitle = Text("Cross-platform ESP32 firmware flasher", style="dim")
         panel = Panel(f"{title}\n{subtitle}", border_style="blue")
@@ -206,6 +587,20 @@ def main():
         console.print(f"[green]Found {len(firmware_dirs)} firmware target(s)[/green]")
         show_target_table(firmware_dirs, console)
 
+    if args.fleet is not None:
+        ports = enumerate_ports(args.fleet)
+        if not ports:
+            if console and not args.ci:
+                console.print("[red]No serial ports found for fleet mode[/red]")
+            else:
+                print("No serial ports found for fleet mode")
+            sys.exit(1)
+        if console and not args.ci:
+            console.print(f"[dim]Flashing {len(ports)} port(s), {min(args.jobs, len(ports))} at a time[/dim]")
+        success = run_fleet(ports, firmware_dirs, args.esptool, min(args.jobs, len(ports)),
+                            args.baud, console, args.ci, args.smart, args.keep_nvs)
+        sys.exit(0 if success else 1)
+
     # Select target
     if len(firmware_dirs) == 1:
         # Only one target, use it
@@ -233,7 +628,8 @@ def main():
         console.print()
 
     # Flash the target
-    success = flash_target(target_name, target_path, port, console, args.ci)
+    success = flash_target(target_name, target_path, port, console, args.ci, args.smart, args.baud,
+                           args.keep_nvs)
 
     if not success:
         sys.exit(1)
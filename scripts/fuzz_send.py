@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Mesh-NOW /send Fuzzer
+Generate a /send body corpus and replay it against a node
+
+The corpus combines hand-written edge cases (broken percent escapes, batch
+forms, oversized values cut inside UTF-8 sequences, JSON escapes, surrogate
+pairs, deep nesting) with seeded random mutations of them. Every case records
+the status and messages the firmware decoder must produce, computed by the
+reference model in send_decoder.py.
+
+Replaying checks that each response status matches, that the node stays
+responsive, and (with --check-loopback) that the messages echoed into
+/messages are exactly the decoded ones. With no --url a local stand-in node
+is started.
+"""
+
+import sys
+import json
+import random
+import argparse
+from pathlib import Path
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from send_decoder import (MAX_MESSAGE_BYTES, SEND_BATCH_MAX, SEND_BODY_LIMIT,
+                          decode_send_body, expected_status)
+from standin_node import StandinNode, StandinServer
+
+FORM = "application/x-www-form-urlencoded"
+JSON = "application/json"
+
+MUTATION_BYTES = b"%&=+\"\\{}[]:,0aF\x00\x7f\xc3\xa9\xe2\x82\xac\xf0\x9f\x98\x80"
+
+
+def seed_cases():
+    """Hand-written (name, content_type, body) cases"""
+    long_ascii = b"a" * (MAX_MESSAGE_BYTES + 20)
+    cut_two = b"a" * (MAX_MESSAGE_BYTES - 1) + "é".encode()          # 2-byte char straddles the cap
+    cut_four = b"a" * (MAX_MESSAGE_BYTES - 2) + "😀".encode()         # 4-byte char straddles the cap
+    batch = b"&".join(b"messages[]=m%d" % i for i in range(SEND_BATCH_MAX + 4))
+
+    return [
+        ("form-simple", FORM, b"message=hello"),
+        ("form-plus", FORM, b"message=hello+mesh+world"),
+        ("form-escapes", FORM, b"message=caf%C3%A9%20%26%3D%2B"),
+        ("form-lower-hex", FORM, b"message=%e2%82%ac"),
+        ("form-bad-escape", FORM, b"message=100%+sure%zz"),
+        ("form-half-escape", FORM, b"message=abc%4"),
+        ("form-trailing-pct", FORM, b"message=abc%"),
+        ("form-half-escape-amp", FORM, b"message=a%4&message=b"),
+        ("form-encoded-key", FORM, b"m%65ssage=encoded+key"),
+        ("form-other-keys", FORM, b"foo=bar&message=x&baz=qux"),
+        ("form-empty", FORM, b""),
+        ("form-empty-value", FORM, b"message=&message=kept"),
+        ("form-no-equals", FORM, b"message"),
+        ("form-double-equals", FORM, b"message=a=b"),
+        ("form-long-key", FORM, b"messagemessagemessage=x"),
+        ("form-batch", FORM, b"messages[]=one&messages[]=two&messages=three"),
+        ("form-batch-encoded", FORM, b"messages%5B%5D=one&messages%5b%5d=two"),
+        ("form-batch-overflow", FORM, batch),
+        ("form-long", FORM, b"message=" + long_ascii),
+        ("form-cut-utf8-2", FORM, b"message=" + cut_two),
+        ("form-cut-utf8-4", FORM, b"message=" + cut_four),
+        ("form-raw-utf8", FORM, "message=héllo wörld".encode()),
+        ("form-nul", FORM, b"message=a%00b"),
+        ("form-limit", FORM, b"message=" + b"x" * (SEND_BODY_LIMIT - 8)),
+        ("form-over-limit", FORM, b"message=" + b"x" * SEND_BODY_LIMIT),
+        ("json-simple", JSON, b'{"message":"hello"}'),
+        ("json-space", JSON, b' \n{ "message" :\t"hello" } \r\n'),
+        ("json-batch", JSON, b'{"messages":["one","two","three"]}'),
+        ("json-both", JSON, b'{"message":"a","messages":["b"],"message":"c"}'),
+        ("json-escapes", JSON, b'{"message":"q\\"b\\\\s\\/n\\nt\\tu\\u00e9"}'),
+        ("json-surrogates", JSON, b'{"message":"\\ud83d\\ude00"}'),
+        ("json-lone-high", JSON, b'{"message":"a\\ud83db"}'),
+        ("json-lone-low", JSON, b'{"message":"\\ude00"}'),
+        ("json-high-high", JSON, b'{"message":"\\ud83d\\ud83d\\ude00"}'),
+        ("json-literals", JSON, b'{"n":1.5e3,"t":true,"f":false,"z":null,"message":"x"}'),
+        ("json-nested-ignored", JSON, b'{"meta":{"message":"no"},"messages":[{"message":"no"},["no"],"yes"]}'),
+        ("json-messages-string", JSON, b'{"messages":"not an array"}'),
+        ("json-message-number", JSON, b'{"message":42}'),
+        ("json-deep", JSON, b'{"a":' + b"[" * 7 + b"]" * 7 + b',"message":"ok"}'),
+        ("json-too-deep", JSON, b'{"a":' + b"[" * 8 + b"]" * 8 + b"}"),
+        ("json-long", JSON, b'{"message":"' + long_ascii + b'"}'),
+        ("json-cut-utf8", JSON, b'{"message":"' + cut_four + b'"}'),
+        ("json-batch-overflow", JSON,
+         b'{"messages":[' + b",".join(b'"m%d"' % i for i in range(SEND_BATCH_MAX + 4)) + b"]}"),
+        ("json-empty-object", JSON, b"{}"),
+        ("json-empty-body", JSON, b""),
+        ("json-array-top", JSON, b'["hello"]'),
+        ("json-unterminated", JSON, b'{"message":"hello'),
+        ("json-trailing", JSON, b'{"message":"hello"} x'),
+        ("json-trailing-comma", JSON, b'{"message":"hello",}'),
+        ("json-missing-colon", JSON, b'{"message" "hello"}'),
+        ("json-bad-escape", JSON, b'{"message":"\\x41"}'),
+        ("json-bad-unicode", JSON, b'{"message":"\\u12g4"}'),
+        ("json-control-char", JSON, b'{"message":"a\nb"}'),
+        ("json-charset", JSON + "; charset=utf-8", b'{"message":"typed"}'),
+        ("json-as-form", FORM, b'{"message":"hello"}'),
+    ]
+
+
+def mutate(rng, body):
+    body = bytearray(body)
+    for _ in range(rng.randint(1, 4)):
+        op = rng.randrange(5)
+        pos = rng.randint(0, len(body))
+        if op == 0 and body:
+            body[min(pos, len(body) - 1)] = rng.randrange(256)
+        elif op == 1:
+            body[pos:pos] = bytes([rng.choice(MUTATION_BYTES)])
+        elif op == 2 and body:
+            del body[pos:pos + rng.randint(1, 8)]
+        elif op == 3:
+            body = body[:pos]
+        else:
+            end = rng.randint(pos, len(body))
+            body[pos:pos] = body[pos:end] * rng.randint(1, 4)
+    return bytes(body[:SEND_BODY_LIMIT + 64])
+
+
+def build_corpus(seed, count):
+    """Return corpus entries with their expected outcome"""
+    rng = random.Random(seed)
+    seeds = seed_cases()
+    cases = list(seeds)
+    for i in range(count):
+        name, content_type, body = rng.choice(seeds)
+        cases.append((f"mut{i:05d}-{name}", content_type, mutate(rng, body)))
+
+    corpus = []
+    for name, content_type, body in cases:
+        status = expected_status(body, content_type)
+        messages, dropped = [], 0
+        if status == 200:
+            messages, dropped = decode_send_body(body, content_type)
+        corpus.append({
+            "name": name,
+            "content_type": content_type,
+            "body": body,
+            "status": status,
+            "messages": messages,
+            "dropped": dropped,
+        })
+    return corpus
+
+
+def save_corpus(corpus, out_dir):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = []
+    for index, case in enumerate(corpus):
+        filename = f"{index:05d}-{case['name']}.bin"
+        (out_dir / filename).write_bytes(case["body"])
+        manifest.append({
+            "file": filename,
+            "content_type": case["content_type"],
+            "status": case["status"],
+            "messages": [m.hex() for m in case["messages"]],
+            "dropped": case["dropped"],
+        })
+    (out_dir / "manifest.json").write_text(json.dumps(manifest, indent=1))
+
+
+def load_corpus(corpus_dir):
+    corpus_dir = Path(corpus_dir)
+    corpus = []
+    for entry in json.loads((corpus_dir / "manifest.json").read_text()):
+        corpus.append({
+            "name": entry["file"],
+            "content_type": entry["content_type"],
+            "body": (corpus_dir / entry["file"]).read_bytes(),
+            "status": entry["status"],
+            "messages": [bytes.fromhex(m) for m in entry["messages"]],
+            "dropped": entry["dropped"],
+        })
+    return corpus
+
+
+def post(base_url, case, timeout):
+    request = Request(f"{base_url}/send", data=case["body"], headers={"Content-Type": case["content_type"]})
+    try:
+        with urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except HTTPError as e:
+        return e.code
+
+
+def fetch_messages(base_url, since, timeout):
+    """Return (contents, cursor) for everything after since"""
+    contents = []
+    while True:
+        with urlopen(f"{base_url}/messages?since={since}&limit=25", timeout=timeout) as response:
+            data = json.load(response)
+        contents.extend(m["content"] for m in data.get("messages", []))
+        since = data.get("next", since)
+        if not data.get("more"):
+            return contents, since
+
+
+def alive(base_url, timeout):
+    try:
+        with urlopen(f"{base_url}/peers", timeout=timeout) as response:
+            response.read()
+        return True
+    except (URLError, OSError):
+        return False
+
+
+def replay(corpus, base_url, check_loopback, timeout):
+    failures = []
+    cursor = 0
+    if check_loopback:
+        _, cursor = fetch_messages(base_url, 0, timeout)
+
+    for index, case in enumerate(corpus):
+        try:
+            status = post(base_url, case, timeout)
+        except (URLError, OSError) as e:
+            status = None
+            failures.append((case["name"], f"request failed: {e}"))
+        if status is not None and status != case["status"]:
+            failures.append((case["name"], f"status {status}, expected {case['status']}"))
+
+        if check_loopback and status == 200:
+            echoed, cursor = fetch_messages(base_url, cursor, timeout)
+            wanted = [m.decode("utf-8", "replace") for m in case["messages"]]
+            if echoed != wanted:
+                failures.append((case["name"], f"echoed {echoed!r}, expected {wanted!r}"))
+
+        if (index + 1) % 50 == 0 or status is None:
+            if not alive(base_url, timeout):
+                failures.append((case["name"], "node stopped responding"))
+                return failures
+    if not alive(base_url, timeout):
+        failures.append(("<end>", "node stopped responding"))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate and replay a /send fuzz corpus")
+    parser.add_argument("--url", help="Node to fuzz (default: start a local stand-in)")
+    parser.add_argument("--corpus", help="Replay an existing corpus directory instead of generating one")
+    parser.add_argument("--out", help="Write the generated corpus to this directory")
+    parser.add_argument("--seed", type=int, default=1, help="Mutation seed")
+    parser.add_argument("--count", type=int, default=500, help="Number of mutated cases")
+    parser.add_argument("--check-loopback", action="store_true",
+                        help="Compare /messages echoes with the decoded messages (implied for the stand-in)")
+    parser.add_argument("--generate-only", action="store_true", help="Write --out and exit")
+    parser.add_argument("--timeout", type=float, default=5.0, help="Per-request timeout in seconds")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else build_corpus(args.seed, args.count)
+    if args.out:
+        save_corpus(corpus, args.out)
+        print(f"Wrote {len(corpus)} cases to {args.out}")
+    if args.generate_only:
+        return
+
+    server = None
+    base_url = args.url
+    check_loopback = args.check_loopback
+    if not base_url:
+        server = StandinServer(StandinNode(loopback=True))
+        base_url = server.start()
+        check_loopback = True
+        print(f"Started stand-in node at {base_url}")
+
+    try:
+        failures = replay(corpus, base_url, check_loopback, args.timeout)
+    finally:
+        if server:
+            server.stop()
+
+    statuses = {}
+    for case in corpus:
+        statuses[case["status"]] = statuses.get(case["status"], 0) + 1
+    print(f"Replayed {len(corpus)} cases: " + ", ".join(f"{n} x {s}" for s, n in sorted(statuses.items())))
+    for name, reason in failures[:20]:
+        print(f"  FAIL {name}: {reason}")
+    if len(failures) > 20:
+        print(f"  ... {len(failures) - 20} more")
+    print("No failures" if not failures else f"{len(failures)} failures")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Mesh-NOW Group Forwarding Simulation
+Compare flooding group messages with mesh_groups.c's filtered forwarding
+
+Places nodes at random in a square, links those within radio range and
+subscribes them to groups clustered around a few points (or, with
+--scatter, anywhere). The nodes then exchange beacons until their group
+levels settle, as mesh_groups.c builds them, and every group message is
+propagated twice: flooded, with every node re-broadcasting its first copy
+while hops remain, and filtered by mesh_groups_should_forward(). Both runs
+must reach the same subscribers; the report gives the transmissions and
+airtime each costs.
+
+    python scripts/group_sim.py
+    python scripts/group_sim.py --nodes 80 --groups 8 --seed 7 --json groups.json
+    python scripts/group_sim.py --scatter --legacy 0.1 --ci
+
+--legacy makes a fraction of the nodes run firmware from before groups:
+they flood and beacon without levels, so nodes next to them flood too.
+"""
+
+import sys
+import json
+import math
+import random
+import argparse
+import importlib.util
+from pathlib import Path
+from collections import Counter
+
+# rich is imported where it is used; see meshnow/__init__.py
+RICH_AVAILABLE = importlib.util.find_spec("rich") is not None
+
+# Mirrors mesh_now.h / mesh_groups.h
+DEFAULT_ROUTE_TTL = 3
+MESH_GROUP_LEVELS = DEFAULT_ROUTE_TTL - 1
+MESH_GROUP_COUNT = 256
+MESH_MESSAGE_SIZE = 152       # sizeof(mesh_message_t)
+
+# A broadcast ESP-NOW frame at 1 Mbps: long preamble and PLCP header, then
+# the 802.11 action frame header, vendor element and FCS around the payload
+PHY_OVERHEAD_US = 192
+FRAME_OVERHEAD_BYTES = 24 + 1 + 3 + 4 + 1 + 1 + 3 + 1 + 4
+FRAME_AIRTIME_US = PHY_OVERHEAD_US + (FRAME_OVERHEAD_BYTES + MESH_MESSAGE_SIZE) * 8
+
+COLUMNS = ("Group", "Subscribers", "Messages", "Delivered", "Flood tx", "Filtered tx", "Saved", "Airtime saved")
+
+
+class Node:
+    def __init__(self, index, x, y, legacy=False):
+        self.index = index
+        self.x = x
+        self.y = y
+        self.legacy = legacy
+        self.groups = {0}
+        self.neighbours = []
+        # Levels each neighbour's last beacon carried, None for a legacy beacon
+        self.heard = {}
+
+    def beacon(self):
+        """Group levels this node beacons, as mesh_groups_write_beacon()"""
+        if self.legacy:
+            return None
+        levels = [set(self.groups)] + [set() for _ in range(MESH_GROUP_LEVELS - 1)]
+        for levels_heard in self.heard.values():
+            for d in range(1, MESH_GROUP_LEVELS):
+                levels[d] |= set(range(MESH_GROUP_COUNT)) if levels_heard is None else levels_heard[d - 1]
+        return levels
+
+    def should_forward(self, group, hop_count):
+        """mesh_groups_should_forward(), or always for older firmware"""
+        if hop_count < 2:
+            return False
+        if self.legacy:
+            return True
+        reach = hop_count - 1
+        if reach > MESH_GROUP_LEVELS:
+            return True
+        if not self.heard:
+            return True
+        for levels in self.heard.values():
+            if levels is None or any(group in levels[d] for d in range(reach)):
+                return True
+        return False
+
+
+def build_mesh(count, radio_range, rng, legacy):
+    """Random geometric graph, redrawn until it is connected"""
+    for _ in range(1000):
+        nodes = [Node(i, rng.random(), rng.random(), rng.random() < legacy) for i in range(count)]
+        for a in nodes:
+            a.neighbours = [b for b in nodes if b is not a and math.dist((a.x, a.y), (b.x, b.y)) <= radio_range]
+        if len(reach_from(nodes[0], count)) == count:
+            return nodes
+    raise SystemExit(f"no connected mesh of {count} nodes with --range {radio_range}; raise it")
+
+
+def reach_from(origin, hops):
+    """Hop distance of every node within hops of origin"""
+    distance = {origin.index: 0}
+    frontier = [origin]
+    for hop in range(1, hops + 1):
+        frontier = [n for node in frontier for n in node.neighbours if n.index not in distance]
+        for n in frontier:
+            distance.setdefault(n.index, hop)
+    return distance
+
+
+def subscribe(nodes, groups, rng, scatter, cluster_radius, share):
+    """Give each of groups 1..groups its subscribers; returns {group: [node indices]}"""
+    members = {}
+    for group in range(1, groups + 1):
+        if scatter:
+            chosen = [n for n in nodes if rng.random() < share]
+        else:
+            cx, cy = rng.random(), rng.random()
+            chosen = [n for n in nodes if math.dist((n.x, n.y), (cx, cy)) <= cluster_radius and rng.random() < share * 4]
+        if not chosen:
+            chosen = [rng.choice(nodes)]
+        for n in chosen:
+            n.groups.add(group)
+        members[group] = sorted(n.index for n in chosen)
+    return members
+
+
+def exchange_beacons(nodes, max_rounds=16):
+    """Beacon rounds until every node's neighbour table stops changing; returns how many"""
+    for rounds in range(1, max_rounds + 1):
+        beacons = [node.beacon() for node in nodes]
+        changed = False
+        for node in nodes:
+            for n in node.neighbours:
+                if node.heard.get(n.index, "unheard") != beacons[n.index]:
+                    node.heard[n.index] = beacons[n.index]
+                    changed = True
+        if not changed:
+            return rounds
+    return max_rounds
+
+
+def propagate(nodes, origin, group, filtered):
+    """(subscribers reached, transmissions) for one group message from origin
+
+    Each node acts on the first copy it hears, which in a hop-by-hop model is
+    the one with the most hops left, and drops the rest as seen.
+    """
+    transmissions = 1
+    hop_count = {origin.index: DEFAULT_ROUTE_TTL}
+    frontier = [origin]
+    while frontier:
+        heard = []
+        for sender in frontier:
+            for n in sender.neighbours:
+                if n.index not in hop_count:
+                    hop_count[n.index] = hop_count[sender.index] - (0 if sender is origin else 1)
+                    heard.append(n)
+        frontier = []
+        for node in heard:
+            hops = hop_count[node.index]
+            if hops > 1 and (not filtered or node.should_forward(group, hops)):
+                transmissions += 1
+                frontier.append(node)
+    reached = {i for i in hop_count if i != origin.index and group in nodes[i].groups}
+    return reached, transmissions
+
+
+def simulate(args):
+    rng = random.Random(args.seed)
+    nodes = build_mesh(args.nodes, args.range, rng, args.legacy)
+    members = subscribe(nodes, args.groups, rng, args.scatter, args.cluster, args.share)
+    rounds = exchange_beacons(nodes)
+
+    results = {}
+    mismatches = []
+    for group, indices in members.items():
+        stats = Counter()
+        for _ in range(args.messages):
+            # Members mostly talk to their own group
+            origin = nodes[rng.choice(indices)] if rng.random() < 0.9 else rng.choice(nodes)
+            flood_reached, flood_tx = propagate(nodes, origin, group, filtered=False)
+            reached, tx = propagate(nodes, origin, group, filtered=True)
+            if reached != flood_reached:
+                mismatches.append(f"group {group} from node {origin.index}: filtered reached {len(reached)}, "
+                                  f"flooding {len(flood_reached)}")
+            stats["delivered"] += len(reached)
+            stats["flood_tx"] += flood_tx
+            stats["filtered_tx"] += tx
+        results[group] = dict(stats, subscribers=len(indices), messages=args.messages)
+    return {
+        "nodes": args.nodes,
+        "legacy_nodes": sum(n.legacy for n in nodes),
+        "mean_neighbours": round(sum(len(n.neighbours) for n in nodes) / len(nodes), 1),
+        "beacon_rounds": rounds,
+        "frame_airtime_us": FRAME_AIRTIME_US,
+        "groups": results,
+    }, mismatches
+
+
+# Reporting --------------------------------------------------------------------
+
+def saved(flood, filtered):
+    return f"{100 * (flood - filtered) / flood:.0f}%" if flood else "-"
+
+
+def rows(summary):
+    total = Counter()
+    for group, r in summary["groups"].items():
+        for key in ("subscribers", "messages", "delivered", "flood_tx", "filtered_tx"):
+            total[key] += r[key]
+        yield (str(group), str(r["subscribers"]), str(r["messages"]), str(r["delivered"]), str(r["flood_tx"]),
+               str(r["filtered_tx"]), saved(r["flood_tx"], r["filtered_tx"]),
+               f"{(r['flood_tx'] - r['filtered_tx']) * FRAME_AIRTIME_US / 1000:.1f} ms")
+    yield ("all", str(total["subscribers"]), str(total["messages"]), str(total["delivered"]), str(total["flood_tx"]),
+           str(total["filtered_tx"]), saved(total["flood_tx"], total["filtered_tx"]),
+           f"{(total['flood_tx'] - total['filtered_tx']) * FRAME_AIRTIME_US / 1000:.1f} ms")
+
+
+def title(summary):
+    return (f"Mesh-NOW group forwarding: {summary['nodes']} nodes ({summary['legacy_nodes']} legacy), "
+            f"{summary['mean_neighbours']} neighbours each, levels settled in {summary['beacon_rounds']} beacon rounds")
+
+
+def render(summary):
+    from rich.table import Table
+
+    table = Table(title=title(summary))
+    for index, column in enumerate(COLUMNS):
+        table.add_column(column, justify="left" if index == 0 else "right")
+    for row in rows(summary):
+        table.add_row(*row, style="bold" if row[0] == "all" else None)
+    return table
+
+
+def print_plain(summary):
+    print(title(summary))
+    table = [COLUMNS] + list(rows(summary))
+    widths = [max(len(row[i]) for row in table) for i in range(len(COLUMNS))]
+    for row in table:
+        print("  ".join(c.ljust(w) if i == 0 else c.rjust(w) for i, (c, w) in enumerate(zip(row, widths))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate Mesh-NOW group-aware forwarding against flooding")
+    parser.add_argument("--nodes", type=int, default=50, help="Nodes in the mesh")
+    parser.add_argument("--range", type=float, default=0.22, help="Radio range as a fraction of the area's side")
+    parser.add_argument("--groups", type=int, default=5, help="Groups with subscribers (IDs 1..N)")
+    parser.add_argument("--cluster", type=float, default=0.2, help="Radius subscribers cluster within")
+    parser.add_argument("--share", type=float, default=0.1, help="Chance a node joins a group (x4 inside its cluster)")
+    parser.add_argument("--scatter", action="store_true", help="Subscribers anywhere rather than clustered")
+    parser.add_argument("--legacy", type=float, default=0.0, help="Fraction of nodes without group support")
+    parser.add_argument("--messages", type=int, default=200, help="Messages sent to each group")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    parser.add_argument("--ci", action="store_true", help="CI mode - plain output")
+    args = parser.parse_args()
+
+    if not 0 < args.groups < MESH_GROUP_COUNT:
+        parser.error(f"--groups must be between 1 and {MESH_GROUP_COUNT - 1}")
+    if args.nodes < 2 or args.messages < 1:
+        parser.error("--nodes must be at least 2 and --messages at least 1")
+
+    summary, mismatches = simulate(args)
+    if RICH_AVAILABLE and not args.ci:
+        from rich.console import Console
+        Console().print(render(summary))
+    else:
+        print_plain(summary)
+    if args.json:
+        Path(args.json).write_text(json.dumps(dict(summary, mismatches=mismatches), indent=2) + "\n")
+
+    for mismatch in mismatches[:20]:
+        print(f"MISMATCH {mismatch}")
+    if mismatches:
+        print(f"{len(mismatches)} message(s) reached fewer subscribers than flooding")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
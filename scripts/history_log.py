@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Mesh-NOW Message History Log
+Python model of the on-flash history log (components/mesh_now/src/message_history.c)
+
+The firmware stores received messages in the "history" data partition as
+fixed-size records packed into 4 KB sectors used as a ring. Entering a sector
+erases it, which reclaims the oldest records. This module mirrors that format
+so partition dumps can be decoded on the host and the reclaim/recovery logic
+can be exercised without a board:
+
+    esptool.py read_flash 0x110000 0x20000 history.bin
+    python scripts/history_log.py dump history.bin
+    python scripts/history_log.py simulate --messages 5000 --reboot-every 37
+"""
+
+import sys
+import struct
+import zlib
+import random
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+
+# Must match message_history.h / message_queue.h
+MAGIC = 0x4D48
+HEADER = struct.Struct("<HHIII")           # magic, length, seq, crc, reserved
+PAYLOAD = struct.Struct("<128s6sBBII")     # message_t: message, sender_mac, type, group_id, timestamp, message_id
+RECORD_SIZE = HEADER.size + PAYLOAD.size
+SECTOR_SIZE = 4096
+RECORDS_PER_SECTOR = SECTOR_SIZE // RECORD_SIZE
+RAM_RECORDS = 32
+FLUSH_BATCH = 8
+DEFAULT_PARTITION_SIZE = 0x20000
+
+
+@dataclass
+class Entry:
+    seq: int
+    message: str
+    sender_mac: bytes
+    timestamp: int
+    message_id: int = 0
+    type: int = 1           # MSG_TYPE_CHAT
+    group_id: int = 0
+
+    @property
+    def sender(self):
+        return ":".join(f"{b:02x}" for b in self.sender_mac)
+
+
+def record_crc(seq, payload):
+    """CRC32 over the little-endian seq followed by the payload"""
+    return zlib.crc32(payload, zlib.crc32(struct.pack("<I", seq)))
+
+
+def encode_record(entry):
+    """Encode an entry into its on-flash representation"""
+    text = entry.message.encode("utf-8")[:127]
+    payload = PAYLOAD.pack(text, entry.sender_mac, entry.type, entry.group_id, entry.timestamp, entry.message_id)
+    header = HEADER.pack(MAGIC, PAYLOAD.size, entry.seq, record_crc(entry.seq, payload), 0xFFFFFFFF)
+    return header + payload
+
+
+def decode_record(data):
+    """Decode one record, returning None for blank or corrupt slots"""
+    if len(data) < RECORD_SIZE:
+        return None
+    magic, length, seq, crc, _ = HEADER.unpack_from(data)
+    if magic != MAGIC or length != PAYLOAD.size:
+        return None
+    payload = bytes(data[HEADER.size:RECORD_SIZE])
+    if record_crc(seq, payload) != crc:
+        return None
+    text, mac, kind, group_id, timestamp, message_id = PAYLOAD.unpack(payload)
+    return Entry(seq, text.split(b"\0", 1)[0].decode("utf-8", "replace"), mac, timestamp, message_id, kind, group_id)
+
+
+class HistoryLog:
+    """Host model of the firmware history log, including its RAM ring"""
+
+    def __init__(self, image=None, size=DEFAULT_PARTITION_SIZE):
+        self.flash = bytearray(image) if image is not None else bytearray(b"\xff" * size)
+        self.sector_count = len(self.flash) // SECTOR_SIZE
+        self.total_slots = self.sector_count * RECORDS_PER_SECTOR
+        self.erase_counts = [0] * self.sector_count
+        self.flash_writes = 0
+        self.boot()
+
+    # Flash primitives -----------------------------------------------------
+
+    def _slot_offset(self, slot):
+        return (slot // RECORDS_PER_SECTOR) * SECTOR_SIZE + (slot % RECORDS_PER_SECTOR) * RECORD_SIZE
+
+    def _read_slot(self, slot):
+        offset = self._slot_offset(slot)
+        return decode_record(self.flash[offset:offset + RECORD_SIZE])
+
+    def _slot_is_blank(self, slot):
+        offset = self._slot_offset(slot)
+        return all(b == 0xFF for b in self.flash[offset:offset + RECORD_SIZE])
+
+    def _erase_sector(self, sector):
+        start = sector * SECTOR_SIZE
+        self.flash[start:start + SECTOR_SIZE] = b"\xff" * SECTOR_SIZE
+        self.erase_counts[sector] += 1
+
+    def _program(self, offset, data):
+        # NOR flash can only clear bits
+        for i, b in enumerate(data):
+            self.flash[offset + i] &= b
+        self.flash_writes += 1
+
+    # Firmware logic -------------------------------------------------------
+
+    def boot(self):
+        """Rebuild the per-sector index from flash (history_scan)"""
+        self.ram = []
+        self.first_seq = [0] * self.sector_count
+        self.records = [0] * self.sector_count
+        max_seq, max_slot = 0, 0
+
+        for sector in range(self.sector_count):
+            for r in range(RECORDS_PER_SECTOR):
+                slot = sector * RECORDS_PER_SECTOR + r
+                entry = self._read_slot(slot)
+                if entry is None:
+                    break
+                if r == 0:
+                    self.first_seq[sector] = entry.seq
+                elif entry.seq != self.first_seq[sector] + r:
+                    break
+                self.records[sector] += 1
+                if entry.seq > max_seq:
+                    max_seq, max_slot = entry.seq, slot
+
+        if max_seq == 0:
+            self.write_slot = 0
+        else:
+            self.write_slot = (max_slot + 1) % self.total_slots
+            if self.write_slot % RECORDS_PER_SECTOR and not self._slot_is_blank(self.write_slot):
+                self.write_slot = ((self.write_slot // RECORDS_PER_SECTOR + 1) * RECORDS_PER_SECTOR) % self.total_slots
+
+        self.next_seq = max_seq + 1
+        self.persisted_seq = max_seq
+
+    def append(self, message, sender_mac=b"\0" * 6, timestamp=0, message_id=0):
+        entry = Entry(self.next_seq, message, sender_mac, timestamp, message_id)
+        self.next_seq += 1
+        self.ram.append(entry)
+        if len(self.ram) > RAM_RECORDS:
+            self.ram.pop(0)
+        if self.next_seq - 1 - self.persisted_seq >= FLUSH_BATCH:
+            self.flush()
+        return entry.seq
+
+    def flush(self, torn_after=None):
+        """Write pending RAM entries; torn_after simulates power loss mid-write"""
+        latest = self.next_seq - 1
+        while self.persisted_seq < latest:
+            sector, in_sector = divmod(self.write_slot, RECORDS_PER_SECTOR)
+            if in_sector == 0:
+                self._erase_sector(sector)
+                self.first_seq[sector] = 0
+                self.records[sector] = 0
+
+            run = min(latest - self.persisted_seq, RECORDS_PER_SECTOR - in_sector, FLUSH_BATCH)
+            pending = [e for e in self.ram if self.persisted_seq < e.seq <= self.persisted_seq + run]
+            if not pending:
+                self.persisted_seq = latest
+                break
+
+            data = b"".join(encode_record(e) for e in pending)
+            if torn_after is not None:
+                data = data[:torn_after]
+            self._program(sector * SECTOR_SIZE + in_sector * RECORD_SIZE, data)
+            if torn_after is not None:
+                return
+
+            if self.records[sector] == 0:
+                self.first_seq[sector] = self.persisted_seq + 1
+            self.records[sector] += len(pending)
+            self.persisted_seq += len(pending)
+            self.write_slot = (self.write_slot + len(pending)) % self.total_slots
+
+    def oldest_seq(self):
+        candidates = [s for s in self.first_seq if s]
+        if self.ram:
+            candidates.append(self.ram[0].seq)
+        return min(candidates) if candidates else 0
+
+    def get(self, seq):
+        for entry in self.ram:
+            if entry.seq == seq:
+                return entry
+        for sector in range(self.sector_count):
+            first = self.first_seq[sector]
+            if first and first <= seq < first + self.records[sector]:
+                return self._read_slot(sector * RECORDS_PER_SECTOR + seq - first)
+        return None
+
+    def read(self, since=0, limit=25):
+        """Entries with seq > since, oldest first (GET /messages?since=)"""
+        oldest = self.oldest_seq()
+        if not oldest:
+            return []
+        result = []
+        seq = max(since + 1, oldest)
+        while seq < self.next_seq and len(result) < limit:
+            entry = self.get(seq)
+            if entry is not None:
+                result.append(entry)
+            seq += 1
+        return result
+
+
+def dump(args):
+    image = Path(args.image).read_bytes()
+    log = HistoryLog(image)
+    entries = log.read(0, limit=log.total_slots)
+    for entry in entries:
+        print(f"{entry.seq:>8}  {entry.sender}  {entry.timestamp:>10}  {entry.message}")
+    print(f"{len(entries)} entries, oldest {log.oldest_seq()}, latest {log.next_seq - 1}, "
+          f"next slot {log.write_slot}/{log.total_slots}")
+    return 0
+
+
+def simulate(args):
+    rng = random.Random(args.seed)
+    log = HistoryLog(size=args.size)
+    capacity = (log.sector_count - 1) * RECORDS_PER_SECTOR
+    reboots = torn = 0
+
+    expected = {}
+
+    for i in range(1, args.messages + 1):
+        text = f"message {i}"
+        expected[log.append(text, bytes([0x24, 0x6F, 0x28, 0, 0, i % 256]), i)] = text
+
+        if args.reboot_every and i % args.reboot_every == 0:
+            log.flush()
+            if rng.random() < args.torn_ratio:
+                # Power loss while writing one more record
+                log.ram.append(Entry(log.next_seq, "torn", b"\0" * 6, 0))
+                log.next_seq += 1
+                log.flush(torn_after=rng.randrange(1, RECORD_SIZE))
+                torn += 1
+            log.boot()
+            reboots += 1
+
+        # Every retained entry must be readable, contiguous and intact
+        entries = log.read(0, limit=log.total_slots)
+        seqs = [e.seq for e in entries]
+        if seqs and seqs != list(range(seqs[0], seqs[0] + len(seqs))):
+            print(f"FAIL: gap in retained sequence numbers after message {i}")
+            return 1
+        if any(expected.get(e.seq) != e.message for e in entries):
+            print(f"FAIL: corrupt entry after message {i}")
+            return 1
+
+    log.flush()
+    log.boot()
+    retained = len(log.read(0, limit=log.total_slots))
+    # A torn write abandons the remainder of its sector
+    guaranteed = min(capacity - (RECORDS_PER_SECTOR - 1) * min(torn, log.sector_count - 1), args.messages)
+    print(f"messages:      {args.messages}")
+    print(f"reboots:       {reboots} ({torn} with a torn write)")
+    print(f"retained:      {retained} (guaranteed at least {guaranteed})")
+    print(f"flash writes:  {log.flash_writes} ({log.flash_writes / args.messages:.3f} per message)")
+    print(f"sector erases: min {min(log.erase_counts)}, max {max(log.erase_counts)}")
+
+    if retained < guaranteed:
+        print("FAIL: log retained fewer entries than its guaranteed capacity")
+        return 1
+    print("OK")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mesh-NOW message history log tool")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    dump_parser = sub.add_parser("dump", help="Decode a history partition image")
+    dump_parser.add_argument("image", help="Image read with esptool.py read_flash")
+
+    sim_parser = sub.add_parser("simulate", help="Exercise append, reclaim and recovery")
+    sim_parser.add_argument("--messages", type=int, default=5000)
+    sim_parser.add_argument("--size", type=lambda v: int(v, 0), default=DEFAULT_PARTITION_SIZE)
+    sim_parser.add_argument("--reboot-every", type=int, default=0, help="Reboot after every N messages")
+    sim_parser.add_argument("--torn-ratio", type=float, default=0.25, help="Share of reboots that tear a write")
+    sim_parser.add_argument("--seed", type=int, default=1)
+
+    args = parser.parse_args()
+    if args.command == "dump":
+        sys.exit(dump(args))
+    sys.exit(simulate(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Mesh-NOW Host Tests
+Build the mesh_now component for the host and run its tests and benchmarks
+
+components/mesh_now/host_test/ compiles mesh_now.c and message_queue.c with
+the system C compiler against small ESP-NOW, esp_timer and FreeRTOS shims
+(stubs/), so the receive path - deduplication, decryption, routing and the
+pending-ACK lookup - can be tested and timed without a board:
+
+    python scripts/host_test.py                        # tests, benchmarks, then models
+    python scripts/host_test.py --tests --sanitize     # ASan/UBSan build
+    python scripts/host_test.py --bench --baseline builds/host/bench.json --max-regression 25
+    python scripts/host_test.py --models --filter presence
+
+Benchmark results (nanoseconds per received frame, best of --repeat runs)
+are written to builds/host/bench.json. Host numbers say how the code paths
+compare and whether a change made one slower, not how fast a chip runs them.
+Models replay a scenario through the component on a simulated clock (a
+typing user, say) and report what it sent; their figures are deterministic
+and go to the same file.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import importlib.util
+from pathlib import Path
+
+from command_runner import command_text, run
+from firmware_manifest import git_sha
+
+# rich is imported where output is drawn, so --ci runs never load it
+RICH_AVAILABLE = importlib.util.find_spec("rich") is not None
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+COMPONENT_DIR = PROJECT_DIR / "components" / "mesh_now"
+HOST_DIR = COMPONENT_DIR / "host_test"
+BUILD_DIR = PROJECT_DIR / "build" / "host_test"
+RESULTS = PROJECT_DIR / "builds" / "host" / "bench.json"
+SOURCES = [HOST_DIR / "test_mesh_now.c", COMPONENT_DIR / "src" / "message_queue.c",
+           COMPONENT_DIR / "src" / "mesh_metrics.c", COMPONENT_DIR / "src" / "mesh_groups.c",
+           COMPONENT_DIR / "src" / "mesh_presence.c", COMPONENT_DIR / "src" / "mesh_store.c",
+           COMPONENT_DIR / "src" / "message_json.c",            HOST_DIR / "stubs" / "host_shims.c"]
+CFLAGS = ["-std=gnu11", "-O2", "-g", "-Wall", "-Wextra", "-Wno-unused-parameter", "-pthread"]
+SANITIZE_FLAGS = ["-fsanitize=address,undefined", "-fno-omit-frame-pointer", "-fno-sanitize-recover=undefined"]
+# Slowdown (percent) below which a benchmark isn't a regression: host timings jitter
+DEFAULT_MAX_REGRESSION = 25.0
+# Benchmarks faster than this are compared by absolute change instead (ns)
+NOISE_FLOOR_NS = 20.0
+
+
+class PlainConsole:
+    """Minimal console for CI output"""
+
+    def print(self, text="", style=None):
+        import re
+        print(re.sub(r"\[/?[a-z ]+\]", "", str(text)), flush=True)
+
+
+def setup_console(ci):
+    if ci or not RICH_AVAILABLE:
+        return PlainConsole()
+    from rich.console import Console
+    return Console()
+
+
+def compiler():
+    cc = os.environ.get("CC") or shutil.which("cc") or shutil.which("gcc") or shutil.which("clang")
+    if not cc:
+        raise SystemExit("No C compiler found; set CC")
+    return cc
+
+
+def build(console, sanitize=False):
+    """Compile the host binary; returns its path"""
+    binary = BUILD_DIR / ("mesh_now_host_asan" if sanitize else "mesh_now_host")
+    BUILD_DIR.mkdir(parents=True, exist_ok=True)
+    cmd = [compiler(), *CFLAGS, *(SANITIZE_FLAGS if sanitize else []),
+           f"-I{HOST_DIR / 'stubs'}", f"-I{COMPONENT_DIR / 'include'}",
+           *SOURCES, "-o", binary]
+    console.print(f"[cyan]Compiling {binary.name}[/cyan]")
+    result = run(cmd, cwd=PROJECT_DIR, on_line=print)
+    if not result.ok:
+        console.print(f"[red]Build failed: {result.reason()}[/red]")
+        console.print(f"  {command_text(cmd)}")
+        sys.exit(1)
+    return binary
+
+
+def parse_output(lines):
+    """(passed tests, {failed test: reason}, {benchmark: (ns per op, iterations)}, {model: {key: value}})"""
+    passed, failed, benches, models = [], {}, {}, {}
+    for line in lines:
+        if line.startswith("ok "):
+            passed.append(line[3:].strip())
+        elif line.startswith("FAIL "):
+            name, _, reason = line[5:].partition(":")
+            failed[name.strip()] = reason.strip()
+        elif line.startswith("bench "):
+            parts = line.split()
+            if len(parts) == 4:
+                benches[parts[1]] = (float(parts[2]), int(parts[3]))
+        elif line.startswith("model "):
+            parts = line.split()
+            if len(parts) == 4:
+                models.setdefault(parts[1], {})[parts[2]] = float(parts[3])
+    return passed, failed, benches, models
+
+
+def run_binary(console, binary, args, timeout):
+    """Run the host binary; returns (passed, failed, benches, models, ok)"""
+    lines = []
+
+    def on_line(line):
+        lines.append(line)
+        if line.startswith("FAIL "):
+            console.print(f"[red]{line}[/red]")
+        elif not line.startswith(("ok ", "bench ", "model ")):
+            # Log output from the component, or a sanitizer report
+            print(line, flush=True)
+
+    result = run([binary, *args], cwd=PROJECT_DIR, on_line=on_line, timeout=timeout)
+    passed, failed, benches, models = parse_output(lines)
+    if not result.ok and not failed:
+        # A crash or sanitizer report: its output is above, the last line says little
+        crashed = result.returncode is not None and not (result.timed_out or result.cancelled)
+        failed[binary.name] = f"exited with code {result.returncode}" if crashed else result.reason()
+    return passed, failed, benches, models, result.ok
+
+
+def load_baseline(path):
+    try:
+        data = json.loads(Path(path).read_text())
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"Can't read baseline {path}: {e}")
+    return {name: entry["ns_per_op"] for name, entry in data.get("benchmarks", {}).items()}
+
+
+def regressed(old, new, max_regression):
+    if old <= 0:
+        return False
+    if old < NOISE_FLOOR_NS:
+        return new - old > NOISE_FLOOR_NS * max_regression / 100
+    return (new - old) / old * 100 > max_regression
+
+
+def report_benches(console, benches, baseline, max_regression, use_rich):
+    """Print the benchmark table; returns the names that regressed"""
+    regressions = []
+    rows = []
+    for name, (ns, iterations) in benches.items():
+        old = baseline.get(name)
+        change = f"{(ns - old) / old * 100:+.1f}%" if old else ""
+        if old is not None and regressed(old, ns, max_regression):
+            regressions.append(name)
+        rows.append((name, f"{ns:.1f}", f"{old:.1f}" if old else "", change, str(iterations)))
+
+    columns = ("Benchmark", "ns/op", "Baseline", "Change", "Iterations")
+    if use_rich:
+        from rich.table import Table
+        table = Table(title="Receive path (host)")
+        for index, column in enumerate(columns):
+            table.add_column(column, justify="left" if index == 0 else "right")
+        for row in rows:
+            table.add_row(*row, style="red" if row[0] in regressions else None)
+        console.print(table)
+    else:
+        console.print("Receive path (host)")
+        for row in rows:
+            flag = "  REGRESSED" if row[0] in regressions else ""
+            console.print(f"  {row[0]:<26} {row[1]:>9} ns/op {row[3]:>8}{flag}")
+    return regressions
+
+
+def report_models(console, models, use_rich):
+    for name, values in models.items():
+        if use_rich:
+            from rich.table import Table
+            table = Table(title=f"Model {name} (host)")
+            table.add_column("Figure")
+            table.add_column("Value", justify="right")
+            for key, value in values.items():
+                table.add_row(key, f"{value:g}")
+            console.print(table)
+        else:
+            console.print(f"Model {name} (host)")
+            for key, value in values.items():
+                console.print(f"  {key:<26} {value:>12g}")
+
+
+def write_results(path, benches, models, args):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        "git_sha": git_sha(PROJECT_DIR),
+        "recorded_at": int(time.time()),
+        "host": {"system": platform.system(), "machine": platform.machine(), "python": platform.python_version(),
+                 "compiler": os.path.basename(compiler())},
+        "iterations": args.iterations,
+        "repeat": args.repeat,
+        "benchmarks": {name: {"ns_per_op": ns, "iterations": iterations} for name, (ns, iterations) in benches.items()},
+        "models": models,
+    }
+    path.write_text(json.dumps(data, indent=2) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and run the mesh_now host tests and benchmarks")
+    parser.add_argument("--tests", action="store_true", help="Run the tests (default: all three)")
+    parser.add_argument("--bench", action="store_true", help="Run the benchmarks")
+    parser.add_argument("--models", action="store_true", help="Run the models")
+    parser.add_argument("--filter", help="Only tests/benchmarks/models whose name contains this")
+    parser.add_argument("--sanitize", action="store_true", help="Build with AddressSanitizer and UBSan")
+    parser.add_argument("--iterations", type=int, default=200000, help="Frames per benchmark run")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per benchmark; the fastest counts")
+    parser.add_argument("--output", default=str(RESULTS), help=f"Benchmark results (default {RESULTS})")
+    parser.add_argument("--baseline", help="Earlier bench.json to compare against")
+    parser.add_argument("--max-regression", type=float, default=DEFAULT_MAX_REGRESSION,
+                        help=f"Percent slowdown that fails against --baseline (default {DEFAULT_MAX_REGRESSION:g})")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds before the binary is stopped")
+    parser.add_argument("--verbose", action="store_true", help="Show the component's debug logs")
+    parser.add_argument("--ci", action="store_true", help="CI mode - plain output")
+    args = parser.parse_args()
+
+    if args.iterations < 1 or args.repeat < 1:
+        parser.error("--iterations and --repeat must be positive")
+    run_all = not (args.tests or args.bench or args.models)
+    run_tests = args.tests or run_all
+    run_benches = args.bench or run_all
+    run_models = args.models or run_all
+    baseline = load_baseline(args.baseline) if args.baseline else {}
+
+    console = setup_console(args.ci)
+    if (run_benches or run_models) and args.sanitize:
+        console.print("[yellow]Benchmarks of a sanitized build aren't comparable; running tests only[/yellow]")
+        run_benches = run_models = False
+        run_tests = True
+    use_rich = not isinstance(console, PlainConsole)
+    binary = build(console, args.sanitize)
+
+    flags = (["--tests"] if run_tests else []) + (["--bench"] if run_benches else [])
+    flags += ["--models"] if run_models else []
+    flags += ["--iterations", str(args.iterations), "--repeat", str(args.repeat)]
+    if args.filter:
+        flags += ["--filter", args.filter]
+    if args.verbose:
+        flags.append("--verbose")
+    passed, failed, benches, models, ok = run_binary(console, binary, flags, args.timeout)
+
+    if run_tests:
+        style = "red" if failed else "green"
+        console.print(f"[{style}]{len(passed)} passed, {len(failed)} failed[/{style}]")
+        for name, reason in failed.items():
+            console.print(f"  [red]{name}: {reason}[/red]")
+
+    regressions = []
+    if benches:
+        regressions = report_benches(console, benches, baseline, args.max_regression, use_rich)
+    if models:
+        report_models(console, models, use_rich)
+    if benches or models:
+        output = Path(args.output)
+        write_results(output, benches, models, args)
+        console.print(f"Results written to {output}")
+        if regressions:
+            console.print(f"[red]{len(regressions)} benchmark(s) more than {args.max_regression:g}% slower "
+                          f"than the baseline: {', '.join(regressions)}[/red]")
+
+    sys.exit(1 if failed or regressions or not ok else 0)
+
+
+if __name__ == "__main__":
+    main()
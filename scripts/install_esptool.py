@@ -6,60 +6,43 @@ Python version - Platform agnostic with TUI
 
 import os
 import sys
-import subprocess
 import argparse
+import importlib.util
 from pathlib import Path
 
-try:
-    from rich.console import Console
-    from rich.progress import Progress, SpinnerColumn, TextColumn
-    from rich.panel import Panel
-    from rich.text import Text
-    RICH_AVAILABLE = True
-except ImportError:
-    RICH_AVAILABLE = False
+from command_runner import command_log, echo_to, log_path, run
+
+# rich is imported where output is drawn, so --ci runs never load it
+RICH_AVAILABLE = importlib.util.find_spec("rich") is not None
 
 def setup_console():
     """Setup console for output"""
     if RICH_AVAILABLE:
+        from rich.console import Console
         return Console()
     else:
         return None
 
-def run_command(cmd, console=None, ci_mode=False):
-    """Run a command and return success"""
-    try:
-        if ci_mode:
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-        else:
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-
-        if result.returncode != 0:
-            if console and not ci_mode:
-                console.print(f"[red]Command failed: {cmd}[/red]")
-                console.print(f"[dim]{result.stderr}[/dim]")
-            return False, result.stderr
-        return True, result.stdout
-    except Exception as e:
-        if console and not ci_mode:
-            console.print(f"[red]Error running command: {e}[/red]")
-        return False, str(e)
+def run_command(cmd, console=None, ci_mode=False, on_line=None):
+    """Run a command and return success and its output (the last lines)"""
+    result = run(cmd, on_line=on_line, log=command_log("install"))
+    if not result.ok and console and not ci_mode:
+        console.print(f"[red]Command failed: {cmd}[/red]")
+        echo = echo_to(console, "   ")
+        for line in result.tail(30):
+            echo(line)
+        console.print(f"[dim]Full output: {log_path('install')}[/dim]")
+    return result.ok, result.error or result.output
 
 def check_python():
     """Check if Python is available"""
-    try:
-        result = subprocess.run([sys.executable, "--version"], capture_output=True, text=True)
-        return result.returncode == 0, result.stdout.strip()
-    except:
-        return False, ""
+    result = run([sys.executable, "--version"])
+    return result.ok, result.output.strip()
 
 def check_pip():
     """Check if pip is available"""
-    try:
-        result = subprocess.run([sys.executable, "-m", "pip", "--version"], capture_output=True, text=True)
-        return result.returncode == 0, result.stdout.strip()
-    except:
-        return False, ""
+    result = run([sys.executable, "-m", "pip", "--version"])
+    return result.ok, result.output.strip()
 
 def install_esptool(console, ci_mode=False):
     """Install esptool.py"""
@@ -90,13 +73,17 @@ def install_esptool(console, ci_mode=False):
 
     # Install esptool
     if console and not ci_mode:
+        from rich.markup import escape
+        from rich.progress import Progress, SpinnerColumn, TextColumn
         with Progress(
             SpinnerColumn(),
             TextColumn("[progress.description]{task.description}"),
             console=console,
         ) as progress:
             task = progress.add_task("Installing esptool...", total=None)
-            success, output = run_command(f"{sys.executable} -m pip install esptool", console, ci_mode)
+            success, output = run_command(
+                f"{sys.executable} -m pip install esptool", console, ci_mode,
+                on_line=lambda line: progress.update(task, description=f"pip: {escape(line.strip()[:60])}"))
             progress.update(task, completed=True)
     else:
         success, output = run_command(f"{sys.executable} -m pip install esptool", console, ci_mode)
@@ -132,6 +119,8 @@ def main():
 
     if console and not args.ci:
         # Show header
+        from rich.panel import Panel
+        from rich.text import Text
         title = Text("ESP32 Tool Installer", style="bold blue")
         panel = Panel(title, border_style="blue")
         console.print(panel)
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Mesh-NOW Bridge
+Relay chat between mesh islands through one node's web API on each
+
+Nodes out of radio range of each other form separate islands. The bridge
+follows /messages on one node per island and posts every message it has not
+seen before to /relay on the nodes of all the other islands, under the
+origin's sender MAC and message id. Receiving nodes deduplicate relayed
+copies by that id like any other frame, and the bridge keeps its own bounded
+LRU of (sender, id) keys, so a message crosses each island once and never
+echoes back to where it came from.
+
+A node's /messages history holds what it hears from the mesh, not what its
+own clients post to /send, so the bridge carries messages sent from the other
+nodes of an island: put it on a node nobody chats from. Group messages stay
+on their island, as /relay has no group to post them under, and are counted
+as "unrelayable".
+
+Each island has a bounded relay queue: a slow or unreachable node drops its
+oldest queued messages (counted as "dropped") and does not hold up the others.
+
+    python scripts/mesh_bridge.py http://192.168.4.1 http://10.0.0.7
+    python scripts/mesh_bridge.py island-a.local island-b.local --duration 600 --json bridge.json
+    python scripts/mesh_bridge.py --standin 4 --nodes 8 --ci     # self-test against stand-in islands
+
+--standin links stand-in nodes into islands, has every node but the bridged
+one send messages, then checks that each node on every island holds each
+message exactly once under its origin's MAC. --bridges 2 runs two bridges
+over the same islands, each hearing the other's relays, as redundant
+bridges would.
+"""
+
+import sys
+import json
+import time
+import argparse
+import importlib.util
+from pathlib import Path
+from collections import Counter, OrderedDict
+
+# rich, asyncio and meshnow.client (which loads asyncio) are imported where
+# they are used, so --help never loads them
+RICH_AVAILABLE = importlib.util.find_spec("rich") is not None
+
+DEFAULT_QUEUE = 1024
+RELAY_BATCH = 16             # /relay requests pipelined per round trip
+DEFAULT_SEEN = 4096
+DEFAULT_POLL = 0.5
+STANDIN_SETTLE_S = 20.0
+
+COLUMNS = ("Island", "Heard", "New", "Relayed in", "Already seen", "Dropped", "Errors", "Queued",
+           "p50 ms", "Max ms")
+STATS = ("heard", "new", "duplicates", "unrelayable", "missed", "relayed", "already_seen", "dropped", "errors")
+
+
+class SeenCache:
+    """Bounded LRU of the (sender, message_id) keys the bridge has relayed"""
+
+    def __init__(self, capacity=DEFAULT_SEEN):
+        self.capacity = capacity
+        self.keys = OrderedDict()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key):
+        """False if key was already seen"""
+        if key in self.keys:
+            self.keys.move_to_end(key)
+            return False
+        self.keys[key] = None
+        if len(self.keys) > self.capacity:
+            self.keys.popitem(last=False)
+        return True
+
+
+class Island:
+    """The bridge's link to one island: its node's client, relay queue and counters"""
+
+    def __init__(self, url, queue_size):
+        self.url = url
+        self.queue_size = queue_size
+        self.client = None
+        self.queue = None
+        self.stats = dict.fromkeys(STATS, 0)
+        self.latencies = []
+        self.last_error = None
+
+    @property
+    def label(self):
+        return self.url.split("://", 1)[-1]
+
+    def offer(self, message, heard_at):
+        """Queue a message for /relay here, dropping the oldest queued one when full"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self.stats["dropped"] += 1
+        self.queue.put_nowait((message, heard_at))
+
+    def as_dict(self):
+        latencies = sorted(self.latencies)
+        return dict(self.stats, queued=self.queue.qsize() if self.queue else 0, last_error=self.last_error,
+                    relay_ms_p50=round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+                    relay_ms_max=round(latencies[-1] * 1000, 2) if latencies else None)
+
+
+class Bridge:
+    def __init__(self, urls, queue_size=DEFAULT_QUEUE, seen=DEFAULT_SEEN, poll_interval=DEFAULT_POLL,
+                 backlog=False):
+        self.islands = [Island(url, queue_size) for url in urls]
+        self.seen = SeenCache(seen)
+        self.poll_interval = poll_interval
+        self.backlog = backlog
+        self.tasks = []
+
+    async def start(self):
+        """Connect to every island and start following and relaying"""
+        import asyncio
+        from meshnow.client import MeshNowClient
+
+        for island in self.islands:
+            island.client = MeshNowClient(island.url)
+            island.queue = asyncio.Queue(island.queue_size)
+        # Without --backlog only messages sent from now on cross over
+        starts = await asyncio.gather(*(self._start_seq(island) for island in self.islands))
+        for island, since in zip(self.islands, starts):
+            self.tasks.append(asyncio.ensure_future(self._listen(island, since)))
+            self.tasks.append(asyncio.ensure_future(self._deliver(island)))
+
+    async def stop(self):
+        import asyncio
+
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        for island in self.islands:
+            await island.client.close()
+
+    async def run(self, duration=None):
+        import asyncio
+
+        await self.start()
+        try:
+            if duration is None:
+                await asyncio.Event().wait()
+            else:
+                await asyncio.sleep(duration)
+        finally:
+            await self.stop()
+
+    async def drain(self):
+        """Wait until every queued relay has been posted"""
+        for island in self.islands:
+            await island.queue.join()
+
+    async def _start_seq(self, island):
+        if self.backlog:
+            return 0
+        page = await island.client.messages(since=0, limit=1)
+        while page["more"]:
+            page = await island.client.messages(since=page["next"])
+        return page["next"]
+
+    async def _listen(self, island, since):
+        import asyncio
+        from meshnow.client import MeshNowError
+
+        iterator = island.client.iter_messages(since=since, follow=True, poll_interval=self.poll_interval)
+        while True:
+            try:
+                message = await iterator.__anext__()
+            except MeshNowError as e:
+                island.stats["errors"] += 1
+                island.last_error = str(e)
+                await asyncio.sleep(self.poll_interval)
+                continue
+            island.stats["heard"] += 1
+            island.stats["missed"] = iterator.missed
+            if not message.message_id or message.group is not None:
+                # Firmware from before message ids gives nothing to deduplicate
+                # on, and /relay would turn a group message into a broadcast
+                island.stats["unrelayable"] += 1
+                continue
+            if not self.seen.add((message.sender, message.message_id)):
+                island.stats["duplicates"] += 1
+                continue
+            island.stats["new"] += 1
+            heard_at = time.monotonic()
+            for other in self.islands:
+                if other is not island:
+                    other.offer(message, heard_at)
+
+    async def _deliver(self, island):
+        from meshnow.client import MeshNowError
+
+        while True:
+            batch = [await island.queue.get()]
+            while len(batch) < RELAY_BATCH and not island.queue.empty():
+                batch.append(island.queue.get_nowait())
+            try:
+                accepted = await island.client.relay_batch(
+                    [(message.sender, message.message_id, message.content) for message, _ in batch])
+                now = time.monotonic()
+                for (_, heard_at), ok in zip(batch, accepted):
+                    if ok:
+                        island.stats["relayed"] += 1
+                        island.latencies.append(now - heard_at)
+                    else:
+                        island.stats["already_seen"] += 1
+                del island.latencies[:-1024]
+            except MeshNowError as e:
+                island.stats["errors"] += len(batch)
+                island.last_error = str(e)
+            finally:
+                for _ in batch:
+                    island.queue.task_done()
+
+    def summary(self):
+        return {"seen": len(self.seen), "islands": {island.url: island.as_dict() for island in self.islands}}
+
+
+# Reporting --------------------------------------------------------------------
+
+def fmt_ms(value):
+    return "-" if value is None else f"{value:.1f}"
+
+
+def rows(bridge):
+    for island in bridge.islands:
+        s = island.as_dict()
+        trouble = bool(s["dropped"] or s["errors"] or s["missed"])
+        yield (island.label, str(s["heard"]), str(s["new"]), str(s["relayed"]), str(s["already_seen"]),
+               str(s["dropped"]), str(s["errors"]), str(s["queued"]),
+               fmt_ms(s["relay_ms_p50"]), fmt_ms(s["relay_ms_max"])), trouble
+
+
+def title(bridge, elapsed):
+    return f"Mesh-NOW bridge: {len(bridge.islands)} island(s), {len(bridge.seen)} message(s) seen in {elapsed:.1f} s"
+
+
+def render(bridge, elapsed):
+    from rich.table import Table
+
+    table = Table(title=title(bridge, elapsed))
+    for index, column in enumerate(COLUMNS):
+        table.add_column(column, justify="left" if index == 0 else "right")
+    for row, trouble in rows(bridge):
+        table.add_row(*row, style="red" if trouble else None)
+    return table
+
+
+def print_plain(bridge, elapsed):
+    print(title(bridge, elapsed))
+    table = [COLUMNS] + [row for row, _ in rows(bridge)]
+    widths = [max(len(row[i]) for row in table) for i in range(len(COLUMNS))]
+    for row in table:
+        print("  ".join(c.ljust(w) if i == 0 else c.rjust(w) for i, (c, w) in enumerate(zip(row, widths))))
+    sys.stdout.flush()
+
+
+# Stand-in self-test ------------------------------------------------------------
+
+def start_standin_islands(islands, nodes):
+    """Linked stand-in nodes per island, with the first of each served over HTTP"""
+    from standin_node import StandinNode, StandinServer, link
+
+    meshes = []
+    for island in range(islands):
+        # No loopback: like the firmware, a node's history holds only what it hears
+        members = [StandinNode(mac=f"24:6f:28:{island:02x}:00:{node:02x}", loopback=False) for node in range(nodes)]
+        link(*members)
+        meshes.append(members)
+    servers = [StandinServer(members[0]) for members in meshes]
+    for server in servers:
+        server.start()
+    return meshes, servers
+
+
+def standin_contents(node, prefix):
+    with node.lock:
+        return [(entry["content"], entry["sender"]) for entry in node.history if entry["content"].startswith(prefix)]
+
+
+def verify_standins(meshes, sent, prefix):
+    """Problems with delivery: each node should hold each sent message once, under its origin"""
+    problems = []
+    for members in meshes:
+        for node in members:
+            held = standin_contents(node, prefix)
+            counts = Counter(content for content, _ in held)
+            repeated = sum(count - 1 for count in counts.values())
+            missing = len({content for content, origin in sent.items() if origin != node.mac} - set(counts))
+            wrong_sender = sum(1 for content, sender in held if sent.get(content, sender) != sender)
+            if missing or repeated or wrong_sender:
+                problems.append(f"{node.mac}: {missing} missing, {repeated} repeated, "
+                                f"{wrong_sender} under the wrong sender")
+    return problems
+
+
+async def run_standin(bridges, meshes, messages, prefix):
+    """Send messages from every node, wait for delivery, and return {content: origin MAC}"""
+    import asyncio
+
+    sent = {}
+    poll_interval = max(bridge.poll_interval for bridge in bridges)
+    for bridge in bridges:
+        await bridge.start()
+    try:
+        for round_ in range(messages):
+            for island, members in enumerate(meshes):
+                # The bridged node (index 0) only listens
+                for index, node in enumerate(members[1:], 1):
+                    content = f"{prefix}{island}-{index}-{round_}"
+                    node.send(content)
+                    sent[content] = node.mac
+            await asyncio.sleep(0)
+        expected = len(sent)
+        deadline = time.monotonic() + STANDIN_SETTLE_S
+        while time.monotonic() < deadline:
+            for bridge in bridges:
+                await bridge.drain()
+            if all(len(standin_contents(node, prefix)) >= expected - messages * (index > 0)
+                   for members in meshes for index, node in enumerate(members)):
+                break
+            await asyncio.sleep(poll_interval)
+        # A few more polls, so a relay that echoed back would show up
+        await asyncio.sleep(poll_interval * 3)
+        for bridge in bridges:
+            await bridge.drain()
+    finally:
+        for bridge in bridges:
+            await bridge.stop()
+    return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relay Mesh-NOW chat between mesh islands")
+    parser.add_argument("nodes_urls", nargs="*", metavar="node", help="One node per island (host[:port] or URL)")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds (default: until Ctrl-C)")
+    parser.add_argument("--queue", type=int, default=DEFAULT_QUEUE, help="Relay queue per island")
+    parser.add_argument("--seen", type=int, default=DEFAULT_SEEN, help="Message ids remembered for deduplication")
+    parser.add_argument("--poll", type=float, default=DEFAULT_POLL, help="Seconds between /messages polls")
+    parser.add_argument("--backlog", action="store_true", help="Also relay the history already on each node")
+    parser.add_argument("--json", help="Write the final counters to this JSON file")
+    parser.add_argument("--standin", type=int, metavar="N", help="Self-test with N local stand-in islands")
+    parser.add_argument("--nodes", type=int, default=8, help="With --standin, nodes per island")
+    parser.add_argument("--messages", type=int, default=4, help="With --standin, messages sent by each node")
+    parser.add_argument("--bridges", type=int, default=1, help="With --standin, bridges over the same islands")
+    parser.add_argument("--ci", action="store_true", help="CI mode - plain output")
+    args = parser.parse_args()
+
+    if args.queue < 1 or args.seen < 1:
+        parser.error("--queue and --seen must be at least 1")
+    meshes, servers = start_standin_islands(args.standin, args.nodes) if args.standin else ([], [])
+    urls = [url if "://" in url else f"http://{url}" for url in args.nodes_urls]
+    urls += [server.base_url for server in servers]
+    if len(urls) < 2:
+        parser.error("name at least two nodes on different islands, or use --standin")
+
+    import asyncio
+
+    poll = 0.05 if servers and args.poll == DEFAULT_POLL else args.poll
+    bridges = [Bridge(urls, args.queue, args.seen, poll, args.backlog) for _ in range(max(1, args.bridges))]
+    bridge = bridges[0]
+    prefix = f"bridge-{int(time.time() * 1000)}-"
+    sent = {}
+    start = time.monotonic()
+    try:
+        if servers:
+            sent = asyncio.run(run_standin(bridges, meshes, args.messages, prefix))
+        else:
+            print(f"Bridging {len(urls)} islands: {', '.join(island.label for island in bridge.islands)}")
+            asyncio.run(bridge.run(args.duration))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.stop()
+    elapsed = time.monotonic() - start
+
+    console = None
+    if RICH_AVAILABLE and not args.ci:
+        from rich.console import Console
+        console = Console()
+    for each in bridges:
+        if console is not None:
+            console.print(render(each, elapsed))
+        else:
+            print_plain(each, elapsed)
+    if args.json:
+        summary = {"elapsed_s": round(elapsed, 2), "bridges": [each.summary() for each in bridges]}
+        Path(args.json).write_text(json.dumps(summary, indent=2) + "\n")
+
+    if servers:
+        problems = verify_standins(meshes, sent, prefix)
+        # However many bridges, each island accepts each message once
+        relays = sum(island.stats["relayed"] for each in bridges for island in each.islands)
+        expected_relays = len(sent) * (len(meshes) - 1)
+        if relays != expected_relays:
+            problems.append(f"{relays} relays accepted, expected {expected_relays}")
+        dropped = sum(island.stats["dropped"] for each in bridges for island in each.islands)
+        if dropped:
+            problems.append(f"{dropped} relays dropped from full queues (--queue {args.queue})")
+        for problem in problems:
+            print(f"MISMATCH {problem}")
+        print(f"Stand-in self-test {'FAILED' if problems else 'passed'}: {len(meshes)} island(s) of "
+              f"{args.nodes} node(s), {len(bridges)} bridge(s), {len(sent)} message(s)")
+        sys.exit(1 if problems else 0)
+    sys.exit(1 if any(island.stats["errors"] and not island.stats["relayed"] for island in bridge.islands) else 0)
+
+
+if __name__ == "__main__":
+    main()
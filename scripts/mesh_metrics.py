@@ -0,0 +1,199 @@
+"""
+Mesh-NOW Metrics Format
+Reference model of components/mesh_now/src/mesh_metrics.c
+
+Names, binary layout and Prometheus text of a node's /metrics, so host tools
+(the scraper and the stand-in node) read and write exactly what the firmware
+serves. Counters, gauges and histograms keep the firmware's enum order; a
+binary snapshot from newer firmware with more of them decodes with
+placeholder names for the extras.
+"""
+
+import re
+import struct
+
+MAGIC = b"MNM"
+VERSION = 1
+HEADER = struct.Struct("<3sBBBBBI")
+
+COUNTERS = (
+    "frames_sent", "frames_send_failed", "frames_received", "frames_invalid", "duplicates", "beacons",
+    "forwarded", "forward_failed", "acks_sent", "acks_received", "retransmits", "retransmit_giveups",
+    "pending_exhausted", "http_failed", "group_forwards_skipped", "presence_updates", "presence_frames",
+    "store_held", "store_evicted", "store_flushed", "store_delivered", "store_expired",
+)
+GAUGES = (
+    ("queue_depth", "gauge"), ("queue_high_water", "gauge"), ("queue_enqueued_total", "counter"),
+    ("queue_dequeued_total", "counter"), ("queue_dropped_total", "counter"), ("peers", "gauge"),
+    ("free_heap_bytes", "gauge"),
+)
+# Short key, metric family, label
+HISTOGRAMS = (
+    ("http_send", "http_request_duration_seconds", 'handler="send"'),
+    ("http_messages", "http_request_duration_seconds", 'handler="messages"'),
+    ("http_static", "http_request_duration_seconds", 'handler="static"'),
+    ("http_api", "http_request_duration_seconds", 'handler="api"'),
+    ("ack_latency", "ack_latency_seconds", None),
+)
+BUCKET_BOUNDS_US = (500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000, 2500000,
+                    5000000)
+
+SAMPLE = re.compile(r'^meshnow_(\w+?)(?:\{([^}]*)\})? (\S+)$')
+U32 = 0xFFFFFFFF
+
+
+class Snapshot:
+    """One scrape of a node: counters, gauges and per-bucket histogram counts"""
+
+    def __init__(self, uptime_ms=0, counters=None, gauges=None, histograms=None):
+        self.uptime_ms = uptime_ms
+        self.counters = counters if counters is not None else {name: 0 for name in COUNTERS}
+        self.gauges = gauges if gauges is not None else {name: 0 for name, _ in GAUGES}
+        # key -> [per-bucket counts (bounds + 1)], sum in microseconds
+        self.histograms = histograms if histograms is not None else {
+            key: [[0] * (len(BUCKET_BOUNDS_US) + 1), 0] for key, _, _ in HISTOGRAMS}
+
+    def observe_us(self, key, elapsed_us):
+        """Add one sample the way mesh_metrics_observe_us() does"""
+        us = min(max(0, int(elapsed_us)), U32)
+        bucket = next((i for i, bound in enumerate(BUCKET_BOUNDS_US) if us <= bound), len(BUCKET_BOUNDS_US))
+        counts = self.histograms[key]
+        counts[0][bucket] += 1
+        counts[1] = (counts[1] + us) & U32
+
+    def count(self, key):
+        return sum(self.histograms[key][0])
+
+    def quantile_ms(self, key, q):
+        """Upper bound of the bucket holding quantile q, in ms (None if empty or above the last bound)"""
+        buckets = self.histograms[key][0]
+        total = sum(buckets)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for bound, count in zip(BUCKET_BOUNDS_US, buckets):
+            seen += count
+            if seen >= rank:
+                return bound / 1000
+        return None
+
+    def mean_ms(self, key):
+        total = self.count(key)
+        return self.histograms[key][1] / total / 1000 if total else None
+
+    def as_dict(self):
+        return {"uptime_ms": self.uptime_ms, "counters": dict(self.counters), "gauges": dict(self.gauges),
+                "histograms": {key: {"buckets": list(counts), "sum_us": total}
+                               for key, (counts, total) in self.histograms.items()}}
+
+
+def decode(data):
+    """Snapshot from the binary form (GET /metrics?format=binary)"""
+    if len(data) < HEADER.size:
+        raise ValueError(f"metrics payload too short ({len(data)} bytes)")
+    magic, version, n_counters, n_gauges, n_histograms, n_bounds, uptime_ms = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"not a metrics payload (magic {magic!r})")
+    if version != VERSION:
+        raise ValueError(f"unsupported metrics format version {version}")
+    expected = HEADER.size + 4 * (n_counters + n_gauges + n_histograms * (n_bounds + 2))
+    if len(data) != expected:
+        raise ValueError(f"metrics payload is {len(data)} bytes, header says {expected}")
+    if n_bounds != len(BUCKET_BOUNDS_US):
+        raise ValueError(f"{n_bounds} histogram buckets, expected {len(BUCKET_BOUNDS_US)}")
+
+    values = struct.unpack_from(f"<{(len(data) - HEADER.size) // 4}I", data, HEADER.size)
+    counter_names = COUNTERS + tuple(f"counter_{i}" for i in range(len(COUNTERS), n_counters))
+    gauge_names = tuple(name for name, _ in GAUGES) + tuple(f"gauge_{i}" for i in range(len(GAUGES), n_gauges))
+    keys = tuple(key for key, _, _ in HISTOGRAMS) + tuple(f"histogram_{i}" for i in range(len(HISTOGRAMS),
+                                                                                          n_histograms))
+    counters = dict(zip(counter_names, values[:n_counters]))
+    offset = n_counters
+    gauges = dict(zip(gauge_names, values[offset:offset + n_gauges]))
+    offset += n_gauges
+    histograms = {}
+    for key in keys[:n_histograms]:
+        histograms[key] = [list(values[offset:offset + n_bounds + 1]), values[offset + n_bounds + 1]]
+        offset += n_bounds + 2
+    return Snapshot(uptime_ms, counters, gauges, histograms)
+
+
+def encode(snapshot):
+    """Binary form of snapshot, as mesh_metrics_encode() writes it"""
+    values = [snapshot.counters.get(name, 0) for name in COUNTERS]
+    values += [snapshot.gauges.get(name, 0) for name, _ in GAUGES]
+    for key, _, _ in HISTOGRAMS:
+        counts, total = snapshot.histograms[key]
+        values += list(counts) + [total]
+    header = HEADER.pack(MAGIC, VERSION, len(COUNTERS), len(GAUGES), len(HISTOGRAMS), len(BUCKET_BOUNDS_US),
+                         snapshot.uptime_ms & U32)
+    return header + struct.pack(f"<{len(values)}I", *(value & U32 for value in values))
+
+
+def _seconds(us):
+    return f"{us // 1000000}.{us % 1000000:06d}"
+
+
+def format_text(snapshot):
+    """Prometheus text with the samples mesh_metrics_write_text() writes (HELP lines left out)"""
+    lines = ["# TYPE meshnow_uptime_seconds gauge",
+             f"meshnow_uptime_seconds {snapshot.uptime_ms // 1000}.{snapshot.uptime_ms % 1000:03d}"]
+    for name in COUNTERS:
+        lines += [f"# TYPE meshnow_{name}_total counter", f"meshnow_{name}_total {snapshot.counters.get(name, 0)}"]
+    for name, kind in GAUGES:
+        lines += [f"# TYPE meshnow_{name} {kind}", f"meshnow_{name} {snapshot.gauges.get(name, 0)}"]
+    previous = None
+    for key, family, labels in HISTOGRAMS:
+        if family != previous:
+            lines.append(f"# TYPE meshnow_{family} histogram")
+            previous = family
+        counts, total = snapshot.histograms[key]
+        prefix = f"{labels}," if labels else ""
+        cumulative = 0
+        for bound, count in zip(BUCKET_BOUNDS_US, counts):
+            cumulative += count
+            lines.append(f'meshnow_{family}_bucket{{{prefix}le="{_seconds(bound)}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'meshnow_{family}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines += [f"meshnow_{family}_sum{suffix} {_seconds(total)}", f"meshnow_{family}_count{suffix} {cumulative}"]
+    return "\n".join(lines) + "\n"
+
+
+def parse_text(text):
+    """Snapshot from the Prometheus text form (GET /metrics)"""
+    snapshot = Snapshot()
+    gauges = {name for name, _ in GAUGES}
+    histograms = {(family, labels or ""): key for key, family, labels in HISTOGRAMS}
+    bucket_index = {bound: index for index, bound in enumerate(BUCKET_BOUNDS_US)}
+    cumulative = {}
+    for line in text.splitlines():
+        match = SAMPLE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.group(1), match.group(2) or "", match.group(3)
+        if name == "uptime_seconds":
+            snapshot.uptime_ms = round(float(value) * 1000)
+        elif name in gauges:
+            snapshot.gauges[name] = int(value)
+        elif name.endswith("_total") and name[:-6] in COUNTERS:
+            snapshot.counters[name[:-6]] = int(value)
+        elif name.endswith("_bucket"):
+            le = re.search(r'le="([^"]+)"', labels).group(1)
+            rest = re.sub(r',?le="[^"]+"', "", labels)
+            key = histograms.get((name[:-7], rest))
+            # Placed by their bound, not by the order the lines came in
+            bucket = len(BUCKET_BOUNDS_US) if le == "+Inf" else bucket_index.get(round(float(le) * 1000000))
+            if key and bucket is not None:
+                cumulative.setdefault(key, {})[bucket] = int(value)
+        elif name.endswith("_sum"):
+            key = histograms.get((name[:-4], labels))
+            if key:
+                whole, _, fraction = value.partition(".")
+                snapshot.histograms[key][1] = int(whole) * 1000000 + int((fraction + "000000")[:6])
+    for key, buckets in cumulative.items():
+        if len(buckets) == len(BUCKET_BOUNDS_US) + 1:
+            totals = [buckets[index] for index in range(len(buckets))]
+            snapshot.histograms[key][0] = [b - a for a, b in zip([0] + totals[:-1], totals)]
+    return snapshot
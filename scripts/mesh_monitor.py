@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+"""
+Mesh-NOW Mesh Monitor
+Live per-node telemetry from the firmware's serial logs
+
+Tails one serial port or log file per node, parses the MESH_NOW log lines
+(received frames, sends, beacons, ACKs, retransmits, peer changes) into
+events and keeps rolling metrics for each node in memory: RX/TX rate,
+duplicates, ACK latency, retransmits, send failures and peer churn. A rich
+dashboard shows them while the mesh runs:
+
+    python scripts/mesh_monitor.py                          # every USB serial port
+    python scripts/mesh_monitor.py /dev/ttyUSB0 /dev/ttyUSB1 --window 30
+    python scripts/mesh_monitor.py node-a.log node-b.log --ci          # replay, print the totals
+    python scripts/mesh_monitor.py node.log --follow --events events.jsonl
+
+Serial ports need pyserial. Rates and latencies use the timestamps ESP-IDF
+puts in each log line (milliseconds since boot), so a replayed log gives the
+same numbers it gave live; a node whose timestamps jump back has rebooted.
+Parsing is one prefix match plus a dictionary lookup per line, so a single
+process keeps up with well over 10k lines/s (--benchmark measures it).
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import stat
+import argparse
+import importlib.util
+from collections import deque
+from pathlib import Path
+
+# rich and asyncio are imported where they are used, so --benchmark and
+# --help never load them
+RICH_AVAILABLE = importlib.util.find_spec("rich") is not None
+
+DEFAULT_BAUD = 115200
+DEFAULT_WINDOW = 10.0
+DEFAULT_REFRESH = 0.5
+READ_SIZE = 65536
+FILE_POLL = 0.2
+# Sent messages remembered per node while waiting for their ACK
+MAX_AWAITING_ACK = 1024
+LATENCY_SAMPLES = 512
+# A timestamp this far behind the node's last one means the node rebooted
+REBOOT_BACKSTEP_MS = 2000
+REQUIRED_RATE = 10000
+
+MSG_TYPES = {0: "beacon", 1: "chat", 2: "direct", 3: "ack", 4: "group", 5: "presence", 6: "typing"}
+
+# "I (12345) MESH_NOW: Received ..." with optional ANSI colour codes around it
+LOG_LINE = re.compile(r"(?:\x1b\[[0-9;]*m)?([EWIDV]) \((\d+)\) ([\w-]+): (.*?)(?:\x1b\[0m)?$")
+MAC = r"([0-9a-f]{2}(?::[0-9a-f]{2}){5})"
+
+# Message patterns keyed by their first KEY_LENGTH characters: one dict
+# lookup picks the only regex that can match
+KEY_LENGTH = 12
+EVENT_PATTERNS = {
+    "Received ESP": ("rx", re.compile(r"Received ESP-NOW message from " + MAC + r", type: (\d+), id: (\d+)")),
+    "Duplicate me": ("duplicate", re.compile(r"Duplicate message (\d+) ignored")),
+    "Received dis": ("beacon", re.compile(r"Received discovery beacon from " + MAC)),
+    "Received ACK": ("ack", re.compile(r"Received ACK for message (\d+)")),
+    "Sent message": ("tx", re.compile(r"Sent message type (\d+) id (\d+)")),
+    "Message sent": ("send_ok", re.compile(r"Message sent successfully to " + MAC)),
+    "Failed to se": ("send_failed", re.compile(r"Failed to send (?:message to |ACK for message )(\S+)")),
+    "Failed to ro": ("send_failed", re.compile(r"Failed to route message (\d+)")),
+    "Retransmitte": ("retransmit", re.compile(r"Retransmitted message (\d+) \(retry (\d+)\)")),
+    "Retransmit f": ("send_failed", re.compile(r"Retransmit failed for (\d+)")),
+    # Out of retries: firmware with store-and-forward holds the message for its target, older firmware drops it
+    "Holding mess": ("dropped", re.compile(r"Holding message (\d+) for its target after (\d+) retries")),
+    "Dropping mes": ("dropped", re.compile(r"Dropping message (\d+) after (\d+) retries")),
+    "No pending s": ("dropped", re.compile(r"No pending slots available for message (\d+)")),
+    "Added peer: ": ("peer_added", re.compile(r"Added peer: " + MAC)),
+    "Removed peer": ("peer_removed", re.compile(r"Removed peer: " + MAC)),
+    "Active mesh ": ("peers", re.compile(r"Active mesh peers: (\d+)")),
+    "Device MAC: ": ("mac", re.compile(r"Device MAC: " + MAC)),
+}
+
+COUNTED = ("rx", "tx", "duplicate", "beacon", "ack", "retransmit", "dropped", "send_failed", "peer_added",
+           "peer_removed")
+
+
+def parse_line(line):
+    """(level, timestamp ms, tag, event, match) for a known log line, else None"""
+    match = LOG_LINE.match(line)
+    if not match:
+        return None
+    level, ts, tag, message = match.groups()
+    entry = EVENT_PATTERNS.get(message[:KEY_LENGTH])
+    if entry is None:
+        return None
+    event, pattern = entry
+    fields = pattern.match(message)
+    if fields is None:
+        return None
+    return level, int(ts), tag, event, fields
+
+
+class RollingCounter:
+    """Event counts in one-second buckets over the last window seconds"""
+
+    def __init__(self, window):
+        self.window = max(1, int(window))
+        self.buckets = [0] * self.window
+        self.seconds = [-1] * self.window
+        self.total = 0
+
+    def add(self, second, count=1):
+        slot = second % self.window
+        if self.seconds[slot] != second:
+            self.seconds[slot] = second
+            self.buckets[slot] = 0
+        self.buckets[slot] += count
+        self.total += count
+
+    def count(self, now_second):
+        oldest = now_second - self.window
+        return sum(n for n, s in zip(self.buckets, self.seconds) if oldest < s <= now_second)
+
+    def rate(self, now_second):
+        return self.count(now_second) / self.window
+
+
+class NodeMetrics:
+    """Rolling metrics of one node, fed with its parsed log lines"""
+
+    def __init__(self, name, window):
+        self.name = name
+        self.window = window
+        self.mac = None
+        self.lines = 0
+        self.counters = {event: RollingCounter(window) for event in COUNTED}
+        self.awaiting_ack = {}
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.peers = set()
+        self.peer_count = None
+        self.reboots = 0
+        self.last_ts = None
+        self.last_seen = None
+        self.error = None
+
+    def observe(self, parsed, arrival):
+        """Fold one parse_line() result in; returns the event as a dict"""
+        _, ts, _, event, fields = parsed
+        if self.last_ts is not None and ts < self.last_ts - REBOOT_BACKSTEP_MS:
+            self.reboots += 1
+            self.awaiting_ack.clear()
+            self.latencies.clear()
+            self.peers.clear()
+        self.last_ts = ts
+        self.last_seen = arrival
+        second = ts // 1000
+        record = {"node": self.name, "ts": ts, "event": event}
+
+        if event in self.counters:
+            self.counters[event].add(second)
+        if event == "rx":
+            record.update(src=fields.group(1), type=MSG_TYPES.get(int(fields.group(2)), fields.group(2)),
+                          id=int(fields.group(3)))
+        elif event == "tx":
+            msg_type, msg_id = int(fields.group(1)), int(fields.group(2))
+            record.update(type=MSG_TYPES.get(msg_type, msg_type), id=msg_id)
+            if msg_type == 2:
+                if len(self.awaiting_ack) >= MAX_AWAITING_ACK:
+                    del self.awaiting_ack[next(iter(self.awaiting_ack))]
+                self.awaiting_ack[msg_id] = ts
+        elif event == "ack":
+            msg_id = int(fields.group(1))
+            record["id"] = msg_id
+            sent = self.awaiting_ack.pop(msg_id, None)
+            if sent is not None:
+                record["latency_ms"] = ts - sent
+                self.latencies.append((ts, ts - sent))
+        elif event in ("duplicate", "retransmit"):
+            record["id"] = int(fields.group(1))
+        elif event == "dropped":
+            record["id"] = int(fields.group(1))
+            self.awaiting_ack.pop(record["id"], None)
+        elif event == "peer_added":
+            self.peers.add(fields.group(1))
+            record["peer"] = fields.group(1)
+        elif event == "peer_removed":
+            self.peers.discard(fields.group(1))
+            record["peer"] = fields.group(1)
+        elif event == "peers":
+            self.peer_count = int(fields.group(1))
+            record["count"] = self.peer_count
+        elif event == "mac":
+            self.mac = fields.group(1)
+            record["mac"] = self.mac
+        elif event in ("beacon", "send_ok", "send_failed"):
+            record["target"] = fields.group(1)
+        return record
+
+    def now_ms(self, live, now):
+        """The node's current time: its last timestamp, advanced by wall time when live"""
+        if self.last_ts is None:
+            return 0
+        if live and self.last_seen is not None:
+            return self.last_ts + int((now - self.last_seen) * 1000)
+        return self.last_ts
+
+    def snapshot(self, live=True, now=None):
+        now_ms = self.now_ms(live, time.monotonic() if now is None else now)
+        second = now_ms // 1000
+        counts = {event: counter.count(second) for event, counter in self.counters.items()}
+        recent = sorted(ms for ts, ms in self.latencies if ts > now_ms - self.window * 1000)
+        rx = counts["rx"]
+        return {
+            "node": self.name,
+            "mac": self.mac,
+            "lines": self.lines,
+            "rx_per_s": rx / self.window,
+            "tx_per_s": (counts["tx"] + counts["retransmit"]) / self.window,
+            "duplicates": counts["duplicate"],
+            "duplicate_pct": counts["duplicate"] / (rx or 1) * 100,
+            "beacons": counts["beacon"],
+            "ack_p50_ms": percentile(recent, 50),
+            "ack_p95_ms": percentile(recent, 95),
+            "acks": counts["ack"],
+            "awaiting_ack": len(self.awaiting_ack),
+            "retransmits": counts["retransmit"],
+            "dropped": counts["dropped"],
+            "send_failed": counts["send_failed"],
+            "peers": self.peer_count if self.peer_count is not None else len(self.peers),
+            "peer_churn": counts["peer_added"] + counts["peer_removed"],
+            "reboots": self.reboots,
+            "totals": {event: counter.total for event, counter in self.counters.items()},
+        }
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Monitor:
+    """Routes lines from every source to its node's metrics"""
+
+    def __init__(self, window, events_file=None):
+        self.window = window
+        self.nodes = {}
+        self.events_file = events_file
+        self.lines = 0
+        self.started = time.monotonic()
+
+    def node(self, name):
+        metrics = self.nodes.get(name)
+        if metrics is None:
+            metrics = self.nodes[name] = NodeMetrics(name, self.window)
+        return metrics
+
+    def feed(self, name, lines, arrival=None):
+        node = self.node(name)
+        arrival = time.monotonic() if arrival is None else arrival
+        node.lines += len(lines)
+        self.lines += len(lines)
+        for line in lines:
+            parsed = parse_line(line)
+            if parsed is None:
+                continue
+            record = node.observe(parsed, arrival)
+            if self.events_file:
+                self.events_file.write(json.dumps(record) + "\n")
+
+
+# Sources -----------------------------------------------------------------------
+
+def is_serial(path):
+    if re.match(r"^(COM\d+|/dev/(tty|cu)\.?\w+)", path):
+        return True
+    try:
+        return stat.S_ISCHR(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+def source_name(path):
+    return Path(path).name if not path.startswith("COM") else path
+
+
+class LineSplitter:
+    """Split byte chunks into decoded lines, holding back a partial last line"""
+
+    def __init__(self):
+        self.partial = b""
+
+    def split(self, chunk):
+        data = self.partial + chunk
+        parts = data.split(b"\n")
+        self.partial = parts.pop()
+        return [part.decode("utf-8", "replace").rstrip("\r") for part in parts]
+
+    def flush(self):
+        rest, self.partial = self.partial, b""
+        return [rest.decode("utf-8", "replace").rstrip("\r")] if rest else []
+
+
+async def tail_file(monitor, path, follow, stop):
+    """Read a log file to its end, then (with follow) keep reading what is appended"""
+    import asyncio
+
+    name = source_name(path)
+    splitter = LineSplitter()
+    with open(path, "rb") as f:
+        while not stop.is_set():
+            chunk = f.read(READ_SIZE)
+            if chunk:
+                monitor.feed(name, splitter.split(chunk))
+                # Let the other sources and the dashboard run between chunks
+                await asyncio.sleep(0)
+                continue
+            if not follow:
+                break
+            if os.stat(path).st_size < f.tell():
+                # Truncated or rotated in place: start over
+                f.seek(0)
+            try:
+                await asyncio.wait_for(stop.wait(), FILE_POLL)
+            except asyncio.TimeoutError:
+                pass
+    monitor.feed(name, splitter.flush())
+
+
+async def tail_serial(monitor, port, baud, stop):
+    """Read a serial port on a worker thread until stopped"""
+    import asyncio
+    import serial
+
+    name = source_name(port)
+    node = monitor.node(name)
+    loop = asyncio.get_running_loop()
+    try:
+        connection = serial.serial_for_url(port, baudrate=baud, timeout=FILE_POLL)
+    except (serial.SerialException, OSError) as e:
+        node.error = f"can't open: {e}"
+        return
+    splitter = LineSplitter()
+    try:
+        while not stop.is_set():
+            # in_waiting keeps large reads from waiting on the timeout for a full buffer
+            chunk = await loop.run_in_executor(None, lambda: connection.read(max(1, connection.in_waiting)))
+            if chunk:
+                monitor.feed(name, splitter.split(chunk))
+    except serial.SerialException as e:
+        node.error = f"disconnected: {e}"
+    finally:
+        connection.close()
+    monitor.feed(name, splitter.flush())
+
+
+# Output ------------------------------------------------------------------------
+
+COLUMNS = ("Node", "RX/s", "TX/s", "Dup%", "Bcn", "ACK p50", "p95", "Retx", "Drop", "Fail", "Peers", "Churn",
+           "Boots")
+
+
+def fmt_ms(value):
+    return "-" if value is None else f"{value:.0f}ms"
+
+
+def rows(monitor, live):
+    now = time.monotonic()
+    for name in sorted(monitor.nodes):
+        s = monitor.nodes[name].snapshot(live, now)
+        # The last three MAC bytes tell boards apart
+        label = f"{name} {s['mac'][9:]}" if s["mac"] else name
+        if monitor.nodes[name].error:
+            label += f" ({monitor.nodes[name].error})"
+        yield (label, f"{s['rx_per_s']:.1f}", f"{s['tx_per_s']:.1f}", f"{s['duplicate_pct']:.1f}", str(s["beacons"]),
+               fmt_ms(s["ack_p50_ms"]), fmt_ms(s["ack_p95_ms"]), str(s["retransmits"]), str(s["dropped"]),
+               str(s["send_failed"]), str(s["peers"]), str(s["peer_churn"]), str(s["reboots"])), s
+
+
+def title(monitor):
+    elapsed = max(time.monotonic() - monitor.started, 1e-6)
+    return (f"Mesh-NOW: {len(monitor.nodes)} node(s), {monitor.lines} lines, {monitor.lines / elapsed:,.0f} lines/s, "
+            f"{monitor.window:g}s window")
+
+
+def render(monitor, live):
+    from rich.table import Table
+
+    table = Table(title=title(monitor))
+    for index, column in enumerate(COLUMNS):
+        table.add_column(column, justify="left" if index == 0 else "right")
+    for row, s in rows(monitor, live):
+        node = monitor.nodes[s["node"]]
+        style = "red" if node.error or s["dropped"] or s["send_failed"] else "yellow" if s["retransmits"] else None
+        table.add_row(*row, style=style)
+    return table
+
+
+def print_plain(monitor, live):
+    print(title(monitor))
+    table = [COLUMNS] + [row for row, _ in rows(monitor, live)]
+    widths = [max(len(row[i]) for row in table) for i in range(len(COLUMNS))]
+    for row in table:
+        print("  ".join(c.ljust(w) if i == 0 else c.rjust(w) for i, (c, w) in enumerate(zip(row, widths))))
+    sys.stdout.flush()
+
+
+async def run_monitor(monitor, sources, args, console):
+    import asyncio
+    import signal
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    tasks = []
+    for source in sources:
+        if is_serial(source):
+            tasks.append(asyncio.ensure_future(tail_serial(monitor, source, args.baud, stop)))
+        else:
+            tasks.append(asyncio.ensure_future(tail_file(monitor, source, args.follow, stop)))
+    readers = asyncio.ensure_future(asyncio.gather(*tasks))
+    deadline = time.monotonic() + args.duration if args.duration else None
+
+    async def wait_tick(interval):
+        try:
+            await asyncio.wait({readers, asyncio.ensure_future(stop.wait())}, timeout=interval,
+                               return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if deadline is not None and time.monotonic() >= deadline:
+                stop.set()
+
+    live = any(is_serial(source) for source in sources) or args.follow
+    try:
+        if console is not None and live:
+            from rich.live import Live
+            with Live(render(monitor, live), console=console, refresh_per_second=max(1, int(1 / args.refresh))) as view:
+                while not readers.done() and not stop.is_set():
+                    await wait_tick(args.refresh)
+                    view.update(render(monitor, live))
+        elif live and args.interval:
+            while not readers.done() and not stop.is_set():
+                await wait_tick(args.interval)
+                print_plain(monitor, live)
+        else:
+            while not readers.done() and not stop.is_set():
+                await wait_tick(args.refresh)
+    finally:
+        stop.set()
+        await readers
+    return live
+
+
+# Benchmark ---------------------------------------------------------------------
+
+def synthetic_lines(count, nodes=4):
+    """A mix of log lines like a busy mesh produces, timestamps 1 ms apart"""
+    macs = [f"24:0a:c4:00:00:{index:02x}" for index in range(nodes)]
+    templates = [
+        "I ({ts}) MESH_NOW: Received ESP-NOW message from {mac}, type: 1, id: {id}",
+        "I ({ts}) MESH_NOW: Message sent successfully to ff:ff:ff:ff:ff:ff",
+        "I ({ts}) MESH_NOW: Sent message type 2 id {id}",
+        "I ({ts}) MESH_NOW: Received ACK for message {ack}",
+        "W ({ts}) MESH_NOW: Duplicate message {id} ignored",
+        "I ({ts}) MESH_NOW: Received discovery beacon from {mac}",
+        "I ({ts}) MSG_QUEUE: Message queued successfully",
+        "I ({ts}) MESH_NOW: Retransmitted message {id} (retry 1)",
+    ]
+    lines = []
+    for index in range(count):
+        template = templates[index % len(templates)]
+        lines.append(template.format(ts=1000 + index, mac=macs[index % nodes], id=index, ack=index - 1))
+    return lines
+
+
+def benchmark(count):
+    lines = synthetic_lines(count)
+    monitor = Monitor(DEFAULT_WINDOW)
+    chunk = 1000
+    start = time.perf_counter()
+    for offset in range(0, count, chunk):
+        monitor.feed("bench", lines[offset:offset + chunk], arrival=0.0)
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed
+    ok = rate >= REQUIRED_RATE
+    print(f"Parsed {count} lines in {elapsed * 1000:.0f} ms: {rate:,.0f} lines/s "
+          f"({'ok' if ok else 'below'} the {REQUIRED_RATE:,} lines/s target)")
+    return ok
+
+
+def default_ports():
+    from flash_mesh_now import enumerate_ports
+    return enumerate_ports()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Live per-node telemetry from Mesh-NOW serial logs")
+    parser.add_argument("sources", nargs="*", help="Serial ports or log files, one per node "
+                                                   "(default: every USB serial port)")
+    parser.add_argument("--baud", type=int, default=DEFAULT_BAUD, help=f"Serial baud rate (default {DEFAULT_BAUD})")
+    parser.add_argument("--follow", action="store_true", help="Keep reading log files as they grow")
+    parser.add_argument("--window", type=float, default=DEFAULT_WINDOW,
+                        help=f"Seconds the rolling metrics cover (default {DEFAULT_WINDOW:g})")
+    parser.add_argument("--refresh", type=float, default=DEFAULT_REFRESH, help="Dashboard refresh interval (s)")
+    parser.add_argument("--interval", type=float, default=10.0,
+                        help="With --ci on live sources, print the table this often (s; 0 = only at the end)")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds")
+    parser.add_argument("--events", help="Write every parsed event to this JSON-lines file")
+    parser.add_argument("--json", help="Write the final per-node metrics to this JSON file")
+    parser.add_argument("--benchmark", type=int, metavar="LINES", nargs="?", const=200000,
+                        help="Measure parsing throughput on synthetic lines and exit")
+    parser.add_argument("--ci", action="store_true", help="CI mode - plain output")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        sys.exit(0 if benchmark(args.benchmark) else 1)
+    if args.window < 1:
+        parser.error("--window must be at least 1 second")
+    if args.refresh <= 0:
+        parser.error("--refresh must be positive")
+
+    sources = args.sources or default_ports()
+    if not sources:
+        parser.error("no serial ports found; name ports or log files")
+    missing = [source for source in sources if not is_serial(source) and not os.path.isfile(source)]
+    if missing:
+        parser.error(f"not found: {', '.join(missing)}")
+    if any(is_serial(source) for source in sources) and importlib.util.find_spec("serial") is None:
+        parser.error("reading serial ports needs pyserial: pip install pyserial")
+    names = [source_name(source) for source in sources]
+    if len(set(names)) != len(names):
+        parser.error("sources must have distinct file names; each one is a node")
+
+    console = None
+    if RICH_AVAILABLE and not args.ci:
+        from rich.console import Console
+        console = Console()
+
+    import asyncio
+
+    events_file = open(args.events, "w") if args.events else None
+    monitor = Monitor(args.window, events_file)
+    try:
+        live = asyncio.run(run_monitor(monitor, sources, args, console))
+    finally:
+        if events_file:
+            events_file.close()
+
+    if console is not None:
+        if not live:
+            # A live dashboard leaves its last frame on screen
+            console.print(render(monitor, live))
+    else:
+        print_plain(monitor, live)
+    if args.json:
+        snapshots = [monitor.nodes[name].snapshot(live) for name in sorted(monitor.nodes)]
+        Path(args.json).write_text(json.dumps({"window_s": args.window, "lines": monitor.lines,
+                                               "nodes": snapshots}, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Mesh-NOW CLI
+One entry point for the build, flash and frontend scripts
+
+    python scripts/meshnow build --target esp32s3 --ci
+    python scripts/meshnow fleet-flash release/firmware --ports "/dev/ttyUSB*" --jobs 8
+    python scripts/meshnow --help
+
+Each subcommand runs the matching script's main() with the remaining
+arguments, so `meshnow flash --help` and `scripts/flash.py --help` are the
+same tool. A script is only imported when its subcommand runs, and the
+scripts import rich, asyncio and friends where they use them, so a --ci
+invocation pays for little more than the interpreter.
+scripts/check_startup.py holds every subcommand to an import-time budget.
+"""
+
+import sys
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent.parent
+
+
+def fleet_args(args):
+    """flash_mesh_now.py arguments for fleet-flash: --ports is its --fleet"""
+    args = ["--fleet" if arg == "--ports" else arg for arg in args]
+    return args if "--fleet" in args else args + ["--fleet"]
+
+
+# Subcommand: (script relative to the project, summary, argument rewrite)
+COMMANDS = {
+    "build": ("scripts/build.py", "Build one target, or pick one interactively", None),
+    "build-all": ("scripts/build_all.py", "Build every target", None),
+    "flash": ("scripts/flash.py", "Flash one board from a firmware directory", None),
+    "fleet-flash": ("scripts/flash_mesh_now.py", "Flash every connected board at once", fleet_args),
+    "embed": ("scripts/embed_frontend.py", "Embed the built frontend as C headers", None),
+    "frontend": ("frontend/build_frontend.py", "Build the web frontend", None),
+    "test-targets": ("scripts/test_targets.py", "Check every target's configuration", None),
+    "profiles": ("scripts/sdkconfig_profiles.py", "Generate and check the performance sdkconfig profiles", None),
+    "monitor": ("scripts/mesh_monitor.py", "Live per-node telemetry from serial logs", None),
+    "metrics": ("scripts/metrics_scraper.py", "Scrape /metrics from many nodes at once", None),
+    "load-test": ("scripts/load_test.py", "Load test the web API and report latency", None),
+    "bridge": ("scripts/mesh_bridge.py", "Relay chat between mesh islands", None),
+    "group-sim": ("scripts/group_sim.py", "Simulate group-aware forwarding against flooding", None),
+    "host-test": ("scripts/host_test.py", "Run the mesh_now host tests and benchmarks", None),
+    "size": ("scripts/size_tracker.py", "Record and compare firmware sizes", None),
+    "install-esptool": ("scripts/install_esptool.py", "Install esptool.py", None),
+}
+
+
+def usage():
+    lines = ["usage: meshnow <command> [arguments]", "", "commands:"]
+    lines += [f"  {name:<16} {summary}" for name, (_, summary, _) in COMMANDS.items()]
+    lines += ["", "Run 'meshnow <command> --help' for a command's own options."]
+    return "\n".join(lines)
+
+
+def load_script(path):
+    """Import a script by path, registered under its file name like a plain import"""
+    import importlib.util
+
+    path = PROJECT_DIR / path
+    # Scripts import their siblings (command_runner, build_profile, ...)
+    if str(path.parent) not in sys.path:
+        sys.path.insert(0, str(path.parent))
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[path.stem] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return 0 if argv else 2
+
+    name, args = argv[0], argv[1:]
+    if name not in COMMANDS:
+        print(f"meshnow: unknown command '{name}'", file=sys.stderr)
+        print(usage(), file=sys.stderr)
+        return 2
+
+    path, _, rewrite = COMMANDS[name]
+    module = load_script(path)
+    sys.argv = [f"meshnow {name}"] + (rewrite(args) if rewrite else args)
+    return module.main()
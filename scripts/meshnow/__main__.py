@@ -0,0 +1,10 @@
+"""Entry point for `python scripts/meshnow` and `python -m meshnow` (from scripts/)"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from meshnow import main
+
+sys.exit(main())
@@ -0,0 +1,415 @@
+"""
+Mesh-NOW Client
+asyncio client for a node's web API (main/src/web_server.c)
+
+    from meshnow.client import MeshNowClient
+
+    async with MeshNowClient("http://192.168.4.1") as node:
+        await node.send("hello")
+        await node.send_batch(["one", "two", "three"])
+        async for message in node.iter_messages(follow=True):
+            print(message.sender, message.content)
+        await node.join_group(3)
+        await node.send("hello group 3", group=3)
+
+Requests share a small pool of keep-alive connections (pool_size, 2 by
+default): the node's httpd serves only a handful of sockets, and a TCP and
+Wi-Fi handshake per request costs more than most handlers. send_batch packs
+up to SEND_BATCH_MAX messages into each /send body and pipelines the bodies
+on one connection, so a long batch costs one round trip per connection
+rather than one per message.
+
+A 503 response, a refused connection (the node is out of sockets) or a reset
+is retried with exponential backoff and jitter, honouring Retry-After.
+GETs are also retried after timeouts and resets mid-response. A /send is
+only repeated when the node cannot have acted on it, so a retry does not
+post a message twice.
+"""
+
+import json
+import random
+import asyncio
+from collections import namedtuple
+from urllib.parse import quote, urlsplit
+
+SEND_BATCH_MAX = 16          # CONFIG_MESH_NOW_SEND_BATCH_MAX default, see send_decoder.py
+MESSAGES_PAGE_MAX = 25
+SESSION_COOKIE = "meshnow_sid"
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_TIMEOUT = 5.0
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF = 0.25
+MAX_BACKOFF = 8.0
+
+# message_id is the originating node's id for the message, shared by every node that heard it;
+# group is the group a group message was sent to, None for a broadcast
+Message = namedtuple("Message", "seq sender content timestamp message_id group", defaults=(None,))
+
+
+class MeshNowError(Exception):
+    """A request that failed after its retries"""
+
+
+class HttpStatusError(MeshNowError):
+    def __init__(self, status, body=b""):
+        super().__init__(f"HTTP {status}: {body[:80].decode('utf-8', 'replace')}")
+        self.status = status
+        self.body = body
+
+
+class ProtocolError(MeshNowError):
+    """A response that is not HTTP/1.1"""
+
+
+class StaleConnection(ConnectionResetError):
+    """A reused keep-alive connection the server had already closed"""
+
+
+class Connection:
+    """One HTTP/1.1 connection, reopened when the server closes it"""
+
+    def __init__(self, host, port, timeout=DEFAULT_TIMEOUT, keepalive=True):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.reader = None
+        self.writer = None
+        self.opened = 0
+        self.requests = 0
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b"", headers=None):
+        """(status, headers, body) of one request"""
+        return (await self.pipeline([(method, path, body, headers)]))[0]
+
+    async def pipeline(self, requests):
+        """Write every (method, path, body, headers) request, then read the responses in order
+
+        Raises on the first failure; responses read before it are lost with the
+        connection, so callers pipeline only requests they can account for.
+        """
+        try:
+            return await asyncio.wait_for(self._pipeline(requests), self.timeout * len(requests))
+        except BaseException:
+            # A half-read response leaves the connection unusable
+            await self.close()
+            raise
+
+    async def _pipeline(self, requests):
+        reused = self.writer is not None
+        if not reused:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            self.opened += 1
+        for method, path, body, headers in requests:
+            self.writer.write(self._encode(method, path, body or b"", headers or {}))
+        await self.writer.drain()
+
+        responses = []
+        for index in range(len(requests)):
+            try:
+                response = await self._read_response()
+            except ConnectionResetError:
+                # Nothing came back on a pooled connection: the server closed it while idle
+                if reused and not responses:
+                    raise StaleConnection("keep-alive connection closed by the server")
+                raise
+            self.requests += 1
+            responses.append(response)
+            if response[1].get("connection", "").lower() == "close" and index < len(requests) - 1:
+                raise ConnectionResetError("server closed the connection inside a pipeline")
+        if not self.keepalive or responses[-1][1].get("connection", "").lower() == "close":
+            await self.close()
+        return responses
+
+    def _encode(self, method, path, body, headers):
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}",
+                 f"Connection: {'keep-alive' if self.keepalive else 'close'}"]
+        lines += [f"{key}: {value}" for key, value in headers.items()]
+        if body or method == "POST":
+            lines.append(f"Content-Length: {len(body)}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+    async def _read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed before the response")
+        parts = status_line.split(None, 2)
+        if len(parts) < 2 or not parts[1].isdigit():
+            raise ProtocolError(f"bad status line {status_line[:40]!r}")
+        status = int(parts[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            data = bytearray()
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                data += await self.reader.readexactly(size)
+                await self.reader.readline()
+            data = bytes(data)
+        elif "content-length" in headers:
+            data = await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            data = await self.reader.read()
+            headers["connection"] = "close"
+        return status, headers, data
+
+
+def encode_send_body(messages):
+    """Form body /send decodes into these messages, in order"""
+    return "&".join(f"message={quote(message, safe='')}" for message in messages).encode("ascii")
+
+
+class MessageIterator:
+    """Follows the /messages cursor; since is where to resume, missed counts overwritten messages"""
+
+    def __init__(self, client, since, follow, poll_interval, limit, group=None):
+        self.client = client
+        self.group = group
+        self.since = since
+        self.follow = follow
+        self.poll_interval = poll_interval
+        self.limit = limit
+        self.missed = 0
+        self.buffer = []
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self.buffer:
+            page = await self.client.messages(self.since, self.limit, self.group)
+            oldest = page.get("oldest", 0)
+            if oldest > self.since + 1 and page["messages"]:
+                # The node's history wrapped past the cursor
+                self.missed += oldest - self.since - 1
+            self.buffer = [Message(m["seq"], m["sender"], m["content"], m["timestamp"], m.get("id", 0),
+                                   m.get("group")) for m in page["messages"]]
+            self.since = page.get("next", self.since)
+            if self.buffer or page.get("more"):
+                continue
+            if not self.follow:
+                raise StopAsyncIteration
+            await asyncio.sleep(self.poll_interval)
+        return self.buffer.pop(0)
+
+
+class MeshNowClient:
+    """Async client for one node, with a keep-alive connection pool"""
+
+    def __init__(self, base_url, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, session=True):
+        url = urlsplit(base_url if "://" in base_url else f"http://{base_url}")
+        if url.scheme != "http":
+            raise ValueError(f"nodes serve plain HTTP, not {url.scheme}")
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        # With session=False every request starts a new server-side session
+        self.session = session
+        self.cookie = None
+        self.retried = 0
+        self.connections = [Connection(self.host, self.port, timeout) for _ in range(max(1, pool_size))]
+        self.idle = asyncio.LifoQueue()
+        for connection in self.connections:
+            self.idle.put_nowait(connection)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        for connection in self.connections:
+            await connection.close()
+
+    @property
+    def connections_opened(self):
+        return sum(connection.opened for connection in self.connections)
+
+    # Transport ---------------------------------------------------------------
+
+    def _headers(self, headers=None):
+        headers = dict(headers or {})
+        if self.session and self.cookie:
+            headers["Cookie"] = f"{SESSION_COOKIE}={self.cookie}"
+        return headers
+
+    def _remember_cookie(self, headers):
+        cookie = headers.get("set-cookie", "")
+        if self.session and cookie.startswith(f"{SESSION_COOKIE}="):
+            self.cookie = cookie.split(";")[0].split("=", 1)[1]
+
+    def _delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), MAX_BACKOFF)
+            except ValueError:
+                pass
+        return min(self.backoff * 2 ** attempt, MAX_BACKOFF) * random.uniform(0.5, 1.0)
+
+    async def _exchange(self, requests, idempotent):
+        """Responses to requests pipelined on one pooled connection, retried per the module's rules"""
+        responses = [None] * len(requests)
+        pending = list(range(len(requests)))
+        attempt = 0
+        while True:
+            connection = await self.idle.get()
+            try:
+                answers = await connection.pipeline(
+                    [(method, path, body, self._headers(headers))
+                     for method, path, body, headers in (requests[index] for index in pending)])
+            except StaleConnection:
+                # Not a failure of the node: go again at once on a fresh connection
+                continue
+            except (asyncio.TimeoutError, ConnectionError, OSError, asyncio.IncompleteReadError) as e:
+                unsent = isinstance(e, ConnectionRefusedError)
+                if attempt >= self.retries or not (unsent or idempotent):
+                    method, path = requests[pending[0]][:2]
+                    raise MeshNowError(f"{method} {path}: {e or type(e).__name__}") from e
+                delay = self._delay(attempt)
+            else:
+                for index, answer in zip(pending, answers):
+                    self._remember_cookie(answer[1])
+                    responses[index] = answer
+                # 503 means the node turned the request away, so only those are repeated
+                busy = [index for index in pending if responses[index][0] == 503]
+                if not busy or attempt >= self.retries:
+                    return responses
+                delay = self._delay(attempt, responses[busy[0]][1].get("retry-after"))
+                pending = busy
+            finally:
+                self.idle.put_nowait(connection)
+            attempt += 1
+            self.retried += 1
+            await asyncio.sleep(delay)
+
+    async def _request(self, method, path, body=b"", headers=None):
+        status, headers, data = (await self._exchange([(method, path, body, headers)], method == "GET"))[0]
+        if status != 200:
+            raise HttpStatusError(status, data)
+        return data
+
+    async def _get_json(self, path):
+        return json.loads(await self._request("GET", path))
+
+    # API ---------------------------------------------------------------------
+
+    async def send(self, message, group=None):
+        """Post one chat message, to everyone or to one group"""
+        await self.send_batch([message], group)
+
+    async def send_batch(self, messages, group=None):
+        """Post messages, SEND_BATCH_MAX per /send body, pipelining the bodies on one connection
+
+        Messages go out in order unless the node answers 503 to some bodies,
+        which are then posted again after the others. With group they are
+        sent only to that group's subscribers.
+        """
+        messages = list(messages)
+        chunks = [messages[i:i + SEND_BATCH_MAX] for i in range(0, len(messages), SEND_BATCH_MAX)]
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        path = "/send" if group is None else f"/send?group={int(group)}"
+        requests = [("POST", path, encode_send_body(chunk), headers) for chunk in chunks]
+        # One pipeline at a time keeps the bodies in order on the node
+        for start in range(0, len(requests), SEND_BATCH_MAX):
+            batch = requests[start:start + SEND_BATCH_MAX]
+            for status, _, data in await self._exchange(batch, idempotent=False):
+                if status != 200:
+                    raise HttpStatusError(status, data)
+
+    async def relay(self, sender, message_id, message):
+        """Rebroadcast a message heard elsewhere under its origin's sender MAC and id
+
+        Returns False when the node has already seen that id (HTTP 409), so the
+        message is not repeated on its mesh.
+        """
+        return (await self.relay_batch([(sender, message_id, message)]))[0]
+
+    async def relay_batch(self, messages):
+        """relay() each (sender, message_id, message), pipelining up to SEND_BATCH_MAX requests
+
+        Returns one bool per message, in order.
+        """
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        requests = [("POST", f"/relay?sender={quote(sender, safe=':')}&id={int(message_id)}",
+                     encode_send_body([message]), headers) for sender, message_id, message in messages]
+        accepted = []
+        for start in range(0, len(requests), SEND_BATCH_MAX):
+            for status, _, data in await self._exchange(requests[start:start + SEND_BATCH_MAX], idempotent=False):
+                if status not in (200, 409):
+                    raise HttpStatusError(status, data)
+                accepted.append(status == 200)
+        return accepted
+
+    async def messages(self, since=None, limit=MESSAGES_PAGE_MAX, group=None):
+        """One /messages page: {"messages", "next", "oldest", "latest", "more"}
+
+        With since=None the node's session cursor for this client is used.
+        A group page holds only that group's messages and may come back short
+        while "more" is set, as the node looks through a bounded stretch of
+        its history per request.
+        """
+        query = f"?limit={limit}" + ("" if since is None else f"&since={since}")
+        if group is not None:
+            query += f"&group={int(group)}"
+        return await self._get_json(f"/messages{query}")
+
+    def iter_messages(self, since=0, follow=False, poll_interval=1.0, limit=MESSAGES_PAGE_MAX, group=None):
+        """Async iterator over Message tuples after since; follow keeps polling for new ones"""
+        return MessageIterator(self, since, follow, poll_interval, limit, group)
+
+    async def peers(self):
+        return (await self._get_json("/peers"))["peers"]
+
+    async def presence(self):
+        """GET /presence: [{"mac", "status", "typing"}] for nodes whose status or typing has not timed out"""
+        return (await self._get_json("/presence"))["nodes"]
+
+    async def set_presence(self, status):
+        """Set this node's status; an empty one clears it"""
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        await self._request("POST", "/presence", encode_send_body([status] if status else []), headers)
+
+    async def typing(self, target, typing=True):
+        """Report typing to target; fine to call on every keystroke, the node debounces it"""
+        await self._request("POST", f"/typing?to={quote(target, safe=':')}&typing={int(bool(typing))}")
+
+    async def groups(self):
+        """GET /groups: {"groups": subscribed IDs, "neighbours": nodes beaconing group levels}"""
+        return await self._get_json("/groups")
+
+    async def join_group(self, group):
+        return json.loads(await self._request("POST", f"/groups?join={int(group)}"))
+
+    async def leave_group(self, group):
+        return json.loads(await self._request("POST", f"/groups?leave={int(group)}"))
+
+    async def wifi_info(self):
+        return await self._get_json("/wifi-info")
+
+    async def metrics(self, binary=True):
+        """GET /metrics: the binary form's bytes, or the Prometheus text"""
+        data = await self._request("GET", "/metrics?format=binary" if binary else "/metrics")
+        return data if binary else data.decode("utf-8")
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Mesh-NOW Metrics Scraper
+Collect GET /metrics from many nodes at once
+
+Scrapes every node concurrently (--jobs at a time) and shows the counters
+that matter when a mesh misbehaves: frames sent and received, duplicates,
+forwards, retransmits, pending-slot exhaustion, queue drops and handler
+latency. The binary form is the default: about 400 bytes against the
+text's 7 KB. --format text reads the Prometheus text a Prometheus server would.
+
+    python scripts/metrics_scraper.py 192.168.4.1 10.0.0.12:80
+    python scripts/metrics_scraper.py nodes.txt --watch 5      # rates between scrapes
+    python scripts/metrics_scraper.py --standin 8 --ci         # self-test against stand-in nodes
+
+A file argument lists one node per line. --standin starts local stand-in
+nodes, sends each a different number of messages, then checks every scraped
+value against what the stand-ins counted and exits non-zero on a mismatch.
+"""
+
+import sys
+import json
+import time
+import argparse
+import importlib.util
+from pathlib import Path
+
+import mesh_metrics
+
+# rich, asyncio and urllib.request are imported where they are used, so --help
+# never loads them
+RICH_AVAILABLE = importlib.util.find_spec("rich") is not None
+
+DEFAULT_JOBS = 16
+DEFAULT_TIMEOUT = 5.0
+
+COLUMNS = ("Node", "Uptime", "TX", "RX", "Dup", "Fwd", "Retx", "Gave up", "No slot", "Q drop", "Peers", "Heap",
+           "/send p95", "ACK p50")
+
+
+def node_url(target):
+    target = target.strip().rstrip("/")
+    return target if "://" in target else f"http://{target}"
+
+
+def read_targets(args):
+    targets = []
+    for arg in args:
+        path = Path(arg)
+        if path.is_file():
+            targets += [line.split("#")[0].strip() for line in path.read_text().splitlines()]
+        else:
+            targets.append(arg)
+    return [node_url(target) for target in targets if target]
+
+
+def scrape(url, fmt, timeout):
+    """One node's snapshot; raises on HTTP or format errors"""
+    from urllib.request import Request, urlopen
+
+    query = "?format=binary" if fmt == "binary" else ""
+    with urlopen(Request(f"{url}/metrics{query}"), timeout=timeout) as response:
+        body = response.read()
+    return mesh_metrics.decode(body) if fmt == "binary" else mesh_metrics.parse_text(body.decode("utf-8"))
+
+
+async def scrape_all(urls, fmt, jobs, timeout):
+    """{url: {"snapshot", "error", "elapsed_ms"}}, scraping at most jobs nodes at a time"""
+    import asyncio
+
+    semaphore = asyncio.Semaphore(jobs)
+
+    async def one(url):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                snapshot, error = await asyncio.to_thread(scrape, url, fmt, timeout), None
+            except Exception as e:
+                snapshot, error = None, str(e)
+            return url, {"snapshot": snapshot, "error": error,
+                         "elapsed_ms": (time.perf_counter() - start) * 1000}
+
+    return dict(await asyncio.gather(*(one(url) for url in urls)))
+
+
+# Output ------------------------------------------------------------------------
+
+def fmt_ms(value):
+    return "-" if value is None else f"{value:g}ms"
+
+
+def fmt_count(snapshot, previous, name, interval):
+    """The counter, or its rate per second since the previous scrape in --watch mode"""
+    value = snapshot.counters[name]
+    if previous is None or interval <= 0:
+        return str(value)
+    before = previous.counters[name]
+    # A counter going backwards means the node rebooted
+    delta = value - before if value >= before else value
+    return f"{delta / interval:.1f}/s"
+
+
+def rows(results, previous, interval):
+    for url in sorted(results):
+        result = results[url]
+        s = result["snapshot"]
+        label = url.split("://", 1)[-1]
+        if s is None:
+            yield (f"{label} ({result['error']})",) + ("-",) * (len(COLUMNS) - 1), True
+            continue
+        before = (previous or {}).get(url, {}).get("snapshot")
+        if before is not None and s.uptime_ms < before.uptime_ms:
+            before = None
+        counts = [fmt_count(s, before, name, interval)
+                  for name in ("frames_sent", "frames_received", "duplicates", "forwarded", "retransmits",
+                               "retransmit_giveups", "pending_exhausted")]
+        trouble = bool(s.counters["retransmit_giveups"] or s.counters["pending_exhausted"]
+                       or s.gauges["queue_dropped_total"] or s.counters["frames_send_failed"])
+        yield (label, f"{s.uptime_ms // 1000}s", *counts, str(s.gauges["queue_dropped_total"]),
+               str(s.gauges["peers"]), f"{s.gauges['free_heap_bytes'] // 1024}K",
+               fmt_ms(s.quantile_ms("http_send", 0.95)), fmt_ms(s.quantile_ms("ack_latency", 0.5))), trouble
+
+
+def title(results, elapsed):
+    ok = sum(1 for result in results.values() if result["snapshot"] is not None)
+    return f"Mesh-NOW metrics: {ok}/{len(results)} node(s) scraped in {elapsed * 1000:.0f} ms"
+
+
+def render(results, previous, interval, elapsed):
+    from rich.table import Table
+
+    table = Table(title=title(results, elapsed))
+    for index, column in enumerate(COLUMNS):
+        table.add_column(column, justify="left" if index == 0 else "right")
+    for row, trouble in rows(results, previous, interval):
+        table.add_row(*row, style="red" if trouble else None)
+    return table
+
+
+def print_plain(results, previous, interval, elapsed):
+    print(title(results, elapsed))
+    table = [COLUMNS] + [row for row, _ in rows(results, previous, interval)]
+    widths = [max(len(row[i]) for row in table) for i in range(len(COLUMNS))]
+    for row in table:
+        print("  ".join(c.ljust(w) if i == 0 else c.rjust(w) for i, (c, w) in enumerate(zip(row, widths))))
+    sys.stdout.flush()
+
+
+def write_json(path, results):
+    nodes = {url: {"error": result["error"], "elapsed_ms": round(result["elapsed_ms"], 2),
+                   "metrics": result["snapshot"].as_dict() if result["snapshot"] else None}
+             for url, result in sorted(results.items())}
+    Path(path).write_text(json.dumps({"scraped_at": time.time(), "nodes": nodes}, indent=2) + "\n")
+
+
+# Stand-in self-test ------------------------------------------------------------
+
+def start_standins(count):
+    from standin_node import StandinNode, StandinServer
+
+    servers = [StandinServer(StandinNode(mac=f"24:6f:28:00:01:{index:02x}")) for index in range(count)]
+    for server in servers:
+        server.start()
+    return servers
+
+
+def drive_standins(servers):
+    """Node i gets i + 1 messages through /send and one /messages poll"""
+    from urllib.request import Request, urlopen
+
+    for index, server in enumerate(servers):
+        for n in range(index + 1):
+            request = Request(f"{server.base_url}/send", data=f"message=scrape-{index}-{n}".encode(),
+                              headers={"Content-Type": "application/x-www-form-urlencoded"})
+            with urlopen(request, timeout=DEFAULT_TIMEOUT) as response:
+                response.read()
+        with urlopen(f"{server.base_url}/messages", timeout=DEFAULT_TIMEOUT) as response:
+            response.read()
+
+
+def verify_standins(servers, results):
+    """Mismatches between what each stand-in counted and what was scraped"""
+    problems = []
+    for server in servers:
+        result = results[server.base_url]
+        scraped = result["snapshot"]
+        if scraped is None:
+            problems.append(f"{server.base_url}: {result['error']}")
+            continue
+        expected = server.node.metrics_snapshot()
+        for name in ("frames_sent", "frames_received"):
+            if scraped.counters[name] != expected.counters[name]:
+                problems.append(f"{server.base_url}: {name} {scraped.counters[name]}, "
+                                f"expected {expected.counters[name]}")
+        for key in ("http_send", "http_messages"):
+            if scraped.histograms[key] != expected.histograms[key]:
+                problems.append(f"{server.base_url}: {key} histogram differs")
+        if scraped.count("http_send") != len(server.node.sent):
+            problems.append(f"{server.base_url}: {scraped.count('http_send')} /send timings for "
+                            f"{len(server.node.sent)} requests")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape /metrics from Mesh-NOW nodes concurrently")
+    parser.add_argument("targets", nargs="*", help="Node addresses (host[:port] or URL) or files listing them")
+    parser.add_argument("--format", choices=("binary", "text"), default="binary", help="Form of /metrics to read")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="Nodes scraped at once")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="Per-node timeout (s)")
+    parser.add_argument("--watch", type=float, metavar="SECONDS",
+                        help="Scrape again every SECONDS and show counter rates")
+    parser.add_argument("--count", type=int, help="With --watch, stop after this many scrapes")
+    parser.add_argument("--json", help="Write the last scrape to this JSON file")
+    parser.add_argument("--standin", type=int, metavar="N", help="Self-test against N local stand-in nodes")
+    parser.add_argument("--ci", action="store_true", help="CI mode - plain output")
+    args = parser.parse_args()
+
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.watch is not None and args.watch <= 0:
+        parser.error("--watch must be positive")
+    servers = start_standins(args.standin) if args.standin else []
+    urls = read_targets(args.targets) + [server.base_url for server in servers]
+    if not urls:
+        parser.error("name at least one node, or use --standin")
+
+    console = None
+    if RICH_AVAILABLE and not args.ci:
+        from rich.console import Console
+        console = Console()
+
+    import asyncio
+
+    previous = None
+    scrapes = 0
+    try:
+        if servers:
+            drive_standins(servers)
+        while True:
+            start = time.monotonic()
+            results = asyncio.run(scrape_all(urls, args.format, args.jobs, args.timeout))
+            elapsed = time.monotonic() - start
+            interval = args.watch if previous is not None else 0
+            if console is not None:
+                console.print(render(results, previous, interval, elapsed))
+            else:
+                print_plain(results, previous, interval, elapsed)
+            previous = results
+            scrapes += 1
+            if not args.watch or (args.count and scrapes >= args.count):
+                break
+            time.sleep(max(0.0, args.watch - elapsed))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        problems = verify_standins(servers, previous) if servers and previous else []
+        for server in servers:
+            server.stop()
+
+    if args.json and previous:
+        write_json(args.json, previous)
+    if servers:
+        for problem in problems:
+            print(f"MISMATCH {problem}")
+        print(f"Stand-in self-test {'FAILED' if problems else 'passed'}: {len(servers)} node(s), "
+              f"{args.format} format")
+        sys.exit(1 if problems else 0)
+    sys.exit(0 if previous and all(r["snapshot"] is not None for r in previous.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,534 @@
+"""
+Mesh-NOW sdkconfig Check
+Validation of configs/sdkconfig.<target> and the root sdkconfig
+
+Parses every target config plus the generated root sdkconfig into one
+model indexed by option, then checks it against rules this firmware
+depends on: Wi-Fi/ESP-NOW buffers and their share of the chip's RAM, the
+httpd task stack, PSRAM, the FreeRTOS tick rate, core pinning, flash size
+and compiler optimization.
+Limits that come from the firmware (httpd stack size, handler buffers,
+task delays, Kconfig defaults, partition table) are read from the sources,
+so the rules follow the code. The whole check takes a few milliseconds,
+which lets build_all.py run it before every build:
+
+    configs = load(project_dir)
+    findings = configs.check()
+    report(console, findings)
+"""
+
+import re
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+TARGETS = ("esp32", "esp32s2", "esp32s3", "esp32c3", "esp32c6")
+ROOT = "sdkconfig"
+DUAL_CORE = {"esp32", "esp32s3"}
+PSRAM_TARGETS = {"esp32", "esp32s2", "esp32s3"}
+OCTAL_PSRAM_TARGETS = {"esp32s3"}
+INTERNAL_RAM_KB = {"esp32": 520, "esp32s2": 320, "esp32s3": 512, "esp32c3": 400, "esp32c6": 512}
+
+# ESP-IDF 5.5 defaults for options the target configs may leave unset
+IDF_DEFAULTS = {
+    "CONFIG_ESP_WIFI_STATIC_RX_BUFFER_NUM": "10",
+    "CONFIG_ESP_WIFI_DYNAMIC_RX_BUFFER_NUM": "32",
+    "CONFIG_ESP_WIFI_TX_BUFFER_TYPE": "1",
+    "CONFIG_ESP_WIFI_DYNAMIC_TX_BUFFER_NUM": "32",
+    "CONFIG_ESP_WIFI_STATIC_TX_BUFFER_NUM": "16",
+    "CONFIG_ESP_WIFI_AMPDU_RX_ENABLED": "y",
+    "CONFIG_ESP_WIFI_RX_BA_WIN": "6",
+    "CONFIG_ESP_WIFI_ESPNOW_MAX_ENCRYPT_NUM": "7",
+    "CONFIG_HTTPD_MAX_REQ_HDR_LEN": "512",
+    "CONFIG_HTTPD_MAX_URI_LEN": "512",
+    "CONFIG_FREERTOS_HZ": "100",
+    "CONFIG_ESPTOOLPY_FLASHSIZE": "2MB",
+}
+OPTIMIZATION_LEVELS = ("DEBUG", "SIZE", "PERF", "NONE")
+
+STATIC_RX_RANGE = (2, 25)
+ESPNOW_ENCRYPT_RANGE = (0, 17)
+# Each Wi-Fi RX/TX buffer is about 1.6 KB; all of them together may take at
+# most this share of internal RAM, the rest is for lwIP, httpd and the mesh queues
+WIFI_BUFFER_BYTES = 1600
+WIFI_RAM_SHARE = 0.25
+# httpd's own frame, lwIP send path and the logging/printf calls in handlers
+HTTPD_STACK_HEADROOM = 4096
+# Browsers send more than the default 512 bytes of headers once cookies pile up
+MIN_REQ_HDR_LEN = 512
+
+LINE_PATTERN = re.compile(r"^(CONFIG_\w+)=(.*)$")
+NOT_SET_PATTERN = re.compile(r"^# (CONFIG_\w+) is not set$")
+DEFINE_PATTERN = re.compile(r"^\s*#define\s+(\w+)\s+([^/\n]+)", re.MULTILINE)
+BUFFER_PATTERN = re.compile(r"^\s*(?:char|uint8_t)\s+(\w+)\[([^\]]+)\];", re.MULTILINE)
+# Struct bodies: their arrays live wherever the struct does, not on the handler's stack
+STRUCT_BODY_PATTERN = re.compile(r"\bstruct\s*\w*\s*\{[^{}]*\}")
+STACK_PATTERN = re.compile(r"config\.stack_size\s*=\s*(\w+)")
+PINNED_PATTERN = re.compile(r"xTaskCreatePinnedToCore\((.*?)\);", re.DOTALL)
+DELAY_PATTERN = re.compile(r"pdMS_TO_TICKS\(([^()]+)\)")
+KCONFIG_PATTERN = re.compile(r"config (\w+)\n(?:.*\n)*?\s+default (\S+)")
+
+
+class Finding:
+    """One rule violation; level is 'error' or 'warning'"""
+
+    def __init__(self, level, config, key, message, line=None):
+        self.level = level
+        self.config = config
+        self.key = key
+        self.message = message
+        self.line = line
+
+    @property
+    def location(self):
+        return f"{self.config}:{self.line}" if self.line else self.config
+
+    def __str__(self):
+        key = f" {self.key}:" if self.key else ""
+        return f"{self.level} {self.location}{key} {self.message}"
+
+
+class SdkConfig:
+    """One parsed sdkconfig file: option values with their line numbers"""
+
+    def __init__(self, name, path, target=None):
+        self.name = name
+        self.path = Path(path)
+        self.target = target
+        self.values = {}
+        self.lines = {}
+        self.duplicates = []       # (key, first line, line, previous value, value)
+        self.deprecated = set()
+
+    @classmethod
+    def parse(cls, name, path, target=None):
+        return cls.parse_text(name, Path(path).read_text(errors="replace"), path, target)
+
+    @classmethod
+    def parse_text(cls, name, text, path, target=None):
+        config = cls(name, path, target)
+        deprecated = False
+        for number, raw in enumerate(text.splitlines(), 1):
+            line = raw.strip()
+            if line.startswith("# Deprecated options"):
+                deprecated = True
+            match = LINE_PATTERN.match(line)
+            if match:
+                key, value = match.group(1), match.group(2).strip()
+            else:
+                match = NOT_SET_PATTERN.match(line)
+                if not match:
+                    continue
+                key, value = match.group(1), "n"
+            if key in config.values:
+                config.duplicates.append((key, config.lines[key], number, config.values[key], value))
+            config.values[key] = value
+            config.lines[key] = number
+            if deprecated:
+                config.deprecated.add(key)
+        if config.target is None:
+            config.target = config.string("CONFIG_IDF_TARGET")
+        return config
+
+    def get(self, key, default=None):
+        return self.values.get(key, IDF_DEFAULTS.get(key, default))
+
+    def string(self, key):
+        value = self.get(key)
+        return value.strip('"') if value is not None else None
+
+    def int(self, key):
+        try:
+            return int(self.get(key), 0)
+        except (TypeError, ValueError):
+            return None
+
+    def enabled(self, key):
+        return self.get(key) == "y"
+
+    def choice(self, prefix, options):
+        """The option of a Kconfig choice set to y here, or None if left to its default"""
+        for option in options:
+            if self.values.get(f"{prefix}{option}") == "y":
+                return option
+        return None
+
+
+class Firmware:
+    """Limits the rules need, read from the firmware sources"""
+
+    def __init__(self, project_dir):
+        project_dir = Path(project_dir)
+        sources = [path for base in ("main", "components") for path in (project_dir / base).rglob("*.[ch]")]
+        texts = {path: path.read_text(errors="replace") for path in sources}
+        self.defines = {}
+        for text in texts.values():
+            for name, value in DEFINE_PATTERN.findall(text):
+                self.defines.setdefault(name, value.strip())
+
+        web_server = project_dir / "main" / "src" / "web_server.c"
+        text = texts.get(web_server, "")
+        match = STACK_PATTERN.search(text)
+        self.httpd_stack = self.evaluate(match.group(1)) if match else None
+        locals_text = STRUCT_BODY_PATTERN.sub("", text)
+        buffers = [(name, self.evaluate(size)) for name, size in BUFFER_PATTERN.findall(locals_text)]
+        buffers = [(name, size) for name, size in buffers if size]
+        self.httpd_buffer = max(buffers, key=lambda item: item[1]) if buffers else None
+
+        self.pinned = []           # (task entry, core)
+        self.delays = []           # milliseconds passed to pdMS_TO_TICKS
+        for text in texts.values():
+            for args in PINNED_PATTERN.findall(text):
+                parts = [re.sub(r"//.*|/\*.*?\*/", "", part).strip() for part in args.split(",")]
+                core = self.evaluate(parts[-1])
+                if core is not None:
+                    self.pinned.append((parts[0], core))
+            self.delays += [ms for ms in map(self.evaluate, DELAY_PATTERN.findall(text)) if ms]
+
+        kconfig = project_dir / "main" / "Kconfig.projbuild"
+        text = kconfig.read_text() if kconfig.exists() else ""
+        self.kconfig_defaults = {f"CONFIG_{name}": value for name, value in KCONFIG_PATTERN.findall(text)}
+        self.partitions_end = partitions_end(project_dir / "partitions.csv")
+
+    def evaluate(self, expression, depth=0):
+        """Integer value of a constant expression over #defines, or None"""
+        expression = expression.strip()
+        if depth > 8:
+            return None
+        def substitute(match):
+            value = self.evaluate(self.defines[match.group(0)], depth + 1) if match.group(0) in self.defines else None
+            return str(value) if value is not None else match.group(0)
+        expression = re.sub(r"\b[A-Za-z_]\w*\b", substitute, expression)
+        expression = re.sub(r"\b(0x[0-9a-fA-F]+|\d+)[uUlL]*\b", r"\1", expression)
+        if not re.fullmatch(r"[\dxa-fA-F\s+\-*/()]+", expression):
+            return None
+        try:
+            return int(eval(expression, {"__builtins__": {}}))
+        except Exception:
+            return None
+
+
+def size_bytes(text):
+    """'0x20000', '1M', '64K' or '4MB' as bytes"""
+    match = re.fullmatch(r"(0x[0-9a-f]+|\d+)\s*([km]?)b?", text.strip().lower())
+    if not match:
+        raise ValueError(f"not a size: {text}")
+    return int(match.group(1), 0) * {"": 1, "k": 1024, "m": 1024 * 1024}[match.group(2)]
+
+
+def partitions_end(path):
+    """First byte past the last partition of a partition table CSV, or None"""
+    try:
+        lines = Path(path).read_text().splitlines()
+    except OSError:
+        return None
+    end = None
+    for line in lines:
+        fields = [field.strip() for field in line.split(",")]
+        if line.lstrip().startswith("#") or len(fields) < 5 or not fields[3] or not fields[4]:
+            continue
+        try:
+            end = max(end or 0, size_bytes(fields[3]) + size_bytes(fields[4]))
+        except ValueError:
+            continue
+    return end
+
+
+def normalized(key):
+    return key.replace("_", "")
+
+
+class ConfigSet:
+    """Target configs and the root sdkconfig, indexed by option"""
+
+    def __init__(self, configs, root=None, firmware=None):
+        self.configs = configs     # {target: SdkConfig}
+        self.root = root
+        self.firmware = firmware
+        self.index = {}            # {option: {config name: value}}
+        for config in self.all():
+            for key, value in config.values.items():
+                self.index.setdefault(key, {})[config.name] = value
+        known = root.values.keys() - root.deprecated if root else ()
+        self.known = {normalized(key): key for key in known}
+
+    def all(self):
+        return list(self.configs.values()) + ([self.root] if self.root else [])
+
+    def check(self):
+        """Findings of every rule against every config, errors first"""
+        findings = []
+        for config in self.configs.values():
+            findings += self.check_config(config)
+        for rule in SET_RULES:
+            findings += rule(self)
+        return sorted(findings, key=lambda finding: (finding.level != "error", finding.config, finding.line or 0))
+
+    def check_config(self, config):
+        """Findings of the per-target rules for one config (which needn't be in the set)"""
+        return [finding for rule in TARGET_RULES for finding in rule(self, config)]
+
+    def differences(self, names=None):
+        """[(option, {target: value})] for options the target configs disagree on"""
+        names = names or list(self.configs)
+        rows = []
+        for key in sorted(self.index):
+            if key.startswith("CONFIG_IDF_TARGET"):
+                continue
+            values = {name: self.index[key].get(name) for name in names}
+            if any(value is not None for value in values.values()) and len(set(values.values())) > 1:
+                rows.append((key, values))
+        return rows
+
+
+def load(project_dir=PROJECT_DIR, targets=TARGETS):
+    """ConfigSet of configs/sdkconfig.<target> (those that exist) and the root sdkconfig"""
+    project_dir = Path(project_dir)
+    configs = {}
+    for target in targets:
+        path = project_dir / "configs" / f"sdkconfig.{target}"
+        configs[target] = SdkConfig.parse(target, path, target) if path.exists() else SdkConfig(target, path, target)
+    root_path = project_dir / ROOT
+    root = SdkConfig.parse(ROOT, root_path) if root_path.exists() else None
+    return ConfigSet(configs, root, Firmware(project_dir))
+
+
+def finding(level, config, key, message):
+    return Finding(level, config.name, key, message, config.lines.get(key))
+
+
+# Rules: each takes (configs, config) or (configs) and returns a list of findings
+
+def check_file(configs, config):
+    if not config.values and not config.path.exists():
+        return [Finding("error", config.name, None, f"{config.path.name} is missing")]
+    findings = []
+    target = config.string("CONFIG_IDF_TARGET")
+    if target != config.target:
+        findings.append(finding("error", config, "CONFIG_IDF_TARGET",
+                                f"is {target or 'not set'}, file is for {config.target}"))
+    flag = f"CONFIG_IDF_TARGET_{config.target.upper()}"
+    if flag in config.values and not config.enabled(flag):
+        findings.append(finding("error", config, flag, "must be y"))
+    for key, first, line, previous, value in config.duplicates:
+        level = "error" if previous != value else "warning"
+        detail = f"was {previous} on line {first}" if previous != value else f"also set on line {first}"
+        findings.append(Finding(level, config.name, key, f"set twice ({detail})", line))
+    return findings
+
+
+def check_unknown(configs, config):
+    """Options the root sdkconfig doesn't know but that differ from one it does only by underscores"""
+    findings = []
+    for key in config.values:
+        if configs.root is None or key in configs.root.values:
+            continue
+        short = normalized(key)
+        matches = [known for stripped, known in configs.known.items() if stripped.startswith(short)]
+        if matches:
+            findings.append(finding("error", config, key, f"is not an ESP-IDF option, did you mean {min(matches, key=len)}?"))
+    return findings
+
+
+def check_wifi(configs, config):
+    findings = []
+    static_rx = config.int("CONFIG_ESP_WIFI_STATIC_RX_BUFFER_NUM")
+    dynamic_rx = config.int("CONFIG_ESP_WIFI_DYNAMIC_RX_BUFFER_NUM")
+    low, high = STATIC_RX_RANGE
+    if static_rx is not None and not low <= static_rx <= high and not config.enabled("CONFIG_SPIRAM_TRY_ALLOCATE_WIFI_LWIP"):
+        findings.append(finding("error", config, "CONFIG_ESP_WIFI_STATIC_RX_BUFFER_NUM",
+                                f"{static_rx} is outside {low}..{high}"))
+    if dynamic_rx and static_rx and dynamic_rx < static_rx:
+        findings.append(finding("warning", config, "CONFIG_ESP_WIFI_DYNAMIC_RX_BUFFER_NUM",
+                                f"{dynamic_rx} is below the {static_rx} static RX buffers"))
+    ba_window = config.int("CONFIG_ESP_WIFI_RX_BA_WIN")
+    if config.enabled("CONFIG_ESP_WIFI_AMPDU_RX_ENABLED") and static_rx and ba_window and ba_window > static_rx:
+        findings.append(finding("error", config, "CONFIG_ESP_WIFI_RX_BA_WIN",
+                                f"block-ack window {ba_window} exceeds the {static_rx} static RX buffers"))
+
+    # A /send batch goes out back to back; each frame holds a TX buffer until sent
+    batch = configs.firmware.kconfig_defaults.get("CONFIG_MESH_NOW_SEND_BATCH_MAX") if configs.firmware else None
+    batch = config.int("CONFIG_MESH_NOW_SEND_BATCH_MAX") if "CONFIG_MESH_NOW_SEND_BATCH_MAX" in config.values else batch
+    if config.int("CONFIG_ESP_WIFI_TX_BUFFER_TYPE") == 1:
+        key = "CONFIG_ESP_WIFI_DYNAMIC_TX_BUFFER_NUM"
+    else:
+        key = "CONFIG_ESP_WIFI_STATIC_TX_BUFFER_NUM"
+    tx_buffers = config.int(key)
+    if batch and tx_buffers is not None and tx_buffers < int(batch):
+        findings.append(finding("warning", config, key,
+                                f"{tx_buffers} TX buffers can't hold a full /send batch of {batch} ESP-NOW frames"))
+
+    encrypt = config.int("CONFIG_ESP_WIFI_ESPNOW_MAX_ENCRYPT_NUM")
+    low, high = ESPNOW_ENCRYPT_RANGE
+    if encrypt is not None and not low <= encrypt <= high:
+        findings.append(finding("error", config, "CONFIG_ESP_WIFI_ESPNOW_MAX_ENCRYPT_NUM",
+                                f"{encrypt} is outside {low}..{high}"))
+    return findings
+
+
+def wifi_buffers(config):
+    """Wi-Fi buffers that can be held in internal RAM at once"""
+    static_rx = config.int("CONFIG_ESP_WIFI_STATIC_RX_BUFFER_NUM") or 0
+    if config.enabled("CONFIG_SPIRAM") and config.enabled("CONFIG_SPIRAM_TRY_ALLOCATE_WIFI_LWIP"):
+        return static_rx       # Dynamic buffers come from PSRAM
+    dynamic_rx = config.int("CONFIG_ESP_WIFI_DYNAMIC_RX_BUFFER_NUM") or 0
+    if config.int("CONFIG_ESP_WIFI_TX_BUFFER_TYPE") == 1:
+        tx = config.int("CONFIG_ESP_WIFI_DYNAMIC_TX_BUFFER_NUM") or 0
+    else:
+        tx = config.int("CONFIG_ESP_WIFI_STATIC_TX_BUFFER_NUM") or 0
+    return static_rx + dynamic_rx + tx
+
+
+def check_ram(configs, config):
+    ram_kb = INTERNAL_RAM_KB.get(config.target)
+    if not ram_kb or not config.values:
+        return []
+    count = wifi_buffers(config)
+    limit = int(ram_kb * 1024 * WIFI_RAM_SHARE // WIFI_BUFFER_BYTES)
+    if count <= limit:
+        return []
+    return [finding("error", config, "CONFIG_ESP_WIFI_DYNAMIC_RX_BUFFER_NUM",
+                    f"{count} Wi-Fi buffers ({count * WIFI_BUFFER_BYTES // 1024} KB) exceed {limit}, "
+                    f"{WIFI_RAM_SHARE:.0%} of {config.target}'s {ram_kb} KB RAM")]
+
+
+def check_httpd(configs, config):
+    findings = []
+    header = config.int("CONFIG_HTTPD_MAX_REQ_HDR_LEN")
+    if header is not None and header < MIN_REQ_HDR_LEN:
+        findings.append(finding("warning", config, "CONFIG_HTTPD_MAX_REQ_HDR_LEN",
+                                f"{header} bytes of headers is below {MIN_REQ_HDR_LEN}, browsers get 431 errors"))
+    uri = config.int("CONFIG_HTTPD_MAX_URI_LEN")
+    if uri is not None and header is not None and uri > header:
+        findings.append(finding("warning", config, "CONFIG_HTTPD_MAX_URI_LEN",
+                                f"{uri} is longer than the {header}-byte header buffer the URI is read into"))
+    return findings
+
+
+def check_psram(configs, config):
+    if not config.enabled("CONFIG_SPIRAM"):
+        return []
+    if config.target not in PSRAM_TARGETS:
+        return [finding("error", config, "CONFIG_SPIRAM", f"{config.target} has no PSRAM interface")]
+    findings = []
+    if config.enabled("CONFIG_SPIRAM_MODE_OCT") and config.target not in OCTAL_PSRAM_TARGETS:
+        findings.append(finding("error", config, "CONFIG_SPIRAM_MODE_OCT", f"{config.target} has no octal PSRAM"))
+    if not config.enabled("CONFIG_SPIRAM_IGNORE_NOTFOUND"):
+        findings.append(finding("warning", config, "CONFIG_SPIRAM",
+                                "boards without PSRAM abort at boot (set CONFIG_SPIRAM_IGNORE_NOTFOUND=y)"))
+    return findings
+
+
+def check_freertos(configs, config):
+    findings = []
+    hz = config.int("CONFIG_FREERTOS_HZ")
+    if not hz:
+        return [finding("error", config, "CONFIG_FREERTOS_HZ", "is not a number")]
+    if 1000 % hz:
+        findings.append(finding("warning", config, "CONFIG_FREERTOS_HZ",
+                                f"{hz} Hz doesn't divide 1000, pdMS_TO_TICKS rounds every delay"))
+    shortest = min(configs.firmware.delays) if configs.firmware and configs.firmware.delays else None
+    if shortest and shortest * hz < 1000:
+        findings.append(finding("error", config, "CONFIG_FREERTOS_HZ",
+                                f"a tick is longer than the firmware's shortest delay ({shortest} ms)"))
+
+    unicore = config.enabled("CONFIG_FREERTOS_UNICORE")
+    if config.target in DUAL_CORE:
+        if unicore:
+            findings.append(finding("warning", config, "CONFIG_FREERTOS_UNICORE", f"leaves one of {config.target}'s cores idle"))
+    elif config.values.get("CONFIG_FREERTOS_UNICORE") == "n":
+        findings.append(finding("warning", config, "CONFIG_FREERTOS_UNICORE",
+                                f"=n is ignored, {config.target} has one core"))
+    if unicore or config.target not in DUAL_CORE:
+        for task, core in (configs.firmware.pinned if configs.firmware else []):
+            if core > 0:
+                findings.append(Finding("error", config.name, None, f"{task} is pinned to core {core} on a single core"))
+        if config.enabled("CONFIG_ESP_MAIN_TASK_AFFINITY_CPU1"):
+            findings.append(finding("error", config, "CONFIG_ESP_MAIN_TASK_AFFINITY_CPU1", "there is no core 1"))
+        if (config.int("CONFIG_MESH_NOW_HTTPD_CORE") or 0) > 0:
+            findings.append(finding("warning", config, "CONFIG_MESH_NOW_HTTPD_CORE", "is ignored on a single core"))
+    return findings
+
+
+def check_flash(configs, config):
+    end = configs.firmware.partitions_end if configs.firmware else None
+    if not end or not config.enabled("CONFIG_PARTITION_TABLE_CUSTOM"):
+        return []
+    choice = config.choice("CONFIG_ESPTOOLPY_FLASHSIZE_", ("1MB", "2MB", "4MB", "8MB", "16MB", "32MB"))
+    size = choice or config.string("CONFIG_ESPTOOLPY_FLASHSIZE")
+    if size_bytes(size) < end:
+        key = f"CONFIG_ESPTOOLPY_FLASHSIZE_{size}"
+        return [finding("error", config, key, f"partitions.csv needs {end // 1024} KB, flash is {size}")]
+    return []
+
+
+def check_httpd_stack(configs):
+    """The httpd task runs every handler; its stack is set in web_server.c, not sdkconfig"""
+    firmware = configs.firmware
+    if not (firmware and firmware.httpd_stack and firmware.httpd_buffer):
+        return []
+    name, size = firmware.httpd_buffer
+    if firmware.httpd_stack >= size + HTTPD_STACK_HEADROOM:
+        return []
+    return [Finding("error", "web_server.c", "stack_size",
+                    f"{firmware.httpd_stack} bytes leaves less than {HTTPD_STACK_HEADROOM} "
+                    f"beside the {size}-byte {name} buffer")]
+
+
+def check_optimization(configs):
+    """Release targets should build at one optimization level, and not at -Og"""
+    levels = {name: config.choice("CONFIG_COMPILER_OPTIMIZATION_", OPTIMIZATION_LEVELS)
+              for name, config in configs.configs.items() if config.path.exists()}
+    findings = []
+    if len(set(levels.values())) > 1:
+        groups = {}
+        for name, level in levels.items():
+            groups.setdefault(level.title() if level else "Debug (default)", []).append(name)
+        summary = "; ".join(f"{level}: {', '.join(names)}" for level, names in groups.items())
+        findings.append(Finding("warning", "configs", "CONFIG_COMPILER_OPTIMIZATION",
+                                f"targets build at different levels ({summary})"))
+    for name, level in levels.items():
+        if level in ("DEBUG", "NONE"):
+            config = configs.configs[name]
+            findings.append(finding("warning", config, f"CONFIG_COMPILER_OPTIMIZATION_{level}", "release firmware built unoptimized"))
+    return findings
+
+
+def check_root(configs):
+    """The root sdkconfig should still match the target config it was generated from"""
+    root = configs.root
+    config = configs.configs.get(root.target) if root else None
+    if config is None or not config.path.exists():
+        return []
+    stale = [key for key, value in config.values.items()
+             if key in root.values and root.values[key] != value and key not in root.deprecated]
+    if not stale:
+        return []
+    shown = ", ".join(f"{key}={root.values[key]}" for key in stale[:3]) + (", ..." if len(stale) > 3 else "")
+    return [Finding("warning", ROOT, None,
+                    f"{len(stale)} option(s) differ from configs/sdkconfig.{root.target} ({shown}); "
+                    f"run idf.py set-target {root.target} to regenerate")]
+
+
+TARGET_RULES = (check_file, check_unknown, check_wifi, check_ram, check_httpd, check_psram, check_freertos, check_flash)
+SET_RULES = (check_httpd_stack, check_optimization, check_root)
+
+
+def validate(project_dir=PROJECT_DIR, targets=TARGETS):
+    """(ConfigSet, findings, milliseconds taken)"""
+    start = time.perf_counter()
+    configs = load(project_dir, targets)
+    findings = configs.check()
+    return configs, findings, (time.perf_counter() - start) * 1000
+
+
+def errors(findings):
+    return [finding for finding in findings if finding.level == "error"]
+
+
+def report(console, findings):
+    """Print findings through a rich console or the scripts' plain console"""
+    for item in findings:
+        colour = "red" if item.level == "error" else "yellow"
+        key = f" {item.key}:" if item.key else ""
+        console.print(f"[{colour}]{item.level}[/{colour}] {item.location}{key} {item.message}")
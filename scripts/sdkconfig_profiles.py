@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Mesh-NOW sdkconfig Profiles
+Performance variants of configs/sdkconfig.<target>
+
+Each profile below is a set of option overrides applied on top of a
+target's hand-maintained config: first the options for every target, then
+those for dual-core chips and for chips with PSRAM, then per-target
+overrides where a chip's RAM can't take the common values. The result is
+checked with sdkconfig_check.py (including its Wi-Fi buffer RAM limit per
+chip), so a profile that doesn't fit a target fails here rather than at
+boot. build.py --profile <name> builds with one:
+
+    python scripts/sdkconfig_profiles.py                     # check every profile/target
+    python scripts/sdkconfig_profiles.py throughput --out build/profiles
+    python scripts/build.py --target esp32s3 --profile low-latency
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+from sdkconfig_check import (DUAL_CORE, OPTIMIZATION_LEVELS, PROJECT_DIR, TARGETS, SdkConfig, errors, load,
+                             report, wifi_buffers)
+
+# Kconfig choices: setting one member drops the others from the base config
+CHOICE_GROUPS = {
+    "CONFIG_COMPILER_OPTIMIZATION_": OPTIMIZATION_LEVELS,
+    "CONFIG_LWIP_TCPIP_TASK_AFFINITY_": ("NO_AFFINITY", "CPU0", "CPU1"),
+}
+
+PROFILES = {
+    "throughput": {
+        "description": "Most messages and HTTP bytes per second",
+        "options": {
+            "CONFIG_COMPILER_OPTIMIZATION_PERF": "y",
+            "CONFIG_ESP_WIFI_STATIC_RX_BUFFER_NUM": "16",
+            "CONFIG_ESP_WIFI_DYNAMIC_RX_BUFFER_NUM": "32",
+            "CONFIG_ESP_WIFI_TX_BUFFER_TYPE": "1",
+            "CONFIG_ESP_WIFI_DYNAMIC_TX_BUFFER_NUM": "32",
+            "CONFIG_ESP_WIFI_AMPDU_RX_ENABLED": "y",
+            "CONFIG_ESP_WIFI_AMPDU_TX_ENABLED": "y",
+            "CONFIG_ESP_WIFI_RX_BA_WIN": "16",
+            # Wi-Fi and lwIP receive/transmit paths run from IRAM
+            "CONFIG_ESP_WIFI_IRAM_OPT": "y",
+            "CONFIG_ESP_WIFI_RX_IRAM_OPT": "y",
+            "CONFIG_LWIP_IRAM_OPTIMIZATION": "y",
+            "CONFIG_LWIP_TCP_SND_BUF_DEFAULT": "11520",
+            "CONFIG_LWIP_TCP_WND_DEFAULT": "11520",
+        },
+        "dual-core": {
+            # Wi-Fi and the mesh tasks live on core 0
+            "CONFIG_MESH_NOW_HTTPD_CORE": "1",
+        },
+        "psram": {
+            "CONFIG_SPIRAM_TRY_ALLOCATE_WIFI_LWIP": "y",
+            "CONFIG_ESP_WIFI_DYNAMIC_RX_BUFFER_NUM": "64",
+            "CONFIG_ESP_WIFI_DYNAMIC_TX_BUFFER_NUM": "64",
+            "CONFIG_ESP_WIFI_RX_BA_WIN": "16",
+        },
+        "targets": {
+            "esp32s2": {
+                "CONFIG_ESP_WIFI_STATIC_RX_BUFFER_NUM": "10",
+                "CONFIG_ESP_WIFI_DYNAMIC_RX_BUFFER_NUM": "20",
+                "CONFIG_ESP_WIFI_DYNAMIC_TX_BUFFER_NUM": "20",
+                "CONFIG_ESP_WIFI_RX_BA_WIN": "10",
+            },
+            "esp32c3": {
+                "CONFIG_ESP_WIFI_STATIC_RX_BUFFER_NUM": "12",
+                "CONFIG_ESP_WIFI_DYNAMIC_RX_BUFFER_NUM": "24",
+                "CONFIG_ESP_WIFI_DYNAMIC_TX_BUFFER_NUM": "24",
+                "CONFIG_ESP_WIFI_RX_BA_WIN": "12",
+            },
+        },
+    },
+    "low-latency": {
+        "description": "Shortest time from POST /send to the air and back",
+        "options": {
+            "CONFIG_COMPILER_OPTIMIZATION_PERF": "y",
+            "CONFIG_FREERTOS_HZ": "1000",
+            "CONFIG_ESP_WIFI_IRAM_OPT": "y",
+            "CONFIG_ESP_WIFI_RX_IRAM_OPT": "y",
+            "CONFIG_LWIP_IRAM_OPTIMIZATION": "y",
+            # Aggregation holds frames back to fill an A-MPDU
+            "CONFIG_ESP_WIFI_AMPDU_TX_ENABLED": "n",
+            # POST /send runs its ESP-NOW sends on the httpd task
+            "CONFIG_MESH_NOW_HTTPD_PRIORITY": "6",
+        },
+        "dual-core": {
+            "CONFIG_MESH_NOW_HTTPD_CORE": "1",
+            "CONFIG_LWIP_TCPIP_TASK_AFFINITY_CPU0": "y",
+        },
+    },
+    "low-memory": {
+        "description": "Most free heap, for boards running other work",
+        "options": {
+            "CONFIG_COMPILER_OPTIMIZATION_SIZE": "y",
+            "CONFIG_ESP_WIFI_STATIC_RX_BUFFER_NUM": "4",
+            "CONFIG_ESP_WIFI_DYNAMIC_RX_BUFFER_NUM": "8",
+            "CONFIG_ESP_WIFI_TX_BUFFER_TYPE": "1",
+            "CONFIG_ESP_WIFI_DYNAMIC_TX_BUFFER_NUM": "8",
+            "CONFIG_ESP_WIFI_RX_BA_WIN": "4",
+            "CONFIG_ESP_WIFI_AMPDU_TX_ENABLED": "n",
+            "CONFIG_ESP_WIFI_AMSDU_TX_ENABLED": "n",
+            # On chips sharing IRAM and DRAM this memory goes back to the heap
+            "CONFIG_ESP_WIFI_IRAM_OPT": "n",
+            "CONFIG_ESP_WIFI_RX_IRAM_OPT": "n",
+            "CONFIG_LWIP_IRAM_OPTIMIZATION": "n",
+            "CONFIG_HTTPD_MAX_REQ_HDR_LEN": "512",
+            "CONFIG_HTTPD_MAX_URI_LEN": "256",
+            # One /send batch must fit the TX buffers
+            "CONFIG_MESH_NOW_SEND_BATCH_MAX": "8",
+            "CONFIG_MESH_NOW_SEND_BODY_LIMIT": "2048",
+        },
+    },
+}
+
+
+def base_config(target, project_dir=PROJECT_DIR):
+    path = Path(project_dir) / "configs" / f"sdkconfig.{target}"
+    return SdkConfig.parse(target, path, target)
+
+
+def profile_options(target, name, base):
+    """Overrides of profile name for target, in the order they apply"""
+    spec = PROFILES[name]
+    options = dict(spec.get("options", {}))
+    if target in DUAL_CORE and not base.enabled("CONFIG_FREERTOS_UNICORE"):
+        options.update(spec.get("dual-core", {}))
+    if base.enabled("CONFIG_SPIRAM"):
+        options.update(spec.get("psram", {}))
+    options.update(spec.get("targets", {}).get(target, {}))
+    return options
+
+
+def replaced_keys(options):
+    """Base options an override replaces: the option itself and its choice siblings"""
+    keys = set(options)
+    for key, value in options.items():
+        for prefix, members in CHOICE_GROUPS.items():
+            if value == "y" and key[len(prefix):] in members and key.startswith(prefix):
+                keys.update(prefix + member for member in members)
+    return keys
+
+
+def generate(target, name, project_dir=PROJECT_DIR):
+    """sdkconfig.defaults text for target with profile name applied"""
+    path = Path(project_dir) / "configs" / f"sdkconfig.{target}"
+    base = SdkConfig.parse(target, path, target)
+    options = profile_options(target, name, base)
+    replaced = replaced_keys(options)
+
+    lines = []
+    for line in path.read_text().splitlines():
+        key = line.split("=", 1)[0].strip()
+        if key in replaced:
+            continue
+        lines.append(line)
+    while lines and not lines[-1].strip():
+        lines.pop()
+    lines += ["", f"# Profile: {name} ({PROFILES[name]['description']})",
+              f"# Generated by scripts/sdkconfig_profiles.py from configs/sdkconfig.{target}"]
+    lines += [f"{key}={value}" for key, value in options.items()]
+    return "\n".join(lines) + "\n"
+
+
+def check(target, name, project_dir=PROJECT_DIR, checker=None):
+    """(generated text, SdkConfig of it, findings of the per-target rules)"""
+    checker = checker or load(project_dir, ())
+    text = generate(target, name, project_dir)
+    config = SdkConfig.parse_text(target, text, f"{target}.{name}", target)
+    return text, config, checker.check_config(config)
+
+
+def summary(config):
+    """Short description of the tuning a generated config ends up with"""
+    level = config.choice("CONFIG_COMPILER_OPTIMIZATION_", OPTIMIZATION_LEVELS) or "DEBUG"
+    core = config.int("CONFIG_MESH_NOW_HTTPD_CORE")
+    return (f"-O {level.lower():<5} {wifi_buffers(config):>3} Wi-Fi buffers  "
+            f"httpd prio {config.int('CONFIG_MESH_NOW_HTTPD_PRIORITY') or 5}"
+            + (f" core {core}" if core is not None and core >= 0 else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate and check the performance sdkconfig profiles")
+    parser.add_argument("profiles", nargs="*", help=f"Profiles (default: all of {', '.join(PROFILES)})")
+    parser.add_argument("--targets", nargs="*", help="Targets (default: all)")
+    parser.add_argument("--out", help="Write sdkconfig.<target>.<profile> files to this directory")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.profiles if name not in PROFILES]
+    if unknown:
+        parser.error(f"unknown profile(s): {', '.join(unknown)}")
+    targets = args.targets or list(TARGETS)
+    unknown = [target for target in targets if target not in TARGETS]
+    if unknown:
+        parser.error(f"unknown target(s): {', '.join(unknown)}")
+
+    class PlainConsole:
+        def print(self, text=""):
+            import re
+            print(re.sub(r"\[.*?\]", "", str(text)))
+
+    checker = load(PROJECT_DIR, ())
+    out = Path(args.out) if args.out else None
+    if out:
+        out.mkdir(parents=True, exist_ok=True)
+    failures = 0
+    for name in args.profiles or PROFILES:
+        print(f"{name}: {PROFILES[name]['description']}")
+        for target in targets:
+            text, config, findings = check(target, name, PROJECT_DIR, checker)
+            failed = bool(errors(findings))
+            failures += failed
+            print(f"   {target:<8} {summary(config)}  {'FAILED' if failed else 'ok'}")
+            report(PlainConsole(), [f for f in findings if f.level == "error"])
+            if out and not failed:
+                (out / f"sdkconfig.{target}.{name}").write_text(text)
+    if out:
+        print(f"Profiles written to {out}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+Mesh-NOW /send Body Decoder
+Reference model of main/src/form_decoder.c
+
+Decodes application/x-www-form-urlencoded and JSON /send bodies exactly the
+way the firmware does, byte for byte, so host tools (the stand-in node and the
+fuzz corpus) agree with the device on every edge case: lenient percent
+escapes, 127-byte message cap with UTF-8-safe truncation, batch limits and
+the accepted JSON subset.
+"""
+
+MAX_MESSAGE_BYTES = 127          # MAX_MESH_MESSAGE_LEN - 1
+KEY_LEN = 16                     # FORM_DECODER_KEY_LEN
+JSON_DEPTH = 8                   # FORM_DECODER_JSON_DEPTH
+SEND_BODY_LIMIT = 4096           # CONFIG_MESH_NOW_SEND_BODY_LIMIT default
+SEND_BATCH_MAX = 16              # CONFIG_MESH_NOW_SEND_BATCH_MAX default
+
+FORM_KEYS = (b"message", b"messages", b"messages[]")
+HEX = b"0123456789abcdefABCDEF"
+JSON_SPACE = b" \t\n\r"
+
+
+class DecodeError(ValueError):
+    pass
+
+
+def _trim_utf8(value):
+    """Drop a partial UTF-8 sequence left at the end by truncation"""
+    lead = len(value)
+    while lead > 0 and value[lead - 1] & 0xC0 == 0x80:
+        lead -= 1
+    if lead > 0 and value[lead - 1] & 0x80:
+        c = value[lead - 1]
+        need = 2 if c & 0xE0 == 0xC0 else 3 if c & 0xF0 == 0xE0 else 4 if c & 0xF8 == 0xF0 else 1
+        if len(value) - (lead - 1) < need:
+            return value[:lead - 1]
+    return value
+
+
+def _encode_codepoint(cp):
+    if cp < 0x80:
+        return bytes([cp])
+    if cp < 0x800:
+        return bytes([0xC0 | (cp >> 6), 0x80 | (cp & 0x3F)])
+    if cp < 0x10000:
+        return bytes([0xE0 | (cp >> 12), 0x80 | ((cp >> 6) & 0x3F), 0x80 | (cp & 0x3F)])
+    return bytes([0xF0 | (cp >> 18), 0x80 | ((cp >> 12) & 0x3F), 0x80 | ((cp >> 6) & 0x3F), 0x80 | (cp & 0x3F)])
+
+
+class _Collector:
+    def __init__(self, max_messages):
+        self.max_messages = max_messages
+        self.messages = []
+        self.dropped = 0
+        self.value = None
+        self.truncated = False
+
+    def begin(self, wanted):
+        self.value = None
+        if not wanted:
+            return
+        if len(self.messages) >= self.max_messages:
+            self.dropped += 1
+            return
+        self.value = bytearray()
+        self.truncated = False
+
+    def add(self, data):
+        if self.value is None:
+            return
+        for b in data:
+            if b == 0:
+                continue
+            if len(self.value) < MAX_MESSAGE_BYTES:
+                self.value.append(b)
+            else:
+                self.truncated = True
+
+    def end(self):
+        if self.value is None:
+            return
+        value = bytes(self.value)
+        if self.truncated:
+            value = _trim_utf8(value)
+        if value:
+            self.messages.append(value)
+        self.value = None
+
+
+def decode_form(body, max_messages=SEND_BATCH_MAX):
+    out = _Collector(max_messages)
+    key = bytearray()
+    key_overflow = False
+    in_key = True
+
+    def sink(data):
+        nonlocal key_overflow
+        if in_key:
+            for b in data:
+                if len(key) < KEY_LEN - 1 and not key_overflow:
+                    key.append(b)
+                else:
+                    key_overflow = True
+        else:
+            out.add(data)
+
+    def end_pair():
+        nonlocal in_key, key_overflow
+        if not in_key:
+            out.end()
+        in_key = True
+        key.clear()
+        key_overflow = False
+
+    i, n = 0, len(body)
+    while i < n:
+        c = body[i]
+        if c == ord("%"):
+            if i + 1 < n and body[i + 1] in HEX:
+                if i + 2 < n and body[i + 2] in HEX:
+                    sink(bytes([int(body[i + 1:i + 3], 16)]))
+                    i += 3
+                    continue
+                # '%' + one hex digit, then reprocess the next character normally
+                sink(b"%" + body[i + 1:i + 2])
+                i += 2
+                continue
+            sink(b"%")
+        elif c == ord("&"):
+            end_pair()
+        elif c == ord("=") and in_key:
+            in_key = False
+            out.begin(not key_overflow and bytes(key) in FORM_KEYS)
+        elif c == ord("+"):
+            sink(b" ")
+        else:
+            sink(bytes([c]))
+        i += 1
+
+    end_pair()
+    return out.messages, out.dropped
+
+
+def decode_json(body, max_messages=SEND_BATCH_MAX):
+    out = _Collector(max_messages)
+    stack = []                # True = array
+    key = b""
+    in_messages = False
+    i, n = 0, len(body)
+
+    def space():
+        nonlocal i
+        while i < n and body[i] in JSON_SPACE:
+            i += 1
+
+    def expect(ch):
+        space()
+        if i >= n or body[i] != ord(ch):
+            raise DecodeError(f"expected {ch!r} at {i}")
+
+    def read_string(is_key):
+        nonlocal i
+        i += 1  # opening quote
+        data = bytearray()
+        high = 0
+        while True:
+            if i >= n:
+                raise DecodeError("unterminated string")
+            c = body[i]
+            if c == ord('"'):
+                i += 1
+                if high:
+                    data += _encode_codepoint(0xFFFD)
+                return bytes(data)
+            if c < 0x20:
+                raise DecodeError("control character in string")
+            if c != ord("\\"):
+                if high:
+                    data += _encode_codepoint(0xFFFD)
+                    high = 0
+                data.append(c)
+                i += 1
+                continue
+            if i + 1 >= n:
+                raise DecodeError("unterminated escape")
+            e = chr(body[i + 1])
+            simple = {'"': b'"', "\\": b"\\", "/": b"/", "b": b"\b", "f": b"\f", "n": b"\n", "r": b"\r", "t": b"\t"}
+            if e in simple:
+                if high:
+                    data += _encode_codepoint(0xFFFD)
+                    high = 0
+                data += simple[e]
+                i += 2
+                continue
+            if e != "u":
+                raise DecodeError("invalid escape")
+            digits = body[i + 2:i + 6]
+            if len(digits) < 4 or any(d not in HEX for d in digits):
+                raise DecodeError("invalid unicode escape")
+            cp = int(digits, 16)
+            i += 6
+            if 0xD800 <= cp <= 0xDBFF:
+                if high:
+                    data += _encode_codepoint(0xFFFD)
+                high = cp
+            elif 0xDC00 <= cp <= 0xDFFF:
+                if high:
+                    data += _encode_codepoint(0x10000 + ((high - 0xD800) << 10) + (cp - 0xDC00))
+                    high = 0
+                else:
+                    data += _encode_codepoint(0xFFFD)
+            else:
+                if high:
+                    data += _encode_codepoint(0xFFFD)
+                    high = 0
+                data += _encode_codepoint(cp)
+
+    def read_value():
+        nonlocal i, in_messages
+        space()
+        if i >= n:
+            raise DecodeError("unexpected end")
+        c = body[i]
+        depth = len(stack)
+        if c == ord('"'):
+            wanted = (depth == 1 and key == b"message") or (depth == 2 and in_messages)
+            out.begin(wanted)
+            out.add(read_string(False))
+            out.end()
+        elif c in (ord("{"), ord("[")):
+            is_array = c == ord("[")
+            if depth >= JSON_DEPTH:
+                raise DecodeError("nesting too deep")
+            stack.append(is_array)
+            if is_array and len(stack) == 2 and key == b"messages":
+                in_messages = True
+            i += 1
+            read_container(is_array)
+        elif ord("0") <= c <= ord("9") or c == ord("-") or ord("a") <= c <= ord("z"):
+            while i < n and (chr(body[i]).isascii() and (chr(body[i]).isalnum() or body[i] in b".+-")):
+                i += 1
+        else:
+            raise DecodeError(f"unexpected {chr(c)!r}")
+
+    def read_container(is_array):
+        nonlocal i, key, in_messages
+        space()
+        close = ord("]") if is_array else ord("}")
+        if i < n and body[i] == close:
+            i += 1
+        else:
+            while True:
+                if not is_array:
+                    expect('"')
+                    name = read_string(True)
+                    if len(stack) == 1:
+                        key = name if len(name) < KEY_LEN else b"\0" * KEY_LEN
+                    expect(":")
+                    i += 1
+                read_value()
+                space()
+                if i >= n:
+                    raise DecodeError("unexpected end")
+                if body[i] == ord(","):
+                    i += 1
+                    continue
+                if body[i] == close:
+                    i += 1
+                    break
+                raise DecodeError(f"unexpected {chr(body[i])!r}")
+        stack.pop()
+        if len(stack) < 2:
+            in_messages = False
+
+    space()
+    if i >= n or body[i] != ord("{"):
+        raise DecodeError("body must be a JSON object")
+    stack.append(False)
+    i += 1
+    read_container(False)
+    space()
+    if i != n:
+        raise DecodeError("trailing data")
+    return out.messages, out.dropped
+
+
+def decode_send_body(body, content_type="", max_messages=SEND_BATCH_MAX):
+    """Return (messages as bytes, dropped count); raises DecodeError for bad JSON"""
+    if content_type.split(";")[0].strip().lower() == "application/json":
+        return decode_json(body, max_messages)
+    return decode_form(body, max_messages)
+
+
+def expected_status(body, content_type="", limit=SEND_BODY_LIMIT):
+    """HTTP status the firmware answers with for a body"""
+    if len(body) > limit:
+        return 413
+    try:
+        decode_send_body(body, content_type)
+    except DecodeError:
+        return 400
+    return 200
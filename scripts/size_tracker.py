@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Mesh-NOW Size Tracker
+Per-component flash/DRAM/IRAM history for firmware builds
+
+Parses the linker map (and, when given, the `idf.py size --format json`
+memory capacities) of a build and stores each component's footprint in a SQLite
+database, so builds can be compared and growth caught before a target runs
+out of memory:
+
+    idf.py size --format json > build/size.json
+    python scripts/size_tracker.py record esp32s2 --size-json build/size.json
+    python scripts/size_tracker.py diff esp32s2                # previous vs latest
+    python scripts/size_tracker.py diff esp32s2 1a2b3c4 latest --fail-on-regression
+    python scripts/size_tracker.py trend esp32s2 --component main
+
+Components are the ESP-IDF archives (libmain.a -> main); the embedded
+frontend arrays are split out of main as "frontend". "flash" is what a
+component adds to the app image (code, read-only and initialized data, IRAM
+code), "dram" is its static RAM (.data and .bss) and "iram" its IRAM code.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import subprocess
+import importlib.util
+from pathlib import Path
+
+# rich is imported where output is drawn, so --ci runs never load it
+RICH_AVAILABLE = importlib.util.find_spec("rich") is not None
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_DB = Path(os.environ.get("MESH_NOW_SIZE_DB", PROJECT_DIR / "builds" / "size_history.db"))
+KINDS = ("flash", "dram", "iram")
+# Growth (bytes, or percent with a % suffix) that counts as a regression
+DEFAULT_THRESHOLDS = {"flash": "4096", "dram": "512", "iram": "512"}
+
+# Input sections that are split out of their archive into a pseudo-component
+PSEUDO_COMPONENTS = [
+    ("frontend", re.compile(r"\.rodata\.(INDEX_HTML|BUNDLE_JS|STYLES_CSS)(_size)?$")),
+]
+
+MEMORY_REGION = re.compile(r"^(\w+)\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)")
+OUTPUT_SECTION = re.compile(r"^(\.[\w.]+)(?:\s+0x[0-9a-fA-F]+\s+0x[0-9a-fA-F]+)?")
+INPUT_SECTION = re.compile(r"^ (\S+)\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)\s+(\S.*)$")
+INPUT_NAME_ONLY = re.compile(r"^ (\.\S+)$")
+INPUT_CONTINUATION = re.compile(r"^\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)\s+(\S.*)$")
+ARCHIVE = re.compile(r"lib([^/\\(]+)\.a\(")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS builds (
+    id INTEGER PRIMARY KEY,
+    target TEXT NOT NULL,
+    git_sha TEXT,
+    label TEXT,
+    recorded_at INTEGER NOT NULL,
+    image_size INTEGER,
+    flash INTEGER NOT NULL,
+    dram INTEGER NOT NULL,
+    iram INTEGER NOT NULL,
+    dram_total INTEGER,
+    iram_total INTEGER
+);
+CREATE TABLE IF NOT EXISTS components (
+    build_id INTEGER NOT NULL REFERENCES builds(id) ON DELETE CASCADE,
+    component TEXT NOT NULL,
+    flash INTEGER NOT NULL,
+    dram INTEGER NOT NULL,
+    iram INTEGER NOT NULL,
+    PRIMARY KEY (build_id, component)
+);
+CREATE INDEX IF NOT EXISTS builds_target ON builds(target, id);
+"""
+
+
+def setup_console():
+    """Setup console for output"""
+    if RICH_AVAILABLE:
+        from rich.console import Console
+        return Console()
+    else:
+        return None
+
+
+# Map file parsing --------------------------------------------------------------
+
+def section_kinds(output_section):
+    """Which footprints an output section counts toward"""
+    name = output_section.lower()
+    if "dummy" in name:
+        return ()                  # Address-space placeholders, no bytes
+    if name.startswith(".iram"):
+        return ("flash", "iram")
+    if name.startswith(".dram"):
+        return ("dram",) if "bss" in name or "noinit" in name else ("flash", "dram")
+    if name.startswith(".flash"):
+        return ("flash",)
+    return ()
+
+
+def component_of(section, path):
+    for name, pattern in PSEUDO_COMPONENTS:
+        if pattern.match(section):
+            return name
+    match = ARCHIVE.search(path)
+    return match.group(1) if match else "other"
+
+
+def parse_map(text):
+    """(component -> {kind: bytes}, memory region -> length) from a GNU ld map file"""
+    usage = {}
+    regions = {}
+    state = "preamble"
+    output_section = None
+    pending_name = None
+
+    for line in text.splitlines():
+        if line.startswith("Memory Configuration"):
+            state = "memory"
+            continue
+        if line.startswith("Linker script and memory map"):
+            state = "map"
+            continue
+
+        if state == "memory":
+            match = MEMORY_REGION.match(line)
+            if match and match.group(1) != "Name":
+                regions[match.group(1)] = int(match.group(3), 16)
+            continue
+        if state != "map":
+            continue
+
+        if line.startswith("."):
+            output_section = OUTPUT_SECTION.match(line).group(1)
+            pending_name = None
+            continue
+
+        match = INPUT_SECTION.match(line)
+        if match:
+            section, size, path = match.group(1), int(match.group(3), 16), match.group(4)
+        elif pending_name and INPUT_CONTINUATION.match(line):
+            match = INPUT_CONTINUATION.match(line)
+            section, size, path = pending_name, int(match.group(2), 16), match.group(3)
+        else:
+            name_only = INPUT_NAME_ONLY.match(line)
+            pending_name = name_only.group(1) if name_only else None
+            continue
+        pending_name = None
+
+        kinds = section_kinds(output_section or "")
+        if not kinds or size == 0 or section == "*fill*":
+            continue
+        totals = usage.setdefault(component_of(section, path), dict.fromkeys(KINDS, 0))
+        for kind in kinds:
+            totals[kind] += size
+
+    return usage, regions
+
+
+def region_capacity(regions, prefix):
+    return sum(length for name, length in regions.items() if name.startswith(prefix)) or None
+
+
+def parse_size_json(path):
+    """DRAM/IRAM capacity from `idf.py size --format json`; the map file can't
+    tell how much of a shared DIRAM region each side may use"""
+    data = json.loads(Path(path).read_text())
+    capacity = {}
+    for kind in ("dram", "iram"):
+        used, available = data.get(f"used_{kind}"), data.get(f"available_{kind}")
+        if isinstance(used, int) and isinstance(available, int):
+            capacity[f"{kind}_total"] = used + available
+    return capacity
+
+
+# Database ----------------------------------------------------------------------
+
+def open_db(path):
+    import sqlite3
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(str(path))
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA foreign_keys = ON")
+    db.executescript(SCHEMA)
+    return db
+
+
+def git_head():
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=PROJECT_DIR, capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def record_build(db, target, usage, totals, git_sha=None, label=None, image_size=None):
+    """Store one build; returns its id"""
+    with db:
+        cursor = db.execute(
+            "INSERT INTO builds (target, git_sha, label, recorded_at, image_size, flash, dram, iram, "
+            "dram_total, iram_total) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (target, git_sha, label, int(time.time()), image_size,
+             totals["flash"], totals["dram"], totals["iram"], totals.get("dram_total"), totals.get("iram_total")))
+        build_id = cursor.lastrowid
+        db.executemany(
+            "INSERT INTO components (build_id, component, flash, dram, iram) VALUES (?, ?, ?, ?, ?)",
+            [(build_id, name, sizes["flash"], sizes["dram"], sizes["iram"]) for name, sizes in usage.items()])
+    return build_id
+
+
+def resolve_build(db, target, ref):
+    """Build row for an id, a git SHA prefix, 'latest' or 'previous'"""
+    if ref in ("latest", "previous"):
+        rows = db.execute("SELECT * FROM builds WHERE target = ? ORDER BY id DESC LIMIT 2", (target,)).fetchall()
+        index = 0 if ref == "latest" else 1
+        return rows[index] if len(rows) > index else None
+    if ref.isdigit():
+        row = db.execute("SELECT * FROM builds WHERE target = ? AND id = ?", (target, int(ref))).fetchone()
+        if row:
+            return row
+    return db.execute("SELECT * FROM builds WHERE target = ? AND git_sha LIKE ? ORDER BY id DESC LIMIT 1",
+                      (target, ref + "%")).fetchone()
+
+
+def component_sizes(db, build_id):
+    rows = db.execute("SELECT * FROM components WHERE build_id = ?", (build_id,)).fetchall()
+    return {row["component"]: {kind: row[kind] for kind in KINDS} for row in rows}
+
+
+# Comparison --------------------------------------------------------------------
+
+def parse_thresholds(values):
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    for value in values or []:
+        kind, _, limit = value.partition("=")
+        if kind not in KINDS or not re.fullmatch(r"\d+(\.\d+)?%?", limit):
+            raise argparse.ArgumentTypeError(f"bad threshold {value!r}; use e.g. dram=512 or flash=2%")
+        thresholds[kind] = limit
+    return thresholds
+
+
+def exceeds(old, new, limit):
+    growth = new - old
+    if growth <= 0:
+        return False
+    if limit.endswith("%"):
+        return old == 0 or growth * 100.0 / old > float(limit[:-1])
+    return growth > float(limit)
+
+
+def compare(old_sizes, new_sizes, thresholds):
+    """Rows of (component, {kind: (old, new)}, regressed kinds) for components that changed"""
+    rows = []
+    empty = dict.fromkeys(KINDS, 0)
+    for name in sorted(set(old_sizes) | set(new_sizes)):
+        old, new = old_sizes.get(name, empty), new_sizes.get(name, empty)
+        if old == new:
+            continue
+        regressed = [kind for kind in KINDS if exceeds(old[kind], new[kind], thresholds[kind])]
+        rows.append((name, {kind: (old[kind], new[kind]) for kind in KINDS}, regressed))
+    rows.sort(key=lambda row: -max(abs(new - old) for old, new in row[1].values()))
+    return rows
+
+
+def delta(old, new):
+    change = new - old
+    return f"{change:+,}" if change else "0"
+
+
+def build_name(row):
+    return f"#{row['id']} {(row['git_sha'] or '')[:8]}{' ' + row['label'] if row['label'] else ''}".rstrip()
+
+
+def print_table(console, title, columns, rows, styles=None):
+    if console:
+        from rich.table import Table
+        table = Table(title=title)
+        for index, column in enumerate(columns):
+            table.add_column(column, justify="left" if index == 0 else "right")
+        for index, row in enumerate(rows):
+            style = styles[index] if styles else None
+            table.add_row(*row, style=style)
+        console.print(table)
+        return
+    print(title)
+    widths = [max(len(str(c)) for c in [column] + [row[i] for row in rows]) for i, column in enumerate(columns)]
+    print("  ".join(c.ljust(w) if i == 0 else c.rjust(w) for i, (c, w) in enumerate(zip(columns, widths))))
+    for row in rows:
+        print("  ".join(c.ljust(w) if i == 0 else c.rjust(w) for i, (c, w) in enumerate(zip(row, widths))))
+
+
+# Commands ----------------------------------------------------------------------
+
+def record(args, console):
+    map_path = Path(args.map)
+    if not map_path.exists():
+        print(f"Map file not found: {map_path} (build the target first)")
+        return 1
+    usage, regions = parse_map(map_path.read_text(errors="replace"))
+    if not usage:
+        print(f"No flash/DRAM/IRAM sections found in {map_path}")
+        return 1
+
+    totals = {kind: sum(sizes[kind] for sizes in usage.values()) for kind in KINDS}
+    totals["dram_total"] = region_capacity(regions, "dram0")
+    totals["iram_total"] = region_capacity(regions, "iram0")
+    if args.size_json:
+        totals.update(parse_size_json(args.size_json))
+
+    image = Path(args.image)
+    image_size = image.stat().st_size if image.exists() else None
+    db = open_db(args.db)
+    build_id = record_build(db, args.target, usage, totals, args.sha or git_head(), args.label, image_size)
+    row = resolve_build(db, args.target, str(build_id))
+    print(f"Recorded {args.target} build {build_name(row)}: {len(usage)} components, "
+          f"flash {totals['flash']:,} B, DRAM {totals['dram']:,} B, IRAM {totals['iram']:,} B")
+    return 0
+
+
+def diff(args, console):
+    db = open_db(args.db)
+    old = resolve_build(db, args.target, args.old)
+    new = resolve_build(db, args.target, args.new)
+    if new is not None and old is None and args.old == "previous":
+        print(f"Only one {args.target} build recorded; nothing to compare yet")
+        return 0
+    if old is None or new is None:
+        print(f"Need two recorded {args.target} builds ({args.old!r}, {args.new!r}); record more first")
+        return 1
+
+    thresholds = parse_thresholds(args.threshold)
+    rows = compare(component_sizes(db, old["id"]), component_sizes(db, new["id"]), thresholds)
+    totals_old = {kind: old[kind] for kind in KINDS}
+    totals_new = {kind: new[kind] for kind in KINDS}
+    total_regressed = [kind for kind in KINDS if exceeds(totals_old[kind], totals_new[kind], thresholds[kind])]
+
+    table_rows, styles = [], []
+    for name, sizes, regressed in rows:
+        table_rows.append([name] + [f"{sizes[k][1]:,} ({delta(*sizes[k])})" for k in KINDS]
+                          + [", ".join(regressed)])
+        styles.append("red" if regressed else None)
+    table_rows.append(["TOTAL"] + [f"{totals_new[k]:,} ({delta(totals_old[k], totals_new[k])})" for k in KINDS]
+                      + [", ".join(total_regressed)])
+    styles.append("bold red" if total_regressed else "bold")
+    print_table(console, f"{args.target}: {build_name(old)} -> {build_name(new)}",
+                ["Component", "Flash", "DRAM", "IRAM", "Regression"], table_rows, styles)
+
+    regressions = sum(1 for _, _, regressed in rows if regressed) + (1 if total_regressed else 0)
+    limits = ", ".join(f"{kind} > {thresholds[kind]}" for kind in KINDS)
+    if regressions:
+        print(f"{regressions} regression(s) past thresholds ({limits})")
+        return 1 if args.fail_on_regression else 0
+    print(f"No regressions past thresholds ({limits})")
+    return 0
+
+
+def trend(args, console):
+    db = open_db(args.db)
+    builds = db.execute("SELECT * FROM builds WHERE target = ? ORDER BY id DESC LIMIT ?",
+                        (args.target, args.limit)).fetchall()[::-1]
+    if not builds:
+        print(f"No {args.target} builds recorded")
+        return 1
+
+    def used(value, total):
+        return f"{value:,}" + (f" ({value * 100.0 / total:.0f}%)" if total else "")
+
+    rows, previous = [], None
+    for build in builds:
+        if args.component:
+            sizes = component_sizes(db, build["id"]).get(args.component, dict.fromkeys(KINDS, 0))
+            values = [f"{sizes[k]:,}" for k in KINDS]
+            current = sizes["flash"]
+        else:
+            values = [f"{build['flash']:,}", used(build["dram"], build["dram_total"]),
+                      used(build["iram"], build["iram_total"])]
+            current = build["flash"]
+        change = delta(previous, current) if previous is not None else ""
+        previous = current
+        rows.append([build_name(build), time.strftime("%Y-%m-%d %H:%M", time.localtime(build["recorded_at"])),
+                     f"{build['image_size']:,}" if build["image_size"] else "-"] + values + [change])
+
+    title = f"{args.target} size trend" + (f" for {args.component}" if args.component else "")
+    print_table(console, title, ["Build", "Recorded", "Image", "Flash", "DRAM", "IRAM", "Flash change"], rows)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mesh-NOW firmware size history")
+    parser.add_argument("--db", default=str(DEFAULT_DB), help=f"History database (default {DEFAULT_DB})")
+    parser.add_argument("--ci", action="store_true", help="CI mode - plain output")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = sub.add_parser("record", help="Store the footprint of a finished build")
+    record_parser.add_argument("target")
+    record_parser.add_argument("--map", default=str(PROJECT_DIR / "build" / "mesh-now.map"))
+    record_parser.add_argument("--size-json", help="Output of `idf.py size --format json`")
+    record_parser.add_argument("--image", default=str(PROJECT_DIR / "build" / "mesh-now.bin"))
+    record_parser.add_argument("--sha", help="Git commit (default: HEAD)")
+    record_parser.add_argument("--label", help="Free-form note, e.g. a branch or PR number")
+
+    diff_parser = sub.add_parser("diff", help="Compare two builds of a target")
+    diff_parser.add_argument("target")
+    diff_parser.add_argument("old", nargs="?", default="previous", help="Build id, git SHA prefix, 'previous'")
+    diff_parser.add_argument("new", nargs="?", default="latest", help="Build id, git SHA prefix, 'latest'")
+    diff_parser.add_argument("--threshold", action="append", metavar="KIND=LIMIT",
+                             help="Growth that counts as a regression, e.g. dram=256 or flash=2%% "
+                                  f"(defaults: {', '.join(f'{k}={v}' for k, v in DEFAULT_THRESHOLDS.items())})")
+    diff_parser.add_argument("--fail-on-regression", action="store_true", help="Exit 1 if anything regressed")
+
+    trend_parser = sub.add_parser("trend", help="Footprint of the recent builds of a target")
+    trend_parser.add_argument("target")
+    trend_parser.add_argument("--limit", type=int, default=20)
+    trend_parser.add_argument("--component", help="Show one component instead of the totals")
+
+    args = parser.parse_args()
+    console = setup_console() if not args.ci else None
+    try:
+        sys.exit({"record": record, "diff": diff, "trend": trend}[args.command](args, console))
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()
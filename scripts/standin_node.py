@@ -0,0 +1,551 @@
+#!/usr/bin/env python3
+"""
+Mesh-NOW Stand-in Node
+Local HTTP server implementing the device web API (main/src/web_server.c)
+
+Host tools and the frontend can be exercised against this instead of a board.
+It mirrors the firmware's observable behavior: a bounded message history with
+sequence numbers, /messages cursor pagination, per-client session cursors
+carried in the meshnow_sid cookie, the /send body decoder and /metrics
+(counters for the frames it "sends" and receives, handler latencies).
+
+Nodes joined with link() model one mesh island: a message sent or relayed on
+one is heard by the others under its origin's MAC and message id, and each
+node drops ids it has already seen, as mesh_now.c does. Group messages
+(/send?group=N) are kept only by nodes subscribed to the group (/groups).
+A status posted to /presence and typing posted to /typing show in the other
+nodes' /presence until they time out, without the firmware's debouncing.
+"""
+
+import sys
+import json
+import time
+import random
+import secrets
+import argparse
+import threading
+from collections import deque
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit, parse_qs
+
+import mesh_metrics
+from send_decoder import DecodeError, SEND_BODY_LIMIT, decode_send_body
+
+# Mirrors web_server.c / message_history.h
+MESSAGES_PER_POLL = 10
+MESSAGES_PAGE_MAX = 25
+SESSION_COOKIE = "meshnow_sid"
+MAX_CLIENT_SESSIONS = 16
+SESSION_TIMEOUT_S = 60.0
+HISTORY_CAPACITY = 775
+MAX_MESSAGE_LEN = 127
+MAX_SEEN_MESSAGE_IDS = 128
+MESSAGES_SCAN_MAX = 100
+MESH_GROUP_COUNT = 256
+# Mirrors mesh_presence.h
+PRESENCE_STATUS_LEN = 32
+PRESENCE_TIMEOUT_S = 180.0
+TYPING_TIMEOUT_S = 4.5
+
+# The built frontend when there is one, like the headers the firmware embeds
+FRONTEND_DIR = Path(__file__).resolve().parent.parent / "frontend"
+STATIC_FILES = {
+    "/": ("index.html", "text/html"),
+    "/bundle.js": ("bundle.js", "application/javascript"),
+    "/styles.css": ("styles.css", "text/css"),
+}
+
+
+def static_file(path):
+    """(body, content type) for a page path, from frontend/dist or frontend/public"""
+    name, content_type = STATIC_FILES[path]
+    for directory in (FRONTEND_DIR / "dist", FRONTEND_DIR / "public"):
+        if (directory / name).is_file():
+            return (directory / name).read_bytes(), content_type
+    return b"", content_type
+
+
+class StandinNode:
+    """In-memory model of one node's web-facing state"""
+
+    def __init__(self, mac="24:6f:28:00:00:01", loopback=True, session_timeout=SESSION_TIMEOUT_S,
+                 history_capacity=HISTORY_CAPACITY):
+        self.mac = mac
+        self.loopback = loopback
+        self.session_timeout = session_timeout
+        self.history_capacity = history_capacity
+        self.history = []
+        self.next_seq = 1
+        self.sessions = {}
+        self.sent = []
+        self.peers = []
+        self.metrics = mesh_metrics.Snapshot()
+        self.started = time.monotonic()
+        self.unavailable = 0
+        self.retry_after = None
+        self.next_message_id = random.getrandbits(32) or 1
+        self.seen_ids = deque(maxlen=MAX_SEEN_MESSAGE_IDS)
+        self.neighbours = []
+        self.groups = {0}
+        # mac -> [status, status expiry, typing-to-us expiry]
+        self.presence = {}
+        self.lock = threading.Lock()
+
+    # Mesh side ------------------------------------------------------------
+
+    def _new_message_id(self):
+        message_id = self.next_message_id
+        self.next_message_id = (self.next_message_id + 1) & 0xFFFFFFFF or 1
+        return message_id
+
+    def _mark_seen(self, message_id):
+        """False if message_id was already seen; the seen window is the firmware's"""
+        if message_id in self.seen_ids:
+            return False
+        self.seen_ids.append(message_id)
+        return True
+
+    def inject(self, content, sender=None, timestamp=None, message_id=None, group=None):
+        """Add a message as if it had been received over ESP-NOW
+
+        Returns its sequence number, or None when message_id was already seen
+        and the frame is dropped as a duplicate, or when it is for a group
+        this node has not joined.
+        """
+        with self.lock:
+            if message_id is None:
+                message_id = self._new_message_id()
+            elif not self._mark_seen(message_id):
+                self.metrics.counters["duplicates"] += 1
+                return None
+            self.metrics.counters["frames_received"] += 1
+            if group is not None and group not in self.groups:
+                return None
+            return self._append(content, sender, timestamp, message_id, group)
+
+    def _append(self, content, sender, timestamp, message_id, group=None):
+        """Add a history entry; the caller holds the lock"""
+        entry = {
+            "seq": self.next_seq,
+            "id": message_id,
+            "sender": sender or self.mac,
+            "content": content[:MAX_MESSAGE_LEN],
+            "timestamp": int(time.monotonic() * 1000) if timestamp is None else timestamp,
+        }
+        if group is not None:
+            entry["group"] = group
+        self.next_seq += 1
+        self.history.append(entry)
+        if len(self.history) > self.history_capacity:
+            del self.history[:len(self.history) - self.history_capacity]
+        return entry["seq"]
+
+    def send(self, content, group=None):
+        """Handle a message posted to /send, or /send?group=N with group"""
+        with self.lock:
+            self.sent.append(content)
+            self.metrics.counters["frames_sent"] += 1
+            message_id = self._new_message_id()
+            if not self.loopback:
+                self._mark_seen(message_id)
+        if self.loopback:
+            self.inject(content, message_id=message_id, group=group)
+        self._broadcast(content, self.mac, message_id, group)
+
+    def relay(self, sender, message_id, content):
+        """Handle POST /relay: rebroadcast under the origin's MAC and id
+
+        False if the id was already seen here, which the firmware answers with 409.
+        """
+        with self.lock:
+            if not self._mark_seen(message_id):
+                return False
+            self.sent.append(content)
+            self.metrics.counters["frames_sent"] += 1
+            # Its own clients see it too, as mesh_now_send_relay delivers it locally
+            self._append(content, sender, None, message_id)
+        self._broadcast(content, sender, message_id)
+        return True
+
+    def _broadcast(self, content, sender, message_id, group=None):
+        for neighbour in self.neighbours:
+            neighbour.inject(content, sender, message_id=message_id, group=group)
+
+    def set_presence(self, status):
+        """Handle POST /presence: neighbours list the status until it times out"""
+        status = status.encode()[:PRESENCE_STATUS_LEN - 1].decode("utf-8", "ignore")
+        now = time.monotonic()
+        for neighbour in self.neighbours:
+            with neighbour.lock:
+                entry = neighbour.presence.setdefault(self.mac, ["", 0.0, 0.0])
+                entry[0] = status
+                entry[1] = now + PRESENCE_TIMEOUT_S if status else 0.0
+
+    def set_typing(self, target, typing):
+        """Handle POST /typing: the target shows it until it times out"""
+        for neighbour in self.neighbours:
+            if neighbour.mac == target:
+                with neighbour.lock:
+                    entry = neighbour.presence.setdefault(self.mac, ["", 0.0, 0.0])
+                    if typing:
+                        entry[2] = time.monotonic() + TYPING_TIMEOUT_S
+
+    def presence_status(self):
+        """Payload for GET /presence"""
+        now = time.monotonic()
+        with self.lock:
+            nodes = [{"mac": mac, "status": status if status_until > now else "", "typing": typing_until > now}
+                     for mac, (status, status_until, typing_until) in self.presence.items()
+                     if status_until > now or typing_until > now]
+        return {"nodes": nodes}
+
+    def join_group(self, group):
+        with self.lock:
+            self.groups.add(group)
+
+    def leave_group(self, group):
+        with self.lock:
+            self.groups.discard(group)
+
+    def groups_status(self):
+        """Payload for GET /groups"""
+        with self.lock:
+            return {"groups": sorted(self.groups), "neighbours": len(self.neighbours)}
+
+    def observe(self, histogram, elapsed_us):
+        with self.lock:
+            self.metrics.observe_us(histogram, elapsed_us)
+
+    def metrics_snapshot(self):
+        """Copy of the metrics as GET /metrics would report them now"""
+        with self.lock:
+            snapshot = mesh_metrics.decode(mesh_metrics.encode(self.metrics))
+        snapshot.uptime_ms = int((time.monotonic() - self.started) * 1000)
+        snapshot.gauges["peers"] = len(self.peers)
+        return snapshot
+
+    # Web side -------------------------------------------------------------
+
+    def reject_next(self, count, retry_after=None):
+        """Answer the next count requests with 503, as an overloaded node would"""
+        with self.lock:
+            self.unavailable = count
+            self.retry_after = retry_after
+
+    def take_rejection(self):
+        with self.lock:
+            if self.unavailable <= 0:
+                return False
+            self.unavailable -= 1
+            return True
+
+    def _evict_stale(self, now):
+        for sid in [sid for sid, s in self.sessions.items() if now - s["last_seen"] > self.session_timeout]:
+            del self.sessions[sid]
+
+    def _create_session(self, now):
+        if len(self.sessions) >= MAX_CLIENT_SESSIONS:
+            oldest = min(self.sessions, key=lambda sid: self.sessions[sid]["last_seen"])
+            del self.sessions[oldest]
+        sid = f"{secrets.randbits(32) or 1:08x}"
+        self.sessions[sid] = {"cursor": 0, "last_seen": now}
+        return sid
+
+    def messages(self, since=None, limit=MESSAGES_PER_POLL, session_id=None, group=None):
+        """Return (payload, new_session_id) for GET /messages
+
+        With group, only that group's messages from the next MESSAGES_SCAN_MAX
+        entries; the cursor moves past the ones skipped.
+        """
+        now = time.monotonic()
+        with self.lock:
+            self._evict_stale(now)
+            new_sid = None
+            if session_id not in self.sessions:
+                session_id = new_sid = self._create_session(now)
+            session = self.sessions[session_id]
+
+            if since is None:
+                since = session["cursor"]
+            if limit <= 0 or limit > MESSAGES_PAGE_MAX:
+                limit = MESSAGES_PAGE_MAX
+
+            if group is None:
+                page = [e for e in self.history if e["seq"] > since][:limit]
+                last_seq = page[-1]["seq"] if page else since
+            else:
+                page = []
+                last_seq = since
+                for entry in [e for e in self.history if e["seq"] > since][:MESSAGES_SCAN_MAX]:
+                    last_seq = entry["seq"]
+                    if entry.get("group") == group:
+                        page.append(entry)
+                        if len(page) == limit:
+                            break
+            session["cursor"] = last_seq
+            session["last_seen"] = now
+
+            payload = {
+                "messages": [dict(e) for e in page],
+                "next": last_seq,
+                "oldest": self.history[0]["seq"] if self.history else 0,
+                "latest": self.next_seq - 1,
+                "more": self.next_seq - 1 > last_seq,
+            }
+        return payload, new_sid
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, delayed ACKs
+    # add 40 ms to some responses
+    disable_nagle_algorithm = True
+
+    @property
+    def node(self):
+        return self.server.node
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        data = body if isinstance(body, bytes) else body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _json(self, payload, headers=None):
+        self._send(200, json.dumps(payload, separators=(",", ":")), headers=headers)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _timed(self, handle):
+        """Run a request handler, recording its time like web_server.c's timed_handler"""
+        start = time.perf_counter()
+        try:
+            handle()
+        finally:
+            path = urlsplit(self.path).path
+            histogram = {"/send": "http_send", "/relay": "http_send", "/messages": "http_messages"}.get(
+                path, "http_static" if path in ("/", "/bundle.js", "/styles.css") else "http_api")
+            self.node.observe(histogram, (time.perf_counter() - start) * 1e6)
+
+    def _unavailable(self):
+        if not self.node.take_rejection():
+            return False
+        self._read_body()
+        headers = {} if self.node.retry_after is None else {"Retry-After": str(self.node.retry_after)}
+        self._send(503, "Busy", "text/plain", headers)
+        return True
+
+    def do_GET(self):
+        if not self._unavailable():
+            self._timed(self._get)
+
+    def do_POST(self):
+        if not self._unavailable():
+            self._timed(self._post)
+
+    def _get(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == "/messages":
+            cookie = SimpleCookie(self.headers.get("Cookie", ""))
+            session_id = cookie[SESSION_COOKIE].value if SESSION_COOKIE in cookie else None
+            since = int(query["since"][0]) if "since" in query else None
+            limit = int(query.get("limit", [MESSAGES_PER_POLL])[0])
+            group = parse_group(query)
+            if group == -1:
+                self._send(400, "Invalid group", "text/plain")
+                return
+            payload, new_sid = self.node.messages(since, limit, session_id, group)
+            headers = {}
+            if new_sid:
+                headers["Set-Cookie"] = f"{SESSION_COOKIE}={new_sid}; Path=/; SameSite=Strict"
+            self._json(payload, headers)
+        elif url.path == "/peers":
+            self._json({"peers": list(self.node.peers)})
+        elif url.path == "/groups":
+            self._json(self.node.groups_status())
+        elif url.path == "/presence":
+            self._json(self.node.presence_status())
+        elif url.path == "/wifi-info":
+            ssid = "MESH-NOW-" + self.node.mac.replace(":", "")[-8:].upper()
+            self._json({"ssid": ssid, "password": "password", "channel": 1})
+        elif url.path in STATIC_FILES:
+            self._send(200, *static_file(url.path))
+        elif url.path == "/metrics":
+            snapshot = self.node.metrics_snapshot()
+            if query.get("format") == ["binary"]:
+                self._send(200, mesh_metrics.encode(snapshot), "application/octet-stream")
+            else:
+                self._send(200, mesh_metrics.format_text(snapshot), "text/plain; version=0.0.4")
+        else:
+            self._send(404, "Not found", "text/plain")
+
+    def _post(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+
+        if url.path == "/send":
+            group = parse_group(parse_qs(url.query))
+            if group == -1:
+                self._send(400, "Invalid group", "text/plain")
+                return
+            if length > SEND_BODY_LIMIT:
+                self.close_connection = True
+                self._send(413, "Request body too large", "text/plain")
+                return
+            try:
+                messages, _ = decode_send_body(self._read_body(), self.headers.get("Content-Type", ""))
+            except DecodeError:
+                self._send(400, "Invalid JSON body", "text/plain")
+                return
+            for message in messages:
+                self.node.send(message.decode("utf-8", "replace"), group)
+            self._send(200, "OK", "text/plain")
+        elif url.path == "/relay":
+            query = parse_qs(url.query)
+            try:
+                sender = query["sender"][0]
+                message_id = int(query["id"][0])
+                messages, _ = decode_send_body(self._read_body(), self.headers.get("Content-Type", ""), 1)
+            except (KeyError, ValueError, DecodeError):
+                self._send(400, "Missing sender, id or message", "text/plain")
+                return
+            if len(bytes.fromhex(sender.replace(":", ""))) != 6 or not 0 < message_id <= 0xFFFFFFFF or not messages:
+                self._send(400, "Missing sender, id or message", "text/plain")
+            elif self.node.relay(sender.lower(), message_id, messages[0].decode("utf-8", "replace")):
+                self._send(200, "OK", "text/plain")
+            else:
+                self._send(409, "Already seen", "text/plain")
+        elif url.path == "/presence":
+            try:
+                messages, _ = decode_send_body(self._read_body(), self.headers.get("Content-Type", ""), 1)
+            except DecodeError:
+                self._send(400, "Invalid JSON body", "text/plain")
+                return
+            self.node.set_presence(messages[0].decode("utf-8", "replace") if messages else "")
+            self._send(200, "OK", "text/plain")
+        elif url.path == "/typing":
+            query = parse_qs(url.query)
+            target = query.get("to", [""])[0].lower()
+            try:
+                valid = len(bytes.fromhex(target.replace(":", ""))) == 6
+            except ValueError:
+                valid = False
+            if not valid:
+                self._send(400, "Missing or invalid to", "text/plain")
+                return
+            self.node.set_typing(target, query.get("typing", ["1"])[0] != "0")
+            self._send(200, "OK", "text/plain")
+        elif url.path == "/groups":
+            query = parse_qs(url.query)
+            key = "join" if "join" in query else "leave" if "leave" in query else None
+            if key is None:
+                self._send(400, "Expected join or leave", "text/plain")
+                return
+            group = parse_group({"group": query[key]})
+            if group == -1:
+                self._send(400, "Invalid group", "text/plain")
+                return
+            if key == "join":
+                self.node.join_group(group)
+            else:
+                self.node.leave_group(group)
+            self._json(self.node.groups_status())
+        else:
+            self._send(404, "Not found", "text/plain")
+
+
+def parse_group(query):
+    """The ?group=N of a parsed query: None without one, -1 if it is not a group ID"""
+    if "group" not in query:
+        return None
+    value = query["group"][0]
+    if not value.isdigit() or int(value) >= MESH_GROUP_COUNT:
+        return -1
+    return int(value)
+
+
+def link(*nodes):
+    """Put nodes in one mesh island, each hearing what the others send and relay"""
+    for node in nodes:
+        node.neighbours = [other for other in nodes if other is not node]
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, node, host="127.0.0.1", port=0, verbose=False):
+        super().__init__((host, port), StandinHandler)
+        self.node = node
+        self.verbose = verbose
+        self.thread = None
+        self.connections = 0
+
+    def verify_request(self, request, client_address):
+        self.connections += 1
+        return True
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve in a background thread and return the base URL"""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Mesh-NOW device API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--mac", default="24:6f:28:00:00:01")
+    parser.add_argument("--no-loopback", action="store_true", help="Do not echo /send into the history")
+    parser.add_argument("--chatter", type=float, default=0.0, help="Inject synthetic messages per second")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    node = StandinNode(mac=args.mac, loopback=not args.no_loopback)
+    server = StandinServer(node, args.host, args.port, args.verbose)
+    print(f"Stand-in node {args.mac} listening on {server.base_url}")
+
+    if args.chatter > 0:
+        def chatter():
+            n = 0
+            while True:
+                n += 1
+                sender = "24:6f:28:00:00:%02x" % random.randint(2, 9)
+                node.inject(f"synthetic message {n}", sender)
+                time.sleep(1.0 / args.chatter)
+        threading.Thread(target=chatter, daemon=True).start()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,24 @@
 #!/usr/bin/env python3
 """
 Quick test script to verify all targets configure successfully
+
+Validates configs/sdkconfig.<target> and the root sdkconfig with
+sdkconfig_check.py, lists what the targets set differently and exits
+non-zero on errors.
 """
 
 import os
 import sys
-import subprocess
 import shutil
+import argparse
+import importlib.util
 from pathlib import Path
 
-try:
-    from rich.console import Console
-    from rich.table import Table
-    RICH_AVAILABLE = True
-except ImportError:
-    RICH_AVAILABLE = False
+from command_runner import command_log, echo_to, run
+from sdkconfig_check import TARGETS, errors, report, validate
+
+# rich is imported where output is drawn, so --ci runs never load it
+RICH_AVAILABLE = importlib.util.find_spec("rich") is not None
 
 def check_idf_setup(console):
     """Check if ESP-IDF environment is set up"""
@@ -26,42 +30,56 @@ def check_idf_setup(console):
     return idf_path
 
 def run_command(cmd, cwd=None, console=None, silent=True):
-    """Run a command silently and return success"""
-    try:
-        result = subprocess.run(cmd, shell=True, cwd=cwd, capture_output=silent, text=True)
-        if not result.returncode == 0 and console:
-            console.print(f"[red]Command failed: {cmd}[/red]")
-            if result.stderr:
-                console.print(f"[red]Error: {result.stderr}[/red]")
-        return result.returncode == 0
-    except Exception as e:
-        if console:
-            console.print(f"[red]Exception running command: {e}[/red]")
-        return False
-
-def test_target(target, console, script_dir):
-    """Test configuration for a target"""
-    # Check if config file exists
-    config_file = script_dir.parent / "configs" / f"sdkconfig.{target}"
-    if not config_file.exists():
-        return "Config file missing"
-
-    # Check if config file is readable and contains target-specific settings
-    try:
-        with open(config_file, 'r') as f:
-            content = f.read()
-            if f'CONFIG_IDF_TARGET="{target}"' not in content:
-                return "Config file invalid"
-    except Exception as e:
-        return f"Config file error: {e}"
-
-    # For CI environments, skip actual ESP-IDF testing since it may not support all targets
-    # The config file validation is sufficient to ensure the target is configured
-    return "Configuration OK"
+    """Run a command (echoing its output unless silent) and return success"""
+    result = run(cmd, cwd=cwd, on_line=None if silent else echo_to(console), log=command_log("test"))
+    if not result.ok and console:
+        console.print(f"[red]Command failed: {cmd}[/red]")
+        if silent and result.lines:
+            console.print(f"[red]Error: {result.reason()}[/red]")
+    return result.ok
+
+def test_target(target, findings):
+    """Status line for a target from the validation findings"""
+    own = [finding for finding in findings if finding.config == target]
+    errors = sum(finding.level == "error" for finding in own)
+    warnings = len(own) - errors
+    if errors:
+        return f"{errors} error(s)" + (f", {warnings} warning(s)" if warnings else "")
+    return f"Configuration OK ({warnings} warning(s))" if warnings else "Configuration OK"
+
+def print_differences(console, configs, use_rich):
+    """Table of the options the target configs disagree on"""
+    rows = configs.differences()
+    if not rows:
+        return
+    console.print()
+    console.print("Differences between targets:")
+    targets = list(configs.configs)
+    if use_rich:
+        from rich.table import Table
+        table = Table()
+        table.add_column("Option", style="cyan")
+        for target in targets:
+            table.add_column(target)
+        for key, values in rows:
+            table.add_row(key[len("CONFIG_"):], *(values[target] or "-" for target in targets))
+        console.print(table)
+    else:
+        width = max(len(key) for key, _ in rows) - len("CONFIG_")
+        console.print("   " + " ".join([f"{'option':<{width}}"] + [f"{target:>8}" for target in targets]))
+        for key, values in rows:
+            cells = [f"{values[target] or '-':>8}" for target in targets]
+            console.print("   " + " ".join([f"{key[len('CONFIG_'):]:<{width}}"] + cells))
 
 def main():
+    parser = argparse.ArgumentParser(description="Check every target's configuration")
+    parser.add_argument("--ci", action="store_true", help="CI mode - plain output")
+    args = parser.parse_args()
+    use_rich = RICH_AVAILABLE and not args.ci
+
     # Setup console
-    if RICH_AVAILABLE:
+    if use_rich:
+        from rich.console import Console
         console = Console()
     else:
         class PlainConsole:
@@ -80,22 +98,24 @@ def main():
     script_dir = Path(__file__).parent
     os.chdir(script_dir.parent)  # Change to project root
 
-    targets = ["esp32", "esp32s2", "esp32s3", "esp32c3", "esp32c6"]
+    targets = list(TARGETS)
 
     console.print("Testing all ESP32 targets for Mesh-NOW")
     console.print("=" * 40)
     console.print()
 
-    results = []
-    for target in targets:
-        console.print(f"Testing {target}...")
-        result = test_target(target, console, script_dir)
-        results.append(f"{target}: {result}")
+    configs, findings, elapsed = validate(script_dir.parent, targets)
+    results = [f"{target}: {test_target(target, findings)}" for target in targets]
+    if findings:
+        report(console, findings)
+        console.print()
+    console.print(f"Checked {len(configs.all())} configs in {elapsed:.1f} ms")
 
     console.print()
     console.print("Results:")
 
-    if RICH_AVAILABLE:
+    if use_rich:
+        from rich.table import Table
         table = Table()
         table.add_column("Target", style="cyan")
         table.add_column("Status", style="green")
@@ -107,5 +127,8 @@ def main():
         for result in results:
             console.print(f"   {result}")
 
+    print_differences(console, configs, use_rich)
+    sys.exit(1 if errors(findings) else 0)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file